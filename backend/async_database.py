@@ -0,0 +1,104 @@
+"""
+Async Database - Request-scoped database sessions that do not block the event loop
+Handlers get a RequestDatabase through Depends(get_async_db) and run their ORM code with
+`await db.run_sync(fn)`. With aiosqlite / asyncpg installed that runs on an AsyncSession (database
+I/O is awaited, so one slow query no longer holds up other requests on the worker); without them
+it runs on a regular Session in a worker thread. Either way the session is closed after the request.
+"""
+from typing import Any, Callable, Dict, Optional
+import asyncio
+import importlib.util
+
+from sqlalchemy.engine import make_url
+
+try:
+    from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+except ImportError:
+    AsyncSession = async_sessionmaker = create_async_engine = None
+
+# Import config
+try:
+    from config import (
+        ASYNC_DATABASE_ENABLED, DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT_SECONDS, DB_POOL_RECYCLE_SECONDS
+    )
+except ImportError:
+    ASYNC_DATABASE_ENABLED = True
+    DB_POOL_SIZE = 10
+    DB_MAX_OVERFLOW = 20
+    DB_POOL_TIMEOUT_SECONDS = 30
+    DB_POOL_RECYCLE_SECONDS = 300
+
+# Database backend -> (async SQLAlchemy driver, module it needs)
+ASYNC_DRIVERS = {
+    "sqlite": ("sqlite+aiosqlite", "aiosqlite"),
+    "postgresql": ("postgresql+asyncpg", "asyncpg"),
+}
+
+
+def pool_options(database_url: str) -> Dict[str, Any]:
+    """Connection pool arguments for create_engine / create_async_engine (server databases only)"""
+    if make_url(database_url).get_backend_name() == "sqlite":
+        return {}
+    return {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT_SECONDS,
+        "pool_recycle": DB_POOL_RECYCLE_SECONDS,
+        "pool_pre_ping": True
+    }
+
+
+def async_database_url(database_url: str) -> Optional[str]:
+    """The async-driver form of a database URL, or None if its driver is not installed"""
+    if create_async_engine is None:
+        return None
+    url = make_url(database_url.replace("postgres://", "postgresql://", 1))
+    driver = ASYNC_DRIVERS.get(url.get_backend_name())
+    if driver is None or importlib.util.find_spec(driver[1]) is None:
+        return None
+    url = url.set(drivername=driver[0])
+    if driver[1] == "asyncpg" and "sslmode" in url.query:
+        # libpq's sslmode is called ssl by asyncpg
+        sslmode = url.query["sslmode"]
+        url = url.difference_update_query(["sslmode"]).update_query_dict({"ssl": sslmode})
+    return url.render_as_string(hide_password=False)
+
+
+def create_async_session_factory(database_url: str, enabled: bool = ASYNC_DATABASE_ENABLED):
+    """async_sessionmaker for the database, or None to run ORM code in threads instead"""
+    if not enabled:
+        return None
+    url = async_database_url(database_url)
+    if url is None:
+        print("Async database driver not installed (aiosqlite / asyncpg); database calls run in threads")
+        return None
+    async_engine = create_async_engine(url, **pool_options(database_url))
+    return async_sessionmaker(async_engine, expire_on_commit=False, autoflush=False)
+
+
+class RequestDatabase:
+    """The database session of one request; created on first use, closed by get_async_db"""
+
+    def __init__(self, session_factory, async_session_factory=None):
+        self.session_factory = session_factory
+        self.async_session_factory = async_session_factory
+        self._session = None
+
+    async def run_sync(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """Run fn(session, *args, **kwargs), ORM code written against a regular Session, off the event loop"""
+        if self.async_session_factory is not None:
+            if self._session is None:
+                self._session = self.async_session_factory()
+            return await self._session.run_sync(fn, *args, **kwargs)
+        if self._session is None:
+            self._session = self.session_factory()
+        return await asyncio.to_thread(fn, self._session, *args, **kwargs)
+
+    async def close(self):
+        if self._session is None:
+            return
+        session, self._session = self._session, None
+        if self.async_session_factory is not None:
+            await session.close()
+        else:
+            await asyncio.to_thread(session.close)
@@ -2,6 +2,7 @@
 Centralized configuration for AI models and services.
 Adjust models and versions here to affect the entire application.
 """
+import os
 
 # OpenAI GPT Configuration
 # Using gpt-4o-mini for testing - change to "gpt-4" for production
@@ -22,16 +23,184 @@ OPENAI_TEMPERATURE_DEBATE = 0.8  # Higher for creative debate
 OPENAI_TEMPERATURE_JOB_ANALYSIS = 0.3  # Medium for analysis
 OPENAI_TEMPERATURE_TEXT_EXTRACTION = 0.0  # Low for accurate extraction
 
+# OpenAI HTTP Client Configuration
+# One pooled client is created per process and shared by every LLM call,
+# so concurrency is bounded by these limits instead of executor threads
+OPENAI_HTTP2_ENABLED = True  # Multiplex requests over HTTP/2 (needs the 'h2' package, falls back to HTTP/1.1)
+OPENAI_MAX_CONNECTIONS = 20  # Maximum open connections to the OpenAI API per process
+OPENAI_MAX_KEEPALIVE_CONNECTIONS = 10  # Idle connections kept warm for reuse
+OPENAI_KEEPALIVE_EXPIRY_SECONDS = 30.0  # Close idle connections after this many seconds
+OPENAI_REQUEST_TIMEOUT_SECONDS = 60.0  # Total timeout for a single completion request
+OPENAI_CONNECT_TIMEOUT_SECONDS = 10.0  # Timeout for establishing a connection
+
+# OpenAI Rate Limits (per model)
+# All OpenAI traffic passes one process-wide governor; bursts queue instead of hitting 429s
+OPENAI_RATE_LIMITS = {
+    "gpt-4o-mini": {"rpm": 500, "tpm": 200000},  # Requests / tokens per minute
+    "gpt-4": {"rpm": 500, "tpm": 30000},
+}
+OPENAI_DEFAULT_RATE_LIMIT = {"rpm": 500, "tpm": 30000}  # For models not listed above
+OPENAI_MAX_CONCURRENT_REQUESTS = 10  # Maximum in-flight OpenAI calls per process
+
+# OpenAI Retry / Hedging / Circuit Breaker Configuration
+OPENAI_MAX_RETRIES = 3  # Retries after the first attempt for transient errors (timeouts, 429, 5xx)
+OPENAI_RETRY_BASE_DELAY_SECONDS = 0.5  # Backoff doubles per attempt (full jitter); Retry-After wins when present
+OPENAI_RETRY_MAX_DELAY_SECONDS = 8.0
+OPENAI_HEDGING_ENABLED = True  # Fire a duplicate request when a call runs past the model's p95 latency
+OPENAI_HEDGE_MIN_SAMPLES = 20  # Latency samples needed before hedging starts
+OPENAI_HEDGE_MIN_DELAY_SECONDS = 2.0  # Never hedge earlier than this
+OPENAI_CIRCUIT_FAILURE_THRESHOLD = 5  # Consecutive transient failures that open a model's circuit
+OPENAI_CIRCUIT_RESET_SECONDS = 30.0  # Time the circuit stays open before a trial request
+
+# LLM Response Cache Configuration
+# Identical requests (model, messages, max_tokens, temperature) are served from cache
+LLM_CACHE_ENABLED = True  # Set to False to disable caching entirely
+LLM_CACHE_MAX_ENTRIES = 1000  # Size of the in-memory LRU tier
+LLM_CACHE_SQLITE_PATH = None  # e.g. "./llm_cache.db" to keep cached responses across restarts
+LLM_CACHE_MAX_DEFAULT_TEMPERATURE = 0.3  # Calls at or below this temperature are cached by default; higher needs explicit opt-in
+LLM_CACHE_DEFAULT_TTL_SECONDS = 3600  # TTL for endpoints not listed below
+LLM_CACHE_TTL_SECONDS = {
+    "evaluation": 24 * 3600,  # Persona and combined evaluations
+    "job_extraction": 7 * 24 * 3600,  # Extracting a job posting from URL content
+    "job_analysis": 24 * 3600,
+    "candidate_matching": 6 * 3600,
+    "candidate_summary": 6 * 3600,
+    "debate": 3600  # Only cached when explicitly requested (temperature 0.8)
+}
+
+# Background Task Queue Configuration (task_queue.py)
+TASK_QUEUE_WORKERS = 4  # Worker coroutines per process; each runs one evaluation/debate/analysis at a time
+TASK_QUEUE_POLL_INTERVAL_SECONDS = 2.0  # Fallback poll for tasks submitted by other processes
+TASK_QUEUE_LEASE_SECONDS = 60  # Running tasks without a heartbeat for this long are requeued
+TASK_QUEUE_MAX_ATTEMPTS = 3  # Give up on a task after this many interrupted runs
+
+# Batch Evaluation Configuration (/tasks/batch-evaluate)
+BATCH_EVALUATION_MAX_CONCURRENT_CANDIDATES = 4  # Candidates evaluated at once per process (each runs its personas in parallel)
+BATCH_EVALUATION_COMMIT_SIZE = 10  # Evaluation results written per database commit
+
+# Debate Planner Configuration (debate_planner.py)
+# After each persona round the planner scores how much the personas agree and decides
+# whether another round is worth its latency. With DEBATE_ADAPTIVE_ENABLED = False every
+# debate runs exactly DEBATE_DEFAULT_PERSONA_ROUNDS rounds.
+DEBATE_ADAPTIVE_ENABLED = True
+DEBATE_MIN_PERSONA_ROUNDS = 1  # Always run at least this many persona rounds
+DEBATE_DEFAULT_PERSONA_ROUNDS = 3  # Rounds for a debate that neither converges nor is contentious
+DEBATE_MAX_PERSONA_ROUNDS = 5  # Upper bound including extra rounds for contentious candidates
+DEBATE_CONVERGENCE_THRESHOLD = 0.75  # Agreement (0-1) at or above which remaining rounds are skipped
+DEBATE_CONTENTION_THRESHOLD = 0.35  # Agreement at or below which extra rounds are added (up to the max)
+DEBATE_TOKEN_BUDGET = 40000  # Total tokens per debate; no new round starts once this is used up
+DEBATE_TIME_BUDGET_SECONDS = 90  # Wall time per debate; no new round starts after this
+
+# Debate Checkpoint Configuration (debate_checkpoints.py)
+# Every finished debate step is stored under a debate session id. A debate that fails halfway
+# (or whose worker is recycled) resumes from its last checkpoint instead of starting over.
+DEBATE_CHECKPOINTS_ENABLED = True
+
+# Workflow Progress Configuration (workflow_progress.py)
+# "sqlite" shares progress between all uvicorn workers on the host through a SQLite file;
+# "memory" keeps it in the process (only correct with a single worker).
+WORKFLOW_PROGRESS_BACKEND = "sqlite"
+WORKFLOW_PROGRESS_SQLITE_PATH = "workflow_progress.db"  # Relative paths are resolved against backend/
+WORKFLOW_PROGRESS_TTL_SECONDS = 3600  # Sessions without updates for this long are dropped
+WORKFLOW_PROGRESS_MAX_SESSIONS = 1000  # Least recently updated sessions are dropped beyond this
+WORKFLOW_PROGRESS_POLL_INTERVAL_SECONDS = 0.5  # How quickly SSE subscribers see updates from other workers
+
+# Debate Context Configuration (langchain_debate.py)
+# Personas read the debate transcript every turn. Once the messages they would read pass
+# DEBATE_CONTEXT_SUMMARY_THRESHOLD_TOKENS, the rounds before the latest one are replaced by a
+# rolling summary written by the moderator, so per-turn input stays about flat.
+DEBATE_CONTEXT_SUMMARY_ENABLED = True
+DEBATE_CONTEXT_SUMMARY_THRESHOLD_TOKENS = 800  # Unsummarized transcript tokens that trigger a rolling summary
+DEBATE_CONTEXT_SUMMARY_MAX_SENTENCES = 6  # Length the moderator is asked to keep the rolling summary to
+
 # Azure Document Intelligence Configuration
 AZURE_ENABLED = True  # Set to False to disable Azure entirely
 AZURE_TIMEOUT_SECONDS = 30
 
-# File Processing Configuration
-# Reduced limits for gpt-4o-mini to stay within token limits
-MAX_RESUME_CHARS = 2000  # Reduced from 3000 for smaller model
-MAX_MOTIVATION_CHARS = 500  # Reduced from 1000 for smaller model
-MAX_JOB_DESC_CHARS = 1000  # Reduced from 2000 for smaller model
-MAX_COMPANY_NOTE_CHARS = 500  # Limit for company notes
+# Document Extraction Configuration (document_extraction.py)
+# PyMuPDF / PyPDF2 / python-docx parsing runs in a process pool so uploads never block the
+# event loop. Set DOCUMENT_EXTRACTION_PROCESS_POOL_ENABLED = False to parse in threads instead.
+DOCUMENT_EXTRACTION_PROCESS_POOL_ENABLED = True
+DOCUMENT_EXTRACTION_WORKERS = 2  # Parser processes per app worker
+DOCUMENT_EXTRACTION_MAX_TASKS_PER_CHILD = 50  # Parser processes are replaced after this many documents
+DOCUMENT_EXTRACTION_TIMEOUT_SECONDS = 30  # Per parser task (document or page range); a stuck parser process is terminated
+# PDFs are read page by page and reading stops once DOCUMENT_EXTRACTION_MAX_CHARS are collected:
+# stored text is capped at STORED_DOCUMENT_MAX_TOKENS anyway (8000 tokens, ~4-6 characters each).
+# Longer PDFs are split into page ranges that the parser processes extract in parallel.
+DOCUMENT_EXTRACTION_MAX_CHARS = 48000  # None reads every page
+DOCUMENT_EXTRACTION_PAGES_PER_TASK = 8  # Page range per parser task; the first range tells us the page count
+
+# Upload Configuration (upload_spool.py)
+# Uploaded documents are streamed to a temporary file in chunks and extracted from disk, so memory
+# per upload stays flat. The document type is sniffed from the file's magic bytes, not its name.
+UPLOAD_MAX_BYTES = 20 * 1024 * 1024  # Larger uploads are rejected with 413
+UPLOAD_CHUNK_BYTES = 1024 * 1024  # Copy buffer per upload
+UPLOAD_SPOOL_DIR = None  # Directory for spooled uploads; None uses the system temp directory
+
+# Bulk Upload Configuration (POST /upload-resumes/bulk)
+BULK_UPLOAD_MAX_FILES = 200  # Files per batch (multipart files or zip members)
+BULK_UPLOAD_MAX_CONCURRENT_EXTRACTIONS = 8  # Documents of one batch extracted at the same time
+BULK_UPLOAD_MAX_ARCHIVE_BYTES = 200 * 1024 * 1024  # Zip archive size; each member is also capped at UPLOAD_MAX_BYTES
+
+# Extraction Cache Configuration (extraction_cache.py)
+# Extracted text is stored per SHA-256 of the file bytes and DOCUMENT_EXTRACTOR_VERSION, so a CV
+# that is uploaded again skips parsing, Azure and AI extraction. Bump DOCUMENT_EXTRACTOR_VERSION
+# when extractors, PDF_EXTRACTION_PRIORITY or DOCUMENT_EXTRACTION_MAX_CHARS change the extracted text.
+EXTRACTION_CACHE_ENABLED = True
+DOCUMENT_EXTRACTOR_VERSION = "2"
+
+# Extraction Strategy Configuration (extraction_strategy.py)
+# Local extractors (PyMuPDF, PyPDF2, python-docx) run first, in PDF_EXTRACTION_PRIORITY order. Their
+# output is scored (characters per PDF page, share of unreadable characters, raw %PDF bytes) and
+# Azure / AI extraction only run when no local result reaches EXTRACTION_QUALITY_THRESHOLD.
+# Remote extractors run concurrently; the best result available at the deadline is used.
+EXTRACTION_QUALITY_THRESHOLD = 0.6  # 0-1; below this a local result escalates to remote extraction
+EXTRACTION_MIN_CHARS_PER_PAGE = 200  # Text-layer CV pages have well over this; scanned pages have ~0
+EXTRACTION_MAX_GARBAGE_RATIO = 0.2  # Share of unreadable characters (broken font mappings) at which quality is 0
+EXTRACTION_REMOTE_DEADLINE_SECONDS = 45  # Wait at most this long for Azure / AI extraction
+
+# List Pagination Configuration (pagination.py)
+# List endpoints (/candidates, /recruiter/candidates, /job-descriptions, /evaluation-results, /comments,
+# /approvals) accept limit, cursor (the next_cursor of the previous page), sort and fields.
+# Without limit or cursor they return all rows, as before, unless LIST_DEFAULT_PAGE_SIZE is set.
+LIST_DEFAULT_PAGE_SIZE = None  # Page size when no limit is given; set (e.g. 100) once all clients follow next_cursor
+LIST_MAX_PAGE_SIZE = 500  # Largest limit a client may request
+
+# Database Connection Configuration (async_database.py)
+# Hot endpoints run their queries on an AsyncSession (aiosqlite for SQLite, asyncpg for PostgreSQL)
+# when the driver is installed, and in a worker thread otherwise. Pool sizes apply per engine and per
+# worker process (PostgreSQL only): the sync and the async engine each hold up to
+# DB_POOL_SIZE + DB_MAX_OVERFLOW connections, so keep workers * 2 * that below max_connections.
+ASYNC_DATABASE_ENABLED = True  # False: always use the sync engine in worker threads
+DB_POOL_SIZE = 10  # Connections kept open per engine
+DB_MAX_OVERFLOW = 20  # Extra connections allowed under load
+DB_POOL_TIMEOUT_SECONDS = 30  # Wait this long for a free connection before failing the request
+DB_POOL_RECYCLE_SECONDS = 300  # Reconnect connections older than this (server-side idle timeouts)
+
+# Prompt Token Budget Configuration
+# Token counts use the model's BPE tokenizer (tiktoken), see token_budget.py
+OPENAI_MAX_INPUT_TOKENS = 4000  # Prompt tokens we are willing to send per call
+OPENAI_MODEL_CONTEXT_WINDOWS = {  # Input limit is also bounded by context window minus max_tokens
+    "gpt-4o-mini": 128000,
+    "gpt-4o": 128000,
+    "gpt-4": 8192
+}
+# How the budget left after the fixed prompt text is divided over document sections.
+# Lower priority number = served first. Each section gets min_tokens before any
+# section gets more, and never more than max_tokens.
+PROMPT_SECTION_LIMITS = {
+    "resume": {"priority": 1, "min_tokens": 400, "max_tokens": 1500},
+    "company_note": {"priority": 2, "min_tokens": 100, "max_tokens": 300},
+    "job_description": {"priority": 3, "min_tokens": 200, "max_tokens": 500},
+    "job_requirements": {"priority": 3, "min_tokens": 200, "max_tokens": 500},
+    "motivation": {"priority": 4, "min_tokens": 100, "max_tokens": 400},
+    "candidate_details": {"priority": 5, "min_tokens": 50, "max_tokens": 400}
+}
+DEBATE_HISTORY_RESERVE_TOKENS = 1500  # Kept free in debate prompts for persona prompts and conversation history
+STORED_DOCUMENT_MAX_TOKENS = 8000  # Cap on extracted CV/motivation text stored at upload (prompts are budgeted per call)
+TOKENIZER_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "tokenizer_cache")
+TOKENIZER_DEFAULT_ENCODING = "o200k_base"  # Used for models tiktoken doesn't know
+TOKEN_COUNT_CACHE_SIZE = 4096  # Memoized (text, encoding) -> token count entries
 
 # PDF Extraction Priority (in order of preference)
 # Options: 'pymupdf', 'azure', 'ai', 'pypdf2'
@@ -0,0 +1,210 @@
+"""
+Debate Checkpoints - Persists every completed debate step so a failed debate can be resumed
+A debate session row holds the debate's inputs. Each finished moderator turn, persona round and
+rolling context summary is stored as a checkpoint. Resuming replays the checkpoints instead of
+calling the LLM again and continues with the first step that has none.
+"""
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Any
+from uuid import uuid4
+import json
+
+SESSION_STATUS_RUNNING = 'running'
+SESSION_STATUS_FAILED = 'failed'
+SESSION_STATUS_COMPLETED = 'completed'
+
+STEP_STATUS_COMPLETED = 'completed'
+STEP_STATUS_FAILED = 'failed'
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _loads(value: Optional[str]):
+    if not value:
+        return None
+    try:
+        return json.loads(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class DebateCheckpoints:
+    """Checkpoints of one debate session, handed to the debate engine"""
+
+    def __init__(self, store: "DebateCheckpointStore", session_id: str,
+                 completed: Dict[str, Dict[str, Any]], failed: Dict[str, Dict[str, Any]]):
+        self.store = store
+        self.session_id = session_id
+        self._completed = completed
+        self._failed = failed
+        self.restored_steps = len(completed)
+
+    def completed(self, step: str) -> Optional[Dict[str, Any]]:
+        """Payload of a step that already finished in an earlier run"""
+        return self._completed.get(step)
+
+    def partial(self, step: str) -> Optional[Dict[str, Any]]:
+        """What a failed step got done before failing (e.g. the persona responses that succeeded)"""
+        return self._failed.get(step)
+
+    def save(self, step: str, payload: Dict[str, Any]):
+        self.store.save_step(self.session_id, step, STEP_STATUS_COMPLETED, payload)
+        self._completed[step] = payload
+        self._failed.pop(step, None)
+
+    def fail(self, step: str, error: str, payload: Optional[Dict[str, Any]] = None):
+        self.store.save_step(self.session_id, step, STEP_STATUS_FAILED, payload or {}, error=error)
+        self._failed[step] = payload or {}
+
+
+class DebateCheckpointStore:
+    """Debate sessions and their step checkpoints in the application database"""
+
+    def __init__(self, session_factory, session_model, checkpoint_model):
+        self.session_factory = session_factory
+        self.session_model = session_model
+        self.checkpoint_model = checkpoint_model
+
+    def create(self, candidate_id: str, job_id: Optional[str], persona_prompts: Dict[str, str],
+               company_note: Optional[str] = None, session_id: Optional[str] = None) -> str:
+        """Store a new debate session with the inputs needed to resume it; returns its id"""
+        db = self.session_factory()
+        try:
+            session = self.session_model(
+                id=session_id or str(uuid4()),
+                candidate_id=candidate_id,
+                job_id=job_id,
+                persona_prompts=json.dumps(persona_prompts, ensure_ascii=False),
+                company_note=company_note,
+                status=SESSION_STATUS_RUNNING,
+                created_at=_utcnow()
+            )
+            db.add(session)
+            db.commit()
+            return session.id
+        finally:
+            db.close()
+
+    def serialize_checkpoint(self, checkpoint, include_payload: bool = True) -> Dict[str, Any]:
+        data = {
+            "step": checkpoint.step,
+            "sequence": checkpoint.sequence,
+            "status": checkpoint.status,
+            "error": checkpoint.error,
+            "created_at": checkpoint.created_at.isoformat() if checkpoint.created_at else None,
+            "updated_at": checkpoint.updated_at.isoformat() if checkpoint.updated_at else None
+        }
+        if include_payload:
+            data["payload"] = _loads(checkpoint.payload)
+        return data
+
+    def _checkpoints(self, db, session_id: str) -> List[Any]:
+        return db.query(self.checkpoint_model).filter(
+            self.checkpoint_model.session_id == session_id
+        ).order_by(self.checkpoint_model.sequence).all()
+
+    def get_session(self, session_id: str, include_payload: bool = False) -> Optional[Dict[str, Any]]:
+        db = self.session_factory()
+        try:
+            session = db.query(self.session_model).filter(self.session_model.id == session_id).first()
+            if not session:
+                return None
+            return {
+                "id": session.id,
+                "candidate_id": session.candidate_id,
+                "job_id": session.job_id,
+                "persona_prompts": _loads(session.persona_prompts) or {},
+                "company_note": session.company_note,
+                "status": session.status,
+                "result_id": session.result_id,
+                "error": session.error,
+                "created_at": session.created_at.isoformat() if session.created_at else None,
+                "updated_at": session.updated_at.isoformat() if session.updated_at else None,
+                "checkpoints": [
+                    self.serialize_checkpoint(checkpoint, include_payload)
+                    for checkpoint in self._checkpoints(db, session_id)
+                ]
+            }
+        finally:
+            db.close()
+
+    def open(self, session_id: str) -> Optional[DebateCheckpoints]:
+        """Load a session's checkpoints to (re)run its debate; marks the session running"""
+        db = self.session_factory()
+        try:
+            session = db.query(self.session_model).filter(self.session_model.id == session_id).first()
+            if not session:
+                return None
+            completed, failed = {}, {}
+            for checkpoint in self._checkpoints(db, session_id):
+                target = completed if checkpoint.status == STEP_STATUS_COMPLETED else failed
+                target[checkpoint.step] = _loads(checkpoint.payload) or {}
+            session.status = SESSION_STATUS_RUNNING
+            session.error = None
+            session.updated_at = _utcnow()
+            db.commit()
+            return DebateCheckpoints(self, session_id, completed, failed)
+        finally:
+            db.close()
+
+    def save_step(self, session_id: str, step: str, status: str, payload: Dict[str, Any],
+                  error: Optional[str] = None):
+        """Insert or overwrite the checkpoint of one step"""
+        db = self.session_factory()
+        try:
+            checkpoint = db.query(self.checkpoint_model).filter(
+                self.checkpoint_model.session_id == session_id,
+                self.checkpoint_model.step == step
+            ).first()
+            if checkpoint is None:
+                sequence = db.query(self.checkpoint_model).filter(
+                    self.checkpoint_model.session_id == session_id
+                ).count()
+                checkpoint = self.checkpoint_model(
+                    id=str(uuid4()), session_id=session_id, step=step, sequence=sequence, created_at=_utcnow()
+                )
+                db.add(checkpoint)
+            checkpoint.status = status
+            checkpoint.payload = json.dumps(payload, ensure_ascii=False)
+            checkpoint.error = error
+            checkpoint.updated_at = _utcnow()
+            db.commit()
+        finally:
+            db.close()
+
+    def discard_from(self, session_id: str, step: str) -> bool:
+        """Delete the checkpoint of step and of every later step so they run again; False if step has none"""
+        db = self.session_factory()
+        try:
+            checkpoint = db.query(self.checkpoint_model).filter(
+                self.checkpoint_model.session_id == session_id,
+                self.checkpoint_model.step == step
+            ).first()
+            if checkpoint is None:
+                return False
+            db.query(self.checkpoint_model).filter(
+                self.checkpoint_model.session_id == session_id,
+                self.checkpoint_model.sequence >= checkpoint.sequence
+            ).delete(synchronize_session=False)
+            db.commit()
+            return True
+        finally:
+            db.close()
+
+    def _finish(self, session_id: str, **fields):
+        db = self.session_factory()
+        try:
+            db.query(self.session_model).filter(self.session_model.id == session_id).update(
+                {**fields, "updated_at": _utcnow()}, synchronize_session=False
+            )
+            db.commit()
+        finally:
+            db.close()
+
+    def complete(self, session_id: str, result_id: Optional[str]):
+        self._finish(session_id, status=SESSION_STATUS_COMPLETED, result_id=result_id, error=None)
+
+    def mark_failed(self, session_id: str, error: str):
+        self._finish(session_id, status=SESSION_STATUS_FAILED, error=error)
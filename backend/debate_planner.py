@@ -0,0 +1,242 @@
+"""
+Debate Planner - Decides after each persona round whether the debate needs another round
+Agreement between the personas is scored locally (stance keywords, score statements and
+text similarity, no LLM call). Converged debates stop early, contentious ones get extra
+rounds, and no new round starts once the debate's token or time budget is used up.
+"""
+from collections import Counter
+from typing import Dict, List, Optional, Any
+import math
+import re
+import time
+
+# Import config
+try:
+    from config import (
+        DEBATE_ADAPTIVE_ENABLED, DEBATE_MIN_PERSONA_ROUNDS, DEBATE_DEFAULT_PERSONA_ROUNDS, DEBATE_MAX_PERSONA_ROUNDS,
+        DEBATE_CONVERGENCE_THRESHOLD, DEBATE_CONTENTION_THRESHOLD, DEBATE_TOKEN_BUDGET, DEBATE_TIME_BUDGET_SECONDS
+    )
+except ImportError:
+    DEBATE_ADAPTIVE_ENABLED = True
+    DEBATE_MIN_PERSONA_ROUNDS = 1
+    DEBATE_DEFAULT_PERSONA_ROUNDS = 3
+    DEBATE_MAX_PERSONA_ROUNDS = 5
+    DEBATE_CONVERGENCE_THRESHOLD = 0.75
+    DEBATE_CONTENTION_THRESHOLD = 0.35
+    DEBATE_TOKEN_BUDGET = 40000
+    DEBATE_TIME_BUDGET_SECONDS = 90
+
+STANCE_WEIGHT = 0.7  # Share of the agreement score that comes from stance; the rest is text similarity
+
+# Checked in this order; matched phrases are removed so "niet geschikt" doesn't also count as "geschikt"
+NEGATIVE_PHRASES = [
+    'niet geschikt', 'ongeschikt', 'niet passend', 'past niet', 'afwijzen', 'afwijzing', 'onvoldoende',
+    'mismatch', 'zwak', 'bezwaar', 'red flag', 'te duur', 'niet aanbevelen'
+]
+UNDECIDED_PHRASES = [
+    'twijfel', 'verdere evaluatie', 'meer informatie', 'onduidelijk', 'nader onderzoek', 'gesprek nodig'
+]
+POSITIVE_PHRASES = [
+    'geschikt', 'sterk', 'uitnodigen', 'aanbevelen', 'positief', 'past goed', 'overtuigend', 'solide',
+    'goede match', 'ruim voldoende'
+]
+SCORE_PATTERNS = [
+    re.compile(r'(\d+(?:[.,]\d+)?)\s*/\s*10\b'),
+    re.compile(r'\bscore\s*(?:van\s*)?(\d+(?:[.,]\d+)?)', re.IGNORECASE)
+]
+STOPWORDS = {
+    'de', 'het', 'een', 'en', 'van', 'in', 'is', 'op', 'te', 'dat', 'die', 'voor', 'met', 'zijn', 'niet',
+    'aan', 'er', 'maar', 'om', 'ook', 'als', 'dan', 'bij', 'nog', 'wel', 'naar', 'kan', 'wat', 'deze',
+    'hij', 'zij', 'ze', 'we', 'wij', 'ik', 'je', 'jij', 'heeft', 'hebben', 'wordt', 'worden', 'moet',
+    'meer', 'zou', 'over', 'door', 'tot', 'of', 'dit', 'zo', 'uit', 'kandidaat', 'the', 'and'
+}
+WORD_PATTERN = re.compile(r'[a-zà-ÿ]{3,}')
+
+
+def extract_score(text: str) -> Optional[float]:
+    """First 1-10 score statement in a message ("7/10", "score 6,5"), if any"""
+    for pattern in SCORE_PATTERNS:
+        match = pattern.search(text)
+        if match:
+            try:
+                score = float(match.group(1).replace(',', '.'))
+            except ValueError:
+                continue
+            if 1.0 <= score <= 10.0:
+                return score
+    return None
+
+
+def message_stance(text: str) -> Optional[float]:
+    """Stance of a message from -1 (reject) to 1 (hire); None if it doesn't express one"""
+    lowered = (text or '').lower()
+    counts = {}
+    for name, phrases in (('negative', NEGATIVE_PHRASES), ('undecided', UNDECIDED_PHRASES), ('positive', POSITIVE_PHRASES)):
+        counts[name] = 0
+        for phrase in phrases:
+            occurrences = lowered.count(phrase)
+            if occurrences:
+                counts[name] += occurrences
+                lowered = lowered.replace(phrase, ' ')
+    total = counts['positive'] + counts['negative'] + counts['undecided']
+    keyword_stance = (counts['positive'] - counts['negative']) / total if total else None
+
+    score = extract_score(text or '')
+    score_stance = max(-1.0, min(1.0, (score - 5.5) / 4.5)) if score is not None else None
+
+    if score_stance is not None and keyword_stance is not None:
+        return 0.6 * score_stance + 0.4 * keyword_stance
+    return score_stance if score_stance is not None else keyword_stance
+
+
+def _term_vector(text: str) -> Counter:
+    return Counter(word for word in WORD_PATTERN.findall((text or '').lower()) if word not in STOPWORDS)
+
+
+def _cosine(a: Counter, b: Counter) -> float:
+    if not a or not b:
+        return 0.0
+    dot = sum(count * b[word] for word, count in a.items() if word in b)
+    norm = math.sqrt(sum(c * c for c in a.values())) * math.sqrt(sum(c * c for c in b.values()))
+    return dot / norm if norm else 0.0
+
+
+def score_agreement(messages: List[str]) -> Dict[str, Optional[float]]:
+    """Agreement between the messages of one round (0 = opposed, 1 = same conclusion)
+
+    None with fewer than two messages: a single persona cannot agree or disagree with anyone.
+    """
+    vectors = [_term_vector(message) for message in messages]
+    pairs = [(i, j) for i in range(len(vectors)) for j in range(i + 1, len(vectors))]
+    if not pairs:
+        stances = [stance for stance in (message_stance(message) for message in messages) if stance is not None]
+        return {
+            'agreement': None,
+            'stance_agreement': None,
+            'lexical_similarity': None,
+            'stances': [round(stance, 2) for stance in stances]
+        }
+    lexical = sum(_cosine(vectors[i], vectors[j]) for i, j in pairs) / len(pairs)
+
+    stances = [stance for stance in (message_stance(message) for message in messages) if stance is not None]
+    stance_agreement = 1.0 - (max(stances) - min(stances)) / 2.0 if len(stances) >= 2 else None
+
+    if stance_agreement is None:
+        agreement = lexical
+    else:
+        agreement = STANCE_WEIGHT * stance_agreement + (1 - STANCE_WEIGHT) * lexical
+    return {
+        'agreement': round(agreement, 3),
+        'stance_agreement': round(stance_agreement, 3) if stance_agreement is not None else None,
+        'lexical_similarity': round(lexical, 3),
+        'stances': [round(stance, 2) for stance in stances]
+    }
+
+
+class DebatePlanner:
+    """Tracks one debate's budget and decides after each persona round whether to continue"""
+
+    def __init__(
+        self,
+        adaptive: bool = DEBATE_ADAPTIVE_ENABLED,
+        min_rounds: int = DEBATE_MIN_PERSONA_ROUNDS,
+        default_rounds: int = DEBATE_DEFAULT_PERSONA_ROUNDS,
+        max_rounds: int = DEBATE_MAX_PERSONA_ROUNDS,
+        convergence_threshold: float = DEBATE_CONVERGENCE_THRESHOLD,
+        contention_threshold: float = DEBATE_CONTENTION_THRESHOLD,
+        token_budget: int = DEBATE_TOKEN_BUDGET,
+        time_budget_seconds: float = DEBATE_TIME_BUDGET_SECONDS
+    ):
+        self.adaptive = adaptive
+        self.min_rounds = max(1, min_rounds)
+        self.default_rounds = max(self.min_rounds, default_rounds)
+        self.max_rounds = max(self.default_rounds, max_rounds)
+        self.convergence_threshold = convergence_threshold
+        self.contention_threshold = contention_threshold
+        self.token_budget = token_budget
+        self.time_budget_seconds = time_budget_seconds
+        self.started_at = time.monotonic()
+        self.tokens_used = 0
+        self.rounds: List[Dict[str, Any]] = []
+        self.stop_reason: Optional[str] = None
+
+    def record_tokens(self, tokens: int):
+        self.tokens_used += max(0, int(tokens or 0))
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started_at
+
+    def _budget_exhausted(self) -> Optional[str]:
+        if self.token_budget and self.tokens_used >= self.token_budget:
+            return 'token_budget'
+        if self.time_budget_seconds and self.elapsed() >= self.time_budget_seconds:
+            return 'time_budget'
+        return None
+
+    def _decide(self, round_number: int, agreement: Optional[float]) -> tuple:
+        """(continue?, reason) for the round after round_number; without an agreement score the default schedule runs"""
+        if not self.adaptive:
+            if round_number < self.default_rounds:
+                return True, 'fixed_schedule'
+            return False, 'schedule_complete'
+        if round_number >= self.max_rounds:
+            return False, 'max_rounds'
+        if round_number < self.min_rounds:
+            return True, 'min_rounds'
+        budget_reason = self._budget_exhausted()
+        if budget_reason:
+            return False, budget_reason
+        if agreement is not None and agreement >= self.convergence_threshold:
+            return False, 'converged'
+        if round_number < self.default_rounds:
+            return True, 'default_schedule'
+        if agreement is not None and agreement <= self.contention_threshold:
+            return True, 'contentious'
+        return False, 'schedule_complete'
+
+    def start_round(self, round_number: int, reason: str):
+        """Record that a persona round runs and why"""
+        self.rounds.append({'round': round_number, 'status': 'ran', 'reason': reason})
+
+    def decide_after_round(self, round_number: int, messages: List[str]) -> Dict[str, Any]:
+        """Score the round's persona messages and decide whether another round runs"""
+        scores = score_agreement(messages)
+        should_continue, reason = self._decide(round_number, scores['agreement'])
+        decision = {
+            'after_round': round_number,
+            **scores,
+            'continue': should_continue,
+            'reason': reason,
+            'tokens_used': self.tokens_used,
+            'elapsed_seconds': round(self.elapsed(), 2)
+        }
+        self.apply_decision(decision)
+        return decision
+
+    def apply_decision(self, decision: Dict[str, Any]):
+        """Record a decision; also used to replay decisions from a resumed debate's checkpoints"""
+        round_number = decision['after_round']
+        self.tokens_used = max(self.tokens_used, decision.get('tokens_used', 0))
+        if self.rounds and self.rounds[-1]['round'] == round_number:
+            self.rounds[-1]['agreement'] = decision['agreement']
+        if not decision['continue']:
+            self.stop_reason = decision['reason']
+            # Rounds of the default schedule that won't run, and why
+            for skipped in range(round_number + 1, self.default_rounds + 1):
+                self.rounds.append({'round': skipped, 'status': 'skipped', 'reason': decision['reason']})
+
+    def summary(self) -> Dict[str, Any]:
+        """Planner settings and outcome for timing_data"""
+        return {
+            'adaptive': self.adaptive,
+            'rounds_run': sum(1 for entry in self.rounds if entry['status'] == 'ran'),
+            'stop_reason': self.stop_reason,
+            'tokens_used': self.tokens_used,
+            'token_budget': self.token_budget,
+            'time_budget_seconds': self.time_budget_seconds,
+            'convergence_threshold': self.convergence_threshold,
+            'contention_threshold': self.contention_threshold,
+            'min_rounds': self.min_rounds,
+            'default_rounds': self.default_rounds,
+            'max_rounds': self.max_rounds
+        }
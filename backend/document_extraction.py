@@ -0,0 +1,334 @@
+"""
+Document Extraction - Local (CPU-bound) text extractors and the process pool they run in
+This module has no side effects on import (no app, database or API clients), so pool worker
+processes can import it cheaply. Parsing runs in a bounded ProcessPoolExecutor: PDF parsing
+scales across cores, never blocks the event loop, workers are recycled after
+DOCUMENT_EXTRACTION_MAX_TASKS_PER_CHILD documents and a document that exceeds
+DOCUMENT_EXTRACTION_TIMEOUT_SECONDS is abandoned (its worker is terminated).
+PDFs are extracted page by page: reading stops once DOCUMENT_EXTRACTION_MAX_CHARS are collected and
+long PDFs are split into page ranges that the pool extracts in parallel.
+A document source is either the file's bytes or the path of a spooled upload (upload_spool.py);
+extractors open paths themselves, so an upload is never copied into the worker processes.
+"""
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from io import BytesIO
+from typing import BinaryIO, Callable, Dict, List, Optional, Tuple, Union
+import asyncio
+import codecs
+import mmap
+import os
+import threading
+import zipfile
+
+try:
+    import fitz  # PyMuPDF
+    FITZ_AVAILABLE = True
+except ImportError:
+    FITZ_AVAILABLE = False
+    print("Warning: PyMuPDF (fitz) not available. PDF parsing will be limited.")
+try:
+    from PyPDF2 import PdfReader
+    PYPDF2_AVAILABLE = True
+except ImportError:
+    PYPDF2_AVAILABLE = False
+    print("Warning: PyPDF2 not available. PDF parsing will be limited.")
+try:
+    from docx import Document
+    DOCX_AVAILABLE = True
+except ImportError:
+    DOCX_AVAILABLE = False
+    Document = None
+
+# Import config
+try:
+    from config import (
+        DOCUMENT_EXTRACTION_PROCESS_POOL_ENABLED, DOCUMENT_EXTRACTION_WORKERS,
+        DOCUMENT_EXTRACTION_MAX_TASKS_PER_CHILD, DOCUMENT_EXTRACTION_TIMEOUT_SECONDS,
+        DOCUMENT_EXTRACTION_MAX_CHARS, DOCUMENT_EXTRACTION_PAGES_PER_TASK
+    )
+except ImportError:
+    DOCUMENT_EXTRACTION_PROCESS_POOL_ENABLED = True
+    DOCUMENT_EXTRACTION_WORKERS = 2
+    DOCUMENT_EXTRACTION_MAX_TASKS_PER_CHILD = 50
+    DOCUMENT_EXTRACTION_TIMEOUT_SECONDS = 30
+    DOCUMENT_EXTRACTION_MAX_CHARS = 48000
+    DOCUMENT_EXTRACTION_PAGES_PER_TASK = 8
+
+PDF_METHOD_LABELS = {'pymupdf': 'PyMuPDF', 'pypdf2': 'PyPDF2'}
+
+# File bytes, or the path of a file on disk
+DocumentSource = Union[bytes, str]
+
+SNIFF_BYTES = 2048  # Leading bytes needed by sniff_document_type
+OLE_SIGNATURE = b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1'  # Legacy .doc (and other old Office files)
+
+
+def open_source(source: DocumentSource) -> BinaryIO:
+    """Binary file object for a source (the caller closes it)"""
+    return open(source, 'rb') if isinstance(source, str) else BytesIO(source)
+
+
+def read_source_head(source: DocumentSource, size: int) -> bytes:
+    """The first size bytes of a source"""
+    if isinstance(source, str):
+        with open(source, 'rb') as handle:
+            return handle.read(size)
+    return source[:size]
+
+
+def sniff_document_type(source: DocumentSource, head: Optional[bytes] = None) -> str:
+    """Document type from the file's magic bytes: 'pdf', 'docx', 'doc', 'text' or 'binary'"""
+    if head is None:
+        head = read_source_head(source, SNIFF_BYTES)
+    if b'%PDF-' in head[:1024]:
+        return 'pdf'
+    if head.startswith(b'PK\x03\x04'):
+        # .docx is a zip file with a word/ part
+        try:
+            with zipfile.ZipFile(open_source(source)) as archive:
+                if any(name.startswith('word/') for name in archive.namelist()):
+                    return 'docx'
+        except zipfile.BadZipFile:
+            pass
+        return 'binary'
+    if head.startswith(OLE_SIGNATURE):
+        return 'doc'
+    if b'\x00' not in head:
+        try:
+            # final=False: the head may end in the middle of a multi-byte character
+            codecs.getincrementaldecoder('utf-8')().decode(head, final=False)
+            return 'text'
+        except UnicodeDecodeError:
+            pass
+    return 'binary'
+
+
+class ExtractionTimeoutError(ValueError):
+    """A document took longer than DOCUMENT_EXTRACTION_TIMEOUT_SECONDS to parse"""
+
+
+def _collect_pages(page_texts, max_chars: Optional[int]) -> List[str]:
+    """Take page texts until max_chars characters are collected"""
+    pages = []
+    collected = 0
+    for page_text in page_texts:
+        pages.append(page_text or "")
+        collected += len(pages[-1])
+        if max_chars and collected >= max_chars:
+            break
+    return pages
+
+
+def _pymupdf_pages(source: DocumentSource, start: int, stop: Optional[int], max_chars: Optional[int]) -> Tuple[List[str], int]:
+    if not FITZ_AVAILABLE:
+        raise ImportError("PyMuPDF not available")
+    if isinstance(source, str):
+        pdf_document = fitz.open(source, filetype="pdf")
+    else:
+        pdf_document = fitz.open(stream=source, filetype="pdf")
+    try:
+        page_count = pdf_document.page_count
+        stop = page_count if stop is None else min(stop, page_count)
+        return _collect_pages((pdf_document.load_page(i).get_text() for i in range(start, stop)), max_chars), page_count
+    finally:
+        pdf_document.close()
+
+
+def _pypdf2_pages(source: DocumentSource, start: int, stop: Optional[int], max_chars: Optional[int]) -> Tuple[List[str], int]:
+    if not PYPDF2_AVAILABLE:
+        raise ImportError("PyPDF2 not available")
+    with open_source(source) as stream:
+        pdf_reader = PdfReader(stream)
+        page_count = len(pdf_reader.pages)
+        stop = page_count if stop is None else min(stop, page_count)
+        return _collect_pages((pdf_reader.pages[i].extract_text() for i in range(start, stop)), max_chars), page_count
+
+
+PDF_PAGE_EXTRACTORS = {'pymupdf': _pymupdf_pages, 'pypdf2': _pypdf2_pages}
+
+
+def extract_pdf_pages(method: str, pdf_content: DocumentSource, start: int = 0, stop: Optional[int] = None,
+                      max_chars: Optional[int] = DOCUMENT_EXTRACTION_MAX_CHARS) -> Tuple[List[str], int]:
+    """Text of pages start..stop (stops early at max_chars) and the PDF's page count"""
+    try:
+        return PDF_PAGE_EXTRACTORS[method](pdf_content, start, stop, max_chars)
+    except Exception as e:
+        raise ValueError(f"{PDF_METHOD_LABELS[method]} extraction error: {str(e)}")
+
+
+def join_pdf_pages(method: str, pages: List[str]) -> str:
+    text = "\n".join(pages)
+    if not text.strip():
+        raise ValueError(f"{PDF_METHOD_LABELS[method]} extraction error: No text extracted from PDF")
+    return text.strip()
+
+
+def extract_text_from_pdf_pymupdf(pdf_content: DocumentSource, max_chars: Optional[int] = DOCUMENT_EXTRACTION_MAX_CHARS) -> str:
+    """Extract text from PDF using PyMuPDF (fitz)"""
+    pages, _ = extract_pdf_pages('pymupdf', pdf_content, max_chars=max_chars)
+    return join_pdf_pages('pymupdf', pages)
+
+
+def extract_text_from_pdf_pypdf2(pdf_content: DocumentSource, max_chars: Optional[int] = DOCUMENT_EXTRACTION_MAX_CHARS) -> str:
+    """Extract text from PDF using PyPDF2"""
+    pages, _ = extract_pdf_pages('pypdf2', pdf_content, max_chars=max_chars)
+    return join_pdf_pages('pypdf2', pages)
+
+
+def extract_text_from_docx(doc_content: DocumentSource) -> str:
+    """Extract text from Word documents using python-docx"""
+    try:
+        if not DOCX_AVAILABLE:
+            raise ImportError("python-docx not available")
+        document = Document(doc_content if isinstance(doc_content, str) else BytesIO(doc_content))
+        text = "\n".join(paragraph.text for paragraph in document.paragraphs)
+        if not text.strip():
+            raise ValueError("No text extracted from DOCX")
+        return text
+    except Exception as e:
+        raise ValueError(f"DOCX extraction error: {str(e)}")
+
+
+def extract_plain_text(content: DocumentSource) -> str:
+    """Decode a plain text file (.txt etc.) as UTF-8"""
+    try:
+        if isinstance(content, str):
+            if not os.path.getsize(content):
+                raise ValueError("File contains no text")
+            # Decode straight from the memory-mapped file instead of reading it into a bytes copy first
+            with open(content, 'rb') as handle, mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                text = str(mapped, 'utf-8')
+        else:
+            text = content.decode('utf-8')
+    except UnicodeDecodeError:
+        raise ValueError("Not valid UTF-8 text")
+    if not text.strip():
+        raise ValueError("File contains no text")
+    return text
+
+
+# Extraction method (as in PDF_EXTRACTION_PRIORITY) -> local extractor
+LOCAL_EXTRACTORS: Dict[str, Callable[[DocumentSource], str]] = {
+    'pymupdf': extract_text_from_pdf_pymupdf,
+    'pypdf2': extract_text_from_pdf_pypdf2,
+    'docx': extract_text_from_docx,
+    'text': extract_plain_text
+}
+
+
+def run_local_extractor(method: str, content: DocumentSource) -> str:
+    """Run one local extractor and return its stripped text (executed inside pool workers)"""
+    return LOCAL_EXTRACTORS[method](content).strip()
+
+
+class ExtractionPool:
+    """Bounded process pool for the local extractors"""
+
+    def __init__(self, workers: int = DOCUMENT_EXTRACTION_WORKERS,
+                 max_tasks_per_child: int = DOCUMENT_EXTRACTION_MAX_TASKS_PER_CHILD,
+                 timeout_seconds: float = DOCUMENT_EXTRACTION_TIMEOUT_SECONDS,
+                 use_processes: bool = DOCUMENT_EXTRACTION_PROCESS_POOL_ENABLED):
+        self.workers = max(1, workers)
+        self.max_tasks_per_child = max_tasks_per_child
+        self.timeout_seconds = timeout_seconds
+        self.use_processes = use_processes
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+        self.stats = {'extractions': 0, 'timeouts': 0, 'recycled_pools': 0, 'pages': 0, 'early_stops': 0, 'parallel_documents': 0}
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                # max_tasks_per_child starts workers with 'spawn': they only import this module
+                self._pool = ProcessPoolExecutor(max_workers=self.workers, max_tasks_per_child=self.max_tasks_per_child)
+            return self._pool
+
+    def _discard_pool(self, pool: ProcessPoolExecutor):
+        """Replace a pool whose worker hangs or died; stuck workers are terminated"""
+        with self._lock:
+            if self._pool is not pool:
+                return
+            self._pool = None
+            self.stats['recycled_pools'] += 1
+        # The executor has no API to stop one busy worker, so terminate its processes directly
+        for process in list((getattr(pool, '_processes', None) or {}).values()):
+            process.terminate()
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    async def _submit(self, function: Callable, method: str, *args):
+        """Run one extraction task off the event loop; raises ExtractionTimeoutError after timeout_seconds"""
+        if not self.use_processes:
+            return await asyncio.wait_for(asyncio.to_thread(function, method, *args), self.timeout_seconds)
+        loop = asyncio.get_running_loop()
+        for attempt in range(2):
+            pool = self._get_pool()
+            try:
+                future = loop.run_in_executor(pool, function, method, *args)
+                return await asyncio.wait_for(future, self.timeout_seconds)
+            except asyncio.TimeoutError:
+                self.stats['timeouts'] += 1
+                self._discard_pool(pool)
+                raise ExtractionTimeoutError(f"{method} extraction timed out after {self.timeout_seconds}s")
+            except BrokenProcessPool:
+                # A worker crashed, or the pool was recycled for another document's timeout: retry once
+                self._discard_pool(pool)
+                if attempt:
+                    raise ValueError(f"{method} extraction failed: extraction worker crashed")
+
+    async def _run_pdf(self, method: str, content: DocumentSource, max_chars: Optional[int]) -> Tuple[str, int]:
+        """Extract a PDF in page ranges: the first range also returns the page count, the rest run
+        self.workers at a time until every page is read or max_chars are collected"""
+        pages_per_task = max(1, DOCUMENT_EXTRACTION_PAGES_PER_TASK)
+        pages, page_count = await self._submit(extract_pdf_pages, method, content, 0, pages_per_task, max_chars)
+        collected = sum(len(page) for page in pages)
+        next_page = pages_per_task
+        parallel = self.workers if self.use_processes else 1  # Threads would only contend for the GIL
+        if next_page < page_count and not (max_chars and collected >= max_chars):
+            self.stats['parallel_documents'] += 1
+        while next_page < page_count and not (max_chars and collected >= max_chars):
+            ranges = [(start, min(start + pages_per_task, page_count))
+                      for start in range(next_page, page_count, pages_per_task)][:parallel]
+            results = await asyncio.gather(*[
+                self._submit(extract_pdf_pages, method, content, start, stop, max_chars) for start, stop in ranges
+            ])
+            for range_pages, _ in results:
+                pages.extend(range_pages)
+                collected += sum(len(page) for page in range_pages)
+                if max_chars and collected >= max_chars:
+                    break  # Later ranges are not needed (and would leave a gap after an early stop)
+            next_page = ranges[-1][1]
+        self.stats['pages'] += len(pages)
+        if len(pages) < page_count:
+            self.stats['early_stops'] += 1
+        return join_pdf_pages(method, pages), len(pages)
+
+    async def extract(self, method: str, content: DocumentSource,
+                      max_chars: Optional[int] = DOCUMENT_EXTRACTION_MAX_CHARS) -> Tuple[str, Optional[int]]:
+        """Run a local extractor off the event loop: (text, PDF pages read or None)"""
+        self.stats['extractions'] += 1
+        if method in PDF_PAGE_EXTRACTORS:
+            return await self._run_pdf(method, content, max_chars)
+        return await self._submit(run_local_extractor, method, content), None
+
+    async def run(self, method: str, content: DocumentSource, max_chars: Optional[int] = DOCUMENT_EXTRACTION_MAX_CHARS) -> str:
+        """Run a local extractor off the event loop; raises ExtractionTimeoutError after timeout_seconds per task"""
+        text, _ = await self.extract(method, content, max_chars)
+        return text
+
+    def shutdown(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+
+# Global pool instance (singleton pattern)
+_pool_instance = None
+
+def get_extraction_pool() -> ExtractionPool:
+    """Get or create the global extraction pool"""
+    global _pool_instance
+    if _pool_instance is None:
+        _pool_instance = ExtractionPool()
+    return _pool_instance
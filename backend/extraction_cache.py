@@ -0,0 +1,127 @@
+"""
+Extraction Cache - Content-addressed store of extracted document text
+Entries are keyed by the SHA-256 of the file bytes and DOCUMENT_EXTRACTOR_VERSION and live in
+the application database, so a CV that is uploaded again (by another agency, for another vacancy,
+after a restart) skips parsing, Azure and AI extraction altogether.
+"""
+from datetime import datetime, timezone
+from typing import Dict, Optional, Any
+from uuid import uuid4
+import threading
+
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+
+# Import config
+try:
+    from config import EXTRACTION_CACHE_ENABLED, DOCUMENT_EXTRACTOR_VERSION
+except ImportError:
+    EXTRACTION_CACHE_ENABLED = True
+    DOCUMENT_EXTRACTOR_VERSION = "1"
+
+
+class ExtractionCache:
+    """Extraction results in the application database, with hit/miss counters for this process"""
+
+    def __init__(self, session_factory, model, extractor_version: str = DOCUMENT_EXTRACTOR_VERSION,
+                 enabled: bool = EXTRACTION_CACHE_ENABLED):
+        self.session_factory = session_factory
+        self.model = model
+        self.extractor_version = extractor_version
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+
+    def _count(self, counter: str):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def get(self, file_hash: str) -> Optional[Dict[str, Any]]:
+        """Cached extraction result (same dict as extract_document_async) or None"""
+        if not self.enabled:
+            return None
+        db = self.session_factory()
+        try:
+            entry = db.query(self.model).filter(
+                self.model.content_hash == file_hash,
+                self.model.extractor_version == self.extractor_version
+            ).first()
+            if entry is None:
+                self._count('misses')
+                return None
+            entry.hit_count = (entry.hit_count or 0) + 1
+            entry.last_used_at = datetime.now(timezone.utc)
+            result = {"text": entry.text, "extraction_method": entry.extraction_method, "azure_used": bool(entry.azure_used)}
+            db.commit()
+            self._count('hits')
+            return result
+        except Exception as e:
+            # A cache failure must never fail an upload; fall back to extracting
+            print(f"Extraction cache lookup failed: {str(e)}")
+            db.rollback()
+            self._count('errors')
+            return None
+        finally:
+            db.close()
+
+    def put(self, file_hash: str, file_size: int, result: Dict[str, Any]):
+        """Store a successful extraction result"""
+        if not self.enabled:
+            return
+        db = self.session_factory()
+        try:
+            db.add(self.model(
+                id=str(uuid4()),
+                content_hash=file_hash,
+                extractor_version=self.extractor_version,
+                file_size=file_size,
+                text=result["text"],
+                extraction_method=result["extraction_method"],
+                azure_used=bool(result.get("azure_used", False)),
+                hit_count=0
+            ))
+            db.commit()
+            self._count('stores')
+        except IntegrityError:
+            # The same file was extracted concurrently and stored first
+            db.rollback()
+        except Exception as e:
+            print(f"Extraction cache store failed: {str(e)}")
+            db.rollback()
+            self._count('errors')
+        finally:
+            db.close()
+
+    def clear(self) -> int:
+        """Delete all cached extractions; returns the number removed"""
+        db = self.session_factory()
+        try:
+            removed = db.query(self.model).delete(synchronize_session=False)
+            db.commit()
+            return removed
+        finally:
+            db.close()
+
+    def get_stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        db = self.session_factory()
+        try:
+            entries, total_hits = db.query(func.count(self.model.id), func.coalesce(func.sum(self.model.hit_count), 0)).filter(
+                self.model.extractor_version == self.extractor_version
+            ).one()
+        finally:
+            db.close()
+        return {
+            'enabled': self.enabled,
+            'extractor_version': self.extractor_version,
+            'hits': self.hits,
+            'misses': self.misses,
+            'stores': self.stores,
+            'errors': self.errors,
+            'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0,
+            'entries': entries,
+            'total_hits': int(total_hits)  # Across all processes and restarts
+        }
@@ -0,0 +1,193 @@
+"""
+Extraction Strategy - Chooses which extractor's text to use for an uploaded document
+Cheap local extractors run first and their output is scored; Azure / AI extraction only run when
+no local result is good enough, concurrently and with a deadline. Latency and quality are recorded
+per extractor so PDF_EXTRACTION_PRIORITY can be tuned from data (GET /extraction-stats).
+"""
+from typing import Awaitable, Callable, Dict, List, Optional, Any, Tuple
+import asyncio
+import re
+import time
+import unicodedata
+
+# Import config
+try:
+    from config import (
+        EXTRACTION_QUALITY_THRESHOLD, EXTRACTION_MIN_CHARS_PER_PAGE, EXTRACTION_MAX_GARBAGE_RATIO,
+        EXTRACTION_REMOTE_DEADLINE_SECONDS
+    )
+except ImportError:
+    EXTRACTION_QUALITY_THRESHOLD = 0.6
+    EXTRACTION_MIN_CHARS_PER_PAGE = 200
+    EXTRACTION_MAX_GARBAGE_RATIO = 0.2
+    EXTRACTION_REMOTE_DEADLINE_SECONDS = 45
+
+# Unassigned, private use (unmapped font glyphs), surrogates and non-whitespace control characters
+GARBAGE_CATEGORIES = {'Cn', 'Co', 'Cs', 'Cc'}
+PDF_OBJECT_PATTERN = re.compile(r'\d+ 0 obj\b')
+
+# extractor(method) -> (text, PDF pages read or None)
+Extractor = Callable[[str], Awaitable[Tuple[str, Optional[int]]]]
+
+
+def garbage_ratio(text: str) -> float:
+    """Share of characters that are not readable text"""
+    if not text:
+        return 0.0
+    garbage = sum(
+        1 for char in text
+        if char == '\ufffd' or (unicodedata.category(char) in GARBAGE_CATEGORIES and not char.isspace())
+    )
+    return garbage / len(text)
+
+
+def looks_like_pdf_bytes(text: str) -> bool:
+    """Raw PDF source instead of its text (an extractor decoded the file as text)"""
+    return text.lstrip().startswith('%PDF') or len(PDF_OBJECT_PATTERN.findall(text[:20000])) >= 3
+
+
+def score_extraction_quality(text: str, page_count: Optional[int] = None,
+                             min_chars_per_page: int = EXTRACTION_MIN_CHARS_PER_PAGE,
+                             max_garbage_ratio: float = EXTRACTION_MAX_GARBAGE_RATIO) -> Dict[str, Any]:
+    """Quality of extracted text from 0 (unusable) to 1; page_count enables the chars-per-page check"""
+    chars = len(text.strip())
+    chars_per_page = chars / page_count if page_count else None
+    ratio = garbage_ratio(text)
+    raw_pdf = looks_like_pdf_bytes(text)
+
+    if not chars or raw_pdf:
+        score = 0.0
+    else:
+        density = min(1.0, chars_per_page / min_chars_per_page) if chars_per_page is not None else 1.0
+        cleanliness = max(0.0, 1.0 - ratio / max_garbage_ratio) if max_garbage_ratio else 1.0
+        score = density * cleanliness
+    return {
+        'score': round(score, 3),
+        'chars': chars,
+        'chars_per_page': round(chars_per_page, 1) if chars_per_page is not None else None,
+        'garbage_ratio': round(ratio, 4),
+        'looks_like_pdf': raw_pdf
+    }
+
+
+class ExtractionStrategy:
+    """Runs the extractors of an extraction plan and picks the text to use"""
+
+    def __init__(self, quality_threshold: float = EXTRACTION_QUALITY_THRESHOLD,
+                 remote_deadline_seconds: float = EXTRACTION_REMOTE_DEADLINE_SECONDS):
+        self.quality_threshold = quality_threshold
+        self.remote_deadline_seconds = remote_deadline_seconds
+        self._stats: Dict[str, Dict[str, float]] = {}
+
+    def _method_stats(self, method: str) -> Dict[str, float]:
+        return self._stats.setdefault(method, {
+            'attempts': 0, 'successes': 0, 'failures': 0, 'abandoned': 0, 'selected': 0,
+            'total_seconds': 0.0, 'quality_sum': 0.0
+        })
+
+    async def _attempt(self, method: str, extractor: Extractor) -> Optional[Dict[str, Any]]:
+        stats = self._method_stats(method)
+        stats['attempts'] += 1
+        started = time.monotonic()
+        try:
+            text, page_count = await extractor(method)
+        except Exception as e:
+            stats['failures'] += 1
+            stats['total_seconds'] += time.monotonic() - started
+            print(f"{method} failed: {str(e)}")
+            return None
+        quality = score_extraction_quality(text, page_count)
+        stats['successes'] += 1
+        stats['total_seconds'] += time.monotonic() - started
+        stats['quality_sum'] += quality['score']
+        print(f"{method}: {quality['chars']} characters, quality {quality['score']}")
+        return {'method': method, 'text': text, 'quality': quality}
+
+    def _accepts(self, candidate: Optional[Dict[str, Any]]) -> bool:
+        return candidate is not None and candidate['quality']['score'] >= self.quality_threshold
+
+    def _select(self, candidate: Dict[str, Any]) -> Dict[str, Any]:
+        self._method_stats(candidate['method'])['selected'] += 1
+        return candidate
+
+    async def _race_remote(self, methods: List[str], extractor: Extractor,
+                           candidates: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """Run remote extractors concurrently; first acceptable result wins, the rest is abandoned at the deadline"""
+        tasks = {asyncio.ensure_future(self._attempt(method, extractor)): method for method in methods}
+        pending = set(tasks)
+        deadline = time.monotonic() + self.remote_deadline_seconds
+        try:
+            while pending:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                done, pending = await asyncio.wait(pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+                # Several may finish together: prefer plan order
+                for task in sorted(done, key=lambda finished: methods.index(tasks[finished])):
+                    candidate = task.result()
+                    if candidate:
+                        candidates.append(candidate)
+                        if self._accepts(candidate):
+                            return candidate
+            return None
+        finally:
+            for task in pending:
+                # Stops waiting; a remote call already running in a thread still finishes in the background
+                self._method_stats(tasks[task])['abandoned'] += 1
+                task.cancel()
+
+    async def extract(self, plan: List[str], local_methods, run_local: Extractor,
+                      run_remote: Extractor) -> Optional[Dict[str, Any]]:
+        """Best extraction for a plan: {'method', 'text', 'quality'}, or None if every extractor failed"""
+        candidates: List[Dict[str, Any]] = []
+        for method in [method for method in plan if method in local_methods]:
+            candidate = await self._attempt(method, run_local)
+            if self._accepts(candidate):
+                return self._select(candidate)
+            if candidate:
+                candidates.append(candidate)
+
+        remote_methods = [method for method in plan if method not in local_methods]
+        if remote_methods:
+            if candidates:
+                print(f"Local extraction quality below {self.quality_threshold}, escalating to {', '.join(remote_methods)}")
+            winner = await self._race_remote(remote_methods, run_remote, candidates)
+            if winner:
+                return self._select(winner)
+
+        # Nothing reached the threshold: use the best usable text (e.g. a sparse scanned CV)
+        usable = [candidate for candidate in candidates if candidate['quality']['score'] > 0]
+        if not usable:
+            return None
+        return self._select(max(usable, key=lambda candidate: candidate['quality']['score']))
+
+    def get_stats(self) -> Dict[str, Any]:
+        extractors = {}
+        for method, stats in self._stats.items():
+            finished = stats['successes'] + stats['failures']
+            extractors[method] = {
+                'attempts': stats['attempts'],
+                'successes': stats['successes'],
+                'failures': stats['failures'],
+                'abandoned': stats['abandoned'],
+                'selected': stats['selected'],
+                'success_rate': round(stats['successes'] / finished, 3) if finished else 0.0,
+                'avg_latency_seconds': round(stats['total_seconds'] / finished, 3) if finished else 0.0,
+                'avg_quality': round(stats['quality_sum'] / stats['successes'], 3) if stats['successes'] else None
+            }
+        return {
+            'quality_threshold': self.quality_threshold,
+            'remote_deadline_seconds': self.remote_deadline_seconds,
+            'extractors': extractors
+        }
+
+
+# Global strategy instance (singleton pattern)
+_strategy_instance = None
+
+def get_extraction_strategy() -> ExtractionStrategy:
+    """Get or create the global extraction strategy"""
+    global _strategy_instance
+    if _strategy_instance is None:
+        _strategy_instance = ExtractionStrategy()
+    return _strategy_instance
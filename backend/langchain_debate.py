@@ -5,18 +5,37 @@ Structured turn-based debate with JSON output format
 
 from langchain_openai import ChatOpenAI
 from langchain_core.prompts import ChatPromptTemplate
-from typing import Dict, List, Optional, Tuple, Any
+from typing import AsyncIterator, Callable, Dict, List, Optional, Tuple, Any
 import os
 import json
 import asyncio
+import contextvars
 import time
+import httpx
+
+from llm_client import get_async_http_client, get_sync_http_client
+from llm_governor import get_governor, estimate_request_tokens
+from llm_resilience import get_resilience
+from token_budget import count_tokens
+from debate_planner import DebatePlanner
+from debate_checkpoints import DebateCheckpoints
 
 # Import config
 try:
-    from config import OPENAI_MODEL_DEBATE, OPENAI_TEMPERATURE_DEBATE
+    from config import OPENAI_MODEL_DEBATE, OPENAI_TEMPERATURE_DEBATE, OPENAI_MAX_TOKENS_DEBATE
 except ImportError:
     OPENAI_MODEL_DEBATE = "gpt-4o-mini"
     OPENAI_TEMPERATURE_DEBATE = 0.8
+    OPENAI_MAX_TOKENS_DEBATE = 1500
+
+try:
+    from config import (
+        DEBATE_CONTEXT_SUMMARY_ENABLED, DEBATE_CONTEXT_SUMMARY_THRESHOLD_TOKENS, DEBATE_CONTEXT_SUMMARY_MAX_SENTENCES
+    )
+except ImportError:
+    DEBATE_CONTEXT_SUMMARY_ENABLED = True
+    DEBATE_CONTEXT_SUMMARY_THRESHOLD_TOKENS = 800
+    DEBATE_CONTEXT_SUMMARY_MAX_SENTENCES = 6
 
 
 def create_persona_prompt_template(persona_name: str, persona_prompt: str, candidate_info: str, job_info: str, company_note: Optional[str] = None) -> ChatPromptTemplate:
@@ -138,26 +157,249 @@ Geef een korte, directe begeleiding of vraag (1-2 zinnen) die de discussie vooru
     ])
 
 
+class ChatModelRegistry:
+    """ChatOpenAI instances per (model, temperature), built once and reused by every debate turn.
+
+    All instances send their requests through the process-wide pooled HTTP clients from
+    llm_client, so debate turns reuse warm connections instead of opening new ones. llm_client
+    owns those clients: when it rebuilds the async one for a new event loop (and closes the old
+    one), the registry starts over with instances bound to the new client.
+    """
+    
+    def __init__(self):
+        self._models: Dict[Tuple[str, float], ChatOpenAI] = {}
+        self._http_async_client: Optional[httpx.AsyncClient] = None
+    
+    def get(self, model: str, temperature: float) -> ChatOpenAI:
+        http_async_client = get_async_http_client()
+        if http_async_client is not self._http_async_client:
+            self._models.clear()
+            self._http_async_client = http_async_client
+        key = (model, temperature)
+        if key not in self._models:
+            self._models[key] = ChatOpenAI(
+                model=model,
+                temperature=temperature,
+                max_retries=0,  # Retries are handled by llm_resilience
+                model_kwargs={"response_format": {"type": "text"}},
+                http_client=get_sync_http_client(),
+                http_async_client=http_async_client
+            )
+        return self._models[key]
+    
+    def size(self) -> int:
+        return len(self._models)
+
+
+# Global registry instance (singleton pattern)
+_registry_instance = None
+
+def get_chat_model_registry() -> ChatModelRegistry:
+    """Get or create global ChatOpenAI registry"""
+    global _registry_instance
+    if _registry_instance is None:
+        _registry_instance = ChatModelRegistry()
+    return _registry_instance
+
+
 def create_persona_llm() -> ChatOpenAI:
-    """Create a LangChain LLM instance for personas"""
-    return ChatOpenAI(
-        model=OPENAI_MODEL_DEBATE,
-        temperature=OPENAI_TEMPERATURE_DEBATE,
-        model_kwargs={"response_format": {"type": "text"}}
-    )
+    """Get the shared LangChain LLM instance for personas"""
+    return get_chat_model_registry().get(OPENAI_MODEL_DEBATE, OPENAI_TEMPERATURE_DEBATE)
 
 
 def create_orchestrator_llm() -> ChatOpenAI:
-    """Create a LangChain LLM instance for orchestrator"""
-    return ChatOpenAI(
-        model=OPENAI_MODEL_DEBATE,
-        temperature=OPENAI_TEMPERATURE_DEBATE,
-        model_kwargs={"response_format": {"type": "text"}}
+    """Get the shared LangChain LLM instance for orchestrator"""
+    return get_chat_model_registry().get(OPENAI_MODEL_DEBATE, OPENAI_TEMPERATURE_DEBATE)
+
+
+# Moderator steps before persona rounds 2 and 3 keep their established names in timing_data
+MODERATOR_STEP_NAMES = {2: 'moderator_guidance', 3: 'moderator_deepening'}
+CONTENTIOUS_ROUND_STATUS = "Extra ronde: de experts zijn het nog niet eens. Benoem het belangrijkste meningsverschil tussen de digitale werknemers en vraag gericht naar de argumenten of feiten die het beslechten, zodat een eindbeslissing mogelijk wordt (afwijzen, geschikt, of verdere evaluatie)."
+
+# Receives each streamed content delta; None means "discard the deltas so far" (the turn is being retried)
+TokenCallback = Callable[[Optional[str]], None]
+# Receives (event, data) pairs from a running debate
+DebateEventCallback = Callable[[str, Dict[str, Any]], None]
+
+# Planner of the debate running in the current task; LLM calls report their token usage to it
+_active_planner: contextvars.ContextVar[Optional[DebatePlanner]] = contextvars.ContextVar('active_debate_planner', default=None)
+
+
+async def invoke_chain_governed(prompt_template: ChatPromptTemplate, llm: ChatOpenAI, inputs: Dict[str, Any],
+                                on_token: Optional[TokenCallback] = None):
+    """Invoke prompt | llm behind the process-wide OpenAI rate limiter and retry/hedging layer.
+
+    With on_token the turn is streamed (ChatOpenAI.astream) and every content delta is passed on;
+    the return value is the same complete message either way.
+    """
+    prompt_messages = prompt_template.format_messages(**inputs)
+    messages = [{'content': str(m.content)} for m in prompt_messages]
+    estimated_tokens = estimate_request_tokens(messages, OPENAI_MAX_TOKENS_DEBATE, llm.model_name)
+    attempts = 0
+    
+    async def attempt(ticket):
+        nonlocal attempts
+        attempts += 1
+        if on_token is None:
+            attempt_result = await llm.ainvoke(prompt_messages)
+        else:
+            if attempts > 1:
+                on_token(None)
+            attempt_result = None
+            async for chunk in llm.astream(prompt_messages):
+                attempt_result = chunk if attempt_result is None else attempt_result + chunk
+                if chunk.content:
+                    on_token(chunk.content)
+        usage = getattr(attempt_result, 'usage_metadata', None) or {}
+        ticket.record_usage(usage.get('total_tokens'))
+        return attempt_result
+    
+    # Retries transient errors and hedges slow turns so one stuck call doesn't stall the debate.
+    # Streamed turns are not hedged: two racing attempts would interleave their deltas.
+    # Each request is admitted by the rate governor first; hedging is timed from admission.
+    result = await get_resilience().call_async(
+        llm.model_name, attempt, hedge=on_token is None,
+        admit=lambda: get_governor().acquire_async(llm.model_name, estimated_tokens)
     )
+    
+    planner = _active_planner.get()
+    if planner is not None:
+        usage = getattr(result, 'usage_metadata', None) or {}
+        planner.record_tokens(usage.get('total_tokens') or (
+            estimate_request_tokens(messages, 0, llm.model_name) + count_tokens(str(result.content), llm.model_name)
+        ))
+    return result
+
+
+# Words that show company note details (salary, availability) have come up in the debate
+COMPANY_NOTE_KEYWORDS = ['salaris', 'beschikbaar', '€', 'euro', 'maand', 'week', 'opzegtermijn', 'bedrijfsnotitie', 'salarisindicatie']
+
+
+class DebateTranscript:
+    """The debate transcript as personas read it, kept up to date incrementally.
+
+    Every message is formatted and token-counted once, when it is added. Once the unsummarized
+    messages pass DEBATE_CONTEXT_SUMMARY_THRESHOLD_TOKENS, the rounds before the latest moderator
+    message can be replaced by a rolling summary from the moderator (apply_summary). The shared
+    'HUIDIG DEBAT' prefix is built once and extended as messages arrive; every persona turn adds
+    its own instructions to it.
+    """
+    
+    def __init__(self, company_note: Optional[str] = None):
+        self.company_note = company_note
+        self.messages: List[str] = []  # Formatted "Role: content" per conversation entry
+        self.message_tokens: List[int] = []
+        self.roles: List[str] = []
+        self.summary: Optional[str] = None
+        self.summarized_upto = 0  # Messages before this index are covered by the summary
+        self.summary_count = 0
+        self.company_note_mentioned = False
+        self._prefix: Optional[str] = None
+    
+    def sync(self, conversation: List[Dict[str, str]]):
+        """Add the conversation entries that are not in the transcript yet"""
+        for entry in conversation[len(self.messages):]:
+            role = entry.get('role', 'Unknown')
+            content = entry.get('content', '').strip()
+            formatted = f"{role}: {content}\n\n" if content else ""
+            self.messages.append(formatted)
+            self.message_tokens.append(count_tokens(formatted, OPENAI_MODEL_DEBATE))
+            self.roles.append(role)
+            if self.company_note and not self.company_note_mentioned:
+                content_lower = content.lower()
+                self.company_note_mentioned = any(keyword in content_lower for keyword in COMPANY_NOTE_KEYWORDS)
+            if self._prefix is not None:
+                self._prefix += formatted
+    
+    def prefix(self) -> str:
+        """'HUIDIG DEBAT' block: rolling summary (if any) followed by the unsummarized messages"""
+        if self._prefix is None:
+            parts = ["HUIDIG DEBAT:\n\n"]
+            if self.summary:
+                parts.append(f"SAMENVATTING EERDERE RONDES (moderator):\n{self.summary}\n\n")
+            parts.extend(self.messages[self.summarized_upto:])
+            self._prefix = ''.join(parts)
+        return self._prefix
+    
+    def unsummarized_tokens(self) -> int:
+        return sum(self.message_tokens[self.summarized_upto:])
+    
+    def context_tokens(self) -> int:
+        return count_tokens(self.prefix(), OPENAI_MODEL_DEBATE)
+    
+    def summary_cutoff(self) -> Optional[int]:
+        """Index of the latest moderator message: everything before it can be summarized"""
+        if self.unsummarized_tokens() <= DEBATE_CONTEXT_SUMMARY_THRESHOLD_TOKENS:
+            return None
+        for index in range(len(self.roles) - 1, self.summarized_upto, -1):
+            if self.roles[index] == 'Moderator':
+                return index
+        return None
+    
+    def pending_summary_text(self, upto: int) -> str:
+        """Messages between the current summary and upto, for the moderator to summarize"""
+        return ''.join(self.messages[self.summarized_upto:upto]).strip()
+    
+    def apply_summary(self, summary: str, upto: int):
+        """Replace the messages before upto by the moderator's rolling summary"""
+        self.summary = summary
+        self.summarized_upto = upto
+        self.summary_count += 1
+        self._prefix = None
+    
+    def stats(self) -> Dict[str, Any]:
+        """Context size figures for timing_data"""
+        return {
+            'summaries': self.summary_count,
+            'summarized_messages': self.summarized_upto,
+            'context_tokens': self.context_tokens(),
+            'summary_threshold_tokens': DEBATE_CONTEXT_SUMMARY_THRESHOLD_TOKENS
+        }
+
+
+ROLLING_SUMMARY_TEMPLATE = ChatPromptTemplate.from_messages([
+    ("system", """Je bent de moderator van een debat tussen digitale werknemers ({persona_names}) over een kandidaat.
+
+Vat de eerdere rondes van het debat samen zodat de experts verder kunnen zonder het volledige verslag te lezen.
+- Maximaal {max_sentences} zinnen, zakelijk en informatiedicht
+- Per expert het standpunt en de belangrijkste argumenten (noem ze bij naam)
+- Waar de experts het over eens zijn en welke meningsverschillen of vragen nog open staan
+- Vermeld of bedrijfsnotitie-informatie (salaris, beschikbaarheid) al besproken is
+- Geen nieuwe eigen beoordeling toevoegen"""),
+    ("human", """EERDERE SAMENVATTING:
+{previous_summary}
+
+NIEUWE BERICHTEN:
+{messages}
+
+Geef de bijgewerkte samenvatting.""")
+])
+
+
+async def invoke_rolling_summary(persona_names: List[str], transcript: DebateTranscript, upto: int) -> Optional[str]:
+    """Moderator-written summary of the transcript up to upto (extends the previous summary); None on failure"""
+    try:
+        result = await invoke_chain_governed(ROLLING_SUMMARY_TEMPLATE, create_orchestrator_llm(), {
+            "persona_names": ', '.join(persona_names),
+            "max_sentences": DEBATE_CONTEXT_SUMMARY_MAX_SENTENCES,
+            "previous_summary": transcript.summary or "(nog geen)",
+            "messages": transcript.pending_summary_text(upto)
+        })
+    except Exception as e:
+        # Personas keep reading the full transcript
+        print(f"Error creating rolling debate summary: {str(e)}")
+        return None
+    summary = (result.content if hasattr(result, 'content') else str(result)).strip()
+    return summary or None
+
 
+def format_conversation_context(conversation: List[Dict[str, str]], persona_name: str, company_note: Optional[str] = None,
+                                transcript: Optional[DebateTranscript] = None) -> str:
+    """Format the conversation context for a persona to read
 
-def format_conversation_context(conversation: List[Dict[str, str]], persona_name: str, company_note: Optional[str] = None) -> str:
-    """Format the conversation context for a persona to read"""
+    Pass the debate's DebateTranscript to reuse its formatted messages and rolling summary;
+    without one the full conversation is formatted.
+    """
     if not conversation:
         # First turn - moderator has opened, personas should share their perspective
         return f"""De moderator heeft het debat geopend. Jouw beurt ({persona_name}).
@@ -169,19 +411,14 @@ De evaluatie is al gedaan. Spring direct in op specifieke aspecten vanuit jouw p
 
 Houd het kort (1-2 zinnen) en zakelijk. Geen herhaling van evaluatie-resultaten - focus op discussie."""
     
-    formatted = "HUIDIG DEBAT:\n\n"
-    for entry in conversation:
-        role = entry.get('role', 'Unknown')
-        content = entry.get('content', '').strip()
-        if content:
-            formatted += f"{role}: {content}\n\n"
+    if transcript is None:
+        transcript = DebateTranscript(company_note)
+    transcript.sync(conversation)
+    
+    formatted = transcript.prefix()
     
     # Detect if company note topics have been discussed
-    company_note_mentioned = False
-    if company_note:
-        note_keywords = ['salaris', 'beschikbaar', '€', 'euro', 'maand', 'week', 'opzegtermijn', 'bedrijfsnotitie', 'salarisindicatie']
-        conversation_text = ' '.join([entry.get('content', '').lower() for entry in conversation])
-        company_note_mentioned = any(keyword in conversation_text for keyword in note_keywords)
+    company_note_mentioned = bool(company_note) and transcript.company_note_mentioned
     
     # Get recent messages from other personas (not just moderator)
     recent_persona_messages = []
@@ -288,26 +525,32 @@ async def invoke_persona(
     candidate_info: str,
     job_info: str,
     conversation: List[Dict[str, str]],
-    company_note: Optional[str] = None
+    company_note: Optional[str] = None,
+    on_token: Optional[TokenCallback] = None,
+    prompt_template: Optional[ChatPromptTemplate] = None,
+    transcript: Optional[DebateTranscript] = None,
+    raise_errors: bool = False
 ) -> Dict[str, str]:
     """Invoke a persona to generate a natural conversational response"""
     
-    prompt_template = create_persona_prompt_template(
-        persona_name, persona_prompt, candidate_info, job_info, company_note
-    )
+    if prompt_template is None:
+        prompt_template = create_persona_prompt_template(
+            persona_name, persona_prompt, candidate_info, job_info, company_note
+        )
     llm = create_persona_llm()
     
     # Format conversation context for this persona
-    conversation_context = format_conversation_context(conversation, persona_name, company_note)
+    conversation_context = format_conversation_context(conversation, persona_name, company_note, transcript)
     
     # Invoke LLM with error handling
     try:
-        chain = prompt_template | llm
-        result = await chain.ainvoke({"conversation_context": conversation_context})
+        result = await invoke_chain_governed(prompt_template, llm, {"conversation_context": conversation_context}, on_token)
     except Exception as e:
         print(f"Error invoking persona {persona_name}: {str(e)}")
         import traceback
         traceback.print_exc()
+        if raise_errors:
+            raise  # Checkpointed debates fail the step so it can be re-run
         # Return a fallback message
         return {
             'speaker': persona_name,
@@ -385,26 +628,32 @@ async def invoke_orchestrator(
     candidate_info: str,
     job_info: str,
     conversation: List[Dict[str, str]],
-    company_note: Optional[str] = None
+    company_note: Optional[str] = None,
+    on_token: Optional[TokenCallback] = None,
+    prompt_template: Optional[ChatPromptTemplate] = None,
+    status_override: Optional[str] = None,
+    raise_errors: bool = False
 ) -> Dict[str, str]:
     """Invoke orchestrator to guide the conversation"""
     
-    prompt_template = create_orchestrator_prompt_template(
-        persona_names, candidate_info, job_info, company_note, is_summary=False
-    )
+    if prompt_template is None:
+        prompt_template = create_orchestrator_prompt_template(
+            persona_names, candidate_info, job_info, company_note, is_summary=False
+        )
     llm = create_orchestrator_llm()
     
     # Get conversation status
-    conversation_status = get_conversation_status(conversation, persona_names)
+    conversation_status = status_override or get_conversation_status(conversation, persona_names)
     
     # Invoke LLM with error handling
     try:
-        chain = prompt_template | llm
-        result = await chain.ainvoke({"conversation_status": conversation_status})
+        result = await invoke_chain_governed(prompt_template, llm, {"conversation_status": conversation_status}, on_token)
     except Exception as e:
         print(f"Error invoking orchestrator: {str(e)}")
         import traceback
         traceback.print_exc()
+        if raise_errors:
+            raise  # Checkpointed debates fail the step so it can be re-run
         # Return a fallback message
         return {
             'speaker': 'Moderator',
@@ -426,13 +675,17 @@ async def invoke_orchestrator_summary(
     candidate_info: str,
     job_info: str,
     conversation: List[Dict[str, str]],
-    company_note: Optional[str] = None
+    company_note: Optional[str] = None,
+    on_token: Optional[TokenCallback] = None,
+    prompt_template: Optional[ChatPromptTemplate] = None,
+    raise_errors: bool = False
 ) -> Dict[str, str]:
     """Invoke orchestrator to provide a final summary of the conversation"""
     
-    prompt_template = create_orchestrator_prompt_template(
-        persona_names, candidate_info, job_info, company_note, is_summary=True
-    )
+    if prompt_template is None:
+        prompt_template = create_orchestrator_prompt_template(
+            persona_names, candidate_info, job_info, company_note, is_summary=True
+        )
     llm = create_orchestrator_llm()
     
     # Get conversation status for context
@@ -440,12 +693,13 @@ async def invoke_orchestrator_summary(
     
     # Invoke LLM with error handling
     try:
-        chain = prompt_template | llm
-        result = await chain.ainvoke({"conversation_status": conversation_status})
+        result = await invoke_chain_governed(prompt_template, llm, {"conversation_status": conversation_status}, on_token)
     except Exception as e:
         print(f"Error invoking orchestrator summary: {str(e)}")
         import traceback
         traceback.print_exc()
+        if raise_errors:
+            raise  # Checkpointed debates fail the step so it can be re-run
         # Return a fallback message
         return {
             'speaker': 'Moderator',
@@ -467,7 +721,9 @@ async def run_multi_agent_debate(
     candidate_info: str,
     job_info: str,
     company_note: Optional[str] = None,
-    track_timing: bool = True
+    track_timing: bool = True,
+    checkpoints: Optional[DebateCheckpoints] = None,
+    on_event: Optional[DebateEventCallback] = None
 ) -> Tuple[str, Dict[str, Any]]:
     """
     Run a structured turn-based debate and return JSON format with timing data
@@ -478,10 +734,78 @@ async def run_multi_agent_debate(
         job_info: Job posting details
         company_note: Optional company guidance
         track_timing: Whether to track timing for each step
+        checkpoints: Debate session to persist completed steps in; steps it already has are
+            replayed instead of run again. A failing LLM call then fails the debate (so the
+            step can be re-run) instead of ending up as an error message in the transcript.
+        on_event: Called with the same (event, data) pairs stream_multi_agent_debate yields
+            (without token events), e.g. to report progress
     
     Returns:
         Tuple of (JSON string array, timing data dict)
     """
+    return await _run_debate(persona_prompts, candidate_info, job_info, company_note, track_timing,
+                             emit=on_event, checkpoints=checkpoints)
+
+
+async def stream_multi_agent_debate(
+    persona_prompts: Dict[str, str],
+    candidate_info: str,
+    job_info: str,
+    company_note: Optional[str] = None,
+    track_timing: bool = True,
+    stream_tokens: bool = False,
+    checkpoints: Optional[DebateCheckpoints] = None
+) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+    """
+    Async-generator form of run_multi_agent_debate: yields (event, data) while the debate runs
+    
+    Events:
+        step_start:    {'step', 'agents'[, 'reason']} before each moderator turn or persona round
+        token:         {'step', 'role', 'delta'} content deltas (only with stream_tokens)
+        token_reset:   {'step', 'role'} a turn is retried; drop its deltas so far
+        message:       {'step', 'role', 'content'[, 'restored']} each finished message, as soon as it is ready
+        step_complete: {'step', 'duration'[, 'restored']} ('restored': replayed from a checkpoint)
+        context_summary: {'step', 'summary', 'summarized_messages'} older rounds were compressed for the personas
+        plan:          {'after_round', 'agreement', 'continue', 'reason', ...} planner decision after each persona round
+        complete:      {'debate', 'timing_data'} the same values run_multi_agent_debate returns
+    
+    Persona messages of a round arrive in completion order; the transcript in 'complete'
+    keeps the usual order. Stopping the generator cancels the debate.
+    """
+    queue: asyncio.Queue = asyncio.Queue()
+    
+    def emit(event: str, data: Dict[str, Any]):
+        queue.put_nowait((event, data))
+    
+    debate_task = asyncio.ensure_future(_run_debate(
+        persona_prompts, candidate_info, job_info, company_note, track_timing,
+        emit=emit, stream_tokens=stream_tokens, checkpoints=checkpoints
+    ))
+    debate_task.add_done_callback(lambda _: queue.put_nowait(None))
+    try:
+        while True:
+            item = await queue.get()
+            if item is None:
+                break
+            yield item
+        json_output, timing_data = debate_task.result()  # Re-raises if the debate failed
+        yield 'complete', {'debate': json_output, 'timing_data': timing_data}
+    finally:
+        debate_task.cancel()
+
+
+async def _run_debate(
+    persona_prompts: Dict[str, str],
+    candidate_info: str,
+    job_info: str,
+    company_note: Optional[str] = None,
+    track_timing: bool = True,
+    emit: Optional[DebateEventCallback] = None,
+    stream_tokens: bool = False,
+    planner: Optional[DebatePlanner] = None,
+    checkpoints: Optional[DebateCheckpoints] = None
+) -> Tuple[str, Dict[str, Any]]:
+    """Debate flow shared by run_multi_agent_debate and stream_multi_agent_debate"""
     
     openai_api_key = os.getenv("OPENAI_API_KEY")
     if not openai_api_key:
@@ -502,137 +826,261 @@ async def run_multi_agent_debate(
         'total': 0
     }
     
-    # IMPROVED conversation flow: Interactive discussion with moderator guiding
-    # Flow: Moderator → Personas (parallel) → Moderator → Personas → ... → Moderator Conclusion
-    # Target: ~10-14 messages with proper discussion
+    # Formatted once per message and shared by all personas; older rounds get summarized
+    transcript = DebateTranscript(company_note)
     
-    print(f"\n=== DEBAT START ===\nPersonas: {', '.join(persona_names)}")
-    print(f"Start time: {timing_data['start_time']}")
-    
-    # 1. Moderator opens the debate - Sets the topic and asks for perspectives
-    print("  → Moderator opent debat...")
-    step_start = time.time()
-    entry = await invoke_orchestrator(persona_names, candidate_info, job_info, conversation, company_note)
-    step_time = time.time() - step_start
-    conversation.append({"role": "Moderator", "content": entry['message']})
-    if track_timing:
-        timing_data['steps'].append({
-            'step': 'moderator_opening',
-            'agent': 'Moderator',
-            'duration': round(step_time, 2),
-            'timestamp': step_start
-        })
-        print(f"  ✓ Moderator opening ({step_time:.2f}s)")
+    planner = planner or DebatePlanner()
     
-    # 2. Round 1: Personas respond to moderator's opening - PARALLELIZED
-    # Each persona shares their perspective (NOT initial impressions - they already evaluated)
-    print(f"  → Round 1: {len(persona_names)} personas reageren vanuit hun perspectief (parallel)...")
-    step_start = time.time()
-    async def get_persona_response(persona_name):
-        entry = await invoke_persona(
-            persona_name,
-            persona_prompts[persona_name],
-            candidate_info,
-            job_info,
-            conversation.copy(),
-            company_note
+    # The persona and moderator prompts only depend on the debate inputs: compile them once
+    persona_templates = {
+        persona_name: create_persona_prompt_template(
+            persona_name, persona_prompts[persona_name], candidate_info, job_info, company_note
         )
-        display_name = persona_name.replace('_', ' ').title()
-        return {"role": display_name, "content": entry['message']}
-    
-    round1_responses = await asyncio.gather(*[get_persona_response(pn) for pn in persona_names])
-    step_time = time.time() - step_start
-    conversation.extend(round1_responses)
-    if track_timing:
-        timing_data['steps'].append({
-            'step': 'personas_round1',
-            'agents': persona_names,
-            'duration': round(step_time, 2),
-            'timestamp': step_start,
-            'parallel': True
-        })
-        print(f"  ✓ Round 1 complete ({step_time:.2f}s)")
-    
-    # 3. Moderator responds and guides discussion deeper
-    print("  → Moderator begeleidt discussie...")
-    step_start = time.time()
-    entry = await invoke_orchestrator(persona_names, candidate_info, job_info, conversation, company_note)
-    step_time = time.time() - step_start
-    conversation.append({"role": "Moderator", "content": entry['message']})
-    if track_timing:
-        timing_data['steps'].append({
-            'step': 'moderator_guidance',
+        for persona_name in persona_names
+    }
+    guidance_template = create_orchestrator_prompt_template(persona_names, candidate_info, job_info, company_note, is_summary=False)
+    summary_template = create_orchestrator_prompt_template(persona_names, candidate_info, job_info, company_note, is_summary=True)
+    
+    def send(event: str, data: Dict[str, Any]):
+        if emit is not None:
+            emit(event, data)
+    
+    def token_callback(step: str, role: str) -> Optional[TokenCallback]:
+        if emit is None or not stream_tokens:
+            return None
+        
+        def on_token(delta: Optional[str]):
+            if delta is None:
+                emit('token_reset', {'step': step, 'role': role})
+            else:
+                emit('token', {'step': step, 'role': role, 'delta': delta})
+        return on_token
+    
+    raise_errors = checkpoints is not None
+    
+    def record_step(entry: Dict[str, Any]) -> Dict[str, Any]:
+        if track_timing:
+            timing_data['steps'].append(entry)
+        return entry
+    
+    def save_checkpoint(step: str, timing: Dict[str, Any], messages: List[Dict[str, str]], **extra):
+        if checkpoints is not None:
+            checkpoints.save(step, {'messages': messages, 'timing': timing, 'tokens_used': planner.tokens_used, **extra})
+    
+    def restore_checkpoint(step: str) -> Optional[Dict[str, Any]]:
+        """Replay a step finished by an earlier run of this debate session (no LLM call)"""
+        payload = checkpoints.completed(step) if checkpoints is not None else None
+        if payload is None:
+            return None
+        planner.tokens_used = max(planner.tokens_used, payload.get('tokens_used', 0))
+        for message in payload.get('messages', []):
+            conversation.append(message)
+            send('message', {'step': step, 'role': message['role'], 'content': message['content'], 'restored': True})
+        timing = payload.get('timing') or {'step': step}
+        send('step_complete', {'step': step, 'duration': timing.get('duration', 0), 'restored': True})
+        record_step({**timing, 'restored': True})
+        print(f"  ↺ {step} restored from checkpoint")
+        return payload
+    
+    async def summarize_context(step: str, upto: int):
+        restored = restore_checkpoint(step)
+        if restored is not None:
+            transcript.apply_summary(restored['summary'], restored['upto'])
+            return
+        step_start = time.time()
+        summary = await invoke_rolling_summary(persona_names, transcript, upto)
+        if not summary:
+            return
+        transcript.apply_summary(summary, upto)
+        step_time = time.time() - step_start
+        send('context_summary', {'step': step, 'summary': summary, 'summarized_messages': upto})
+        print(f"  ✓ Rolling summary of {upto} messages ({step_time:.2f}s)")
+        timing = record_step({
+            'step': step,
             'agent': 'Moderator',
             'duration': round(step_time, 2),
-            'timestamp': step_start
-        })
-        print(f"  ✓ Moderator guidance ({step_time:.2f}s)")
-    
-    # 4. Round 2: Personas discuss and respond to each other - PARALLELIZED
-    print(f"  → Round 2: {len(persona_names)} personas discussiëren (parallel)...")
-    step_start = time.time()
-    round2_responses = await asyncio.gather(*[get_persona_response(pn) for pn in persona_names])
-    step_time = time.time() - step_start
-    conversation.extend(round2_responses)
-    if track_timing:
-        timing_data['steps'].append({
-            'step': 'personas_round2',
-            'agents': persona_names,
-            'duration': round(step_time, 2),
             'timestamp': step_start,
             'parallel': True
         })
-        print(f"  ✓ Round 2 complete ({step_time:.2f}s)")
-    
-    # 5. Moderator deepens discussion or asks for specific aspects
-    print("  → Moderator verdiept discussie...")
-    step_start = time.time()
-    entry = await invoke_orchestrator(persona_names, candidate_info, job_info, conversation, company_note)
-    step_time = time.time() - step_start
-    conversation.append({"role": "Moderator", "content": entry['message']})
-    if track_timing:
-        timing_data['steps'].append({
-            'step': 'moderator_deepening',
+        save_checkpoint(step, timing, [], summary=summary, upto=upto)
+    
+    async def moderator_turn(step: str, summary: bool = False, status_override: Optional[str] = None):
+        restored = restore_checkpoint(step)
+        if restored is not None:
+            return restored['timing'].get('duration', 0)
+        send('step_start', {'step': step, 'agents': ['Moderator']})
+        step_start = time.time()
+        try:
+            if summary:
+                entry = await invoke_orchestrator_summary(
+                    persona_names, candidate_info, job_info, conversation, company_note,
+                    on_token=token_callback(step, 'Moderator'), prompt_template=summary_template,
+                    raise_errors=raise_errors
+                )
+            else:
+                entry = await invoke_orchestrator(
+                    persona_names, candidate_info, job_info, conversation, company_note,
+                    on_token=token_callback(step, 'Moderator'), prompt_template=guidance_template,
+                    status_override=status_override, raise_errors=raise_errors
+                )
+        except Exception as e:
+            if checkpoints is not None:
+                checkpoints.fail(step, str(e))
+            raise
+        step_time = time.time() - step_start
+        message = {"role": "Moderator", "content": entry['message']}
+        conversation.append(message)
+        send('message', {'step': step, 'role': 'Moderator', 'content': entry['message']})
+        send('step_complete', {'step': step, 'duration': round(step_time, 2)})
+        timing = record_step({
+            'step': step,
             'agent': 'Moderator',
             'duration': round(step_time, 2),
             'timestamp': step_start
         })
-        print(f"  ✓ Moderator deepening ({step_time:.2f}s)")
-    
-    # 6. Round 3: Personas give final reasoning - PARALLELIZED
-    print(f"  → Round 3: {len(persona_names)} personas geven laatste redenering (parallel)...")
-    step_start = time.time()
-    round3_responses = await asyncio.gather(*[get_persona_response(pn) for pn in persona_names])
-    step_time = time.time() - step_start
-    conversation.extend(round3_responses)
-    if track_timing:
-        timing_data['steps'].append({
-            'step': 'personas_round3',
+        save_checkpoint(step, timing, [message])
+        return step_time
+    
+    async def persona_round(step: str, reason: str):
+        """Run (or restore) one persona round; returns (duration, responses, timing, checkpoint payload if restored)"""
+        restored = restore_checkpoint(step)
+        if restored is not None:
+            return restored['timing'].get('duration', 0), restored['messages'], restored['timing'], restored
+        send('step_start', {'step': step, 'agents': persona_names, 'reason': reason})
+        step_start = time.time()
+        context_snapshot = conversation.copy()
+        transcript.sync(context_snapshot)
+        # Responses that succeeded before this round failed in an earlier run are reused
+        partial = (checkpoints.partial(step) if checkpoints is not None else None) or {}
+        finished = dict(partial.get('responses_by_persona', {}))
+        
+        async def get_persona_response(persona_name):
+            display_name = persona_name.replace('_', ' ').title()
+            if persona_name in finished:
+                response = finished[persona_name]
+                send('message', {'step': step, 'role': response['role'], 'content': response['content'], 'restored': True})
+                return response
+            entry = await invoke_persona(
+                persona_name,
+                persona_prompts[persona_name],
+                candidate_info,
+                job_info,
+                context_snapshot,
+                company_note,
+                on_token=token_callback(step, display_name),
+                prompt_template=persona_templates[persona_name],
+                transcript=transcript,
+                raise_errors=raise_errors
+            )
+            send('message', {'step': step, 'role': display_name, 'content': entry['message']})
+            response = {"role": display_name, "content": entry['message']}
+            finished[persona_name] = response
+            return response
+        
+        results = await asyncio.gather(*[get_persona_response(pn) for pn in persona_names], return_exceptions=True)
+        errors = [result for result in results if isinstance(result, BaseException)]
+        if errors:
+            if checkpoints is not None:
+                checkpoints.fail(step, str(errors[0]), {'responses_by_persona': finished})
+            raise errors[0]
+        responses = list(results)
+        step_time = time.time() - step_start
+        conversation.extend(responses)
+        send('step_complete', {'step': step, 'duration': round(step_time, 2)})
+        timing = record_step({
+            'step': step,
             'agents': persona_names,
             'duration': round(step_time, 2),
             'timestamp': step_start,
-            'parallel': True
+            'parallel': True,
+            'reason': reason
         })
-        print(f"  ✓ Round 3 complete ({step_time:.2f}s)")
-    
-    # Final: Moderator provides final summary and conclusion
-    print("  → Moderator geeft samenvatting en conclusie...")
-    step_start = time.time()
-    entry = await invoke_orchestrator_summary(persona_names, candidate_info, job_info, conversation, company_note)
-    step_time = time.time() - step_start
-    conversation.append({"role": "Moderator", "content": entry['message']})
-    if track_timing:
-        timing_data['steps'].append({
-            'step': 'moderator_final_summary',
-            'agent': 'Moderator',
-            'duration': round(step_time, 2),
-            'timestamp': step_start
-        })
-        print(f"  ✓ Moderator final summary ({step_time:.2f}s)")
+        return step_time, responses, timing, None
     
-    # Calculate total time
-    timing_data['total'] = round(time.time() - timing_data['start_time'], 2)
-    timing_data['end_time'] = time.time()
+    # IMPROVED conversation flow: Interactive discussion with moderator guiding
+    # Flow: Moderator → Personas (parallel) → Moderator → Personas → ... → Moderator Conclusion
+    # Target: ~10-14 messages with proper discussion
+    
+    # Token usage of every LLM call below (including parallel persona tasks) is counted by the planner
+    planner_token = _active_planner.set(planner)
+    try:
+        print(f"\n=== DEBAT START ===\nPersonas: {', '.join(persona_names)}")
+        print(f"Start time: {timing_data['start_time']}")
+        
+        # 1. Moderator opens the debate - Sets the topic and asks for perspectives
+        print("  → Moderator opent debat...")
+        step_time = await moderator_turn('moderator_opening')
+        print(f"  ✓ Moderator opening ({step_time:.2f}s)")
+        
+        # 2. Persona rounds - PARALLELIZED. Round 1: each persona shares their perspective (NOT initial
+        # impressions - they already evaluated). After every round the planner scores agreement and
+        # decides whether the moderator opens another round or moves on to the conclusion.
+        round_number = 1
+        round_reason = 'opening'
+        while True:
+            planner.start_round(round_number, round_reason)
+            print(f"  → Round {round_number}: {len(persona_names)} personas discussiëren (parallel, {round_reason})...")
+            step = f'personas_round{round_number}'
+            step_time, responses, timing, restored = await persona_round(step, round_reason)
+            print(f"  ✓ Round {round_number} complete ({step_time:.2f}s)")
+            
+            if restored is not None:
+                # Keep the decision the earlier run made, so a resumed debate follows the same plan
+                decision = restored['decision']
+                planner.apply_decision(decision)
+            else:
+                decision = planner.decide_after_round(round_number, [response['content'] for response in responses])
+                save_checkpoint(step, timing, responses, decision=decision)
+            send('plan', decision)
+            agreement = f"{decision['agreement']:.2f}" if decision['agreement'] is not None else 'n/a'
+            print(f"  ⚖ Agreement {agreement} → {'next round' if decision['continue'] else 'conclude'} ({decision['reason']})")
+            if not decision['continue']:
+                break
+            
+            # 3. Moderator guides the next round: deeper, towards a conclusion, or at the disagreement
+            round_number += 1
+            round_reason = decision['reason']
+            if round_number > planner.default_rounds:
+                step_name = f'moderator_round{round_number}'
+                status_override = CONTENTIOUS_ROUND_STATUS
+            else:
+                step_name = MODERATOR_STEP_NAMES.get(round_number, f'moderator_round{round_number}')
+                status_override = None
+            print(f"  → Moderator begeleidt ronde {round_number}...")
+            # The moderator's guidance doesn't read the transcript, so older rounds are compressed
+            # into the rolling summary while it is being written
+            transcript.sync(conversation)
+            summary_cutoff = transcript.summary_cutoff() if DEBATE_CONTEXT_SUMMARY_ENABLED else None
+            if summary_cutoff is not None:
+                summary_task = asyncio.ensure_future(summarize_context(f'context_summary_round{round_number}', summary_cutoff))
+                try:
+                    step_time = await moderator_turn(step_name, status_override=status_override)
+                    await summary_task
+                finally:
+                    # A failed moderator turn ends the debate: stop the summary call instead of letting it
+                    # spend tokens and checkpoint into a session that is being marked failed
+                    if not summary_task.done():
+                        summary_task.cancel()
+                    await asyncio.gather(summary_task, return_exceptions=True)
+            else:
+                step_time = await moderator_turn(step_name, status_override=status_override)
+            print(f"  ✓ Moderator {step_name} ({step_time:.2f}s)")
+        
+        # Final: Moderator provides final summary and conclusion
+        print("  → Moderator geeft samenvatting en conclusie...")
+        step_time = await moderator_turn('moderator_final_summary', summary=True)
+        print(f"  ✓ Moderator final summary ({step_time:.2f}s)")
+        
+        # Calculate total time
+        timing_data['total'] = round(time.time() - timing_data['start_time'], 2)
+        timing_data['end_time'] = time.time()
+        timing_data['rounds'] = planner.rounds  # Why each persona round ran or was skipped
+        timing_data['planner'] = planner.summary()
+        timing_data['context'] = transcript.stats()
+        if checkpoints is not None:
+            timing_data['restored_steps'] = checkpoints.restored_steps
+    finally:
+        _active_planner.reset(planner_token)
     
     # Return as JSON string
     json_output = json.dumps(conversation, ensure_ascii=False, indent=2)
@@ -0,0 +1,250 @@
+"""
+LLM Response Cache - Content-addressed cache for OpenAI chat completions
+In-memory LRU tier with an optional SQLite tier that survives restarts. Async callers use
+get_async/set_async, which run the SQLite tier in a thread.
+"""
+from collections import OrderedDict
+from typing import Dict, List, Optional, Any
+import asyncio
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+# Import config
+try:
+    from config import (
+        LLM_CACHE_ENABLED, LLM_CACHE_MAX_ENTRIES, LLM_CACHE_SQLITE_PATH,
+        LLM_CACHE_MAX_DEFAULT_TEMPERATURE, LLM_CACHE_DEFAULT_TTL_SECONDS, LLM_CACHE_TTL_SECONDS
+    )
+except ImportError:
+    LLM_CACHE_ENABLED = True
+    LLM_CACHE_MAX_ENTRIES = 1000
+    LLM_CACHE_SQLITE_PATH = None
+    LLM_CACHE_MAX_DEFAULT_TEMPERATURE = 0.3
+    LLM_CACHE_DEFAULT_TTL_SECONDS = 3600
+    LLM_CACHE_TTL_SECONDS = {}
+
+
+def make_cache_key(model: str, messages: List[Dict], max_tokens: int, temperature: float) -> str:
+    """Create a content hash of everything that determines the completion"""
+    normalized = {
+        'model': model,
+        'messages': [{'role': m.get('role'), 'content': m.get('content')} for m in messages],
+        'max_tokens': max_tokens,
+        'temperature': round(float(temperature), 3)
+    }
+    hash_str = json.dumps(normalized, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(hash_str.encode('utf-8')).hexdigest()
+
+
+def should_use_cache(temperature: float, use_cache: Optional[bool] = None) -> bool:
+    """Decide whether a call may be served from / stored in the cache.
+
+    use_cache=False always bypasses, use_cache=True opts in regardless of temperature,
+    and None caches only deterministic-enough (low temperature) calls.
+    """
+    if not LLM_CACHE_ENABLED or use_cache is False:
+        return False
+    if use_cache is True:
+        return True
+    return temperature <= LLM_CACHE_MAX_DEFAULT_TEMPERATURE
+
+
+def get_ttl_for_endpoint(endpoint: Optional[str]) -> int:
+    """Get the TTL (seconds) configured for an endpoint"""
+    if endpoint and endpoint in LLM_CACHE_TTL_SECONDS:
+        return LLM_CACHE_TTL_SECONDS[endpoint]
+    return LLM_CACHE_DEFAULT_TTL_SECONDS
+
+
+class LLMResponseCache:
+    """Two-tier (memory LRU + optional SQLite) cache for serialized completions"""
+
+    def __init__(self, max_entries: int = 1000, sqlite_path: Optional[str] = None):
+        self.max_entries = max_entries
+        self.sqlite_path = sqlite_path
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()  # key -> (expires_at, payload)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.stats = {
+            'hits': 0,
+            'misses': 0,
+            'memory_hits': 0,
+            'disk_hits': 0,
+            'stores': 0,
+            'evictions': 0,
+            'bypassed': 0
+        }
+        self.endpoint_stats: Dict[str, Dict[str, int]] = {}
+        if self.sqlite_path:
+            self._init_sqlite()
+
+    def _init_sqlite(self):
+        try:
+            conn = self._connect()
+            with conn:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS llm_cache ("
+                    "key TEXT PRIMARY KEY, payload TEXT NOT NULL, endpoint TEXT, "
+                    "expires_at REAL NOT NULL, created_at REAL NOT NULL)"
+                )
+                conn.execute("CREATE INDEX IF NOT EXISTS ix_llm_cache_expires_at ON llm_cache (expires_at)")
+        except Exception as e:
+            print(f"Warning: Could not initialize LLM cache database at {self.sqlite_path}: {e}")
+            self.sqlite_path = None
+
+    def _connect(self) -> sqlite3.Connection:
+        # One connection per thread, reused; sqlite3 connections are not shareable between threads
+        conn = getattr(self._local, 'connection', None)
+        if conn is None:
+            conn = sqlite3.connect(self.sqlite_path, timeout=5)
+            self._local.connection = conn
+        return conn
+
+    def _count(self, endpoint: Optional[str], field: str):
+        self.stats[field] += 1
+        if endpoint and field in ('hits', 'misses', 'bypassed'):
+            counters = self.endpoint_stats.setdefault(endpoint, {'hits': 0, 'misses': 0, 'bypassed': 0})
+            counters[field] += 1
+
+    def _remember(self, key: str, expires_at: float, payload: str):
+        """Insert into the memory tier and evict least recently used entries (lock must be held)"""
+        self._entries[key] = (expires_at, payload)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.stats['evictions'] += 1
+
+    def _get_memory(self, key: str, endpoint: Optional[str], now: float) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry:
+                expires_at, payload = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self._count(endpoint, 'hits')
+                    self.stats['memory_hits'] += 1
+                    return payload
+                del self._entries[key]
+        return None
+
+    def _get_disk(self, key: str, endpoint: Optional[str], now: float) -> Optional[str]:
+        """Look up the SQLite tier and count the hit or miss (blocking)"""
+        if self.sqlite_path:
+            try:
+                conn = self._connect()
+                with conn:
+                    row = conn.execute(
+                        "SELECT payload, expires_at FROM llm_cache WHERE key = ?", (key,)
+                    ).fetchone()
+                    if row and row[1] > now:
+                        with self._lock:
+                            self._remember(key, row[1], row[0])
+                            self._count(endpoint, 'hits')
+                            self.stats['disk_hits'] += 1
+                        return row[0]
+                    if row:
+                        conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+            except Exception as e:
+                print(f"LLM cache read error: {e}")
+
+        with self._lock:
+            self._count(endpoint, 'misses')
+        return None
+
+    def get(self, key: str, endpoint: Optional[str] = None) -> Optional[str]:
+        """Get a cached payload, or None on a miss/expired entry"""
+        now = time.time()
+        payload = self._get_memory(key, endpoint, now)
+        if payload is not None:
+            return payload
+        return self._get_disk(key, endpoint, now)
+
+    async def get_async(self, key: str, endpoint: Optional[str] = None) -> Optional[str]:
+        """get() for the event loop: memory hits are answered inline, the SQLite tier runs in a thread"""
+        now = time.time()
+        payload = self._get_memory(key, endpoint, now)
+        if payload is not None:
+            return payload
+        if not self.sqlite_path:
+            return self._get_disk(key, endpoint, now)  # Only counts the miss
+        return await asyncio.to_thread(self._get_disk, key, endpoint, now)
+
+    def _remember_stored(self, key: str, payload: str, expires_at: float):
+        with self._lock:
+            self._remember(key, expires_at, payload)
+            self.stats['stores'] += 1
+
+    def _store_disk(self, key: str, payload: str, endpoint: Optional[str], expires_at: float, now: float):
+        """Write to the SQLite tier (blocking)"""
+        try:
+            conn = self._connect()
+            with conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO llm_cache (key, payload, endpoint, expires_at, created_at) VALUES (?, ?, ?, ?, ?)",
+                    (key, payload, endpoint, expires_at, now)
+                )
+                # Opportunistically drop expired rows so the file doesn't grow forever
+                conn.execute("DELETE FROM llm_cache WHERE expires_at <= ?", (now,))
+        except Exception as e:
+            print(f"LLM cache write error: {e}")
+
+    def set(self, key: str, payload: str, ttl: int, endpoint: Optional[str] = None):
+        """Store a payload in both tiers"""
+        now = time.time()
+        self._remember_stored(key, payload, now + ttl)
+        if self.sqlite_path:
+            self._store_disk(key, payload, endpoint, now + ttl, now)
+
+    async def set_async(self, key: str, payload: str, ttl: int, endpoint: Optional[str] = None):
+        """set() for the event loop: the SQLite write runs in a thread"""
+        now = time.time()
+        self._remember_stored(key, payload, now + ttl)
+        if self.sqlite_path:
+            await asyncio.to_thread(self._store_disk, key, payload, endpoint, now + ttl, now)
+
+    def record_bypass(self, endpoint: Optional[str] = None):
+        with self._lock:
+            self._count(endpoint, 'bypassed')
+
+    def clear(self):
+        """Remove all entries from both tiers"""
+        with self._lock:
+            self._entries.clear()
+        if self.sqlite_path:
+            try:
+                conn = self._connect()
+                with conn:
+                    conn.execute("DELETE FROM llm_cache")
+            except Exception as e:
+                print(f"LLM cache clear error: {e}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get hit/miss counters and tier sizes"""
+        with self._lock:
+            lookups = self.stats['hits'] + self.stats['misses']
+            return {
+                **self.stats,
+                'hit_rate': round(self.stats['hits'] / lookups, 3) if lookups else 0.0,
+                'memory_entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'persistent': bool(self.sqlite_path),
+                'endpoints': {name: dict(counters) for name, counters in self.endpoint_stats.items()}
+            }
+
+
+# Global cache instance (singleton pattern)
+_cache_instance = None
+
+def get_llm_cache() -> LLMResponseCache:
+    """Get or create global cache instance"""
+    global _cache_instance
+    if _cache_instance is None:
+        _cache_instance = LLMResponseCache(
+            max_entries=LLM_CACHE_MAX_ENTRIES,
+            sqlite_path=LLM_CACHE_SQLITE_PATH
+        )
+    return _cache_instance
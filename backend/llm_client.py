@@ -0,0 +1,170 @@
+"""
+OpenAI Client Pool - Shared OpenAI clients with a bounded HTTP connection pool
+One sync and one async client are created per process and reused by every LLM call
+"""
+import os
+import asyncio
+import threading
+from typing import Dict, Optional, Any, Set
+import httpx
+from openai import OpenAI, AsyncOpenAI
+
+# Import config
+try:
+    from config import (
+        OPENAI_HTTP2_ENABLED, OPENAI_MAX_CONNECTIONS, OPENAI_MAX_KEEPALIVE_CONNECTIONS,
+        OPENAI_KEEPALIVE_EXPIRY_SECONDS, OPENAI_REQUEST_TIMEOUT_SECONDS, OPENAI_CONNECT_TIMEOUT_SECONDS
+    )
+except ImportError:
+    OPENAI_HTTP2_ENABLED = True
+    OPENAI_MAX_CONNECTIONS = 20
+    OPENAI_MAX_KEEPALIVE_CONNECTIONS = 10
+    OPENAI_KEEPALIVE_EXPIRY_SECONDS = 30.0
+    OPENAI_REQUEST_TIMEOUT_SECONDS = 60.0
+    OPENAI_CONNECT_TIMEOUT_SECONDS = 10.0
+
+try:
+    import h2  # noqa: F401 - only needed so httpx can negotiate HTTP/2
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+    print("Warning: 'h2' package not available. OpenAI client will use HTTP/1.1.")
+
+_client_lock = threading.Lock()
+_sync_client: Optional[OpenAI] = None
+_sync_http_client: Optional[httpx.Client] = None
+_async_client: Optional[AsyncOpenAI] = None
+_async_http_client: Optional[httpx.AsyncClient] = None
+_async_client_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+def _use_http2() -> bool:
+    return OPENAI_HTTP2_ENABLED and HTTP2_AVAILABLE
+
+
+def _build_limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=OPENAI_MAX_CONNECTIONS,
+        max_keepalive_connections=OPENAI_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=OPENAI_KEEPALIVE_EXPIRY_SECONDS
+    )
+
+
+def _build_timeout() -> httpx.Timeout:
+    return httpx.Timeout(OPENAI_REQUEST_TIMEOUT_SECONDS, connect=OPENAI_CONNECT_TIMEOUT_SECONDS)
+
+
+def get_openai_client() -> OpenAI:
+    """Get or create the process-wide synchronous OpenAI client"""
+    global _sync_client, _sync_http_client
+    if _sync_client is None:
+        with _client_lock:
+            if _sync_client is None:
+                _sync_http_client = httpx.Client(
+                    http2=_use_http2(),
+                    limits=_build_limits(),
+                    timeout=_build_timeout()
+                )
+                _sync_client = OpenAI(
+                    api_key=os.getenv("OPENAI_API_KEY"),
+                    http_client=_sync_http_client,
+                    max_retries=0  # Retries are handled by llm_resilience
+                )
+    return _sync_client
+
+
+# Close tasks for clients left behind by an earlier event loop (kept referenced until they finish)
+_retiring_clients: Set[asyncio.Future] = set()
+
+
+def _retire_async_client(client: AsyncOpenAI, loop: Optional[asyncio.AbstractEventLoop]) -> None:
+    """Close the pooled connections of an async client that belongs to another event loop.
+
+    A loop that is still running (another thread) closes its own client. A finished loop
+    (asyncio.run() returned) can't, so the client is closed from the current loop: the sockets
+    are closed even though the transport's final callback fails on the closed loop.
+    """
+    if loop is not None and loop.is_running():
+        asyncio.run_coroutine_threadsafe(client.close(), loop)
+        return
+
+    async def close():
+        try:
+            await client.close()
+        except RuntimeError:
+            pass  # "Event loop is closed" from the old transport's callbacks
+        except Exception as e:
+            print(f"Error closing async OpenAI client of a previous event loop: {e}")
+    task = asyncio.ensure_future(close())
+    _retiring_clients.add(task)
+    task.add_done_callback(_retiring_clients.discard)
+
+
+def get_async_openai_client() -> AsyncOpenAI:
+    """Get or create the process-wide async OpenAI client.
+
+    The underlying connection pool belongs to the event loop it was first used on,
+    so the client is rebuilt when called from a different loop (e.g. scripts that
+    call asyncio.run() more than once) and the previous one is closed. Under uvicorn
+    there is one loop per process.
+    """
+    global _async_client, _async_http_client, _async_client_loop
+    loop = asyncio.get_running_loop()
+    if _async_client is None or _async_client_loop is not loop:
+        if _async_client is not None:
+            _retire_async_client(_async_client, _async_client_loop)
+        _async_http_client = httpx.AsyncClient(
+            http2=_use_http2(),
+            limits=_build_limits(),
+            timeout=_build_timeout()
+        )
+        _async_client = AsyncOpenAI(
+            api_key=os.getenv("OPENAI_API_KEY"),
+            http_client=_async_http_client,
+            max_retries=0  # Retries are handled by llm_resilience
+        )
+        _async_client_loop = loop
+    return _async_client
+
+
+def get_async_http_client() -> httpx.AsyncClient:
+    """Get the pooled httpx client behind the async OpenAI client (for SDK wrappers such as ChatOpenAI)"""
+    get_async_openai_client()
+    return _async_http_client
+
+
+def get_sync_http_client() -> httpx.Client:
+    """Get the pooled httpx client behind the sync OpenAI client"""
+    get_openai_client()
+    return _sync_http_client
+
+
+async def close_openai_clients() -> None:
+    """Close pooled connections (called on application shutdown)"""
+    global _sync_client, _sync_http_client, _async_client, _async_http_client, _async_client_loop
+    if _async_client is not None:
+        try:
+            await _async_client.close()
+        except Exception as e:
+            print(f"Error closing async OpenAI client: {e}")
+        _async_client = None
+        _async_http_client = None
+        _async_client_loop = None
+    if _sync_client is not None:
+        try:
+            _sync_client.close()
+        except Exception as e:
+            print(f"Error closing OpenAI client: {e}")
+        _sync_client = None
+        _sync_http_client = None
+
+
+def get_pool_settings() -> Dict[str, Any]:
+    """Get the effective connection pool settings (for diagnostics)"""
+    return {
+        "http2": _use_http2(),
+        "max_connections": OPENAI_MAX_CONNECTIONS,
+        "max_keepalive_connections": OPENAI_MAX_KEEPALIVE_CONNECTIONS,
+        "keepalive_expiry_seconds": OPENAI_KEEPALIVE_EXPIRY_SECONDS,
+        "request_timeout_seconds": OPENAI_REQUEST_TIMEOUT_SECONDS
+    }
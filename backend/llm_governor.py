@@ -0,0 +1,225 @@
+"""
+LLM Governor - Process-wide rate limiting and concurrency control for OpenAI traffic
+Token buckets enforce per-model requests/tokens per minute; excess calls queue in arrival order
+"""
+from contextlib import asynccontextmanager, contextmanager
+from typing import Dict, List, Optional, Any
+import asyncio
+import threading
+import time
+from token_budget import count_message_tokens
+
+# Import config
+try:
+    from config import OPENAI_RATE_LIMITS, OPENAI_DEFAULT_RATE_LIMIT, OPENAI_MAX_CONCURRENT_REQUESTS
+except ImportError:
+    OPENAI_RATE_LIMITS = {}
+    OPENAI_DEFAULT_RATE_LIMIT = {"rpm": 500, "tpm": 200000}
+    OPENAI_MAX_CONCURRENT_REQUESTS = 10
+
+
+def estimate_request_tokens(messages: List[Dict], max_tokens: int = 0, model: Optional[str] = None) -> int:
+    """Estimate the tokens a request will consume (tokenized prompt + completion budget)"""
+    return count_message_tokens(messages, model) + (max_tokens or 0)
+
+
+class TokenBucket:
+    """Token bucket that hands out reservations instead of rejecting.
+
+    A reservation may drive the bucket negative; the caller then waits until
+    the debt is refilled. Later callers see the accumulated debt, so waiting
+    order follows arrival order (fair queueing without an explicit queue).
+    """
+
+    def __init__(self, per_minute: int):
+        self.capacity = max(1, int(per_minute))
+        self.rate = self.capacity / 60.0  # Units per second
+        self.available = float(self.capacity)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.available = min(self.capacity, self.available + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, amount: float) -> float:
+        """Reserve capacity and return how many seconds the caller must wait"""
+        with self._lock:
+            self._refill()
+            self.available -= min(amount, self.capacity)
+            if self.available >= 0:
+                return 0.0
+            return -self.available / self.rate
+
+    def adjust(self, amount: float):
+        """Give back (positive) or additionally consume (negative) capacity after the fact"""
+        with self._lock:
+            self._refill()
+            self.available = min(self.capacity, self.available + amount)
+
+    def level(self) -> float:
+        with self._lock:
+            self._refill()
+            return self.available
+
+
+class GovernorTicket:
+    """Handle for an admitted call; report real usage so the TPM bucket stays accurate"""
+
+    def __init__(self, governor: "LLMGovernor", model: str, reserved_tokens: int, queued_seconds: float):
+        self.governor = governor
+        self.model = model
+        self.reserved_tokens = reserved_tokens
+        self.queued_seconds = queued_seconds
+
+    def record_usage(self, actual_tokens: Optional[int]):
+        if actual_tokens is None:
+            return
+        self.governor._bucket(self.model, 'tpm').adjust(self.reserved_tokens - actual_tokens)
+        self.reserved_tokens = actual_tokens
+
+
+class LLMGovernor:
+    """Single gate in front of every OpenAI call in the process"""
+
+    def __init__(self, max_concurrent: int = 10):
+        self.max_concurrent = max_concurrent
+        self._buckets: Dict[str, Dict[str, TokenBucket]] = {}
+        self._buckets_lock = threading.Lock()
+        self._state_lock = threading.Lock()
+        # Async callers share one semaphore per event loop, sync (threaded) callers a threading semaphore
+        self._async_semaphore_loop: Optional[asyncio.AbstractEventLoop] = None
+        self._async_semaphore_instance: Optional[asyncio.Semaphore] = None
+        self._sync_semaphore = threading.BoundedSemaphore(max_concurrent)
+        self.waiting = 0
+        self.in_flight = 0
+        self.stats = {
+            'admitted': 0,
+            'queued': 0,  # Calls that had to wait before being admitted
+            'total_wait_seconds': 0.0,
+            'max_wait_seconds': 0.0
+        }
+
+    def _limits_for(self, model: str) -> Dict[str, int]:
+        return OPENAI_RATE_LIMITS.get(model, OPENAI_DEFAULT_RATE_LIMIT)
+
+    def _bucket(self, model: str, kind: str) -> TokenBucket:
+        with self._buckets_lock:
+            if model not in self._buckets:
+                limits = self._limits_for(model)
+                self._buckets[model] = {
+                    'rpm': TokenBucket(limits.get('rpm', OPENAI_DEFAULT_RATE_LIMIT['rpm'])),
+                    'tpm': TokenBucket(limits.get('tpm', OPENAI_DEFAULT_RATE_LIMIT['tpm']))
+                }
+            return self._buckets[model][kind]
+
+    def _reserve(self, model: str, tokens: int) -> float:
+        return max(self._bucket(model, 'rpm').reserve(1), self._bucket(model, 'tpm').reserve(tokens))
+
+    def _async_semaphore(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        if self._async_semaphore_loop is not loop:
+            self._async_semaphore_instance = asyncio.Semaphore(self.max_concurrent)
+            self._async_semaphore_loop = loop
+        return self._async_semaphore_instance
+
+    def _enter_queue(self):
+        with self._state_lock:
+            self.waiting += 1
+
+    def _admit(self, queued_seconds: float):
+        with self._state_lock:
+            self.waiting -= 1
+            self.in_flight += 1
+            self.stats['admitted'] += 1
+            if queued_seconds > 0.01:
+                self.stats['queued'] += 1
+            self.stats['total_wait_seconds'] += queued_seconds
+            self.stats['max_wait_seconds'] = max(self.stats['max_wait_seconds'], queued_seconds)
+
+    def _leave(self):
+        with self._state_lock:
+            self.in_flight -= 1
+
+    def _abandon(self):
+        with self._state_lock:
+            self.waiting -= 1
+
+    @asynccontextmanager
+    async def acquire_async(self, model: str, estimated_tokens: int):
+        """Wait for rate budget and a concurrency slot, then run the call"""
+        start = time.monotonic()
+        self._enter_queue()
+        semaphore = self._async_semaphore()
+        try:
+            wait = self._reserve(model, estimated_tokens)
+            if wait > 0:
+                await asyncio.sleep(wait)
+            await semaphore.acquire()
+        except BaseException:
+            self._abandon()
+            raise
+        self._admit(time.monotonic() - start)
+        try:
+            yield GovernorTicket(self, model, estimated_tokens, time.monotonic() - start)
+        finally:
+            semaphore.release()
+            self._leave()
+
+    @contextmanager
+    def acquire(self, model: str, estimated_tokens: int):
+        """Blocking variant of acquire_async for synchronous callers"""
+        start = time.monotonic()
+        self._enter_queue()
+        try:
+            wait = self._reserve(model, estimated_tokens)
+            if wait > 0:
+                time.sleep(wait)
+            self._sync_semaphore.acquire()
+        except BaseException:
+            self._abandon()
+            raise
+        self._admit(time.monotonic() - start)
+        try:
+            yield GovernorTicket(self, model, estimated_tokens, time.monotonic() - start)
+        finally:
+            self._sync_semaphore.release()
+            self._leave()
+
+    def get_status(self) -> Dict[str, Any]:
+        """Get queue depth, in-flight calls and remaining per-model budgets"""
+        with self._buckets_lock:
+            models = list(self._buckets.keys())
+        budgets = {}
+        for model in models:
+            limits = self._limits_for(model)
+            budgets[model] = {
+                'rpm_limit': limits.get('rpm'),
+                'tpm_limit': limits.get('tpm'),
+                'requests_available': round(self._bucket(model, 'rpm').level(), 1),
+                'tokens_available': round(self._bucket(model, 'tpm').level())
+            }
+        with self._state_lock:
+            admitted = self.stats['admitted']
+            return {
+                'queue_depth': self.waiting,
+                'in_flight': self.in_flight,
+                'max_concurrent': self.max_concurrent,
+                'admitted': admitted,
+                'queued': self.stats['queued'],
+                'avg_wait_seconds': round(self.stats['total_wait_seconds'] / admitted, 3) if admitted else 0.0,
+                'max_wait_seconds': round(self.stats['max_wait_seconds'], 3),
+                'models': budgets
+            }
+
+
+# Global governor instance (singleton pattern)
+_governor_instance = None
+
+def get_governor() -> LLMGovernor:
+    """Get or create global governor instance"""
+    global _governor_instance
+    if _governor_instance is None:
+        _governor_instance = LLMGovernor(max_concurrent=OPENAI_MAX_CONCURRENT_REQUESTS)
+    return _governor_instance
@@ -0,0 +1,344 @@
+"""
+LLM Resilience - Retries, hedged requests and circuit breaking for OpenAI calls
+Transient failures are retried with jittered backoff, slow calls are hedged past their p95
+latency, and a per-model circuit breaker fails fast while the upstream is degraded
+"""
+from collections import deque
+from email.utils import parsedate_to_datetime
+from typing import Awaitable, Callable, Dict, Optional, Any, TypeVar
+import asyncio
+import random
+import threading
+import time
+import openai
+
+# Import config
+try:
+    from config import (
+        OPENAI_MAX_RETRIES, OPENAI_RETRY_BASE_DELAY_SECONDS, OPENAI_RETRY_MAX_DELAY_SECONDS,
+        OPENAI_HEDGING_ENABLED, OPENAI_HEDGE_MIN_SAMPLES, OPENAI_HEDGE_MIN_DELAY_SECONDS,
+        OPENAI_CIRCUIT_FAILURE_THRESHOLD, OPENAI_CIRCUIT_RESET_SECONDS
+    )
+except ImportError:
+    OPENAI_MAX_RETRIES = 3
+    OPENAI_RETRY_BASE_DELAY_SECONDS = 0.5
+    OPENAI_RETRY_MAX_DELAY_SECONDS = 8.0
+    OPENAI_HEDGING_ENABLED = True
+    OPENAI_HEDGE_MIN_SAMPLES = 20
+    OPENAI_HEDGE_MIN_DELAY_SECONDS = 2.0
+    OPENAI_CIRCUIT_FAILURE_THRESHOLD = 5
+    OPENAI_CIRCUIT_RESET_SECONDS = 30.0
+
+T = TypeVar("T")
+
+RETRYABLE_STATUS_CODES = {408, 409, 429}
+MAX_RETRY_AFTER_SECONDS = 60.0
+
+
+class CircuitOpenError(Exception):
+    """Raised when a model's circuit is open and calls are rejected without hitting the API"""
+
+
+def is_retryable_error(error: BaseException) -> bool:
+    """Transient errors worth retrying: timeouts, connection errors, 429 and 5xx"""
+    if isinstance(error, (openai.APIConnectionError, openai.APITimeoutError)):
+        return True
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code in RETRYABLE_STATUS_CODES or error.status_code >= 500
+    return isinstance(error, asyncio.TimeoutError)
+
+
+def get_retry_after_seconds(error: BaseException) -> Optional[float]:
+    """Read Retry-After (or retry-after-ms) from an API error response, if present"""
+    response = getattr(error, 'response', None)
+    headers = getattr(response, 'headers', None)
+    if not headers:
+        return None
+    try:
+        retry_after_ms = headers.get('retry-after-ms')
+        if retry_after_ms:
+            return min(float(retry_after_ms) / 1000.0, MAX_RETRY_AFTER_SECONDS)
+        retry_after = headers.get('retry-after')
+        if not retry_after:
+            return None
+        try:
+            return min(float(retry_after), MAX_RETRY_AFTER_SECONDS)
+        except ValueError:
+            retry_at = parsedate_to_datetime(retry_after)
+            return min(max(retry_at.timestamp() - time.time(), 0.0), MAX_RETRY_AFTER_SECONDS)
+    except Exception:
+        return None
+
+
+def get_backoff_delay(attempt: int, error: Optional[BaseException] = None) -> float:
+    """Exponential backoff with full jitter; an explicit Retry-After from the server wins"""
+    retry_after = get_retry_after_seconds(error) if error is not None else None
+    if retry_after is not None:
+        return retry_after
+    ceiling = min(OPENAI_RETRY_MAX_DELAY_SECONDS, OPENAI_RETRY_BASE_DELAY_SECONDS * (2 ** attempt))
+    return random.uniform(0, ceiling)
+
+
+class LatencyTracker:
+    """Rolling window of successful call latencies per model"""
+
+    def __init__(self, window: int = 200):
+        self.samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float):
+        with self._lock:
+            self.samples.append(seconds)
+
+    def percentile(self, pct: float) -> Optional[float]:
+        with self._lock:
+            if not self.samples:
+                return None
+            ordered = sorted(self.samples)
+        index = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+        return ordered[index]
+
+    def count(self) -> int:
+        with self._lock:
+            return len(self.samples)
+
+
+class CircuitBreaker:
+    """Closed → open after N consecutive failures → half-open trial after a cooldown"""
+
+    def __init__(self, failure_threshold: int, reset_seconds: float):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = 'closed'
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.trial_in_progress = False
+        self._lock = threading.Lock()
+
+    def allow_request(self) -> bool:
+        with self._lock:
+            if self.state == 'closed':
+                return True
+            if self.state == 'open' and time.monotonic() - self.opened_at >= self.reset_seconds:
+                self.state = 'half_open'
+                self.trial_in_progress = False
+            if self.state == 'half_open' and not self.trial_in_progress:
+                self.trial_in_progress = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = 'closed'
+            self.consecutive_failures = 0
+            self.trial_in_progress = False
+
+    def record_failure(self):
+        with self._lock:
+            self.consecutive_failures += 1
+            self.trial_in_progress = False
+            if self.state == 'half_open' or self.consecutive_failures >= self.failure_threshold:
+                if self.state != 'open':
+                    print(f"⚠ OpenAI circuit opened after {self.consecutive_failures} consecutive failures")
+                self.state = 'open'
+                self.opened_at = time.monotonic()
+
+    def release_trial(self):
+        """Let another call take the half-open trial when this one ended without an outcome (cancelled)"""
+        with self._lock:
+            if self.state == 'half_open':
+                self.trial_in_progress = False
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'state': self.state,
+                'consecutive_failures': self.consecutive_failures,
+                'open_for_seconds': round(time.monotonic() - self.opened_at, 1) if self.state == 'open' else 0
+            }
+
+
+class LLMResilience:
+    """Per-model retry/hedge/circuit state shared by all callers in the process"""
+
+    def __init__(self):
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._latencies: Dict[str, LatencyTracker] = {}
+        self._lock = threading.Lock()
+        self.stats = {
+            'calls': 0,
+            'retries': 0,
+            'hedges': 0,
+            'hedge_wins': 0,
+            'circuit_rejections': 0,
+            'failures': 0
+        }
+
+    def _count(self, field: str):
+        with self._lock:
+            self.stats[field] += 1
+
+    def breaker(self, model: str) -> CircuitBreaker:
+        with self._lock:
+            if model not in self._breakers:
+                self._breakers[model] = CircuitBreaker(OPENAI_CIRCUIT_FAILURE_THRESHOLD, OPENAI_CIRCUIT_RESET_SECONDS)
+            return self._breakers[model]
+
+    def latency(self, model: str) -> LatencyTracker:
+        with self._lock:
+            if model not in self._latencies:
+                self._latencies[model] = LatencyTracker()
+            return self._latencies[model]
+
+    def hedge_delay(self, model: str) -> Optional[float]:
+        """Seconds after which a duplicate request is fired, or None if hedging is off/not calibrated"""
+        if not OPENAI_HEDGING_ENABLED:
+            return None
+        tracker = self.latency(model)
+        if tracker.count() < OPENAI_HEDGE_MIN_SAMPLES:
+            return None
+        p95 = tracker.percentile(95)
+        return max(p95 or 0.0, OPENAI_HEDGE_MIN_DELAY_SECONDS)
+
+    def _check_circuit(self, model: str):
+        if not self.breaker(model).allow_request():
+            self._count('circuit_rejections')
+            raise CircuitOpenError(f"OpenAI circuit for {model} is open - upstream degraded, failing fast")
+
+    def _record_outcome(self, model: str, error: Optional[BaseException]):
+        if error is None:
+            self.breaker(model).record_success()
+        elif is_retryable_error(error):
+            # Only upstream degradation counts towards opening the circuit, not bad requests
+            self.breaker(model).record_failure()
+        else:
+            self.breaker(model).record_success()
+
+    @staticmethod
+    async def _admitted_call(make_call: Callable[..., Awaitable[T]], admit, admitted: asyncio.Event) -> T:
+        """Run make_call() once admitted, setting `admitted` when it actually starts"""
+        if admit is None:
+            admitted.set()
+            return await make_call()
+        async with admit() as ticket:
+            admitted.set()
+            return await make_call(ticket)
+
+    async def _run_hedged(self, model: str, make_call: Callable[..., Awaitable[T]], hedge: bool = True, admit=None) -> T:
+        """Run one attempt, firing a duplicate if it outlives the model's p95 latency"""
+        delay = self.hedge_delay(model) if hedge else None
+        admitted = asyncio.Event()
+        primary = asyncio.ensure_future(self._admitted_call(make_call, admit, admitted))
+        pending = {primary}
+        try:
+            # Latency and the hedge timer start at admission: time spent queued in the governor
+            # is not upstream slowness, and hedging it would only add to the backlog
+            admission = asyncio.ensure_future(admitted.wait())
+            try:
+                await asyncio.wait({primary, admission}, return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                admission.cancel()
+            start = time.monotonic()
+            done, pending = await asyncio.wait(pending, timeout=delay)
+            if not done:
+                self._count('hedges')
+                pending.add(asyncio.ensure_future(self._admitted_call(make_call, admit, asyncio.Event())))
+            first_error = None
+            while True:
+                for task in done:
+                    if task.exception() is None:
+                        if task is not primary:
+                            self._count('hedge_wins')
+                        self.latency(model).record(time.monotonic() - start)
+                        return task.result()
+                    first_error = first_error or task.exception()
+                if not pending:
+                    raise first_error
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def call_async(self, model: str, make_call: Callable[..., Awaitable[T]], hedge: bool = True, admit=None) -> T:
+        """Run make_call() with circuit breaking, hedging and bounded jittered retries.
+
+        Pass hedge=False for calls with side effects while running (e.g. streamed tokens).
+        admit is an optional factory for an async context manager gating each request (the governor's
+        acquire_async); make_call then receives its ticket and is timed from admission, not from queueing.
+        """
+        self._count('calls')
+        for attempt in range(OPENAI_MAX_RETRIES + 1):
+            self._check_circuit(model)
+            try:
+                result = await self._run_hedged(model, make_call, hedge, admit)
+                self._record_outcome(model, None)
+                return result
+            except asyncio.CancelledError:
+                # A cancelled call says nothing about the upstream, but must not keep the trial slot
+                self.breaker(model).release_trial()
+                raise
+            except Exception as e:
+                self._record_outcome(model, e)
+                if not is_retryable_error(e) or attempt >= OPENAI_MAX_RETRIES:
+                    self._count('failures')
+                    raise
+                delay = get_backoff_delay(attempt, e)
+                self._count('retries')
+                print(f"OpenAI call failed ({type(e).__name__}: {e}), retry {attempt + 1}/{OPENAI_MAX_RETRIES} in {delay:.2f}s")
+                await asyncio.sleep(delay)
+
+    def call(self, model: str, make_call: Callable[[], T]) -> T:
+        """Blocking variant of call_async (retries and circuit breaking, no hedging)"""
+        self._count('calls')
+        for attempt in range(OPENAI_MAX_RETRIES + 1):
+            self._check_circuit(model)
+            start = time.monotonic()
+            try:
+                result = make_call()
+                self.latency(model).record(time.monotonic() - start)
+                self._record_outcome(model, None)
+                return result
+            except Exception as e:
+                self._record_outcome(model, e)
+                if not is_retryable_error(e) or attempt >= OPENAI_MAX_RETRIES:
+                    self._count('failures')
+                    raise
+                delay = get_backoff_delay(attempt, e)
+                self._count('retries')
+                print(f"OpenAI call failed ({type(e).__name__}: {e}), retry {attempt + 1}/{OPENAI_MAX_RETRIES} in {delay:.2f}s")
+                time.sleep(delay)
+
+    def get_status(self) -> Dict[str, Any]:
+        """Get retry/hedge counters, circuit states and latency percentiles per model"""
+        with self._lock:
+            models = set(self._breakers.keys()) | set(self._latencies.keys())
+            stats = dict(self.stats)
+        per_model = {}
+        for model in sorted(models):
+            tracker = self.latency(model)
+            p50 = tracker.percentile(50)
+            p95 = tracker.percentile(95)
+            per_model[model] = {
+                'circuit': self.breaker(model).snapshot(),
+                'samples': tracker.count(),
+                'p50_seconds': round(p50, 3) if p50 is not None else None,
+                'p95_seconds': round(p95, 3) if p95 is not None else None,
+                'hedge_after_seconds': self.hedge_delay(model)
+            }
+        return {
+            **stats,
+            'max_retries': OPENAI_MAX_RETRIES,
+            'hedging_enabled': OPENAI_HEDGING_ENABLED,
+            'models': per_model
+        }
+
+
+# Global resilience instance (singleton pattern)
+_resilience_instance = None
+
+def get_resilience() -> LLMResilience:
+    """Get or create global resilience instance"""
+    global _resilience_instance
+    if _resilience_instance is None:
+        _resilience_instance = LLMResilience()
+    return _resilience_instance
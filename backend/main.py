@@ -2,10 +2,10 @@ from fastapi import FastAPI, HTTPException, UploadFile, File, Form, Request, Que
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from fastapi.exceptions import RequestValidationError
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi import Request as FastAPIRequest
 from pydantic import BaseModel, EmailStr
-from typing import List, Optional, Dict
+from typing import List, Optional, Dict, Any
 from uuid import uuid4
 import openai
 import os
@@ -27,28 +27,15 @@ import io
 import re
 import json
 from io import BytesIO
-from docx import Document
 from dotenv import load_dotenv
 import traceback
 import sys
-from sqlalchemy import create_engine, Column, String, Integer, Text, ForeignKey, Enum, DateTime, Boolean, or_, UniqueConstraint, text
-from sqlalchemy.orm import sessionmaker, declarative_base, relationship
+from sqlalchemy import create_engine, Column, String, Integer, Text, ForeignKey, Enum, DateTime, Boolean, or_, and_, exists, select, insert, UniqueConstraint, Index, text
+from sqlalchemy.orm import Session, sessionmaker, declarative_base, relationship, joinedload, selectinload, load_only, defer, aliased
 from sqlalchemy.sql import func
 from sqlalchemy import inspect as sqlalchemy_inspect
 import enum
 import base64
-try:
-    import fitz  # PyMuPDF
-    FITZ_AVAILABLE = True
-except ImportError:
-    FITZ_AVAILABLE = False
-    print("Warning: PyMuPDF (fitz) not available. PDF parsing will be limited.")
-try:
-    from PyPDF2 import PdfReader
-    PYPDF2_AVAILABLE = True
-except ImportError:
-    PYPDF2_AVAILABLE = False
-    print("Warning: PyPDF2 not available. PDF parsing will be limited.")
 
 # Import centralized configuration
 # Use direct import - this is the most reliable approach
@@ -57,7 +44,9 @@ try:
         OPENAI_MODEL_EVALUATION, OPENAI_MODEL_DEBATE, OPENAI_MODEL_JOB_ANALYSIS, OPENAI_MODEL_TEXT_EXTRACTION,
         OPENAI_MAX_TOKENS_EVALUATION, OPENAI_MAX_TOKENS_DEBATE, OPENAI_MAX_TOKENS_JOB_ANALYSIS, OPENAI_MAX_TOKENS_TEXT_EXTRACTION,
         OPENAI_TEMPERATURE_EVALUATION, OPENAI_TEMPERATURE_DEBATE, OPENAI_TEMPERATURE_JOB_ANALYSIS, OPENAI_TEMPERATURE_TEXT_EXTRACTION,
-        AZURE_ENABLED, MAX_RESUME_CHARS, MAX_MOTIVATION_CHARS, MAX_JOB_DESC_CHARS, MAX_COMPANY_NOTE_CHARS, PDF_EXTRACTION_PRIORITY,
+        AZURE_ENABLED, AZURE_TIMEOUT_SECONDS, PDF_EXTRACTION_PRIORITY, STORED_DOCUMENT_MAX_TOKENS, DEBATE_HISTORY_RESERVE_TOKENS,
+        BATCH_EVALUATION_MAX_CONCURRENT_CANDIDATES, BATCH_EVALUATION_COMMIT_SIZE, DEBATE_CHECKPOINTS_ENABLED,
+        BULK_UPLOAD_MAX_FILES, BULK_UPLOAD_MAX_CONCURRENT_EXTRACTIONS, BULK_UPLOAD_MAX_ARCHIVE_BYTES,
         SCORE_MIN, SCORE_MAX, SCORE_DEFAULT, get_score_scale_prompt_text, get_recommendation_from_score
     )
 except ImportError:
@@ -75,10 +64,15 @@ except ImportError:
     OPENAI_TEMPERATURE_JOB_ANALYSIS = 0.3
     OPENAI_TEMPERATURE_TEXT_EXTRACTION = 0.0
     AZURE_ENABLED = True
-    MAX_RESUME_CHARS = 2000
-    MAX_MOTIVATION_CHARS = 500
-    MAX_JOB_DESC_CHARS = 1000
-    MAX_COMPANY_NOTE_CHARS = 500
+    AZURE_TIMEOUT_SECONDS = 30
+    STORED_DOCUMENT_MAX_TOKENS = 8000
+    DEBATE_HISTORY_RESERVE_TOKENS = 1500
+    BATCH_EVALUATION_MAX_CONCURRENT_CANDIDATES = 4
+    BATCH_EVALUATION_COMMIT_SIZE = 10
+    DEBATE_CHECKPOINTS_ENABLED = True
+    BULK_UPLOAD_MAX_FILES = 200
+    BULK_UPLOAD_MAX_CONCURRENT_EXTRACTIONS = 8
+    BULK_UPLOAD_MAX_ARCHIVE_BYTES = 200 * 1024 * 1024
     PDF_EXTRACTION_PRIORITY = ['pymupdf', 'azure', 'ai']
     SCORE_MIN = 1.0
     SCORE_MAX = 10.0
@@ -99,8 +93,40 @@ except ImportError:
 load_dotenv()
 openai.api_key = os.getenv("OPENAI_API_KEY")
 
+# Shared, pooled OpenAI clients (imported after load_dotenv so the API key is available)
+from llm_client import get_openai_client, get_async_openai_client, close_openai_clients
+from llm_cache import get_llm_cache, make_cache_key, should_use_cache, get_ttl_for_endpoint
+from llm_governor import get_governor, estimate_request_tokens
+from llm_resilience import get_resilience
+from token_budget import truncate_to_tokens, fit_prompt_sections, fit_messages
+from task_queue import TaskQueue
+from document_extraction import (
+    extract_text_from_pdf_pymupdf, extract_text_from_pdf_pypdf2, extract_text_from_docx,
+    get_extraction_pool, LOCAL_EXTRACTORS, DocumentSource, open_source, read_source_head
+)
+from upload_spool import spool_upload, spool_zip_members, UploadTooLargeError
+from debate_checkpoints import DebateCheckpointStore
+from extraction_cache import ExtractionCache
+from extraction_strategy import get_extraction_strategy
+from pagination import ListParams, list_params, paginate
+from async_database import RequestDatabase, create_async_session_factory, pool_options
+from workflow_progress import (
+    create_progress_session, update_progress, complete_progress, fail_progress, get_progress, subscribe as subscribe_progress
+)
+from openai.types.chat import ChatCompletion
+
 app = FastAPI(title="Barnes AI Hiring Assistant", version="4.0.0")
 
+@app.on_event("shutdown")
+async def shutdown_openai_clients():
+    """Release pooled OpenAI connections when the worker stops"""
+    await close_openai_clients()
+
+@app.on_event("shutdown")
+async def shutdown_extraction_pool():
+    """Stop document extraction worker processes"""
+    get_extraction_pool().shutdown()
+
 # CORS configuration - environment-aware
 cors_origins_env = os.getenv("CORS_ORIGINS", "")
 if cors_origins_env:
@@ -149,133 +175,108 @@ async def validation_exception_handler(request: FastAPIRequest, exc: RequestVali
 # File extraction functions
 # -----------------------------
 
-def extract_text_from_file(file_content: bytes, filename: str) -> Dict[str, any]:
-    """Extract text from various file formats. Returns dict with text and extraction_method."""
-    try:
-        print(f"Processing file: {filename}, size: {len(file_content)} bytes")
-        
-        # Check if it's a PDF file
-        if filename.lower().endswith('.pdf'):
-            # Follow extraction priority from config
-            for method in PDF_EXTRACTION_PRIORITY:
-                try:
-                    if method == 'pymupdf':
-                        print("Detected PDF file, trying PyMuPDF...")
-                        result = extract_text_from_pdf_pymupdf(file_content)
-                        print(f"PyMuPDF success: extracted {len(result)} characters")
-                        return {"text": result, "extraction_method": "PyMuPDF", "azure_used": False}
-                    elif method == 'pypdf2':
-                        print("Trying PyPDF2 extraction...")
-                        result = extract_text_from_pdf_pypdf2(file_content)
-                        print(f"PyPDF2 success: extracted {len(result)} characters")
-                        return {"text": result, "extraction_method": "PyPDF2", "azure_used": False}
-                    elif method == 'azure' and AZURE_ENABLED:
-                        print(f"Trying Azure Document Intelligence...")
-                        result = extract_text_from_pdf_azure(file_content)
-                        print(f"Azure success: extracted {len(result)} characters")
-                        return {"text": result, "extraction_method": "Azure Document Intelligence", "azure_used": True}
-                    elif method == 'ai':
-                        print(f"Previous methods failed, trying AI extraction...")
-                        base64_content = base64.b64encode(file_content).decode('utf-8')
-                        result = extract_text_with_ai(base64_content, filename)
-                        print(f"AI extraction result: {len(result)} characters")
-                        return {"text": result, "extraction_method": "OpenAI GPT-4", "azure_used": False}
-                except Exception as e:
-                    print(f"{method} failed: {str(e)}, trying next method...")
-                    continue
-            
-            # If all methods failed
-            raise ValueError("All extraction methods failed")
-        
-        # Handle Word documents
-        if filename.lower().endswith(('.docx', '.doc')):
-            try:
-                text = extract_text_from_docx(file_content)
-                if text.strip():
-                    print(f"DOCX extraction successful: {len(text)} characters")
-                    return {"text": text.strip(), "extraction_method": "python-docx", "azure_used": False}
-            except Exception as e:
-                print(f"DOCX extraction failed: {str(e)}")
-        
-        # For plain text files (.txt, etc.)
-        try:
-            text = file_content.decode('utf-8')
-            if text.strip():
-                print(f"Plain text extraction: {len(text)} characters")
-                return {"text": text.strip(), "extraction_method": "Plain Text", "azure_used": False}
-        except UnicodeDecodeError:
-            pass
-        
-        # If nothing works, try AI extraction as fallback
-        try:
-            base64_content = base64.b64encode(file_content).decode('utf-8')
-            result = extract_text_with_ai(base64_content, filename)
-            print(f"AI fallback result: {len(result)} characters")
-            return {"text": result, "extraction_method": "OpenAI GPT-4", "azure_used": False}
-        except Exception:
-            raise ValueError(f"Could not extract text from {filename}")
-            
-    except Exception as e:
-        print(f"Error in extract_text_from_file: {str(e)}")
-        raise ValueError(f"Error processing file {filename}: {str(e)}")
+# Extraction method -> extraction_method reported to the frontend
+EXTRACTION_METHOD_LABELS = {
+    'pymupdf': 'PyMuPDF',
+    'pypdf2': 'PyPDF2',
+    'azure': 'Azure Document Intelligence',
+    'ai': 'OpenAI GPT-4',
+    'docx': 'python-docx',
+    'text': 'Plain Text'
+}
 
-def extract_text_from_pdf_pymupdf(pdf_content: bytes) -> str:
-    """Extract text from PDF using PyMuPDF (fitz)"""
+# extract_text_with_ai sends the first 10000 base64 characters, i.e. the first 7500 bytes
+AI_EXTRACTION_MAX_BYTES = 7500
+
+def plan_extraction(document_type: str) -> List[str]:
+    """Extraction methods to try for a sniffed document type, in order"""
+    if document_type == 'pdf':
+        # Follow extraction priority from config
+        return [method for method in PDF_EXTRACTION_PRIORITY if method != 'azure' or AZURE_ENABLED]
+    if document_type == 'docx':
+        return ['docx', 'ai']
+    if document_type == 'text':
+        # Plain text files (.txt, etc.), AI extraction as fallback
+        return ['text', 'ai']
+    # Legacy .doc and unknown binary files
+    return ['ai']
+
+def run_remote_extractor(method: str, source: DocumentSource, filename: str) -> str:
+    """Azure / AI extraction (network-bound, needs the API clients of this process)"""
+    if method == 'azure':
+        # AI extraction is a separate step of the plan, so Azure must not fall back to it itself
+        return extract_text_from_pdf_azure(source, fallback_to_ai=False)
+    base64_content = base64.b64encode(read_source_head(source, AI_EXTRACTION_MAX_BYTES)).decode('utf-8')
+    return extract_text_with_ai(base64_content, filename)
+
+def extraction_failed_error(filename: str, document_type: str) -> ValueError:
+    if document_type == 'pdf':
+        return ValueError("All extraction methods failed")
+    return ValueError(f"Could not extract text from {filename}")
+
+async def extract_document_async(source: DocumentSource, filename: str, document_type: str,
+                                 file_hash: str, file_size: int) -> Dict[str, any]:
+    """Extract text from a document; returns dict with text, extraction_method and azure_used. Nothing runs on the event loop.
+
+    Files whose bytes were extracted before are served from the extraction cache without parsing.
+    Otherwise the extraction strategy runs the local parsers (PyMuPDF, PyPDF2, python-docx, in the
+    document extraction process pool) first and only escalates to Azure / AI extraction (concurrently,
+    in threads) when the local text scores below EXTRACTION_QUALITY_THRESHOLD.
+    """
     try:
-        # Open PDF from bytes
-        if not FITZ_AVAILABLE:
-            raise ImportError("PyMuPDF not available")
-        pdf_document = fitz.open(stream=pdf_content, filetype="pdf")
-        text = ""
-        
-        # Extract text from all pages
-        for page_num in range(pdf_document.page_count):
-            page = pdf_document[page_num]
-            text += page.get_text()
-        
-        pdf_document.close()
-        
-        if not text.strip():
-            raise ValueError("No text extracted from PDF")
-        
-        return text.strip()
-        
+        print(f"Processing file: {filename} ({document_type}), size: {file_size} bytes")
+        cached = await asyncio.to_thread(extraction_cache.get, file_hash)
+        if cached:
+            print(f"Extraction cache hit for {filename}: {len(cached['text'])} characters ({cached['extraction_method']})")
+            return cached
+
+        async def run_local(method: str):
+            return await get_extraction_pool().extract(method, source)
+
+        async def run_remote(method: str):
+            return await asyncio.to_thread(run_remote_extractor, method, source, filename), None
+
+        selected = await get_extraction_strategy().extract(plan_extraction(document_type), LOCAL_EXTRACTORS, run_local, run_remote)
+        if selected is None:
+            raise extraction_failed_error(filename, document_type)
+        method = selected["method"]
+        print(f"{EXTRACTION_METHOD_LABELS[method]} selected: {len(selected['text'])} characters, quality {selected['quality']['score']}")
+        extraction = {"text": selected["text"], "extraction_method": EXTRACTION_METHOD_LABELS[method], "azure_used": method == 'azure'}
+        await asyncio.to_thread(extraction_cache.put, file_hash, file_size, extraction)
+        return extraction
     except Exception as e:
-        raise ValueError(f"PyMuPDF extraction error: {str(e)}")
+        print(f"Error in extract_document_async: {str(e)}")
+        raise ValueError(f"Error processing file {filename}: {str(e)}")
 
+async def extract_text_from_upload_async(file: UploadFile) -> Dict[str, any]:
+    """Extract text from an uploaded file without reading it into memory.
 
-def extract_text_from_pdf_pypdf2(pdf_content: bytes) -> str:
-    """Extract text from PDF using PyPDF2"""
+    The upload is spooled to a temporary file (hashed and type-sniffed on the way) that the extractors
+    read by path. Raises HTTPException 413 if it exceeds UPLOAD_MAX_BYTES.
+    """
     try:
-        if not PYPDF2_AVAILABLE:
-            raise ImportError("PyPDF2 not available")
-        
-        pdf_reader = PdfReader(BytesIO(pdf_content))
-        text = ""
-        
-        # Extract text from all pages
-        for page in pdf_reader.pages:
-            text += page.extract_text()
-        
-        if not text.strip():
-            raise ValueError("No text extracted from PDF")
-        
-        return text.strip()
-        
-    except Exception as e:
-        raise ValueError(f"PyPDF2 extraction error: {str(e)}")
+        upload = await spool_upload(file)
+    except UploadTooLargeError as e:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Bestand {e.filename} is te groot (maximaal {e.max_bytes // (1024 * 1024)} MB)."
+        )
+    with upload:
+        return await extract_document_async(upload.path, upload.filename, upload.document_type, upload.sha256, upload.size)
 
 
-def extract_text_from_pdf_azure(pdf_content: bytes) -> str:
+def extract_text_from_pdf_azure(pdf_content: DocumentSource, fallback_to_ai: bool = True) -> str:
     """Extract text from PDF using Azure Document Intelligence"""
     try:
         endpoint = os.getenv("AZURE_DOC_INTEL_ENDPOINT")
         key = os.getenv("AZURE_DOC_INTEL_KEY")
         
         if not endpoint or not key or endpoint == "https://your-resource.cognitiveservices.azure.com/" or key == "your_azure_key_here":
+            if not fallback_to_ai:
+                raise ValueError("Azure credentials not configured")
             print("Azure credentials not configured, falling back to AI extraction...")
             # Fall back to AI extraction
-            base64_content = base64.b64encode(pdf_content).decode('utf-8')
+            base64_content = base64.b64encode(read_source_head(pdf_content, AI_EXTRACTION_MAX_BYTES)).decode('utf-8')
             return extract_text_with_ai(base64_content, "document.pdf")
         
         client = DocumentAnalysisClient(
@@ -283,11 +284,12 @@ def extract_text_from_pdf_azure(pdf_content: bytes) -> str:
             credential=AzureKeyCredential(key)
         )
         
-        poller = client.begin_analyze_document(
-            "prebuilt-read",
-            document=BytesIO(pdf_content)
-        )
-        result = poller.result()
+        with open_source(pdf_content) as document:
+            poller = client.begin_analyze_document(
+                "prebuilt-read",
+                document=document
+            )
+            result = poller.result(timeout=AZURE_TIMEOUT_SECONDS)
         
         text = "\n".join(line.content for page in result.pages for line in page.lines)
         
@@ -297,22 +299,13 @@ def extract_text_from_pdf_azure(pdf_content: bytes) -> str:
         return text.strip()
         
     except Exception as e:
+        if not fallback_to_ai:
+            raise ValueError(f"Azure Document Intelligence error: {str(e)}")
         print(f"Azure Document Intelligence error: {str(e)}, falling back to AI extraction...")
         # Fall back to AI extraction
-        base64_content = base64.b64encode(pdf_content).decode('utf-8')
+        base64_content = base64.b64encode(read_source_head(pdf_content, AI_EXTRACTION_MAX_BYTES)).decode('utf-8')
         return extract_text_with_ai(base64_content, "document.pdf")
 
-def extract_text_from_docx(doc_content: bytes) -> str:
-    """Extract text from Word documents using python-docx"""
-    try:
-        document = Document(BytesIO(doc_content))
-        text = "\n".join(paragraph.text for paragraph in document.paragraphs)
-        if not text.strip():
-            raise ValueError("No text extracted from DOCX")
-        return text
-    except Exception as e:
-        raise ValueError(f"DOCX extraction error: {str(e)}")
-
 def extract_text_with_ai(base64_content: str, filename: str) -> str:
     """Use AI to extract text from file content (fallback for non-PDF files)"""
     try:
@@ -328,15 +321,22 @@ Als dit een CV/curriculum vitae is, extraheer alle kandidaatinformatie inclusief
 Documentinhoud (base64):
 {base64_content[:10000]}..."""  # Limit to 10k chars to avoid token limits
         
-        response = openai.chat.completions.create(
-            model=OPENAI_MODEL_TEXT_EXTRACTION,
-            messages=[
-                {"role": "system", "content": "Je bent een technische documentprocessor. Je extraheert tekst uit documenten zonder uitleg of weigering."},
-                {"role": "user", "content": prompt}
-            ],
-            max_tokens=OPENAI_MAX_TOKENS_TEXT_EXTRACTION,
-            temperature=OPENAI_TEMPERATURE_TEXT_EXTRACTION
-        )
+        messages = [
+            {"role": "system", "content": "Je bent een technische documentprocessor. Je extraheert tekst uit documenten zonder uitleg of weigering."},
+            {"role": "user", "content": prompt}
+        ]
+        def attempt():
+            with get_governor().acquire(OPENAI_MODEL_TEXT_EXTRACTION, estimate_request_tokens(messages, OPENAI_MAX_TOKENS_TEXT_EXTRACTION, OPENAI_MODEL_TEXT_EXTRACTION)) as ticket:
+                attempt_response = get_openai_client().chat.completions.create(
+                    model=OPENAI_MODEL_TEXT_EXTRACTION,
+                    messages=messages,
+                    max_tokens=OPENAI_MAX_TOKENS_TEXT_EXTRACTION,
+                    temperature=OPENAI_TEMPERATURE_TEXT_EXTRACTION
+                )
+                ticket.record_usage(attempt_response.usage.total_tokens if attempt_response.usage else None)
+                return attempt_response
+        
+        response = get_resilience().call(OPENAI_MODEL_TEXT_EXTRACTION, attempt)
         
         result = response.choices[0].message.content.strip()
         
@@ -349,63 +349,158 @@ Documentinhoud (base64):
     except Exception as e:
         raise ValueError(f"AI tekstextractie mislukt: {str(e)}")
 
-def truncate_text_safely(text: str, max_length: int = 3000) -> str:
-    """Safely truncate text to stay within token limits"""
-    if len(text) <= max_length:
-        return text
-    return text[:max_length] + "\n\n[Content truncated for processing...]"
+def _prepare_openai_request(messages: List[Dict], max_tokens: int, model: Optional[str]):
+    """Resolve the model and truncate the last message so the request stays within token limits"""
+    # Use provided model or default to evaluation model
+    # Reference module-level variables - they're imported at top of file
+    if model is None:
+        # Use the module-level variable that was imported at top
+        try:
+            model = OPENAI_MODEL_EVALUATION
+        except NameError:
+            model = "gpt-4o-mini"  # Fallback default
+    
+    # Callers budget their sections up front; this only guards against over-limit calls
+    messages = fit_messages(messages, model, max_tokens)
+    
+    return model, messages
+
+def _cache_key_for(model: str, messages: List[Dict], max_tokens: int, temperature: float,
+                   cache_endpoint: Optional[str], use_cache: Optional[bool]) -> Optional[str]:
+    """Content hash of the call, or None when the call must bypass the cache"""
+    if not should_use_cache(temperature, use_cache):
+        get_llm_cache().record_bypass(cache_endpoint)
+        return None
+    return make_cache_key(model, messages, max_tokens, temperature)
+
+def _cached_result(payload: Optional[str], model: str) -> Optional[Dict]:
+    """Result dict for a cached payload (None on a miss or an unreadable entry)"""
+    if payload is None:
+        return None
+    try:
+        response = ChatCompletion.model_validate_json(payload)
+    except Exception as e:
+        print(f"Ignoring unreadable cache entry: {e}")
+        return None
+    return {
+        "success": True,
+        "result": response,
+        "tokens_used": 0,  # Served from cache, no tokens spent
+        "model_used": model,
+        "cached": True
+    }
 
-async def call_openai_safe_async(messages: List[Dict], max_tokens: int = 1000, temperature: float = 0.1, model: str = None) -> Dict:
-    """Async wrapper for call_openai_safe to enable parallel execution"""
-    loop = asyncio.get_event_loop()
-    return await loop.run_in_executor(None, call_openai_safe, messages, max_tokens, temperature, model)
+def _lookup_cached_completion(model: str, messages: List[Dict], max_tokens: int, temperature: float,
+                              cache_endpoint: Optional[str], use_cache: Optional[bool]):
+    """Return (cache_key, cached_result) - cache_key is None when the call must bypass the cache"""
+    cache_key = _cache_key_for(model, messages, max_tokens, temperature, cache_endpoint, use_cache)
+    if cache_key is None:
+        return None, None
+    return cache_key, _cached_result(get_llm_cache().get(cache_key, cache_endpoint), model)
+
+async def _lookup_cached_completion_async(model: str, messages: List[Dict], max_tokens: int, temperature: float,
+                                          cache_endpoint: Optional[str], use_cache: Optional[bool]):
+    """_lookup_cached_completion for the event loop (the cache's SQLite tier runs in a thread)"""
+    cache_key = _cache_key_for(model, messages, max_tokens, temperature, cache_endpoint, use_cache)
+    if cache_key is None:
+        return None, None
+    return cache_key, _cached_result(await get_llm_cache().get_async(cache_key, cache_endpoint), model)
+
+def _store_cached_completion(cache_key: Optional[str], response, cache_endpoint: Optional[str]):
+    """Store a successful completion under its content hash"""
+    if not cache_key:
+        return
+    try:
+        get_llm_cache().set(cache_key, response.model_dump_json(), get_ttl_for_endpoint(cache_endpoint), cache_endpoint)
+    except Exception as e:
+        print(f"Could not cache LLM response: {e}")
 
-def call_openai_safe(messages: List[Dict], max_tokens: int = 1000, temperature: float = 0.1, model: str = None) -> Dict:
-    """Safely call OpenAI API with token management and error handling"""
+async def _store_cached_completion_async(cache_key: Optional[str], response, cache_endpoint: Optional[str]):
+    """_store_cached_completion for the event loop"""
+    if not cache_key:
+        return
     try:
-        # Use provided model or default to evaluation model
-        # Reference module-level variables - they're imported at top of file
-        if model is None:
-            # Use the module-level variable that was imported at top
-            try:
-                model = OPENAI_MODEL_EVALUATION
-            except NameError:
-                model = "gpt-4o-mini"  # Fallback default
-        
-        # Estimate token count (rough approximation: 1 token ≈ 4 characters)
-        estimated_tokens = sum(len(msg.get('content', '')) // 4 for msg in messages)
-        
-        # For gpt-4o-mini, use conservative limits
-        max_input_tokens = 4000  # Conservative limit for smaller model
-        
-        # If estimated tokens exceed limit, truncate the last user message
-        if estimated_tokens > max_input_tokens:
-            last_message = messages[-1]
-            if last_message and 'content' in last_message:
-                # Calculate how much to keep: leave buffer for system prompt and response
-                # System prompt is typically ~500 tokens, response needs max_tokens
-                # So we can use: max_input_tokens - 500 - max_tokens
-                available_tokens = max_input_tokens - 500 - max_tokens
-                max_content_length = max(available_tokens * 4, 1000)  # Convert tokens to chars, min 1000
-                
-                if len(last_message['content']) > max_content_length:
-                    messages[-1] = {
-                        **last_message,
-                        'content': last_message['content'][:max_content_length] + '\n\n[Content truncated for token limits...]'
-                    }
+        await get_llm_cache().set_async(cache_key, response.model_dump_json(), get_ttl_for_endpoint(cache_endpoint), cache_endpoint)
+    except Exception as e:
+        print(f"Could not cache LLM response: {e}")
+
+async def call_openai_safe_async(messages: List[Dict], max_tokens: int = 1000, temperature: float = 0.1, model: str = None,
+                                 cache_endpoint: Optional[str] = None, use_cache: Optional[bool] = None) -> Dict:
+    """Safely call OpenAI API on the shared async client (no executor threads involved)"""
+    try:
+        model, messages = _prepare_openai_request(messages, max_tokens, model)
+        
+        cache_key, cached = await _lookup_cached_completion_async(model, messages, max_tokens, temperature, cache_endpoint, use_cache)
+        if cached:
+            return cached
+        
+        estimated_tokens = estimate_request_tokens(messages, max_tokens, model)
         
-        response = openai.chat.completions.create(
-            model=model,
-            messages=messages,
-            max_tokens=max_tokens,
-            temperature=temperature
+        async def attempt(ticket):
+            attempt_response = await get_async_openai_client().chat.completions.create(
+                model=model,
+                messages=messages,
+                max_tokens=max_tokens,
+                temperature=temperature
+            )
+            ticket.record_usage(attempt_response.usage.total_tokens if attempt_response.usage else None)
+            return attempt_response
+        
+        # Retries transient errors, hedges slow calls and fails fast while the circuit is open;
+        # every request (hedges included) waits for the rate governor before it is timed
+        response = await get_resilience().call_async(
+            model, attempt, admit=lambda: get_governor().acquire_async(model, estimated_tokens)
         )
+        await _store_cached_completion_async(cache_key, response, cache_endpoint)
+        
+        return {
+            "success": True,
+            "result": response,
+            "tokens_used": response.usage.total_tokens if response.usage else 0,
+            "model_used": model,
+            "cached": False
+        }
+        
+    except Exception as e:
+        return {
+            "success": False,
+            "error": str(e)
+        }
+
+def call_openai_safe(messages: List[Dict], max_tokens: int = 1000, temperature: float = 0.1, model: str = None,
+                     cache_endpoint: Optional[str] = None, use_cache: Optional[bool] = None) -> Dict:
+    """Safely call OpenAI API with token management, response caching and error handling.
+
+    Low-temperature calls are cached by default; pass use_cache=True to opt in
+    (e.g. debate at 0.8) or use_cache=False to force a fresh completion.
+    """
+    try:
+        model, messages = _prepare_openai_request(messages, max_tokens, model)
+        
+        cache_key, cached = _lookup_cached_completion(model, messages, max_tokens, temperature, cache_endpoint, use_cache)
+        if cached:
+            return cached
+        
+        def attempt():
+            with get_governor().acquire(model, estimate_request_tokens(messages, max_tokens, model)) as ticket:
+                attempt_response = get_openai_client().chat.completions.create(
+                    model=model,
+                    messages=messages,
+                    max_tokens=max_tokens,
+                    temperature=temperature
+                )
+                ticket.record_usage(attempt_response.usage.total_tokens if attempt_response.usage else None)
+                return attempt_response
+        
+        response = get_resilience().call(model, attempt)
+        _store_cached_completion(cache_key, response, cache_endpoint)
         
         return {
             "success": True,
             "result": response,
             "tokens_used": response.usage.total_tokens if response.usage else 0,
-            "model_used": model
+            "model_used": model,
+            "cached": False
         }
         
     except Exception as e:
@@ -424,9 +519,28 @@ DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./ai_hiring.db")
 if DATABASE_URL.startswith("sqlite"):
     engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
 else:
-    # PostgreSQL or other databases
-    engine = create_engine(DATABASE_URL, pool_pre_ping=True, pool_recycle=300)
+    # PostgreSQL or other databases; pool sizes from config (DB_POOL_*)
+    engine = create_engine(DATABASE_URL, **pool_options(DATABASE_URL))
 SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False)
+# AsyncSession factory for request handlers, or None if no async driver is installed
+AsyncSessionLocal = create_async_session_factory(DATABASE_URL)
+
+async def get_async_db():
+    """Request-scoped database session (FastAPI dependency); always closed after the request"""
+    db = RequestDatabase(SessionLocal, AsyncSessionLocal)
+    try:
+        yield db
+    finally:
+        await db.close()
+
+def get_db():
+    """Request-scoped sync session for handlers not moved to get_async_db; always closed after the request"""
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
 Base = declarative_base()
 
 class PersonaEnum(str, enum.Enum):
@@ -444,12 +558,13 @@ class JobPostingDB(Base):
     location = Column(String)
     salary_range = Column(String)
     ai_analysis = Column(Text, nullable=True)  # Store AI analysis results
-    created_at = Column(DateTime(timezone=True), nullable=True)  # Made nullable for SQLite compatibility
+    created_at = Column(DateTime(timezone=True), nullable=True, default=datetime.now)  # Made nullable for SQLite compatibility
     timeline_stage = Column(String, nullable=True)  # Manual timeline stage override: 'waiting', 'inProgress', 'afterFirst', 'multiRound', 'completed'
     is_active = Column(Boolean, default=True)  # Active/Inactive grouping
     weighted_requirements = Column(Text, nullable=True)  # JSON string of dict { "skill": weight }
     assigned_agency_id = Column(String, ForeignKey("users.id"), nullable=True)  # For recruiter portal
     company_id = Column(String, ForeignKey("companies.id"), nullable=True)  # Portal/company isolation
+    __table_args__ = (Index('ix_job_postings_company_id', 'company_id'),)
     candidates = relationship("CandidateDB", back_populates="job")
     # Note: Duplicate prevention is handled via check_duplicate_vacancy() function
     # rather than a database constraint to properly handle NULL company_id values
@@ -457,7 +572,7 @@ class JobPostingDB(Base):
 class CandidateDB(Base):
     __tablename__ = "candidates"
     id = Column(String, primary_key=True, default=lambda: str(uuid4()))
-    job_id = Column(String, ForeignKey("job_postings.id"), nullable=True)  # Made nullable - candidates can exist without a job
+    job_id = Column(String, ForeignKey("job_postings.id"), nullable=True, index=True)  # Made nullable - candidates can exist without a job
     name = Column(String, nullable=False)
     email = Column(String)
     resume_text = Column(Text, nullable=False)
@@ -487,9 +602,24 @@ class CandidateDB(Base):
     submitted_by_company_id = Column(String, ForeignKey("companies.id"), nullable=True)  # Which agency/company submitted this candidate
     pipeline_stage = Column(String)  # Pipeline stage: "introduced", "review", "first_interview", "second_interview", "offer", "complete"
     pipeline_status = Column(String)  # Pipeline status: "active", "on_hold", "rejected", "accepted"
+    __table_args__ = (
+        # Candidate list pages (paginate orders by created_at, id), unfiltered and per submitting company
+        Index('ix_candidates_created_id', 'created_at', 'id'),
+        Index('ix_candidates_submitted_by_company_created_id', 'submitted_by_company_id', 'created_at', 'id'),
+    )
     
     job = relationship("JobPostingDB", back_populates="candidates")
     evaluations = relationship("EvaluationDB", back_populates="candidate")
+    # Indexed copy of preferential_job_ids; kept in sync by set_preferential_job_ids()
+    job_links = relationship("CandidateJobLinkDB", cascade="all, delete-orphan")
+
+class CandidateJobLinkDB(Base):
+    __tablename__ = "candidate_job_links"
+    candidate_id = Column(String, ForeignKey("candidates.id", ondelete="CASCADE"), primary_key=True)
+    job_id = Column(String, ForeignKey("job_postings.id", ondelete="CASCADE"), primary_key=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    # The primary key serves "jobs of a candidate"; this index serves "candidates of a job"
+    __table_args__ = (Index('ix_candidate_job_links_job_candidate', 'job_id', 'candidate_id'),)
 
 class CandidateConversationDB(Base):
     __tablename__ = "candidate_conversations"
@@ -505,6 +635,7 @@ class CandidateConversationDB(Base):
     conversation_channel = Column(String, nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+    __table_args__ = (Index('ix_candidate_conversations_candidate_job', 'candidate_id', 'job_id'),)
 
 class EvaluationDB(Base):
     __tablename__ = "evaluations"
@@ -514,6 +645,7 @@ class EvaluationDB(Base):
     persona = Column(Enum(PersonaEnum))
     result_summary = Column(Text)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+    __table_args__ = (Index('ix_evaluations_candidate_id', 'candidate_id'),)
     candidate = relationship("CandidateDB", back_populates="evaluations")
 
 class EvaluationResultDB(Base):
@@ -528,6 +660,14 @@ class EvaluationResultDB(Base):
     is_archived = Column(Boolean, default=False)  # Archive old evaluations when new ones are created
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    __table_args__ = (
+        # Results of a candidate (optionally for a job), e.g. the latest non-archived evaluation
+        Index('ix_evaluation_results_candidate_job', 'candidate_id', 'job_id', 'result_type', 'is_archived'),
+        # Results of a job: archiving on re-evaluation, job timelines, /evaluation-results?job_id=
+        Index('ix_evaluation_results_job_type', 'job_id', 'result_type', 'is_archived'),
+        # Unfiltered /evaluation-results: WHERE is_archived = false ORDER BY created_at DESC
+        Index('ix_evaluation_results_archived_created_id', 'is_archived', 'created_at', 'id'),
+    )
     candidate = relationship("CandidateDB")
     job = relationship("JobPostingDB")
 
@@ -618,6 +758,8 @@ class NotificationDB(Base):
     related_result_id = Column(String, ForeignKey("evaluation_results.id"), nullable=True)
     is_read = Column(Boolean, default=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+    # A user's (unread) notifications, newest first
+    __table_args__ = (Index('ix_notifications_user_read_created', 'user_id', 'is_read', 'created_at'),)
 
 class CommentDB(Base):
     __tablename__ = "comments"
@@ -629,6 +771,12 @@ class CommentDB(Base):
     content = Column(Text, nullable=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    # Comments of a candidate, job or result, newest first
+    __table_args__ = (
+        Index('ix_comments_candidate_created_id', 'candidate_id', 'created_at', 'id'),
+        Index('ix_comments_job_created_id', 'job_id', 'created_at', 'id'),
+        Index('ix_comments_result_created_id', 'result_id', 'created_at', 'id'),
+    )
 
 class JobWatcherDB(Base):
     __tablename__ = "job_watchers"
@@ -636,7 +784,11 @@ class JobWatcherDB(Base):
     job_id = Column(String, ForeignKey("job_postings.id"), nullable=False)
     user_id = Column(String, ForeignKey("users.id"), nullable=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
-    __table_args__ = (UniqueConstraint('job_id', 'user_id', name='unique_job_watcher'),)
+    # The unique constraint's index (job_id first) serves "watchers of a job"
+    __table_args__ = (
+        UniqueConstraint('job_id', 'user_id', name='unique_job_watcher'),
+        Index('ix_job_watchers_user_id', 'user_id'),
+    )
 
 class CandidateWatcherDB(Base):
     __tablename__ = "candidate_watchers"
@@ -675,9 +827,83 @@ class ScheduledAppointmentDB(Base):
     calendar_event_id = Column(String, nullable=True)  # For future calendar integration
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    # Appointments of a candidate or job in date order, and upcoming appointments
+    __table_args__ = (
+        Index('ix_scheduled_appointments_candidate_scheduled', 'candidate_id', 'scheduled_at'),
+        Index('ix_scheduled_appointments_job_scheduled', 'job_id', 'scheduled_at'),
+        Index('ix_scheduled_appointments_scheduled_at', 'scheduled_at'),
+    )
+
+class BackgroundTaskDB(Base):
+    __tablename__ = "background_tasks"
+    id = Column(String, primary_key=True, default=lambda: str(uuid4()))
+    task_type = Column(String, nullable=False)  # 'evaluation', 'debate', 'job_analysis'
+    status = Column(String, nullable=False, default='queued')  # queued, running, completed, failed, cancelled
+    priority = Column(Integer, nullable=False, default=0)  # Higher runs first
+    payload = Column(Text, nullable=False)  # JSON arguments for the task handler
+    result = Column(Text, nullable=True)  # JSON response, same shape as the synchronous endpoint
+    result_id = Column(String, nullable=True)  # EvaluationResultDB id produced by the task, if any
+    progress = Column(Text, nullable=True)  # JSON progress reported by the handler
+    error = Column(Text, nullable=True)
+    attempts = Column(Integer, nullable=False, default=0)
+    cancel_requested = Column(Boolean, default=False)
+    worker_id = Column(String, nullable=True)
+    lease_expires_at = Column(DateTime(timezone=True), nullable=True)  # Requeued if the worker stops heartbeating
+    created_by = Column(String, ForeignKey("users.id"), nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    started_at = Column(DateTime(timezone=True), nullable=True)
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+    __table_args__ = (Index('ix_background_tasks_status_priority', 'status', 'priority', 'created_at'),)
+
+class DebateSessionDB(Base):
+    __tablename__ = "debate_sessions"
+    id = Column(String, primary_key=True, default=lambda: str(uuid4()))
+    candidate_id = Column(String, ForeignKey("candidates.id"), nullable=False)
+    job_id = Column(String, ForeignKey("job_postings.id"), nullable=True)
+    persona_prompts = Column(Text, nullable=False)  # JSON persona name -> system prompt, needed to resume
+    company_note = Column(Text, nullable=True)
+    status = Column(String, nullable=False, default='running')  # running, failed, completed
+    result_id = Column(String, nullable=True)  # EvaluationResultDB id once the debate completed
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+
+class DebateCheckpointDB(Base):
+    __tablename__ = "debate_checkpoints"
+    id = Column(String, primary_key=True, default=lambda: str(uuid4()))
+    session_id = Column(String, ForeignKey("debate_sessions.id"), nullable=False)
+    step = Column(String, nullable=False)  # 'moderator_opening', 'personas_round1', ...
+    sequence = Column(Integer, nullable=False)  # Order in which the steps first ran
+    status = Column(String, nullable=False)  # completed, failed
+    payload = Column(Text, nullable=True)  # JSON messages, timing and planner decision of the step
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    __table_args__ = (UniqueConstraint('session_id', 'step', name='uq_debate_checkpoint_step'),)
+
+class ExtractionCacheDB(Base):
+    __tablename__ = "extraction_cache"
+    id = Column(String, primary_key=True, default=lambda: str(uuid4()))
+    content_hash = Column(String, nullable=False)  # SHA-256 of the uploaded file bytes
+    extractor_version = Column(String, nullable=False)  # DOCUMENT_EXTRACTOR_VERSION the text was extracted with
+    file_size = Column(Integer, nullable=True)
+    text = Column(Text, nullable=False)
+    extraction_method = Column(String, nullable=False)  # Label as reported to the frontend
+    azure_used = Column(Boolean, default=False)
+    hit_count = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    last_used_at = Column(DateTime(timezone=True), nullable=True)
+    __table_args__ = (UniqueConstraint('content_hash', 'extractor_version', name='uq_extraction_cache_hash_version'),)
 
 Base.metadata.create_all(bind=engine)
 
+# Durable queue for long-running LLM work; workers start with the app
+task_queue = TaskQueue(SessionLocal, BackgroundTaskDB)
+# Completed debate steps, so failed debates resume instead of starting over
+debate_checkpoint_store = DebateCheckpointStore(SessionLocal, DebateSessionDB, DebateCheckpointDB)
+# Extracted document text by file hash, so re-uploaded files skip parsing and OCR
+extraction_cache = ExtractionCache(SessionLocal, ExtractionCacheDB)
+
 def slugify(value: Optional[str]) -> str:
     if not value:
         return str(uuid4())[:8]
@@ -709,6 +935,34 @@ def ensure_column_exists(table_name: str, column_name: str, declaration: str):
         # Table might not exist yet, which is fine
         print(f"Note: Could not check columns for {table_name}: {e}")
 
+# Indexes replaced by a wider one (list pages also order by id); dropped from existing databases
+SUPERSEDED_INDEXES = [
+    "ix_candidates_submitted_by_company_created",
+    "ix_evaluation_results_archived_created",
+    "ix_comments_candidate_created",
+    "ix_comments_job_created",
+    "ix_comments_result_created",
+]
+
+def ensure_indexes_exist():
+    """Create indexes declared on the models that an existing database lacks (SQLite and PostgreSQL)
+
+    create_all() only creates indexes together with a new table, so indexes added to existing
+    tables are created here.
+    """
+    for index_name in SUPERSEDED_INDEXES:
+        try:
+            with engine.begin() as connection:
+                connection.execute(text(f"DROP INDEX IF EXISTS {index_name}"))
+        except Exception as e:
+            print(f"Note: Could not drop index {index_name}: {e}")
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            try:
+                index.create(bind=engine, checkfirst=True)
+            except Exception as e:
+                print(f"Note: Could not create index {index.name} on {table.name}: {e}")
+
 SCHEMA_COLUMN_UPDATES = [
     ("users", "company_id", "TEXT"),
     ("users", "password_hash", "TEXT"),
@@ -858,6 +1112,9 @@ def bootstrap_schema():
     Base.metadata.create_all(bind=engine)
     for table, column, declaration in SCHEMA_COLUMN_UPDATES:
         ensure_column_exists(table, column, declaration)
+    ensure_indexes_exist()
+    backfill_candidate_job_links()
+    backfill_created_at()
     
     default_company_id = ensure_default_company()
     assign_users_without_company(default_company_id)
@@ -867,6 +1124,78 @@ def bootstrap_schema():
     # Seed test candidate for candidate portal
     seed_test_candidate_for_portal()
 
+def parse_job_ids(job_ids: Optional[str]) -> List[str]:
+    """Job IDs of a comma-separated string (preferential_job_ids, job_ids form fields), without duplicates"""
+    if not job_ids:
+        return []
+    return list(dict.fromkeys(jid.strip() for jid in str(job_ids).split(",") if jid.strip()))
+
+def set_preferential_job_ids(db, candidate: "CandidateDB", job_ids: List[str], existing_job_ids: Optional[set] = None):
+    """Set a candidate's preferential jobs: the preferential_job_ids column and its candidate_job_links rows
+
+    Links are only created for jobs that exist; pass existing_job_ids to skip that lookup (bulk inserts).
+    """
+    job_ids = list(dict.fromkeys(jid for jid in job_ids if jid))
+    candidate.preferential_job_ids = ",".join(job_ids) if job_ids else None
+    if existing_job_ids is None:
+        existing_job_ids = {
+            row[0] for row in db.query(JobPostingDB.id).filter(JobPostingDB.id.in_(job_ids))
+        } if job_ids else set()
+    current_links = {link.job_id: link for link in candidate.job_links}
+    candidate.job_links = [
+        current_links.get(jid) or CandidateJobLinkDB(job_id=jid)
+        for jid in job_ids if jid in existing_job_ids
+    ]
+
+def candidates_linked_to_jobs(job_ids):
+    """Subquery of candidate IDs with one of job_ids as preferential job (index lookup on candidate_job_links)"""
+    if isinstance(job_ids, str):
+        return select(CandidateJobLinkDB.candidate_id).where(CandidateJobLinkDB.job_id == job_ids)
+    return select(CandidateJobLinkDB.candidate_id).where(CandidateJobLinkDB.job_id.in_(job_ids))
+
+def backfill_candidate_job_links():
+    """Create candidate_job_links from the preferential_job_ids column (skipped once links exist)"""
+    db = SessionLocal()
+    try:
+        if db.query(CandidateJobLinkDB.candidate_id).first() is not None:
+            return
+        existing_job_ids = {row[0] for row in db.query(JobPostingDB.id)}
+        links = []
+        for candidate_id, preferential_job_ids in db.query(CandidateDB.id, CandidateDB.preferential_job_ids).filter(
+            CandidateDB.preferential_job_ids.isnot(None), CandidateDB.preferential_job_ids != ""
+        ):
+            links.extend(
+                {"candidate_id": candidate_id, "job_id": jid}
+                for jid in parse_job_ids(preferential_job_ids) if jid in existing_job_ids
+            )
+        if links:
+            db.execute(insert(CandidateJobLinkDB), links)
+            db.commit()
+            print(f"✓ Backfilled {len(links)} candidate-job links from preferential_job_ids")
+    except Exception as e:
+        db.rollback()
+        print(f"⚠ Could not backfill candidate-job links: {str(e)}")
+    finally:
+        db.close()
+
+def backfill_created_at():
+    """Give rows of paginated lists without created_at one: keyset pages need a NOT NULL sort column"""
+    db = SessionLocal()
+    try:
+        updated = 0
+        for model in (JobPostingDB, CandidateDB, EvaluationResultDB, CommentDB, ApprovalDB):
+            updated += db.query(model).filter(model.created_at.is_(None)).update(
+                {model.created_at: datetime.now()}, synchronize_session=False
+            )
+        db.commit()
+        if updated:
+            print(f"✓ Backfilled created_at of {updated} rows")
+    except Exception as e:
+        db.rollback()
+        print(f"⚠ Could not backfill created_at: {str(e)}")
+    finally:
+        db.close()
+
 def ensure_default_company() -> Optional[str]:
     db = SessionLocal()
     try:
@@ -1205,7 +1534,9 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> UserDB:
+async def get_current_user(
+    credentials: HTTPAuthorizationCredentials = Depends(security)
+) -> UserDB:
     """Get the current authenticated user from JWT token"""
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
@@ -1221,14 +1552,23 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
     except JWTError:
         raise credentials_exception
     
-    db = SessionLocal()
-    try:
-        user = db.query(UserDB).filter(UserDB.id == user_id, UserDB.is_active == True).first()
-        if user is None:
-            raise credentials_exception
+    def load_user(session):
+        user = session.query(UserDB).filter(UserDB.id == user_id, UserDB.is_active == True).first()
+        if user is not None:
+            # Detached like before, so handlers can use it with their own sessions
+            session.expunge(user)
         return user
+    
+    # Own session, closed right after the lookup: the request's session would keep a connection
+    # (and on PostgreSQL an open transaction) until teardown, which runs after the response
+    database = RequestDatabase(SessionLocal, AsyncSessionLocal)
+    try:
+        user = await database.run_sync(load_user)
     finally:
-        db.close()
+        await database.close()
+    if user is None:
+        raise credentials_exception
+    return user
 
 # Permission checking functions
 def require_role(allowed_roles: List[str]):
@@ -1860,10 +2200,9 @@ async def get_current_user_info(current_user: UserDB = Depends(get_current_user)
 # -----------------------------
 
 @app.get("/personas")
-async def get_personas(company_id: Optional[str] = None):
+async def get_personas(company_id: Optional[str] = None, db: Session = Depends(get_db)):
     """Get all active personas, optionally filtered by company/portal"""
     try:
-        db = SessionLocal()
         query = db.query(PersonaDB).filter(PersonaDB.is_active == True)
         
         # Filter by company_id if provided (portal isolation)
@@ -1905,11 +2244,11 @@ async def get_personas(company_id: Optional[str] = None):
 
 @app.post("/personas")
 async def create_persona(
-    request: Request
+    request: Request,
+    db: Session = Depends(get_db)
 ):
     """Create a new evaluation persona - accepts both JSON and Form data"""
     try:
-        db = SessionLocal()
         
         # Check content type to handle both JSON and Form data
         content_type = request.headers.get("content-type", "")
@@ -2026,11 +2365,11 @@ async def create_persona(
 @app.put("/personas/{persona_id}")
 async def update_persona(
     persona_id: str,
-    request: Request
+    request: Request,
+    db: Session = Depends(get_db)
 ):
     """Update a persona - accepts both JSON and Form data"""
     try:
-        db = SessionLocal()
         
         persona = db.query(PersonaDB).filter(PersonaDB.id == persona_id).first()
         if not persona:
@@ -2156,10 +2495,9 @@ async def update_persona(
 # Evaluation Handler endpoints
 # -----------------------------
 @app.get("/evaluation-handlers")
-async def get_evaluation_handlers():
+async def get_evaluation_handlers(db: Session = Depends(get_db)):
     """Get all active evaluation handlers"""
     try:
-        db = SessionLocal()
         handlers = db.query(EvaluationHandlerDB).filter(EvaluationHandlerDB.is_active == True).all()
         db.close()
         
@@ -2188,11 +2526,11 @@ async def create_evaluation_handler(
     name: str = Form(...),
     display_name: str = Form(...),
     guidelines: str = Form(...),
-    is_default: Optional[bool] = Form(False)
+    is_default: Optional[bool] = Form(False),
+    db: Session = Depends(get_db)
 ):
     """Create a new evaluation handler"""
     try:
-        db = SessionLocal()
         
         # If setting as default, unset other defaults
         if is_default:
@@ -2230,11 +2568,11 @@ async def update_evaluation_handler(
     name: Optional[str] = Form(None),
     display_name: Optional[str] = Form(None),
     guidelines: Optional[str] = Form(None),
-    is_default: Optional[bool] = Form(None)
+    is_default: Optional[bool] = Form(None),
+    db: Session = Depends(get_db)
 ):
     """Update an evaluation handler"""
     try:
-        db = SessionLocal()
         handler = db.query(EvaluationHandlerDB).filter(EvaluationHandlerDB.id == handler_id).first()
         
         if not handler:
@@ -2279,10 +2617,9 @@ async def update_evaluation_handler(
         }
 
 @app.delete("/evaluation-handlers/{handler_id}")
-async def delete_evaluation_handler(handler_id: str):
+async def delete_evaluation_handler(handler_id: str, db: Session = Depends(get_db)):
     """Soft delete an evaluation handler (set is_active to False)"""
     try:
-        db = SessionLocal()
         
         handler = db.query(EvaluationHandlerDB).filter(EvaluationHandlerDB.id == handler_id).first()
         if not handler:
@@ -2309,11 +2646,10 @@ async def delete_evaluation_handler(handler_id: str):
         }
 
 @app.delete("/personas/{persona_id}")
-async def delete_persona(persona_id: str):
+async def delete_persona(persona_id: str, db: Session = Depends(get_db)):
     """Soft delete a persona (set is_active to False)"""
     db = None
     try:
-        db = SessionLocal()
         
         persona = db.query(PersonaDB).filter(PersonaDB.id == persona_id).first()
         if not persona:
@@ -2348,10 +2684,9 @@ async def delete_persona(persona_id: str):
 # -----------------------------
 
 @app.get("/persona-templates")
-async def get_persona_templates():
+async def get_persona_templates(db: Session = Depends(get_db)):
     """Get all persona templates (always available, cannot be deleted)"""
     try:
-        db = SessionLocal()
         templates = db.query(PersonaTemplateDB).order_by(PersonaTemplateDB.category, PersonaTemplateDB.display_name).all()
         db.close()
         
@@ -2378,10 +2713,9 @@ async def get_persona_templates():
         raise HTTPException(status_code=500, detail=f"Failed to get persona templates: {str(e)}")
 
 @app.post("/personas/from-template")
-async def create_persona_from_template(request: Request):
+async def create_persona_from_template(request: Request, db: Session = Depends(get_db)):
     """Create a new persona from a template with optional modifications"""
     try:
-        db = SessionLocal()
         
         # Get request data
         content_type = request.headers.get("content-type", "")
@@ -2603,11 +2937,11 @@ except Exception as e:
 
 @app.post("/upload-job-description")
 async def upload_job_description(
-    request: Request
+    request: Request,
+    db: Session = Depends(get_db)
 ):
     """Upload job description - accepts both JSON and Form data"""
     try:
-        db = SessionLocal()
         
         # Check content type to handle both JSON and Form data
         content_type = request.headers.get("content-type", "")
@@ -2638,9 +2972,8 @@ async def upload_job_description(
             
             # If file is provided, extract text from it
             if file and hasattr(file, 'filename') and file.filename:
-                file_content = await file.read()
                 try:
-                    extraction_result = extract_text_from_file(file_content, file.filename)
+                    extraction_result = await extract_text_from_upload_async(file)
                     extracted_text = extraction_result["text"]
                     description = f"{description}\n\nAdditional Details from {file.filename}:\n{extracted_text}"
                 except Exception as e:
@@ -2896,20 +3229,35 @@ def _safe_parse_json(value):
             return None
     return None
 
+# Sortable columns and heavy (deferrable) columns of job description lists
+JOB_SORT_COLUMNS = {
+    "created_at": JobPostingDB.created_at,
+    "title": JobPostingDB.title,
+    "company": JobPostingDB.company
+}
+JOB_HEAVY_COLUMNS = {
+    "description": JobPostingDB.description,
+    "requirements": JobPostingDB.requirements,
+    "ai_analysis": JobPostingDB.ai_analysis,
+    "weighted_requirements": JobPostingDB.weighted_requirements
+}
+
 @app.get("/job-descriptions")
 async def get_job_descriptions(
     request: Request,
     company_id: Optional[str] = None,
-    recruiter_id: Optional[str] = None
+    recruiter_id: Optional[str] = None,
+    params: ListParams = Depends(list_params(JOB_SORT_COLUMNS)),
+    database: RequestDatabase = Depends(get_async_db)
 ):
     """Get all job descriptions, optionally filtered by company_id or recruiter_id
     
     Allows unauthenticated requests for public pages, but filters by company/recruiter if authenticated.
+    Supports limit/cursor pagination, sort (e.g. -created_at, title) and fields (e.g. id,title,company).
     """
-    try:
+    def load(db):
         import json
         from fastapi import Request
-        db = SessionLocal()
         query = db.query(JobPostingDB)
         
         # Try to get current user (optional - allow unauthenticated requests)
@@ -2953,36 +3301,33 @@ async def get_job_descriptions(
                 )
             )
         
-        jobs = query.all()
-        
-        # Remove duplicates: keep only the first occurrence of each title+company+company_id combination
-        seen_jobs = {}  # key: (title_lower, company_lower, company_id)
-        unique_jobs = []
-        for job in jobs:
-            key = (
-                job.title.strip().lower() if job.title else "",
-                job.company.strip().lower() if job.company else "",
-                job.company_id
+        # Remove duplicates: of the jobs with the same title+company+company_id only the most recent one
+        # is listed. Done in SQL so a page holds unique jobs and pages need no knowledge of each other.
+        newer = aliased(JobPostingDB)
+        newer_filters = [newer.assigned_agency_id == recruiter_id] if recruiter_id else []
+        query = query.filter(~exists().where(
+            *newer_filters,
+            func.lower(func.trim(newer.title)) == func.lower(func.trim(JobPostingDB.title)),
+            func.lower(func.trim(newer.company)) == func.lower(func.trim(JobPostingDB.company)),
+            or_(
+                newer.company_id == JobPostingDB.company_id,
+                and_(newer.company_id.is_(None), JobPostingDB.company_id.is_(None))
+            ),
+            or_(
+                newer.created_at > JobPostingDB.created_at,
+                and_(JobPostingDB.created_at.is_(None), newer.created_at.isnot(None)),
+                # Same (or no) created_at: keep one of them
+                and_(
+                    or_(
+                        newer.created_at == JobPostingDB.created_at,
+                        and_(newer.created_at.is_(None), JobPostingDB.created_at.is_(None))
+                    ),
+                    newer.id < JobPostingDB.id
+                )
             )
-            if key not in seen_jobs:
-                seen_jobs[key] = job
-                unique_jobs.append(job)
-            else:
-                # If duplicate found, keep the one with the most recent created_at
-                existing_job = seen_jobs[key]
-                if job.created_at and existing_job.created_at:
-                    if job.created_at > existing_job.created_at:
-                        # Replace with newer one
-                        unique_jobs.remove(existing_job)
-                        seen_jobs[key] = job
-                        unique_jobs.append(job)
-                elif job.created_at and not existing_job.created_at:
-                    # Keep the one with created_at
-                    unique_jobs.remove(existing_job)
-                    seen_jobs[key] = job
-                    unique_jobs.append(job)
-        
-        jobs = unique_jobs  # Use deduplicated list
+        ))
+        query = query.options(*params.defer_unwanted(JOB_HEAVY_COLUMNS))
+        jobs, next_cursor = paginate(query, params, JOB_SORT_COLUMNS, JobPostingDB.id)
         
         # Debug logging
         print(f"[DEBUG get_job_descriptions] Found {len(jobs)} unique jobs (after deduplication)")
@@ -2991,40 +3336,44 @@ async def get_job_descriptions(
         for job in jobs[:3]:  # Log first 3 jobs
             print(f"[DEBUG] Job: {job.title}, company_id: {job.company_id}, is_active: {getattr(job, 'is_active', 'N/A')}")
         
-        db.close()
+        def heavy(job, field):
+            # Deferred columns are only read when requested (reading them would load them one by one)
+            return getattr(job, field) if params.wants(field) else None
         
         return {
             "success": True,
             "jobs": [
-                {
+                params.project({
                     "id": job.id,
                     "title": job.title,
                     "company": job.company,
-                    "description": job.description,
-                    "requirements": job.requirements,
+                    "description": heavy(job, "description"),
+                    "requirements": heavy(job, "requirements"),
                     "location": job.location,
                     "salary_range": job.salary_range,
-                    "ai_analysis": _safe_parse_json(job.ai_analysis) if job.ai_analysis else None,
+                    "ai_analysis": _safe_parse_json(job.ai_analysis) if heavy(job, "ai_analysis") else None,
                     "created_at": job.created_at.isoformat() if job.created_at else "Recently uploaded",
                     "timeline_stage": job.timeline_stage,
                     "is_active": job.is_active if hasattr(job, 'is_active') else True,  # Default to active if not set
-                    "weighted_requirements": job.weighted_requirements if hasattr(job, 'weighted_requirements') else None,
+                    "weighted_requirements": heavy(job, "weighted_requirements"),
                     "assigned_agency_id": job.assigned_agency_id if hasattr(job, 'assigned_agency_id') else None,
                     "company_id": job.company_id if hasattr(job, 'company_id') else None  # Include company_id in response
-                }
+                })
                 for job in jobs
-            ]
+            ],
+            "next_cursor": next_cursor
         }
-        
+    
+    try:
+        return await database.run_sync(load)
     except Exception as e:
         print(f"Error getting job descriptions: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to get job descriptions: {str(e)}")
 
 @app.delete("/job-descriptions/{job_id}")
-async def delete_job_description(job_id: str):
+async def delete_job_description(job_id: str, db: Session = Depends(get_db)):
     """Delete a job description with safe cascade handling"""
     try:
-        db = SessionLocal()
         
         # Check if job exists
         job = db.query(JobPostingDB).filter(JobPostingDB.id == job_id).first()
@@ -3044,6 +3393,9 @@ async def delete_job_description(job_id: str):
                 EvaluationDB.candidate_id.in_([c.id for c in candidates])
             ).delete()
         
+        # Candidates no longer have this job as preferential job
+        db.query(CandidateJobLinkDB).filter(CandidateJobLinkDB.job_id == job_id).delete(synchronize_session=False)
+        
         # Delete the job posting
         db.delete(job)
         db.commit()
@@ -3134,10 +3486,10 @@ TEKST VAN WEBPAGINA:
 
 Extraheer alle beschikbare informatie en vul het JSON object in."""
         
-        openai_result = call_openai_safe([
+        openai_result = await call_openai_safe_async([
             {"role": "system", "content": system_prompt},
             {"role": "user", "content": user_prompt}
-        ], max_tokens=1500, temperature=0.1, model=OPENAI_MODEL_JOB_EXTRACTION)
+        ], max_tokens=1500, temperature=0.1, model=OPENAI_MODEL_JOB_EXTRACTION, cache_endpoint="job_extraction")
         
         if not openai_result["success"]:
             raise HTTPException(status_code=500, detail=f"AI extraction failed: {openai_result.get('error', 'Unknown error')}")
@@ -3200,11 +3552,11 @@ async def update_job_description(
     location: Optional[str] = Form(None),
     salary_range: Optional[str] = Form(None),
     timeline_stage: Optional[str] = Form(None),
-    is_active: Optional[str] = Form(None)
+    is_active: Optional[str] = Form(None),
+    db: Session = Depends(get_db)
 ):
     """Update a job description - supports both Form data and JSON"""
     try:
-        db = SessionLocal()
         
         job = db.query(JobPostingDB).filter(JobPostingDB.id == job_id).first()
         if not job:
@@ -3306,6 +3658,53 @@ async def update_job_description(
         print(f"Error updating job description: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to update job description: {str(e)}")
 
+def guess_name_and_email(resume_text: str, name: Optional[str] = None, email: Optional[str] = None) -> tuple:
+    """Fill in a missing candidate name / email from the CV text (regex heuristics); returns (name, email)"""
+    try:
+        # Extract email using regex pattern
+        if not email:
+            email_pattern = r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b'
+            email_match = re.search(email_pattern, resume_text)
+            if email_match:
+                email = email_match.group(0)
+                print(f"[DEBUG] Extracted email from CV: {email}")
+
+        # Extract name from first few lines (usually at top of CV)
+        if not name:
+            print(f"[DEBUG] Attempting to extract name from CV...")
+            first_lines = resume_text.split('\n')[:15]  # Check more lines
+            for i, line in enumerate(first_lines):
+                line = line.strip()
+                # Skip empty lines and lines that look like headers or contact info
+                if not line:
+                    continue
+                skip_keywords = ['email', 'phone', 'tel', 'address', 'linkedin', 'www', 'http', 'cv', 'resume', 'curriculum', 'vitae', 'mobile', 'telefoon']
+                if any(skip in line.lower() for skip in skip_keywords):
+                    continue
+                # Check if line looks like a name (2-4 words, mostly letters, possibly with dots or hyphens)
+                words = line.split()
+                if 2 <= len(words) <= 4:
+                    # Check if all words are mostly alphabetic (allow dots, hyphens, apostrophes)
+                    if all(re.match(r'^[A-Za-zÀ-ÿ\-\'\.]+$', word) for word in words):
+                        name = line
+                        print(f"[DEBUG] Extracted name from CV (line {i+1}): {name}")
+                        break
+
+            # If still no name, try first non-empty line that's not a header
+            if not name:
+                for i, line in enumerate(first_lines[:5]):
+                    line = line.strip()
+                    if line and len(line) > 3 and not any(skip in line.lower() for skip in skip_keywords):
+                        # Use first substantial line as name
+                        name = line[:50]  # Limit length
+                        print(f"[DEBUG] Using first substantial line as name: {name}")
+                        break
+    except Exception as e:
+        print(f"[DEBUG] Error extracting name/email from CV: {str(e)}")
+        import traceback
+        traceback.print_exc()
+    return name, email
+
 @app.post("/upload-resume")
 async def upload_resume(
     request: Request,
@@ -3344,6 +3743,7 @@ async def upload_resume(
     duplicate_candidate_id: Optional[str] = Form(None)  # ID of existing candidate to overwrite
 ):
     """Upload and process resume file"""
+    db = None
     try:
         # Try to get authenticated user (optional - allows unauthenticated uploads for backward compatibility)
         current_user = None
@@ -3355,9 +3755,11 @@ async def upload_resume(
                 payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
                 user_id = payload.get("sub")
                 if user_id:
-                    db = SessionLocal()
-                    current_user = db.query(UserDB).filter(UserDB.id == user_id, UserDB.is_active == True).first()
-                    db.close()
+                    auth_db = SessionLocal()
+                    try:
+                        current_user = auth_db.query(UserDB).filter(UserDB.id == user_id, UserDB.is_active == True).first()
+                    finally:
+                        auth_db.close()
         except:
             # Authentication failed or not provided - continue without it
             pass
@@ -3366,11 +3768,8 @@ async def upload_resume(
         final_submitted_by_company_id = submitted_by_company_id
         if current_user and current_user.role == "recruiter" and not final_submitted_by_company_id and current_user.company_id:
             final_submitted_by_company_id = current_user.company_id
-        # Read file content
-        file_content = await file.read()
-        
-        # Extract text from file
-        extraction_result = extract_text_from_file(file_content, file.filename)
+        # Extract text from file (spooled to disk, never read into memory as a whole)
+        extraction_result = await extract_text_from_upload_async(file)
         resume_text = extraction_result["text"]
         extraction_method = extraction_result["extraction_method"]
         azure_used = extraction_result.get("azure_used", False)
@@ -3380,7 +3779,7 @@ async def upload_resume(
         print(f"DEBUG: Candidate Resume Extraction")
         print(f"File name: {file.filename}")
         print(f"File type: {'PDF' if file.filename.lower().endswith('.pdf') else 'Other'}")
-        print(f"Original file size (bytes): {len(file_content)}")
+        print(f"Original file size (bytes): {file.size}")
         print(f"Extraction method: {extraction_method}")
         print(f"Azure Document Intelligence used: {azure_used}")
         print(f"Extracted text length: {len(resume_text)}")
@@ -3391,8 +3790,8 @@ async def upload_resume(
         print("="*40)
         # --- Debug logging end --- 
 
-        # Safely truncate text
-        resume_text = truncate_text_safely(resume_text, MAX_RESUME_CHARS)
+        # Cap stored text; prompts budget their own share of it per call
+        resume_text = truncate_to_tokens(resume_text, STORED_DOCUMENT_MAX_TOKENS)
         
         # Normalize name and email (handle empty strings, None, etc.)
         name = name.strip() if name and isinstance(name, str) and name.strip() else None
@@ -3403,50 +3802,7 @@ async def upload_resume(
         # Extract name and email from resume text if not provided
         # IMPORTANT: This happens BEFORE any validation to ensure name is always set
         if not name or not email:
-            try:
-                import re
-                # Extract email using regex pattern
-                if not email:
-                    email_pattern = r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b'
-                    email_match = re.search(email_pattern, resume_text)
-                    if email_match:
-                        email = email_match.group(0)
-                        print(f"[DEBUG] Extracted email from CV: {email}")
-                
-                # Extract name from first few lines (usually at top of CV)
-                if not name:
-                    print(f"[DEBUG] Attempting to extract name from CV...")
-                    first_lines = resume_text.split('\n')[:15]  # Check more lines
-                    for i, line in enumerate(first_lines):
-                        line = line.strip()
-                        # Skip empty lines and lines that look like headers or contact info
-                        if not line:
-                            continue
-                        skip_keywords = ['email', 'phone', 'tel', 'address', 'linkedin', 'www', 'http', 'cv', 'resume', 'curriculum', 'vitae', 'mobile', 'telefoon']
-                        if any(skip in line.lower() for skip in skip_keywords):
-                            continue
-                        # Check if line looks like a name (2-4 words, mostly letters, possibly with dots or hyphens)
-                        words = line.split()
-                        if 2 <= len(words) <= 4:
-                            # Check if all words are mostly alphabetic (allow dots, hyphens, apostrophes)
-                            if all(re.match(r'^[A-Za-zÀ-ÿ\-\'\.]+$', word) for word in words):
-                                name = line
-                                print(f"[DEBUG] Extracted name from CV (line {i+1}): {name}")
-                                break
-                    
-                    # If still no name, try first non-empty line that's not a header
-                    if not name:
-                        for i, line in enumerate(first_lines[:5]):
-                            line = line.strip()
-                            if line and len(line) > 3 and not any(skip in line.lower() for skip in skip_keywords):
-                                # Use first substantial line as name
-                                name = line[:50]  # Limit length
-                                print(f"[DEBUG] Using first substantial line as name: {name}")
-                                break
-            except Exception as e:
-                print(f"[DEBUG] Error extracting name/email from CV: {str(e)}")
-                import traceback
-                traceback.print_exc()
+            name, email = guess_name_and_email(resume_text, name, email)
         
         # If still no name, use a random number (MUST have a name for database)
         if not name or not name.strip():
@@ -3471,11 +3827,10 @@ async def upload_resume(
         motivation_azure_used = False
         if motivation_file and motivation_file.filename:
             try:
-                motivation_content = await motivation_file.read()
-                motivation_result = extract_text_from_file(motivation_content, motivation_file.filename)
+                motivation_result = await extract_text_from_upload_async(motivation_file)
                 motivation_text = motivation_result["text"]
                 motivation_azure_used = motivation_result.get("azure_used", False)
-                motivation_text = truncate_text_safely(motivation_text, MAX_MOTIVATION_CHARS)
+                motivation_text = truncate_to_tokens(motivation_text, STORED_DOCUMENT_MAX_TOKENS)
                 print(f"Motivation letter extracted: {len(motivation_text)} characters using {motivation_result['extraction_method']}")
             except Exception as e:
                 print(f"Error processing motivation file: {str(e)}")
@@ -3486,8 +3841,7 @@ async def upload_resume(
         company_note_azure_used = False
         if company_note_file and company_note_file.filename:
             try:
-                company_note_content = await company_note_file.read()
-                company_note_result = extract_text_from_file(company_note_content, company_note_file.filename)
+                company_note_result = await extract_text_from_upload_async(company_note_file)
                 company_note_text = company_note_result["text"]
                 company_note_azure_used = company_note_result.get("azure_used", False)
                 print(f"Company note extracted: {len(company_note_text)} characters using {company_note_result['extraction_method']}")
@@ -3508,7 +3862,7 @@ async def upload_resume(
         # Parse job_ids for preferential vacatures (many-to-many)
         preferential_job_ids = []
         if job_ids:
-            preferential_job_ids = [jid.strip() for jid in job_ids.split(",") if jid.strip()]
+            preferential_job_ids = parse_job_ids(job_ids)
         elif job_id:
             # If single job_id provided, add it to preferential list
             preferential_job_ids = [job_id]
@@ -3604,7 +3958,7 @@ async def upload_resume(
             if job_id:
                 existing_candidate.job_id = job_id
             if preferential_job_ids:
-                existing_candidate.preferential_job_ids = ",".join(preferential_job_ids)
+                set_preferential_job_ids(db, existing_candidate, preferential_job_ids)
             if company_note_text:
                 existing_candidate.company_note = company_note_text
             
@@ -3762,7 +4116,7 @@ async def upload_resume(
                     if job_id:
                         existing_candidate.job_id = job_id
                     if preferential_job_ids:
-                        existing_candidate.preferential_job_ids = ",".join(preferential_job_ids)
+                        set_preferential_job_ids(db, existing_candidate, preferential_job_ids)
                     if company_note_text:
                         existing_candidate.company_note = company_note_text
                     
@@ -3890,7 +4244,7 @@ async def upload_resume(
                     raise
             candidate_id = candidate_db.id
             if preferential_job_ids:
-                candidate_db.preferential_job_ids = ",".join(preferential_job_ids)
+                set_preferential_job_ids(db, candidate_db, preferential_job_ids)
                 db.commit()
         
         # Create notification if candidate is submitted by recruiter for a job
@@ -3944,16 +4298,217 @@ async def upload_resume(
             status_code=500,
             detail=f"Failed to upload resume: {str(e)}"
         )
+    finally:
+        if db is not None:
+            db.close()
+
+@app.post("/upload-resumes/bulk")
+async def bulk_upload_resumes(
+    files: Optional[List[UploadFile]] = File(None),
+    archive: Optional[UploadFile] = File(None),  # Zip archive of CVs, instead of or next to files
+    job_id: Optional[str] = Form(None),
+    job_ids: Optional[str] = Form(None),  # Comma-separated list of job IDs for preferential vacatures
+    source: Optional[str] = Form(None),
+    submitted_by_company_id: Optional[str] = Form(None),
+    allow_duplicates: Optional[str] = Form(None),  # 'true' to also create candidates that already exist
+    current_user: UserDB = Depends(get_current_user)
+):
+    """Ingest a batch of CVs (multipart files and/or a zip archive) in one request.
+
+    Documents are spooled and extracted concurrently, identical files are extracted once, candidates
+    are matched against existing ones by email (or name when the CV has no email), and all new
+    candidates and their notifications are inserted in one transaction. Returns a report per file.
+    """
+    import random
+    import time
+
+    final_submitted_by_company_id = submitted_by_company_id
+    if current_user.role == "recruiter" and not final_submitted_by_company_id and current_user.company_id:
+        final_submitted_by_company_id = current_user.company_id
+    if job_ids:
+        preferential_job_ids = parse_job_ids(job_ids)
+    else:
+        preferential_job_ids = [job_id] if job_id else []
+    create_duplicates = bool(allow_duplicates) and str(allow_duplicates).lower() == 'true'
+    source_str = source if source and source.strip() else None
+
+    uploads = [upload for upload in (files or []) if upload and upload.filename]
+    has_archive = bool(archive and archive.filename)
+    if not uploads and not has_archive:
+        raise HTTPException(status_code=400, detail="Geen bestanden ontvangen.")
+    if len(uploads) > BULK_UPLOAD_MAX_FILES:
+        raise HTTPException(status_code=400, detail=f"Maximaal {BULK_UPLOAD_MAX_FILES} bestanden per keer.")
+
+    report: List[Dict[str, Any]] = []  # One entry per file, in submission order
+    spooled = []  # (report entry, SpooledUpload)
+    try:
+        # 1. Spool every document to disk
+        for upload in uploads:
+            entry = {"filename": upload.filename}
+            report.append(entry)
+            try:
+                spooled.append((entry, await spool_upload(upload)))
+            except UploadTooLargeError as e:
+                entry.update(status="failed", error=f"Bestand is te groot (maximaal {e.max_bytes // (1024 * 1024)} MB).")
+        if has_archive:
+            try:
+                archive_upload = await spool_upload(archive, max_bytes=BULK_UPLOAD_MAX_ARCHIVE_BYTES)
+            except UploadTooLargeError as e:
+                raise HTTPException(status_code=413, detail=f"Archief is te groot (maximaal {e.max_bytes // (1024 * 1024)} MB).")
+            with archive_upload:
+                try:
+                    members = await asyncio.to_thread(spool_zip_members, archive_upload, BULK_UPLOAD_MAX_FILES - len(uploads))
+                except ValueError as e:
+                    raise HTTPException(status_code=400, detail=str(e))
+            for filename, member, error in members:
+                entry = {"filename": filename}
+                report.append(entry)
+                if member is None:
+                    entry.update(status="failed", error=error)
+                else:
+                    spooled.append((entry, member))
+
+        # 2. Extract concurrently; identical files are extracted once
+        first_entry_by_hash = {}
+        to_extract = []
+        for entry, upload in spooled:
+            if upload.sha256 in first_entry_by_hash:
+                entry.update(status="duplicate_in_batch", duplicate_of=first_entry_by_hash[upload.sha256]["filename"])
+            else:
+                first_entry_by_hash[upload.sha256] = entry
+                to_extract.append((entry, upload))
+
+        extraction_semaphore = asyncio.Semaphore(BULK_UPLOAD_MAX_CONCURRENT_EXTRACTIONS)
+
+        async def extract(entry, upload):
+            async with extraction_semaphore:
+                try:
+                    result = await extract_document_async(
+                        upload.path, upload.filename, upload.document_type, upload.sha256, upload.size
+                    )
+                except Exception as e:
+                    entry.update(status="failed", error=str(e))
+                    return None
+            resume_text = truncate_to_tokens(result["text"], STORED_DOCUMENT_MAX_TOKENS)
+            name, email = guess_name_and_email(resume_text)
+            entry["extraction_method"] = result["extraction_method"]
+            return entry, resume_text, (name or "").strip() or None, email
+
+        extracted = [item for item in await asyncio.gather(*[extract(entry, upload) for entry, upload in to_extract]) if item]
+    finally:
+        for _, upload in spooled:
+            upload.close()
+
+    # 3. Deduplicate and insert everything in one transaction
+    db_started = time.time()
+    db = SessionLocal()
+    try:
+        emails = {email.lower() for _, _, _, email in extracted if email}
+        names = {name.lower() for _, _, name, email in extracted if name and not email}
+        existing_by_email, existing_by_name = {}, {}
+        if emails:
+            for candidate_id, candidate_name, candidate_email in db.query(CandidateDB.id, CandidateDB.name, CandidateDB.email).filter(
+                func.lower(CandidateDB.email).in_(emails)
+            ):
+                existing_by_email.setdefault(candidate_email.lower(), (candidate_id, candidate_name))
+        if names:
+            for candidate_id, candidate_name in db.query(CandidateDB.id, CandidateDB.name).filter(
+                func.lower(CandidateDB.name).in_(names)
+            ):
+                existing_by_name.setdefault(candidate_name.lower(), (candidate_id, candidate_name))
+        linkable_job_ids = {
+            row[0] for row in db.query(JobPostingDB.id).filter(JobPostingDB.id.in_(preferential_job_ids))
+        } if preferential_job_ids else set()
+
+        new_candidates = []
+        batch_keys = {}
+        for entry, resume_text, name, email in extracted:
+            # Same matching as /upload-resume: by email, or by name when there is no email
+            if email:
+                key, existing = ('email', email.lower()), existing_by_email.get(email.lower())
+            elif name:
+                key, existing = ('name', name.lower()), existing_by_name.get(name.lower())
+            else:
+                key, existing = None, None
+            entry.update(name=name, email=email)
+            if existing and not create_duplicates:
+                entry.update(status="duplicate", existing_candidate_id=existing[0], existing_candidate_name=existing[1])
+                continue
+            if key and key in batch_keys and not create_duplicates:
+                entry.update(status="duplicate_in_batch", duplicate_of=batch_keys[key])
+                continue
+            if key:
+                batch_keys[key] = entry["filename"]
+            name = name or f"Kandidaat-{random.randint(10000, 99999)}"
+            candidate = CandidateDB(
+                id=str(uuid4()),
+                job_id=job_id,
+                name=name,
+                email=email,
+                resume_text=resume_text,
+                experience_years=0,
+                years_experience=0,
+                skills="",
+                education="Not specified",
+                source=source_str,
+                submitted_by_company_id=final_submitted_by_company_id,
+                pipeline_stage='review',
+                pipeline_status='active'
+            )
+            set_preferential_job_ids(db, candidate, preferential_job_ids, existing_job_ids=linkable_job_ids)
+            new_candidates.append(candidate)
+            entry.update(status="created", candidate_id=candidate.id, name=name)
+        db.add_all(new_candidates)
+
+        # Same notification as /upload-resume, for all new candidates at once
+        if new_candidates and final_submitted_by_company_id and job_id:
+            job = db.query(JobPostingDB).filter(JobPostingDB.id == job_id).first()
+            if job and job.company_id:
+                company_users = db.query(UserDB).filter(
+                    UserDB.company_id == job.company_id,
+                    UserDB.is_active == True
+                ).all()
+                db.add_all([
+                    NotificationDB(
+                        user_id=user.id,
+                        type="candidate_proposed",
+                        title=f"Nieuwe kandidaat voorgesteld: {candidate.name}",
+                        message=f"Recruiter heeft kandidaat '{candidate.name}' voorgesteld voor vacature '{job.title}'",
+                        related_candidate_id=candidate.id,
+                        related_job_id=job_id
+                    )
+                    for candidate in new_candidates
+                    for user in company_users
+                ])
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        print(f"ERROR in bulk_upload_resumes: {str(e)}")
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=f"Failed to store candidates: {str(e)}")
+    finally:
+        db.close()
+
+    statuses = [entry.get("status") for entry in report]
+    return {
+        "success": True,
+        "total": len(report),
+        "created": statuses.count("created"),
+        "duplicates": statuses.count("duplicate") + statuses.count("duplicate_in_batch"),
+        "failed": statuses.count("failed"),
+        "db_seconds": round(time.time() - db_started, 3),
+        "files": report
+    }
 
 @app.post("/upload-motivation-letter")
 async def upload_motivation_letter(
     candidate_id: str = Form(...),
     motivation_text: Optional[str] = Form(None),
-    motivation_file: Optional[UploadFile] = File(None)
+    motivation_file: Optional[UploadFile] = File(None),
+    db: Session = Depends(get_db)
 ):
     """Upload or update a motivation letter for an existing candidate"""
     try:
-        db = SessionLocal()
         candidate = db.query(CandidateDB).filter(CandidateDB.id == candidate_id).first()
         if not candidate:
             db.close()
@@ -3963,11 +4518,10 @@ async def upload_motivation_letter(
         azure_used = False
 
         if motivation_file and motivation_file.filename:
-            file_content = await motivation_file.read()
-            extraction_result = extract_text_from_file(file_content, motivation_file.filename)
+            extraction_result = await extract_text_from_upload_async(motivation_file)
             extracted_text = extraction_result["text"]
             azure_used = extraction_result.get("azure_used", False)
-            extracted_text = truncate_text_safely(extracted_text, MAX_MOTIVATION_CHARS)
+            extracted_text = truncate_to_tokens(extracted_text, STORED_DOCUMENT_MAX_TOKENS)
 
         if not extracted_text:
             db.close()
@@ -3990,10 +4544,9 @@ async def upload_motivation_letter(
         raise HTTPException(status_code=500, detail=f"Failed to upload motivation letter: {str(e)}")
 
 @app.delete("/candidates/{candidate_id}/motivation")
-async def delete_motivation_letter(candidate_id: str):
+async def delete_motivation_letter(candidate_id: str, db: Session = Depends(get_db)):
     """Remove stored motivation letter for a candidate"""
     try:
-        db = SessionLocal()
         candidate = db.query(CandidateDB).filter(CandidateDB.id == candidate_id).first()
         if not candidate:
             db.close()
@@ -4008,10 +4561,9 @@ async def delete_motivation_letter(candidate_id: str):
         raise HTTPException(status_code=500, detail=f"Failed to delete motivation letter: {str(e)}")
 
 @app.delete("/candidates/{candidate_id}/resume")
-async def delete_resume(candidate_id: str):
+async def delete_resume(candidate_id: str, db: Session = Depends(get_db)):
     """Remove stored resume text for a candidate"""
     try:
-        db = SessionLocal()
         candidate = db.query(CandidateDB).filter(CandidateDB.id == candidate_id).first()
         if not candidate:
             db.close()
@@ -4025,6 +4577,17 @@ async def delete_resume(candidate_id: str):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to delete resume: {str(e)}")
 
+async def read_persona_prompts(request: Optional[Request]) -> Dict[str, str]:
+    """Collect the selected personas from '<persona_name>_prompt' form fields"""
+    persona_prompts = {}
+    if request:
+        form_data = await request.form()
+        for key, value in form_data.items():
+            if key.endswith('_prompt'):
+                persona_name = key.replace('_prompt', '')
+                persona_prompts[persona_name] = value
+    return persona_prompts
+
 @app.post("/evaluate-candidate")
 async def evaluate_candidate(
     candidate_id: str = Form(...),
@@ -4033,116 +4596,42 @@ async def evaluate_candidate(
     custom_guidelines: Optional[str] = Form(None),
     strictness: Optional[str] = Form("medium"),
     company_note: Optional[str] = Form(None),
+    bypass_cache: Optional[bool] = Form(False),  # Force fresh LLM calls instead of cached responses
     request: Request = None
 ):
     """Evaluate candidate using selected personas - each persona evaluates from three perspectives"""
-    # CRITICAL FIX: Initialize variables at the very start to prevent scoping issues
-    # Python was treating these as local variables, causing "cannot access local variable" error
-    # Initialize with defaults first, then use module-level values if available
-    OPENAI_MAX_TOKENS_EVALUATION = 4096  # Default initialization
-    OPENAI_TEMPERATURE_EVALUATION = 0.1  # Default initialization
-    OPENAI_MODEL_EVALUATION = "gpt-4o-mini"  # Default initialization
-    
-    # Now try to get the actual module-level values
-    try:
-        import sys
-        current_module = sys.modules[__name__]
-        OPENAI_MAX_TOKENS_EVALUATION = getattr(current_module, 'OPENAI_MAX_TOKENS_EVALUATION', 4096)
-        OPENAI_TEMPERATURE_EVALUATION = getattr(current_module, 'OPENAI_TEMPERATURE_EVALUATION', 0.1)
-        OPENAI_MODEL_EVALUATION = getattr(current_module, 'OPENAI_MODEL_EVALUATION', "gpt-4o-mini")
-    except:
-        pass  # Use defaults if we can't access module-level
-    
-    # Store in local variables for use in the function
-    _max_tokens_eval = OPENAI_MAX_TOKENS_EVALUATION
-    _temp_eval = OPENAI_TEMPERATURE_EVALUATION
-    _model_eval = OPENAI_MODEL_EVALUATION
-    
-    try:
-        db = SessionLocal()
-        candidate = db.query(CandidateDB).filter(CandidateDB.id == candidate_id).first()
-        
-        if not candidate:
-            db.close()
-            raise HTTPException(status_code=404, detail="Candidate not found")
-        
-        # Determine which job_id to use: passed parameter, candidate.job_id, or first preferential job
-        evaluation_job_id = None
-        if job_id:
-            evaluation_job_id = job_id
-        elif candidate.job_id:
-            evaluation_job_id = candidate.job_id
-        elif candidate.preferential_job_ids:
-            # Use first preferential job if no job_id is set
-            preferential_list = [jid.strip() for jid in candidate.preferential_job_ids.split(",") if jid.strip()]
-            if preferential_list:
-                evaluation_job_id = preferential_list[0]
-        
-        if not evaluation_job_id:
-            db.close()
-            raise HTTPException(status_code=400, detail="Evaluation requires a job posting. Please select a job before evaluating.")
-        
-        # Verify job posting exists
-        job = db.query(JobPostingDB).filter(JobPostingDB.id == evaluation_job_id).first()
-        if not job:
-            db.close()
-            raise HTTPException(status_code=404, detail="Associated job posting not found")
-        
-        # ADD THIS CHECK: Verify resume_text is actually text, not binary
-        # IMPORTANT: Truncate resume text BEFORE using it in prompts
-        resume_text = candidate.resume_text
-        if not resume_text or len(resume_text.strip()) < 50:
-            db.close()
-            raise HTTPException(status_code=400, detail="Resume text is empty or invalid. Please re-upload the resume.")
-        
-        # Truncate resume text to stay within token limits
-        resume_text = truncate_text_safely(resume_text, MAX_RESUME_CHARS)
-        
-        # Get selected personas from form data
-        persona_prompts = {}
-        if request:
-            form_data = await request.form()
-            for key, value in form_data.items():
-                if key.endswith('_prompt'):
-                    persona_name = key.replace('_prompt', '')
-                    persona_prompts[persona_name] = value
-        
-        # If no personas selected, return error
-        if not persona_prompts:
-            db.close()
-            raise HTTPException(status_code=400, detail="At least one persona must be selected for evaluation")
-        
-        # Get persona details from database
-        persona_objects = []
-        for persona_name in persona_prompts.keys():
-            persona = db.query(PersonaDB).filter(PersonaDB.name == persona_name).first()
-            if persona:
-                persona_objects.append(persona)
-        
-        if not persona_objects:
-            db.close()
-            raise HTTPException(status_code=404, detail="Selected personas not found in database")
-        
-        # Add strictness filter
-        strictness_instructions = {
-            "lenient": "Be lenient in your evaluation. Focus on potential and growth opportunities. Give candidates the benefit of the doubt.",
-            "medium": "Provide a balanced evaluation considering both strengths and areas for improvement.",
-            "strict": "Be thorough and critical in your evaluation. Focus on meeting all requirements and potential risks.",
-            "severe": "Be extremely strict and demanding. Only recommend candidates who exceed expectations in all areas."
-        }
-        
-        strictness_instruction = strictness_instructions.get(strictness.lower(), strictness_instructions["medium"])
-        
-        # Get job information if available (outside loop, shared for all personas)
-        # IMPORTANT: Truncate all text BEFORE building prompts to stay within token limits
-        job_info = ""
-        if evaluation_job_id:
-            job = db.query(JobPostingDB).filter(JobPostingDB.id == evaluation_job_id).first()
-            if job:
-                # Truncate job description and requirements to stay within limits
-                job_desc = truncate_text_safely(job.description or "", MAX_JOB_DESC_CHARS)
-                job_req = truncate_text_safely(job.requirements or "", MAX_JOB_DESC_CHARS)
-                job_info = f"""
+    persona_prompts = await read_persona_prompts(request)
+    return await run_candidate_evaluation(
+        candidate_id, persona_prompts, job_id=job_id, strictness=strictness,
+        company_note=company_note, bypass_cache=bypass_cache
+    )
+
+@app.post("/evaluate-candidate/stream")
+async def evaluate_candidate_stream(
+    candidate_id: str = Form(...),
+    job_id: Optional[str] = Form(None),
+    strictness: Optional[str] = Form("medium"),
+    company_note: Optional[str] = Form(None),
+    bypass_cache: Optional[bool] = Form(False),
+    request: Request = None
+):
+    """Streaming /evaluate-candidate (server-sent events).
+
+    Events: 'persona' per persona as soon as it is evaluated, then 'combined' with the combined
+    analysis, then 'result' with the full response body including result_id ('error' on failure).
+    """
+    persona_prompts = await read_persona_prompts(request)
+    # Validate before streaming so bad requests still get a proper status code
+    candidate, job, prepared_personas = load_evaluation_inputs(candidate_id, persona_prompts, job_id)
+    return sse_response(stream_candidate_evaluation(
+        candidate, job, prepared_personas, persona_prompts, company_note=company_note, bypass_cache=bypass_cache
+    ))
+
+def format_evaluation_job_info(job, job_desc: str, job_req: str) -> str:
+    """Job posting block of the persona user prompt"""
+    if not job:
+        return ""
+    return f"""
 
 JOB POSTING DETAILS:
 Title: {job.title}
@@ -4151,39 +4640,24 @@ Location: {job.location or 'N/A'}
 Salary Range: {job.salary_range or 'N/A'}
 Description: {job_desc}
 Requirements: {job_req}"""
-                job_summary_for_prompt = f"{job.title or 'Onbekende functie'} bij {job.company or 'Onbekend bedrijf'}"
-        if not job_summary_for_prompt:
-            job_summary_for_prompt = "Onbekende functie"
-        
-        # Build concise candidate summary for downstream prompts
-        candidate_name_display = candidate.name or "De kandidaat"
-        exp_years = candidate.years_experience or candidate.experience_years
-        summary_parts = [f"{candidate_name_display} wordt beoordeeld voor {job_summary_for_prompt}."]
-        if candidate.location:
-            summary_parts.append(f"Locatie: {candidate.location}.")
-        if exp_years:
-            summary_parts.append(f"Heeft ongeveer {exp_years} jaar ervaring.")
-        if candidate.availability_per_week:
-            summary_parts.append(f"Beschikbaarheid: {candidate.availability_per_week} uur per week.")
-        if candidate.notice_period:
-            summary_parts.append(f"Opzegtermijn: {candidate.notice_period}.")
-        candidate_summary_for_prompt = " ".join(summary_parts).strip()
-        
-        # Include motivational letter if available (truncated)
-        motivational_info = ""
-        if candidate.motivational_letter:
-            motivation_text = truncate_text_safely(candidate.motivational_letter, MAX_MOTIVATION_CHARS)
-            motivational_info = f"""
+
+
+# Include motivational letter if available (budgeted per persona)
+def format_evaluation_motivational_info(motivation_text: str) -> str:
+    if not motivation_text:
+        return ""
+    return f"""
 
 MOTIVATIONAL LETTER:
 {motivation_text}"""
-        
-        # Include company note if provided (truncated)
-        # IMPORTANT: Company note is an impartial party that provides additional information about the candidate
-        company_note_info = ""
-        if company_note:
-            company_note_text = truncate_text_safely(company_note, MAX_COMPANY_NOTE_CHARS)
-            company_note_info = f"""
+
+
+# Include company note if provided (budgeted per persona)
+# IMPORTANT: Company note is an impartial party that provides additional information about the candidate
+def format_evaluation_company_note_info(company_note_text: str) -> str:
+    if not company_note_text:
+        return ""
+    return f"""
 
 BELANGRIJK - BEDRIJFSNOTITIE (Informatie van bemiddelingsbureau):
 Deze bedrijfsnotitie bevat belangrijke informatie over de kandidaat van het bemiddelingsbureau, inclusief:
@@ -4194,134 +4668,121 @@ Deze bedrijfsnotitie bevat belangrijke informatie over de kandidaat van het bemi
 
 LET OP: Als Bureaurecruiter of HR/Inhouse Recruiter moet je deze informatie actief gebruiken. Als er salarisinformatie in staat, gebruik deze in je evaluatie. Als er tegenstrijdigheden zijn tussen CV en bedrijfsnotitie, vertrouw de bedrijfsnotitie.
 {company_note_text}"""
-        
-        # Helper function to filter extended candidate info by persona relevance
-        def get_persona_relevant_fields(persona_name: str, candidate) -> List[str]:
-            """Get only the extended candidate fields relevant to this persona"""
-            import json
-            relevant_fields = []
-            
-            persona_name_lower = persona_name.lower()
-            
-            # Parse JSON fields once
+
+
+# Helper function to filter extended candidate info by persona relevance
+def get_persona_relevant_fields(persona_name: str, candidate) -> List[str]:
+    """Get only the extended candidate fields relevant to this persona"""
+    import json
+    relevant_fields = []
+    
+    persona_name_lower = persona_name.lower()
+    
+    # Parse JSON fields once
+    skill_tags_list = []
+    if candidate.skill_tags:
+        try:
+            skill_tags_list = json.loads(candidate.skill_tags) if isinstance(candidate.skill_tags, str) else candidate.skill_tags
+        except:
             skill_tags_list = []
-            if candidate.skill_tags:
-                try:
-                    skill_tags_list = json.loads(candidate.skill_tags) if isinstance(candidate.skill_tags, str) else candidate.skill_tags
-                except:
-                    skill_tags_list = []
-            
+    
+    prior_job_titles_list = []
+    if candidate.prior_job_titles:
+        try:
+            prior_job_titles_list = json.loads(candidate.prior_job_titles) if isinstance(candidate.prior_job_titles, str) else candidate.prior_job_titles
+        except:
             prior_job_titles_list = []
-            if candidate.prior_job_titles:
-                try:
-                    prior_job_titles_list = json.loads(candidate.prior_job_titles) if isinstance(candidate.prior_job_titles, str) else candidate.prior_job_titles
-                except:
-                    prior_job_titles_list = []
-            
+    
+    certifications_list = []
+    if candidate.certifications:
+        try:
+            certifications_list = json.loads(candidate.certifications) if isinstance(candidate.certifications, str) else candidate.certifications
+        except:
             certifications_list = []
-            if candidate.certifications:
-                try:
-                    certifications_list = json.loads(candidate.certifications) if isinstance(candidate.certifications, str) else candidate.certifications
-                except:
-                    certifications_list = []
-            
-            # Define field relevance per persona type
-            # Tech Lead / Hiring Manager: Technical skills, experience, certifications, test results
-            if 'tech' in persona_name_lower or 'hiring' in persona_name_lower:
-                if candidate.years_experience or candidate.experience_years:
-                    years = candidate.years_experience or candidate.experience_years
-                    relevant_fields.append(f"Jaren ervaring: {years}")
-                if skill_tags_list:
-                    skill_tags_str = ", ".join(skill_tags_list) if isinstance(skill_tags_list, list) else str(skill_tags_list)
-                    relevant_fields.append(f"Vaardigheden tags: {skill_tags_str}")
-                if prior_job_titles_list:
-                    prior_jobs_str = ", ".join(prior_job_titles_list) if isinstance(prior_job_titles_list, list) else str(prior_job_titles_list)
-                    relevant_fields.append(f"Eerdere functietitels: {prior_jobs_str}")
-                if certifications_list:
-                    certs_str = ", ".join(certifications_list) if isinstance(certifications_list, list) else str(certifications_list)
-                    relevant_fields.append(f"Certificeringen: {certs_str}")
-                if candidate.education_level:
-                    relevant_fields.append(f"Opleidingsniveau: {candidate.education_level}")
-                if candidate.test_results:
-                    relevant_fields.append(f"Testresultaten / Vaardigheidsscores: {candidate.test_results}")
-            
-            # Finance Director: Salary, availability, notice period, compensation-related
-            if 'finance' in persona_name_lower:
-                if candidate.salary_expectation:
-                    relevant_fields.append(f"Salarisverwachting: €{candidate.salary_expectation}/jaar (op basis van 40 uur/week)")
-                if candidate.availability_per_week:
-                    relevant_fields.append(f"Beschikbaarheid per week: {candidate.availability_per_week} uur/week")
-                if candidate.notice_period:
-                    relevant_fields.append(f"Opzegtermijn: {candidate.notice_period}")
-            
-            # HR Recruiter / Bureaurecruiter: Motivation, communication, availability, notice period, location, source
-            if 'hr' in persona_name_lower or 'recruiter' in persona_name_lower or 'bureau' in persona_name_lower:
-                if candidate.motivation_reason:
-                    relevant_fields.append(f"Motivatie voor rol / Reden van vertrek: {candidate.motivation_reason}")
-                if candidate.communication_level:
-                    relevant_fields.append(f"Communicatieniveau: {candidate.communication_level}")
-                if candidate.location:
-                    relevant_fields.append(f"Locatie: {candidate.location}")
-                if candidate.availability_per_week:
-                    relevant_fields.append(f"Beschikbaarheid per week: {candidate.availability_per_week} uur/week")
-                if candidate.notice_period:
-                    relevant_fields.append(f"Opzegtermijn: {candidate.notice_period}")
-                if candidate.source:
-                    relevant_fields.append(f"Bron / Hoe gevonden: {candidate.source}")
-                if candidate.age:
-                    relevant_fields.append(f"Leeftijd: {candidate.age} jaar")  # For diversity/inclusion considerations
-            
-            # HR / Inhouse Recruiter: Also education level for compliance
-            if 'hr' in persona_name_lower or 'inhouse' in persona_name_lower:
-                if candidate.education_level:
-                    relevant_fields.append(f"Opleidingsniveau: {candidate.education_level}")
-            
-            return relevant_fields
-        
-        # Evaluate for each selected persona - PARALLELIZED for performance
-        async def evaluate_single_persona(persona):
-            """Evaluate a single persona - designed to run in parallel"""
-            persona_prompt = persona_prompts.get(persona.name, persona.system_prompt)
-            
-            # Get persona-relevant extended fields only (filter by role)
-            persona_relevant_fields = get_persona_relevant_fields(persona.name, candidate)
-            persona_extended_info = ""
-            if persona_relevant_fields:
-                persona_extended_text = "\n".join(persona_relevant_fields)
-                persona_extended_info = f"""
+    
+    # Define field relevance per persona type
+    # Tech Lead / Hiring Manager: Technical skills, experience, certifications, test results
+    if 'tech' in persona_name_lower or 'hiring' in persona_name_lower:
+        if candidate.years_experience or candidate.experience_years:
+            years = candidate.years_experience or candidate.experience_years
+            relevant_fields.append(f"Jaren ervaring: {years}")
+        if skill_tags_list:
+            skill_tags_str = ", ".join(skill_tags_list) if isinstance(skill_tags_list, list) else str(skill_tags_list)
+            relevant_fields.append(f"Vaardigheden tags: {skill_tags_str}")
+        if prior_job_titles_list:
+            prior_jobs_str = ", ".join(prior_job_titles_list) if isinstance(prior_job_titles_list, list) else str(prior_job_titles_list)
+            relevant_fields.append(f"Eerdere functietitels: {prior_jobs_str}")
+        if certifications_list:
+            certs_str = ", ".join(certifications_list) if isinstance(certifications_list, list) else str(certifications_list)
+            relevant_fields.append(f"Certificeringen: {certs_str}")
+        if candidate.education_level:
+            relevant_fields.append(f"Opleidingsniveau: {candidate.education_level}")
+        if candidate.test_results:
+            relevant_fields.append(f"Testresultaten / Vaardigheidsscores: {candidate.test_results}")
+    
+    # Finance Director: Salary, availability, notice period, compensation-related
+    if 'finance' in persona_name_lower:
+        if candidate.salary_expectation:
+            relevant_fields.append(f"Salarisverwachting: €{candidate.salary_expectation}/jaar (op basis van 40 uur/week)")
+        if candidate.availability_per_week:
+            relevant_fields.append(f"Beschikbaarheid per week: {candidate.availability_per_week} uur/week")
+        if candidate.notice_period:
+            relevant_fields.append(f"Opzegtermijn: {candidate.notice_period}")
+    
+    # HR Recruiter / Bureaurecruiter: Motivation, communication, availability, notice period, location, source
+    if 'hr' in persona_name_lower or 'recruiter' in persona_name_lower or 'bureau' in persona_name_lower:
+        if candidate.motivation_reason:
+            relevant_fields.append(f"Motivatie voor rol / Reden van vertrek: {candidate.motivation_reason}")
+        if candidate.communication_level:
+            relevant_fields.append(f"Communicatieniveau: {candidate.communication_level}")
+        if candidate.location:
+            relevant_fields.append(f"Locatie: {candidate.location}")
+        if candidate.availability_per_week:
+            relevant_fields.append(f"Beschikbaarheid per week: {candidate.availability_per_week} uur/week")
+        if candidate.notice_period:
+            relevant_fields.append(f"Opzegtermijn: {candidate.notice_period}")
+        if candidate.source:
+            relevant_fields.append(f"Bron / Hoe gevonden: {candidate.source}")
+        if candidate.age:
+            relevant_fields.append(f"Leeftijd: {candidate.age} jaar")  # For diversity/inclusion considerations
+    
+    # HR / Inhouse Recruiter: Also education level for compliance
+    if 'hr' in persona_name_lower or 'inhouse' in persona_name_lower:
+        if candidate.education_level:
+            relevant_fields.append(f"Opleidingsniveau: {candidate.education_level}")
+    
+    return relevant_fields
 
-BELANGRIJK - STRUCTUREDE KANDIDAATINFORMATIE (Relevant voor {persona.display_name}):
-Deze gestructureerde informatie is expliciet opgeslagen voor deze kandidaat en is relevant voor jouw evaluatie vanuit jouw perspectief. Gebruik deze informatie actief in je beoordeling.
 
-{truncate_text_safely(persona_extended_text, 1500)}"""
-            
-            # Get personal criteria if available
-            import json
-            personal_criteria_text = ""
-            if hasattr(persona, 'personal_criteria') and persona.personal_criteria:
-                try:
-                    personal_criteria_data = json.loads(persona.personal_criteria) if isinstance(persona.personal_criteria, str) else persona.personal_criteria
-                    if personal_criteria_data:
-                        if isinstance(personal_criteria_data, list):
-                            personal_criteria_items = personal_criteria_data
-                        elif isinstance(personal_criteria_data, dict):
-                            personal_criteria_items = list(personal_criteria_data.values())
-                        else:
-                            personal_criteria_items = [str(personal_criteria_data)]
-                        
-                        if personal_criteria_items:
-                            criteria_list = "\n".join([f"- {item}" for item in personal_criteria_items if item])
-                            personal_criteria_text = f"""
+def build_persona_system_prompt(persona, persona_prompt: str) -> str:
+    """Candidate-independent system prompt for a persona (shared by every candidate of a job)"""
+    # Get personal criteria if available
+    import json
+    personal_criteria_text = ""
+    if hasattr(persona, 'personal_criteria') and persona.personal_criteria:
+        try:
+            personal_criteria_data = json.loads(persona.personal_criteria) if isinstance(persona.personal_criteria, str) else persona.personal_criteria
+            if personal_criteria_data:
+                if isinstance(personal_criteria_data, list):
+                    personal_criteria_items = personal_criteria_data
+                elif isinstance(personal_criteria_data, dict):
+                    personal_criteria_items = list(personal_criteria_data.values())
+                else:
+                    personal_criteria_items = [str(personal_criteria_data)]
+                
+                if personal_criteria_items:
+                    criteria_list = "\n".join([f"- {item}" for item in personal_criteria_items if item])
+                    personal_criteria_text = f"""
 
 BELANGRIJK - PERSOONLIJKE EVALUATIECRITERIA (Aangepast voor deze digitale werknemer):
 De volgende persoonlijke criteria zijn aangepast voor deze digitale werknemer en moeten actief worden gebruikt in je evaluatie:
 {criteria_list}"""
-                except:
-                    pass  # Ignore invalid JSON
-            
-            # Build system prompt for this persona - they evaluate from their own perspective
-            # General guardrails for all personas to ensure they focus on vacancy-candidate match
-            general_guardrails = """
+        except:
+            pass  # Ignore invalid JSON
+    
+    # Build system prompt for this persona - they evaluate from their own perspective
+    # General guardrails for all personas to ensure they focus on vacancy-candidate match
+    general_guardrails = """
 
 BELANGRIJKE GUARDRAILS VOOR ALLE EVALUATIES:
 - Je beoordeelt ALLEEN de match tussen de kandidaat en de specifieke vacature vanuit jouw expertise
@@ -4331,8 +4792,8 @@ BELANGRIJKE GUARDRAILS VOOR ALLE EVALUATIES:
 - Je rol is om te beoordelen of de kandidaat past bij wat de vacature vraagt, vanuit jouw perspectief
 - Beoordeel NIET algemene zaken die niet relevant zijn voor deze specifieke vacature
 - Gebruik ALLEEN de informatie die beschikbaar is in de CV, gestructureerde velden, vacature en bedrijfsnotitie"""
-            
-            system_prompt = f"""Je bent {persona.display_name}. Je beoordelingsstijl: {persona_prompt}{personal_criteria_text}{general_guardrails}
+    
+    system_prompt = f"""Je bent {persona.display_name}. Je beoordelingsstijl: {persona_prompt}{personal_criteria_text}{general_guardrails}
 
 Je evalueert deze kandidaat vanuit jouw perspectief. Geef een beoordeling met scores, sterke punten, aandachtspunten en advies.
 
@@ -4357,14 +4818,35 @@ BELANGRIJK:
 - Maak gebruik van alle beschikbare kandidaatgegevens (gestructureerde velden en CV) in je beoordeling
 
 Geef geen tekst buiten het JSON object."""
-            
-            # MAKE SURE we're sending clean text to OpenAI
-            # All text is already truncated above, so we can safely build the prompt
-            # Use persona-specific extended info (filtered by role relevance)
-            user_prompt = f"""Evalueer deze kandidaat vanuit jouw perspectief als {persona.display_name}:
+    return system_prompt
+
+
+def build_persona_user_prompt(persona, candidate, job, company_note: Optional[str], system_prompt: str) -> str:
+    """Candidate prompt for one persona; documents get the tokens left after the system prompt and instructions"""
+    # Get persona-relevant extended fields only (filter by role)
+    persona_extended_text = "\n".join(get_persona_relevant_fields(persona.name, candidate))
+    
+    def format_persona_extended_info(extended_text: str) -> str:
+        if not extended_text:
+            return ""
+        return f"""
+
+BELANGRIJK - STRUCTUREDE KANDIDAATINFORMATIE (Relevant voor {persona.display_name}):
+Deze gestructureerde informatie is expliciet opgeslagen voor deze kandidaat en is relevant voor jouw evaluatie vanuit jouw perspectief. Gebruik deze informatie actief in je beoordeling.
+
+{extended_text}"""
+    
+    # MAKE SURE we're sending clean text to OpenAI
+    # Use persona-specific extended info (filtered by role relevance)
+    def build_user_prompt(sections: Dict[str, str]) -> str:
+        motivational_info = format_evaluation_motivational_info(sections.get("motivation", ""))
+        persona_extended_info = format_persona_extended_info(sections.get("candidate_details", ""))
+        job_info = format_evaluation_job_info(job, sections.get("job_description", ""), sections.get("job_requirements", ""))
+        company_note_info = format_evaluation_company_note_info(sections.get("company_note", ""))
+        return f"""Evalueer deze kandidaat vanuit jouw perspectief als {persona.display_name}:
 
 CV:
-{resume_text}{motivational_info}{persona_extended_info}{job_info}{company_note_info}
+{sections.get('resume', '')}{motivational_info}{persona_extended_info}{job_info}{company_note_info}
 
 BELANGRIJK: Maak actief gebruik van alle beschikbare informatie die relevant is voor jouw rol:
 - CV en motivatiebrief (basis informatie)
@@ -4381,177 +4863,202 @@ EVALUATIE FOCUS:
 FOCUS: Evalueer alleen op aspecten die binnen jouw expertise vallen. Laat andere aspecten (buiten jouw expertise) buiten beschouwing of verwijs kort naar anderen.
 
 Geef een score (1-10), sterke punten, aandachtspunten, analyse en advies. Benoem expliciet grote matches of mismatches."""
-            
-            # Final safety check: ensure the user prompt itself isn't too long
-            # For gpt-4o-mini, limit to ~3000 chars for ~750 tokens
-            # This leaves room for system prompt (~500 tokens) and response (max_tokens)
-            if len(user_prompt) > 3000:
-                user_prompt = user_prompt[:3000] + "\n\n[Prompt truncated for token limits...]"
-            
-            # Call OpenAI safely for this persona - ASYNC VERSION
-            openai_result = await call_openai_safe_async([
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt}
-            ], max_tokens=_max_tokens_eval, temperature=_temp_eval, model=_model_eval)
-            
-            if not openai_result["success"]:
-                print(f"AI evaluation failed for persona {persona.name}: {openai_result['error']}")
-                return persona.name, {
-                    "error": f"Evaluation failed: {openai_result['error']}",
-                    "persona_display_name": persona.display_name
-                }
-            
-            response = openai_result["result"].choices[0].message.content
-            
-            # Try to parse JSON response for this persona
-            try:
-                import json
-                import re
-                
-                # Clean response - remove markdown code blocks if present
-                cleaned_response = response.strip()
-                if "```json" in cleaned_response:
-                    json_match = re.search(r'```json\s*(.*?)\s*```', cleaned_response, re.DOTALL)
-                    if json_match:
-                        cleaned_response = json_match.group(1).strip()
-                elif "```" in cleaned_response:
-                    json_match = re.search(r'```\s*(.*?)\s*```', cleaned_response, re.DOTALL)
-                    if json_match:
-                        cleaned_response = json_match.group(1).strip()
-                
-                # Try to find JSON object if not at start
-                if not cleaned_response.startswith('{'):
-                    json_match = re.search(r'\{.*\}', cleaned_response, re.DOTALL)
-                    if json_match:
-                        cleaned_response = json_match.group(0)
-                
-                evaluation = json.loads(cleaned_response)
-                
-                # Validate and normalize the response structure
-                # Ensure all required fields exist
-                if "score" not in evaluation:
-                    # Try to get score from other possible fields
-                    evaluation["score"] = evaluation.get("total_score", evaluation.get("average_score", SCORE_DEFAULT))
-                
-                # CRITICAL: Validate score is in configured range and clamp if necessary
-                raw_score = float(evaluation.get("score", SCORE_DEFAULT))
-                # Clamp score to configured range (in case AI returns out of range)
-                if raw_score > SCORE_MAX:
-                    print(f"WARNING: Persona {persona.name} returned score {raw_score} > {SCORE_MAX}. Clamping to {SCORE_MAX}")
-                    raw_score = SCORE_MAX
-                elif raw_score < SCORE_MIN:
-                    print(f"WARNING: Persona {persona.name} returned score {raw_score} < {SCORE_MIN}. Clamping to {SCORE_MIN}")
-                    raw_score = SCORE_MIN
-                evaluation["score"] = raw_score
-                
-                if "strengths" not in evaluation:
-                    evaluation["strengths"] = evaluation.get("key_strengths", "Niet beschikbaar")
-                
-                if "weaknesses" not in evaluation:
-                    evaluation["weaknesses"] = evaluation.get("key_development_points", evaluation.get("weaknesses", "Niet beschikbaar"))
-                
-                if "analysis" not in evaluation:
-                    evaluation["analysis"] = evaluation.get("final_analysis", evaluation.get("verdict", "Evaluatie beschikbaar"))
-                
-                # CRITICAL: Always validate recommendation matches the score
-                # Override AI recommendation if it doesn't match score thresholds
-                score = float(evaluation["score"])  # Use validated score
-                correct_recommendation = get_recommendation_from_score(score)
-                
-                # If AI provided recommendation, check if it matches score
-                ai_recommendation = evaluation.get("recommendation", "")
-                if ai_recommendation and ai_recommendation != correct_recommendation:
-                    # Log mismatch but use correct recommendation based on score
-                    print(f"WARNING: Persona {persona.name} provided recommendation '{ai_recommendation}' for score {score}, but should be '{correct_recommendation}'. Using score-based recommendation.")
-                
-                # Store evaluation for this persona
-                return persona.name, {
-                    "score": score,
-                    "strengths": evaluation.get("strengths", "Niet beschikbaar"),
-                    "weaknesses": evaluation.get("weaknesses", "Niet beschikbaar"),
-                    "analysis": evaluation.get("analysis", "Evaluatie beschikbaar"),
-                    "big_hits": evaluation.get("big_hits"),  # Optional big hits
-                    "big_misses": evaluation.get("big_misses"),  # Optional big misses
-                    "recommendation": correct_recommendation,  # Always use score-based recommendation
-                    "persona_display_name": persona.display_name,
-                    "persona_name": persona.name
-                }
-                
-            except json.JSONDecodeError as e:
-                print(f"JSON parsing error for persona {persona.name}: {str(e)}")
-                print(f"Response (first 500 chars): {response[:500]}")
-                # Fallback structured response
-                return persona.name, {
-                    "score": SCORE_DEFAULT,
-                    "strengths": "Niet beschikbaar - parsing error",
-                    "weaknesses": "Niet beschikbaar - parsing error",
-                    "analysis": response[:500] if len(response) > 0 else "Geen response",
-                    "recommendation": get_recommendation_from_score(SCORE_DEFAULT),
-                    "persona_display_name": persona.display_name,
-                    "persona_name": persona.name
-                }
-                
-            except Exception as e:
-                print(f"Unexpected error parsing evaluation for persona {persona.name}: {str(e)}")
-                return persona.name, {
-                    "score": SCORE_DEFAULT,
-                    "strengths": "Niet beschikbaar",
-                    "weaknesses": "Niet beschikbaar",
-                    "analysis": f"Er is een fout opgetreden: {str(e)}",
-                    "recommendation": get_recommendation_from_score(SCORE_DEFAULT),
-                    "persona_display_name": persona.display_name,
-                    "persona_name": persona.name
-                }
+    
+    # Split the tokens left after system prompt and instructions over the documents by priority
+    budgeted_sections = fit_prompt_sections({
+        "resume": candidate.resume_text,
+        "company_note": company_note,
+        "job_description": job.description if job else "",
+        "job_requirements": job.requirements if job else "",
+        "motivation": candidate.motivational_letter,
+        "candidate_details": persona_extended_text
+    }, [system_prompt, build_user_prompt({})], OPENAI_MODEL_EVALUATION, OPENAI_MAX_TOKENS_EVALUATION)
+    return build_user_prompt(budgeted_sections)
+
+
+def parse_persona_evaluation(persona, response: str) -> tuple:
+    """Parse a persona's JSON answer into (persona_name, evaluation) with score-consistent recommendation"""
+    
+    # Try to parse JSON response for this persona
+    try:
+        import json
+        import re
         
-        # Run all persona evaluations in parallel
-        print(f"Running {len(persona_objects)} persona evaluations in parallel...")
-        evaluation_tasks = [evaluate_single_persona(persona) for persona in persona_objects]
-        evaluation_results = await asyncio.gather(*evaluation_tasks)
+        # Clean response - remove markdown code blocks if present
+        cleaned_response = response.strip()
+        if "```json" in cleaned_response:
+            json_match = re.search(r'```json\s*(.*?)\s*```', cleaned_response, re.DOTALL)
+            if json_match:
+                cleaned_response = json_match.group(1).strip()
+        elif "```" in cleaned_response:
+            json_match = re.search(r'```\s*(.*?)\s*```', cleaned_response, re.DOTALL)
+            if json_match:
+                cleaned_response = json_match.group(1).strip()
         
-        # Convert results to dictionary
-        persona_evaluations = {}
-        for persona_name, evaluation_data in evaluation_results:
-            persona_evaluations[persona_name] = evaluation_data
+        # Try to find JSON object if not at start
+        if not cleaned_response.startswith('{'):
+            json_match = re.search(r'\{.*\}', cleaned_response, re.DOTALL)
+            if json_match:
+                cleaned_response = json_match.group(0)
         
-        db.close()
+        evaluation = json.loads(cleaned_response)
+        
+        # Validate and normalize the response structure
+        # Ensure all required fields exist
+        if "score" not in evaluation:
+            # Try to get score from other possible fields
+            evaluation["score"] = evaluation.get("total_score", evaluation.get("average_score", SCORE_DEFAULT))
+        
+        # CRITICAL: Validate score is in configured range and clamp if necessary
+        raw_score = float(evaluation.get("score", SCORE_DEFAULT))
+        # Clamp score to configured range (in case AI returns out of range)
+        if raw_score > SCORE_MAX:
+            print(f"WARNING: Persona {persona.name} returned score {raw_score} > {SCORE_MAX}. Clamping to {SCORE_MAX}")
+            raw_score = SCORE_MAX
+        elif raw_score < SCORE_MIN:
+            print(f"WARNING: Persona {persona.name} returned score {raw_score} < {SCORE_MIN}. Clamping to {SCORE_MIN}")
+            raw_score = SCORE_MIN
+        evaluation["score"] = raw_score
+        
+        if "strengths" not in evaluation:
+            evaluation["strengths"] = evaluation.get("key_strengths", "Niet beschikbaar")
+        
+        if "weaknesses" not in evaluation:
+            evaluation["weaknesses"] = evaluation.get("key_development_points", evaluation.get("weaknesses", "Niet beschikbaar"))
+        
+        if "analysis" not in evaluation:
+            evaluation["analysis"] = evaluation.get("final_analysis", evaluation.get("verdict", "Evaluatie beschikbaar"))
+        
+        # CRITICAL: Always validate recommendation matches the score
+        # Override AI recommendation if it doesn't match score thresholds
+        score = float(evaluation["score"])  # Use validated score
+        correct_recommendation = get_recommendation_from_score(score)
+        
+        # If AI provided recommendation, check if it matches score
+        ai_recommendation = evaluation.get("recommendation", "")
+        if ai_recommendation and ai_recommendation != correct_recommendation:
+            # Log mismatch but use correct recommendation based on score
+            print(f"WARNING: Persona {persona.name} provided recommendation '{ai_recommendation}' for score {score}, but should be '{correct_recommendation}'. Using score-based recommendation.")
+        
+        # Store evaluation for this persona
+        return persona.name, {
+            "score": score,
+            "strengths": evaluation.get("strengths", "Niet beschikbaar"),
+            "weaknesses": evaluation.get("weaknesses", "Niet beschikbaar"),
+            "analysis": evaluation.get("analysis", "Evaluatie beschikbaar"),
+            "big_hits": evaluation.get("big_hits"),  # Optional big hits
+            "big_misses": evaluation.get("big_misses"),  # Optional big misses
+            "recommendation": correct_recommendation,  # Always use score-based recommendation
+            "persona_display_name": persona.display_name,
+            "persona_name": persona.name
+        }
         
-        # Generate combined analysis if we have multiple evaluations
-        combined_analysis = None
-        combined_recommendation = None
-        combined_score = None  # Initialize combined_score
+    except json.JSONDecodeError as e:
+        print(f"JSON parsing error for persona {persona.name}: {str(e)}")
+        print(f"Response (first 500 chars): {response[:500]}")
+        # Fallback structured response
+        return persona.name, {
+            "score": SCORE_DEFAULT,
+            "strengths": "Niet beschikbaar - parsing error",
+            "weaknesses": "Niet beschikbaar - parsing error",
+            "analysis": response[:500] if len(response) > 0 else "Geen response",
+            "recommendation": get_recommendation_from_score(SCORE_DEFAULT),
+            "persona_display_name": persona.display_name,
+            "persona_name": persona.name
+        }
         
-        if len(persona_evaluations) > 1:
-            try:
-                # Collect all evaluations for combined analysis
-                evaluation_summaries = []
-                for persona_name, eval_data in persona_evaluations.items():
-                    if "error" not in eval_data:
-                        persona_obj = next((p for p in persona_objects if p.name == persona_name), None)
-                        display_name = persona_obj.display_name if persona_obj else persona_name
-                        # Create concise summary
-                        strengths_preview = eval_data.get('strengths', '')[:150] if eval_data.get('strengths') else 'N/A'
-                        evaluation_summaries.append(
-                            f"{display_name} ({eval_data.get('score', 'N/A')}/{SCORE_MAX}): {eval_data.get('recommendation', 'N/A')}. "
-                            f"Punten: {strengths_preview}"
-                        )
-                
-                # Create combined analysis prompt with ratings overview
-                # Join summaries outside f-string to avoid backslash issue
-                summaries_text = '\n\n'.join(evaluation_summaries)
-                
-                # Build ratings overview table
-                ratings_overview = []
-                for persona_name, eval_data in persona_evaluations.items():
-                    if "error" not in eval_data:
-                        persona_obj = next((p for p in persona_objects if p.name == persona_name), None)
-                        display_name = persona_obj.display_name if persona_obj else persona_name
-                        score = eval_data.get('score', 'N/A')
-                        recommendation = eval_data.get('recommendation', 'N/A')
-                        ratings_overview.append(f"- {display_name}: Score {score}/{SCORE_MAX}, Advies: {recommendation}")
-                
-                ratings_text = '\n'.join(ratings_overview)
-                
-                combined_prompt = f"""Je combineert de beoordelingen van de digitale werknemers tot één advies voor de kandidaat.
+    except Exception as e:
+        print(f"Unexpected error parsing evaluation for persona {persona.name}: {str(e)}")
+        return persona.name, {
+            "score": SCORE_DEFAULT,
+            "strengths": "Niet beschikbaar",
+            "weaknesses": "Niet beschikbaar",
+            "analysis": f"Er is een fout opgetreden: {str(e)}",
+            "recommendation": get_recommendation_from_score(SCORE_DEFAULT),
+            "persona_display_name": persona.display_name,
+            "persona_name": persona.name
+        }
+
+
+async def evaluate_single_persona(persona, system_prompt: str, candidate, job, company_note: Optional[str],
+                                  bypass_cache: Optional[bool] = False) -> tuple:
+    """Evaluate a candidate from one persona's perspective - designed to run in parallel"""
+    user_prompt = build_persona_user_prompt(persona, candidate, job, company_note, system_prompt)
+    
+    # Call OpenAI safely for this persona - ASYNC VERSION
+    openai_result = await call_openai_safe_async([
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": user_prompt}
+    ], max_tokens=OPENAI_MAX_TOKENS_EVALUATION, temperature=OPENAI_TEMPERATURE_EVALUATION, model=OPENAI_MODEL_EVALUATION,
+       cache_endpoint="evaluation", use_cache=False if bypass_cache else None)
+    
+    if not openai_result["success"]:
+        print(f"AI evaluation failed for persona {persona.name}: {openai_result['error']}")
+        return persona.name, {
+            "error": f"Evaluation failed: {openai_result['error']}",
+            "persona_display_name": persona.display_name
+        }
+    
+    return parse_persona_evaluation(persona, openai_result["result"].choices[0].message.content)
+
+
+def build_candidate_summary(candidate, job_summary_for_prompt: str) -> str:
+    """Concise candidate summary for the combined-analysis prompt"""
+    candidate_name_display = candidate.name or "De kandidaat"
+    exp_years = candidate.years_experience or candidate.experience_years
+    summary_parts = [f"{candidate_name_display} wordt beoordeeld voor {job_summary_for_prompt}."]
+    if candidate.location:
+        summary_parts.append(f"Locatie: {candidate.location}.")
+    if exp_years:
+        summary_parts.append(f"Heeft ongeveer {exp_years} jaar ervaring.")
+    if candidate.availability_per_week:
+        summary_parts.append(f"Beschikbaarheid: {candidate.availability_per_week} uur per week.")
+    if candidate.notice_period:
+        summary_parts.append(f"Opzegtermijn: {candidate.notice_period}.")
+    return " ".join(summary_parts).strip()
+
+
+async def combine_persona_evaluations(persona_evaluations: Dict[str, Dict], persona_objects: List,
+                                      candidate_summary_for_prompt: str, job_summary_for_prompt: str,
+                                      bypass_cache: Optional[bool] = False) -> tuple:
+    """Combine persona evaluations into (combined_analysis, combined_recommendation, combined_score)"""
+    # Generate combined analysis if we have multiple evaluations
+    combined_analysis = None
+    combined_recommendation = None
+    combined_score = None  # Initialize combined_score
+    
+    if len(persona_evaluations) > 1:
+        try:
+            # Collect all evaluations for combined analysis
+            evaluation_summaries = []
+            for persona_name, eval_data in persona_evaluations.items():
+                if "error" not in eval_data:
+                    persona_obj = next((p for p in persona_objects if p.name == persona_name), None)
+                    display_name = persona_obj.display_name if persona_obj else persona_name
+                    # Create concise summary
+                    strengths_preview = eval_data.get('strengths', '')[:150] if eval_data.get('strengths') else 'N/A'
+                    evaluation_summaries.append(
+                        f"{display_name} ({eval_data.get('score', 'N/A')}/{SCORE_MAX}): {eval_data.get('recommendation', 'N/A')}. "
+                        f"Punten: {strengths_preview}"
+                    )
+            
+            # Create combined analysis prompt with ratings overview
+            # Join summaries outside f-string to avoid backslash issue
+            summaries_text = '\n\n'.join(evaluation_summaries)
+            
+            # Build ratings overview table
+            ratings_overview = []
+            for persona_name, eval_data in persona_evaluations.items():
+                if "error" not in eval_data:
+                    persona_obj = next((p for p in persona_objects if p.name == persona_name), None)
+                    display_name = persona_obj.display_name if persona_obj else persona_name
+                    score = eval_data.get('score', 'N/A')
+                    recommendation = eval_data.get('recommendation', 'N/A')
+                    ratings_overview.append(f"- {display_name}: Score {score}/{SCORE_MAX}, Advies: {recommendation}")
+            
+            ratings_text = '\n'.join(ratings_overview)
+            
+            combined_prompt = f"""Je combineert de beoordelingen van de digitale werknemers tot één advies voor de kandidaat.
 
 CONTEXT:
 - Kandidaat: {candidate_summary_for_prompt}
@@ -4579,77 +5086,68 @@ Antwoord met JSON:
 }}
 
 combined_score is optioneel (wordt automatisch berekend). Gebruik ALTIJD /10 notatie."""
-                
-                # Call OpenAI for combined analysis
-                # Use the already imported variables from top of file
-                combined_system_message = f"""Je combineert evaluaties tot een samenhangend advies over de geschiktheid van de kandidaat voor de vacature.
+            
+            # Call OpenAI for combined analysis
+            # Use the already imported variables from top of file
+            combined_system_message = f"""Je combineert evaluaties tot een samenhangend advies over de geschiktheid van de kandidaat voor de vacature.
 
 BELANGRIJK:
 - Alle scores zijn op 1-10 schaal
 - Gebruik ALTIJD /10 notatie (bijv. 7.5/10, 8.0/10)
 - De eindconclusie gaat ALTIJD over de kandidaat en zijn/haar fit met de rol, niet over de digitale werknemers
 - >= 7.0 = goed, >= 8.5 = uitstekend"""
+            
+            combined_result = await call_openai_safe_async([
+                {"role": "system", "content": combined_system_message},
+                {"role": "user", "content": combined_prompt}
+            ], max_tokens=800, temperature=0.3, model=OPENAI_MODEL_EVALUATION,
+               cache_endpoint="evaluation", use_cache=False if bypass_cache else None)
+            
+            if combined_result["success"]:
+                combined_response = combined_result["result"].choices[0].message.content
+                import json
+                import re
                 
-                combined_result = call_openai_safe([
-                    {"role": "system", "content": combined_system_message},
-                    {"role": "user", "content": combined_prompt}
-                ], max_tokens=800, temperature=0.3, model=OPENAI_MODEL_EVALUATION)
+                # Clean and parse JSON
+                cleaned = combined_response.strip()
+                if "```json" in cleaned:
+                    json_match = re.search(r'```json\s*(.*?)\s*```', cleaned, re.DOTALL)
+                    if json_match:
+                        cleaned = json_match.group(1).strip()
+                elif "```" in cleaned:
+                    json_match = re.search(r'```\s*(.*?)\s*```', cleaned, re.DOTALL)
+                    if json_match:
+                        cleaned = json_match.group(1).strip()
                 
-                if combined_result["success"]:
-                    combined_response = combined_result["result"].choices[0].message.content
-                    import json
-                    import re
-                    
-                    # Clean and parse JSON
-                    cleaned = combined_response.strip()
-                    if "```json" in cleaned:
-                        json_match = re.search(r'```json\s*(.*?)\s*```', cleaned, re.DOTALL)
-                        if json_match:
-                            cleaned = json_match.group(1).strip()
-                    elif "```" in cleaned:
-                        json_match = re.search(r'```\s*(.*?)\s*```', cleaned, re.DOTALL)
-                        if json_match:
-                            cleaned = json_match.group(1).strip()
-                    
-                    if not cleaned.startswith('{'):
-                        json_match = re.search(r'\{.*\}', cleaned, re.DOTALL)
-                        if json_match:
-                            cleaned = json_match.group(0)
-                    
-                    try:
-                        combined_data = json.loads(cleaned)
-                        combined_analysis = combined_data.get("combined_analysis", "Gecombineerde analyse beschikbaar")
-                        combined_recommendation = combined_data.get("combined_recommendation", "Twijfelgeval / meer informatie nodig")
-                        combined_score = combined_data.get("combined_score")
-                        # Calculate if not provided
-                        if combined_score is None:
-                            scores = [float(e.get('score', SCORE_DEFAULT)) for e in persona_evaluations.values() if 'error' not in e and e.get('score')]
-                            # Validate all scores are in configured range before averaging
-                            validated_scores = [min(max(s, SCORE_MIN), SCORE_MAX) for s in scores]
-                            combined_score = sum(validated_scores) / len(validated_scores) if validated_scores else SCORE_DEFAULT
-                        # Clamp combined_score to configured range (in case AI returned out of range)
-                        combined_score = min(max(float(combined_score), SCORE_MIN), SCORE_MAX)
-                    except:
-                        # Fallback if parsing fails
-                        combined_analysis = "Gecombineerde analyse van alle geselecteerde perspectieven."
+                if not cleaned.startswith('{'):
+                    json_match = re.search(r'\{.*\}', cleaned, re.DOTALL)
+                    if json_match:
+                        cleaned = json_match.group(0)
+                
+                try:
+                    combined_data = json.loads(cleaned)
+                    combined_analysis = combined_data.get("combined_analysis", "Gecombineerde analyse beschikbaar")
+                    combined_recommendation = combined_data.get("combined_recommendation", "Twijfelgeval / meer informatie nodig")
+                    combined_score = combined_data.get("combined_score")
+                    # Calculate if not provided
+                    if combined_score is None:
                         scores = [float(e.get('score', SCORE_DEFAULT)) for e in persona_evaluations.values() if 'error' not in e and e.get('score')]
                         # Validate all scores are in configured range before averaging
                         validated_scores = [min(max(s, SCORE_MIN), SCORE_MAX) for s in scores]
-                        avg_score = sum(validated_scores) / len(validated_scores) if validated_scores else SCORE_DEFAULT
-                        combined_score = min(max(avg_score, SCORE_MIN), SCORE_MAX)  # Clamp to configured range
-                        combined_recommendation = get_recommendation_from_score(avg_score)
-                else:
-                    # Fallback if API call fails
+                        combined_score = sum(validated_scores) / len(validated_scores) if validated_scores else SCORE_DEFAULT
+                    # Clamp combined_score to configured range (in case AI returned out of range)
+                    combined_score = min(max(float(combined_score), SCORE_MIN), SCORE_MAX)
+                except:
+                    # Fallback if parsing fails
+                    combined_analysis = "Gecombineerde analyse van alle geselecteerde perspectieven."
                     scores = [float(e.get('score', SCORE_DEFAULT)) for e in persona_evaluations.values() if 'error' not in e and e.get('score')]
                     # Validate all scores are in configured range before averaging
                     validated_scores = [min(max(s, SCORE_MIN), SCORE_MAX) for s in scores]
                     avg_score = sum(validated_scores) / len(validated_scores) if validated_scores else SCORE_DEFAULT
                     combined_score = min(max(avg_score, SCORE_MIN), SCORE_MAX)  # Clamp to configured range
-                    combined_analysis = f"Gemiddelde score van {len(persona_evaluations)} perspectieven: {avg_score:.1f}/{SCORE_MAX}"
                     combined_recommendation = get_recommendation_from_score(avg_score)
-            except Exception as e:
-                print(f"Error generating combined analysis: {str(e)}")
-                # Fallback
+            else:
+                # Fallback if API call fails
                 scores = [float(e.get('score', SCORE_DEFAULT)) for e in persona_evaluations.values() if 'error' not in e and e.get('score')]
                 # Validate all scores are in configured range before averaging
                 validated_scores = [min(max(s, SCORE_MIN), SCORE_MAX) for s in scores]
@@ -4657,185 +5155,471 @@ BELANGRIJK:
                 combined_score = min(max(avg_score, SCORE_MIN), SCORE_MAX)  # Clamp to configured range
                 combined_analysis = f"Gemiddelde score van {len(persona_evaluations)} perspectieven: {avg_score:.1f}/{SCORE_MAX}"
                 combined_recommendation = get_recommendation_from_score(avg_score)
-        else:
-            # Single persona evaluation - calculate score directly
-            if len(persona_evaluations) == 1:
-                eval_data = list(persona_evaluations.values())[0]
-                if 'error' not in eval_data:
-                    combined_score = float(eval_data.get('score', SCORE_DEFAULT))
-                    combined_score = min(max(combined_score, SCORE_MIN), SCORE_MAX)
-                    combined_analysis = eval_data.get('analysis', 'Evaluatie beschikbaar')
-                    combined_recommendation = eval_data.get('recommendation', get_recommendation_from_score(combined_score))
-                else:
-                    combined_score = SCORE_DEFAULT
-                    combined_analysis = "Evaluatie beschikbaar"
-                    combined_recommendation = get_recommendation_from_score(SCORE_DEFAULT)
-            else:
-                # No evaluations - fallback
-                combined_score = SCORE_DEFAULT
-                combined_analysis = "Geen evaluaties beschikbaar"
-                combined_recommendation = get_recommendation_from_score(SCORE_DEFAULT)
-        
-        # Ensure combined_score is always defined
-        if combined_score is None:
+        except Exception as e:
+            print(f"Error generating combined analysis: {str(e)}")
+            # Fallback
             scores = [float(e.get('score', SCORE_DEFAULT)) for e in persona_evaluations.values() if 'error' not in e and e.get('score')]
+            # Validate all scores are in configured range before averaging
             validated_scores = [min(max(s, SCORE_MIN), SCORE_MAX) for s in scores]
-            combined_score = sum(validated_scores) / len(validated_scores) if validated_scores else SCORE_DEFAULT
-            combined_score = min(max(combined_score, SCORE_MIN), SCORE_MAX)
-        
-        # Prepare result data
-        result_data = {
-            "evaluations": persona_evaluations,
-            "persona_count": len(persona_evaluations),
-            "combined_analysis": combined_analysis,
-            "combined_recommendation": combined_recommendation,
-            "combined_score": combined_score
-        }
-        result_data["persona_prompts"] = persona_prompts
-        
-        # Initialize result_id variable
-        result_id = None
-        
-        # Save result to database
-        try:
-            import json
-            result_json = json.dumps(result_data)
-            # Sort persona IDs for consistent comparison
-            persona_ids_json = json.dumps(sorted(list(persona_prompts.keys())))
-            
-            # Archive old evaluations for the same candidate, job, and persona set
-            # This ensures we keep history but only show the latest evaluation
-            old_results = db.query(EvaluationResultDB).filter(
-                EvaluationResultDB.candidate_id == candidate_id,
-                EvaluationResultDB.job_id == evaluation_job_id,
-                EvaluationResultDB.result_type == 'evaluation',
-                EvaluationResultDB.selected_personas == persona_ids_json,
-                EvaluationResultDB.is_archived == False
-            ).all()
-            
-            # Archive all old results
-            for old_result in old_results:
-                old_result.is_archived = True
-                old_result.updated_at = func.now()
-            
-            # Check if there's an existing non-archived result (shouldn't happen after archiving, but just in case)
-            existing_result = db.query(EvaluationResultDB).filter(
-                EvaluationResultDB.candidate_id == candidate_id,
-                EvaluationResultDB.job_id == evaluation_job_id,
-                EvaluationResultDB.result_type == 'evaluation',
-                EvaluationResultDB.selected_personas == persona_ids_json,
-                EvaluationResultDB.is_archived == False
-            ).first()
-            
-            result_id = None
-            if existing_result:
-                # Update existing result
-                existing_result.result_data = result_json
-                existing_result.company_note = company_note
-                existing_result.updated_at = func.now()
-                existing_result.is_archived = False  # Ensure it's not archived
-                result_id = existing_result.id
+            avg_score = sum(validated_scores) / len(validated_scores) if validated_scores else SCORE_DEFAULT
+            combined_score = min(max(avg_score, SCORE_MIN), SCORE_MAX)  # Clamp to configured range
+            combined_analysis = f"Gemiddelde score van {len(persona_evaluations)} perspectieven: {avg_score:.1f}/{SCORE_MAX}"
+            combined_recommendation = get_recommendation_from_score(avg_score)
+    else:
+        # Single persona evaluation - calculate score directly
+        if len(persona_evaluations) == 1:
+            eval_data = list(persona_evaluations.values())[0]
+            if 'error' not in eval_data:
+                combined_score = float(eval_data.get('score', SCORE_DEFAULT))
+                combined_score = min(max(combined_score, SCORE_MIN), SCORE_MAX)
+                combined_analysis = eval_data.get('analysis', 'Evaluatie beschikbaar')
+                combined_recommendation = eval_data.get('recommendation', get_recommendation_from_score(combined_score))
             else:
-                # Create new result
-                evaluation_result = EvaluationResultDB(
-                    candidate_id=candidate_id,
-                    job_id=evaluation_job_id,
-                    result_type='evaluation',
-                    result_data=result_json,
-                    selected_personas=persona_ids_json,
-                    company_note=company_note,
-                    is_archived=False
-                )
-                db.add(evaluation_result)
-            
-            db.commit()
-            if not result_id:
-                db.refresh(evaluation_result)
-                result_id = evaluation_result.id
-                
-                # Create notifications for job watchers
-                try:
-                    watchers = db.query(JobWatcherDB).filter(JobWatcherDB.job_id == evaluation_job_id).all()
-                    for watcher in watchers:
-                        notification = NotificationDB(
-                            user_id=watcher.user_id,
-                            type="evaluation_complete",
-                            title=f"Evaluatie voltooid voor {candidate.name}",
-                            message=f"Evaluatie is voltooid voor {candidate.name} bij {job.title if job else 'vacature'}",
-                            related_candidate_id=candidate_id,
-                            related_job_id=evaluation_job_id,
-                            related_result_id=result_id
-                        )
-                        db.add(notification)
-                    db.commit()
-                except Exception as notif_error:
-                    print(f"Error creating notifications: {str(notif_error)}")
-                    # Don't fail the whole request if notifications fail
-        except Exception as e:
-            print(f"Error saving evaluation result: {str(e)}")
-            import traceback
-            traceback.print_exc()
-            # Continue even if saving fails
-        
-        # Ensure database is closed before returning
-        if db:
-            try:
-                db.close()
-            except:
-                pass
-        
+                combined_score = SCORE_DEFAULT
+                combined_analysis = "Evaluatie beschikbaar"
+                combined_recommendation = get_recommendation_from_score(SCORE_DEFAULT)
+        else:
+            # No evaluations - fallback
+            combined_score = SCORE_DEFAULT
+            combined_analysis = "Geen evaluaties beschikbaar"
+            combined_recommendation = get_recommendation_from_score(SCORE_DEFAULT)
+    
+    # Ensure combined_score is always defined
+    if combined_score is None:
+        scores = [float(e.get('score', SCORE_DEFAULT)) for e in persona_evaluations.values() if 'error' not in e and e.get('score')]
+        validated_scores = [min(max(s, SCORE_MIN), SCORE_MAX) for s in scores]
+        combined_score = sum(validated_scores) / len(validated_scores) if validated_scores else SCORE_DEFAULT
+        combined_score = min(max(combined_score, SCORE_MIN), SCORE_MAX)
+    
+    return combined_analysis, combined_recommendation, combined_score
+
+
+def resolve_evaluation_job_id(candidate, job_id: Optional[str] = None) -> Optional[str]:
+    """Job to evaluate against: passed job_id, candidate.job_id, or first preferential job"""
+    if job_id:
+        return job_id
+    if candidate.job_id:
+        return candidate.job_id
+    if candidate.preferential_job_ids:
+        preferential_list = [jid.strip() for jid in candidate.preferential_job_ids.split(",") if jid.strip()]
+        if preferential_list:
+            return preferential_list[0]
+    return None
+
+
+def prepare_evaluation_personas(db, persona_prompts: Dict[str, str]) -> List[tuple]:
+    """Load the selected personas and build their system prompts once: [(persona, system_prompt)]"""
+    personas = db.query(PersonaDB).filter(PersonaDB.name.in_(list(persona_prompts.keys()))).all()
+    personas_by_name = {persona.name: persona for persona in personas}
+    prepared = []
+    for persona_name in persona_prompts.keys():
+        persona = personas_by_name.get(persona_name)
+        if persona:
+            persona_prompt = persona_prompts.get(persona.name, persona.system_prompt)
+            prepared.append((persona, build_persona_system_prompt(persona, persona_prompt)))
+    return prepared
+
+
+async def evaluate_candidate_for_job(candidate, job, prepared_personas: List[tuple], company_note: Optional[str] = None,
+                                     bypass_cache: Optional[bool] = False) -> Dict[str, Any]:
+    """Run all persona evaluations for one candidate in parallel and combine them into result data"""
+    print(f"Running {len(prepared_personas)} persona evaluations in parallel...")
+    evaluation_results = await asyncio.gather(*[
+        evaluate_single_persona(persona, system_prompt, candidate, job, company_note, bypass_cache)
+        for persona, system_prompt in prepared_personas
+    ])
+
+    # Convert results to dictionary
+    persona_evaluations = {}
+    for persona_name, evaluation_data in evaluation_results:
+        persona_evaluations[persona_name] = evaluation_data
+
+    return await build_evaluation_result_data(candidate, job, prepared_personas, persona_evaluations, bypass_cache)
+
+
+async def build_evaluation_result_data(candidate, job, prepared_personas: List[tuple], persona_evaluations: Dict[str, Dict],
+                                       bypass_cache: Optional[bool] = False) -> Dict[str, Any]:
+    """Add the combined analysis to finished persona evaluations"""
+    if job:
+        job_summary_for_prompt = f"{job.title or 'Onbekende functie'} bij {job.company or 'Onbekend bedrijf'}"
+    else:
+        job_summary_for_prompt = "Onbekende functie"
+    combined_analysis, combined_recommendation, combined_score = await combine_persona_evaluations(
+        persona_evaluations,
+        [persona for persona, _ in prepared_personas],
+        build_candidate_summary(candidate, job_summary_for_prompt),
+        job_summary_for_prompt,
+        bypass_cache=bypass_cache
+    )
+
+    return {
+        "evaluations": persona_evaluations,
+        "persona_count": len(persona_evaluations),
+        "combined_analysis": combined_analysis,
+        "combined_recommendation": combined_recommendation,
+        "combined_score": combined_score
+    }
+
+
+def save_evaluation_results(db, job, persona_prompts: Dict[str, str], entries: List[tuple]) -> Dict[str, str]:
+    """Store evaluation results for one job and persona set in a single commit.
+
+    entries: [(candidate, result_data, company_note)]. Older results for the same candidate, job and
+    persona set are archived (history is kept, only the latest is shown) and job watchers are notified.
+    Returns candidate_id -> result_id.
+    """
+    import json
+    # Sort persona IDs for consistent comparison
+    persona_ids_json = json.dumps(sorted(list(persona_prompts.keys())))
+    candidate_ids = [candidate.id for candidate, _, _ in entries]
+
+    db.query(EvaluationResultDB).filter(
+        EvaluationResultDB.candidate_id.in_(candidate_ids),
+        EvaluationResultDB.job_id == job.id,
+        EvaluationResultDB.result_type == 'evaluation',
+        EvaluationResultDB.selected_personas == persona_ids_json,
+        EvaluationResultDB.is_archived == False
+    ).update({"is_archived": True, "updated_at": func.now()}, synchronize_session=False)
+
+    result_ids = {}
+    for candidate, result_data, company_note in entries:
+        result_id = str(uuid4())
+        result_ids[candidate.id] = result_id
+        db.add(EvaluationResultDB(
+            id=result_id,
+            candidate_id=candidate.id,
+            job_id=job.id,
+            result_type='evaluation',
+            result_data=json.dumps({**result_data, "persona_prompts": persona_prompts}),
+            selected_personas=persona_ids_json,
+            company_note=company_note,
+            is_archived=False
+        ))
+
+    # Create notifications for job watchers
+    try:
+        watchers = db.query(JobWatcherDB).filter(JobWatcherDB.job_id == job.id).all()
+        for candidate, _, _ in entries:
+            for watcher in watchers:
+                db.add(NotificationDB(
+                    user_id=watcher.user_id,
+                    type="evaluation_complete",
+                    title=f"Evaluatie voltooid voor {candidate.name}",
+                    message=f"Evaluatie is voltooid voor {candidate.name} bij {job.title if job else 'vacature'}",
+                    related_candidate_id=candidate.id,
+                    related_job_id=job.id,
+                    related_result_id=result_ids[candidate.id]
+                ))
+    except Exception as notif_error:
+        print(f"Error creating notifications: {str(notif_error)}")
+        # Don't fail the whole request if notifications fail
+
+    db.commit()
+    return result_ids
+
+
+def load_evaluation_inputs(candidate_id: str, persona_prompts: Dict[str, str], job_id: Optional[str] = None) -> tuple:
+    """Validate an evaluation request and load (candidate, job, prepared_personas); raises HTTPException"""
+    db = SessionLocal()
+    try:
+        candidate = db.query(CandidateDB).filter(CandidateDB.id == candidate_id).first()
+
+        if not candidate:
+            raise HTTPException(status_code=404, detail="Candidate not found")
+
+        evaluation_job_id = resolve_evaluation_job_id(candidate, job_id)
+        if not evaluation_job_id:
+            raise HTTPException(status_code=400, detail="Evaluation requires a job posting. Please select a job before evaluating.")
+
+        # Verify job posting exists
+        job = db.query(JobPostingDB).filter(JobPostingDB.id == evaluation_job_id).first()
+        if not job:
+            raise HTTPException(status_code=404, detail="Associated job posting not found")
+
+        # ADD THIS CHECK: Verify resume_text is actually text, not binary
+        # Resume text is budgeted per persona prompt (token_budget)
+        resume_text = candidate.resume_text
+        if not resume_text or len(resume_text.strip()) < 50:
+            raise HTTPException(status_code=400, detail="Resume text is empty or invalid. Please re-upload the resume.")
+
+        # If no personas selected, return error
+        if not persona_prompts:
+            raise HTTPException(status_code=400, detail="At least one persona must be selected for evaluation")
+
+        # Get persona details from database
+        prepared_personas = prepare_evaluation_personas(db, persona_prompts)
+        if not prepared_personas:
+            raise HTTPException(status_code=404, detail="Selected personas not found in database")
+
+        return candidate, job, prepared_personas
+    finally:
+        db.close()
+
+
+def save_single_evaluation_result(candidate, job, persona_prompts: Dict[str, str], result_data: Dict[str, Any],
+                                  company_note: Optional[str] = None) -> Optional[str]:
+    """Save one candidate's evaluation; returns the result_id (None if saving failed)"""
+    db = SessionLocal()
+    try:
+        return save_evaluation_results(db, job, persona_prompts, [(candidate, result_data, company_note)])[candidate.id]
+    except Exception as e:
+        print(f"Error saving evaluation result: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        # Continue even if saving fails
+        return None
+    finally:
+        db.close()
+
+
+async def run_candidate_evaluation(
+    candidate_id: str,
+    persona_prompts: Dict[str, str],
+    job_id: Optional[str] = None,
+    strictness: Optional[str] = "medium",
+    company_note: Optional[str] = None,
+    bypass_cache: Optional[bool] = False
+) -> Dict[str, Any]:
+    """Run the persona evaluations and store the EvaluationResultDB row (used by the endpoint and task workers)"""
+    try:
+        candidate, job, prepared_personas = load_evaluation_inputs(candidate_id, persona_prompts, job_id)
+
+        result_data = await evaluate_candidate_for_job(
+            candidate, job, prepared_personas, company_note=company_note, bypass_cache=bypass_cache
+        )
+        result_id = save_single_evaluation_result(candidate, job, persona_prompts, result_data, company_note)
+
         # Return evaluations from all personas with combined analysis
         return {
             "success": True,
-            "evaluations": persona_evaluations,  # Dictionary of persona_name -> evaluation
-            "persona_count": len(persona_evaluations),
-            "combined_analysis": combined_analysis,
-            "combined_recommendation": combined_recommendation,
-            "combined_score": combined_score,
+            **result_data,  # evaluations: dictionary of persona_name -> evaluation
             "result_id": result_id  # Include result_id so frontend can navigate directly
         }
-        
+
     except HTTPException:
         # Re-raise HTTPExceptions (they already have proper status codes)
-        if db:
-            try:
-                db.close()
-            except:
-                pass
         raise
     except Exception as e:
         # Log the full error with traceback
         print(f"Unexpected error in evaluate-candidate endpoint: {str(e)}")
         import traceback
         traceback.print_exc()
-        
-        # Ensure database is closed
-        if db:
-            try:
-                db.close()
-            except:
-                pass
-        
+
         # Raise HTTPException with proper status code
         raise HTTPException(
             status_code=500,
             detail=f"Evaluation failed: {str(e)}"
         )
 
+
+async def stream_candidate_evaluation(candidate, job, prepared_personas: List[tuple], persona_prompts: Dict[str, str],
+                                      company_note: Optional[str] = None, bypass_cache: Optional[bool] = False):
+    """Yield (event, data) as the evaluation progresses: each persona as it finishes, then combined, then result"""
+    tasks = [
+        asyncio.ensure_future(evaluate_single_persona(persona, system_prompt, candidate, job, company_note, bypass_cache))
+        for persona, system_prompt in prepared_personas
+    ]
+    try:
+        finished = {}
+        for next_done in asyncio.as_completed(tasks):
+            persona_name, evaluation_data = await next_done
+            finished[persona_name] = evaluation_data
+            yield "persona", {"persona_name": persona_name, "evaluation": evaluation_data,
+                              "completed": len(finished), "total": len(tasks)}
+
+        # Keep the persona order of the request, like the non-streaming response
+        persona_evaluations = {persona.name: finished[persona.name] for persona, _ in prepared_personas}
+        result_data = await build_evaluation_result_data(candidate, job, prepared_personas, persona_evaluations, bypass_cache)
+        yield "combined", {
+            "combined_analysis": result_data["combined_analysis"],
+            "combined_recommendation": result_data["combined_recommendation"],
+            "combined_score": result_data["combined_score"]
+        }
+
+        result_id = save_single_evaluation_result(candidate, job, persona_prompts, result_data, company_note)
+        yield "result", {"success": True, **result_data, "result_id": result_id}
+    finally:
+        # Client went away or an error occurred: don't leave persona calls running
+        for task in tasks:
+            task.cancel()
+
+
+def format_sse_event(event: str, data: Dict[str, Any]) -> str:
+    """Encode one server-sent event"""
+    import json
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+
+def sse_response(events) -> StreamingResponse:
+    """Stream (event, data) pairs from an async generator as text/event-stream; errors become an 'error' event"""
+    async def body():
+        try:
+            async for event, data in events:
+                yield format_sse_event(event, data)
+        except HTTPException as e:
+            yield format_sse_event("error", {"status_code": e.status_code, "detail": e.detail})
+        except Exception as e:
+            print(f"Error while streaming events: {str(e)}")
+            yield format_sse_event("error", {"status_code": 500, "detail": str(e)})
+
+    return StreamingResponse(body(), media_type="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no"  # Disable proxy buffering so events arrive immediately
+    })
+
+
+# Shared by all batch evaluations on an event loop, on top of the per-call LLM governor
+_batch_evaluation_semaphore: Optional[asyncio.Semaphore] = None
+_batch_evaluation_semaphore_loop: Optional[asyncio.AbstractEventLoop] = None
+
+def get_batch_evaluation_semaphore() -> asyncio.Semaphore:
+    """Candidate slot semaphore of the running event loop (rebuilt per loop, like the governor's)"""
+    global _batch_evaluation_semaphore, _batch_evaluation_semaphore_loop
+    loop = asyncio.get_running_loop()
+    if _batch_evaluation_semaphore_loop is not loop:
+        _batch_evaluation_semaphore = asyncio.Semaphore(BATCH_EVALUATION_MAX_CONCURRENT_CANDIDATES)
+        _batch_evaluation_semaphore_loop = loop
+    return _batch_evaluation_semaphore
+
+
+async def run_batch_evaluation(
+    job_id: str,
+    persona_prompts: Dict[str, str],
+    candidate_ids: Optional[List[str]] = None,
+    company_note: Optional[str] = None,
+    use_candidate_company_note: Optional[bool] = False,
+    bypass_cache: Optional[bool] = False,
+    context=None
+) -> Dict[str, Any]:
+    """Evaluate every candidate of a job with one persona set.
+
+    The job and persona system prompts are loaded once for the whole batch, candidates run
+    concurrently up to BATCH_EVALUATION_MAX_CONCURRENT_CANDIDATES, and results are written
+    BATCH_EVALUATION_COMMIT_SIZE at a time. Progress is reported on the task row (context).
+    """
+    db = SessionLocal()
+    try:
+        job = db.query(JobPostingDB).filter(JobPostingDB.id == job_id).first()
+        if not job:
+            raise HTTPException(status_code=404, detail="Associated job posting not found")
+        if not persona_prompts:
+            raise HTTPException(status_code=400, detail="At least one persona must be selected for evaluation")
+        prepared_personas = prepare_evaluation_personas(db, persona_prompts)
+        if not prepared_personas:
+            raise HTTPException(status_code=404, detail="Selected personas not found in database")
+
+        query = db.query(CandidateDB)
+        if candidate_ids:
+            query = query.filter(CandidateDB.id.in_(candidate_ids))
+        else:
+            query = query.filter(or_(
+                CandidateDB.job_id == job_id,
+                CandidateDB.id.in_(candidates_linked_to_jobs(job_id))
+            ))
+        candidates = query.order_by(CandidateDB.created_at).all()
+    finally:
+        db.close()
+
+    progress = {"total": len(candidates), "completed": 0, "failed": 0, "saved": 0}
+    results: Dict[str, Dict[str, Any]] = {}
+    semaphore = get_batch_evaluation_semaphore()
+    pending_saves: List[tuple] = []
+
+    async def report_progress():
+        if context:
+            await context.set_progress(progress)
+
+    def save_pending():
+        entries = pending_saves[:]
+        pending_saves.clear()
+        if not entries:
+            return
+        save_db = SessionLocal()
+        try:
+            result_ids = save_evaluation_results(save_db, job, persona_prompts, entries)
+            for candidate_id, result_id in result_ids.items():
+                results[candidate_id]["result_id"] = result_id
+            progress["saved"] += len(entries)
+        except Exception as e:
+            print(f"Error saving batch evaluation results: {str(e)}")
+            save_db.rollback()
+            for candidate, _, _ in entries:
+                results[candidate.id]["error"] = f"Saving failed: {str(e)}"
+        finally:
+            save_db.close()
+
+    async def evaluate_one(candidate):
+        entry = {"candidate_id": candidate.id, "candidate_name": candidate.name}
+        results[candidate.id] = entry
+        if not candidate.resume_text or len(candidate.resume_text.strip()) < 50:
+            entry["error"] = "Resume text is empty or invalid. Please re-upload the resume."
+            progress["failed"] += 1
+            await report_progress()
+            return
+        note = candidate.company_note if use_candidate_company_note and candidate.company_note else company_note
+        async with semaphore:
+            try:
+                result_data = await evaluate_candidate_for_job(
+                    candidate, job, prepared_personas, company_note=note, bypass_cache=bypass_cache
+                )
+            except Exception as e:
+                print(f"Batch evaluation failed for candidate {candidate.id}: {str(e)}")
+                entry["error"] = f"Evaluation failed: {str(e)}"
+                progress["failed"] += 1
+                await report_progress()
+                return
+        entry["combined_score"] = result_data["combined_score"]
+        entry["combined_recommendation"] = result_data["combined_recommendation"]
+        pending_saves.append((candidate, result_data, note))
+        progress["completed"] += 1
+        if len(pending_saves) >= BATCH_EVALUATION_COMMIT_SIZE:
+            save_pending()
+        await report_progress()
+
+    print(f"Batch evaluation: {len(candidates)} candidates for job {job_id} with {len(prepared_personas)} personas")
+    await report_progress()
+    try:
+        await asyncio.gather(*[evaluate_one(candidate) for candidate in candidates])
+    finally:
+        # Keep finished evaluations when the task is cancelled halfway
+        save_pending()
+        await report_progress()
+
+    return {
+        "success": True,
+        "job_id": job_id,
+        **progress,
+        "results": [results[candidate.id] for candidate in candidates]
+    }
+# Sortable columns and heavy (deferrable) columns of candidate lists
+CANDIDATE_SORT_COLUMNS = {
+    "created_at": CandidateDB.created_at,
+    "name": CandidateDB.name
+}
+CANDIDATE_HEAVY_COLUMNS = {
+    "resume_text": CandidateDB.resume_text,
+    "motivational_letter": CandidateDB.motivational_letter,
+    "company_note": CandidateDB.company_note,
+    "motivation_reason": CandidateDB.motivation_reason,
+    "test_results": CandidateDB.test_results
+}
+
 @app.get("/candidates")
 async def get_candidates(
     job_id: Optional[str] = None,
     company_id: Optional[str] = None,
-    current_user: UserDB = Depends(get_current_user)
+    params: ListParams = Depends(list_params(CANDIDATE_SORT_COLUMNS)),
+    current_user: UserDB = Depends(get_current_user),
+    database: RequestDatabase = Depends(get_async_db)
 ):
     """Get all evaluated candidates with their evaluations, optionally filtered by job_id or company_id
     
     For company users: Only shows candidates submitted by recruiters (submitted_by_company_id is set)
     For recruiter users: Shows all candidates they submitted (submitted_by_company_id matches their company_id)
     For admin users: Shows all candidates
+    Supports limit/cursor pagination, sort (e.g. -created_at, name) and fields (e.g. id,name,email,job)
     """
-    try:
-        db = SessionLocal()
+    def load(db):
         
         # Get candidates with their evaluations and job info
         query = db.query(CandidateDB)
@@ -4864,14 +5648,14 @@ async def get_candidates(
                 if company_job_ids:
                     # Filter candidates assigned to this company's jobs
                     # Include candidates that:
-                    # 1. Are assigned to company's jobs (job_id or preferential_job_ids), AND
+                    # 1. Are assigned to company's jobs (job_id or preferential jobs), AND
                     # 2. Either have submitted_by_company_id set (recruiter-submitted) OR
                     #    have no submitted_by_company_id (legacy candidates for backward compatibility)
                     query = query.filter(
                         or_(
                             CandidateDB.job_id.in_(company_job_ids),
-                            # Also check preferential_job_ids
-                            or_(*[CandidateDB.preferential_job_ids.like(f"%{job_id}%") for job_id in company_job_ids])
+                            # Also check preferential jobs
+                            CandidateDB.id.in_(candidates_linked_to_jobs(company_job_ids))
                         )
                     )
                     # Allow both recruiter-submitted candidates and legacy candidates (no submitted_by_company_id)
@@ -4883,10 +5667,10 @@ async def get_candidates(
                     )
                 else:
                     # No jobs for this company, return empty
-                    db.close()
                     return {
                         "success": True,
-                        "candidates": []
+                        "candidates": [],
+                        "next_cursor": None
                     }
         
         # Legacy company_id filtering (for backward compatibility, but now handled by role-based filtering above)
@@ -4902,28 +5686,47 @@ async def get_candidates(
             )
         
         if job_id:
-            # Filter by job_id OR by preferential_job_ids containing the job_id
+            # Filter by job_id OR by preferential jobs containing the job_id
             query = query.filter(
                 or_(
                     CandidateDB.job_id == job_id,
-                    CandidateDB.preferential_job_ids.like(f"%{job_id}%")
+                    CandidateDB.id.in_(candidates_linked_to_jobs(job_id))
                 )
             )
-        candidates = query.all()
+
+        # One query for the page of candidates with their job and submitting company name; evaluations
+        # and conversation counts are loaded for the whole page in one more query each
+        query = query.outerjoin(
+            CompanyDB, CompanyDB.id == CandidateDB.submitted_by_company_id
+        ).add_columns(CompanyDB.name).options(*params.defer_unwanted(CANDIDATE_HEAVY_COLUMNS))
+        if params.wants("job"):
+            query = query.options(joinedload(CandidateDB.job))
+        include_evaluations = params.wants("evaluations") or params.wants("evaluation_count")
+        if include_evaluations:
+            query = query.options(selectinload(CandidateDB.evaluations))
+        rows, next_cursor = paginate(query, params, CANDIDATE_SORT_COLUMNS, CandidateDB.id)
+        
+        conversation_counts = {}
+        if rows and params.wants("conversation_count"):
+            conversation_counts = dict(db.query(
+                CandidateConversationDB.candidate_id, func.count(CandidateConversationDB.id)
+            ).filter(
+                CandidateConversationDB.candidate_id.in_([candidate.id for candidate, _ in rows])
+            ).group_by(CandidateConversationDB.candidate_id).all())
         
         result = []
-        for candidate in candidates:
-            # Get job info
-            job_info = None
-            if candidate.job_id:
-                job = db.query(JobPostingDB).filter(JobPostingDB.id == candidate.job_id).first()
-                if job:
-                    job_info = {
-                        "id": job.id,
-                        "title": job.title,
-                        "company": job.company,
-                        "location": job.location
-                    }
+        for candidate, submitted_by_company_name in rows:
+            conversation_count = conversation_counts.get(candidate.id, 0)
+            # Get job info
+            job_info = None
+            job = candidate.job if params.wants("job") else None
+            if job:
+                job_info = {
+                    "id": job.id,
+                    "title": job.title,
+                    "company": job.company,
+                    "location": job.location
+                }
             
             # Parse JSON fields
             skill_tags = None
@@ -4947,31 +5750,28 @@ async def get_candidates(
                 except:
                     certifications = candidate.certifications
             
-            # Get evaluations
-            evaluations = db.query(EvaluationDB).filter(EvaluationDB.candidate_id == candidate.id).all()
-            conversation_count = db.query(CandidateConversationDB).filter(CandidateConversationDB.candidate_id == candidate.id).count()
-            
-            # Get company name if submitted by recruiter
-            submitted_by_company_name = None
-            if candidate.submitted_by_company_id:
-                recruiter_company = db.query(CompanyDB).filter(CompanyDB.id == candidate.submitted_by_company_id).first()
-                if recruiter_company:
-                    submitted_by_company_name = recruiter_company.name
+            evaluations = candidate.evaluations if include_evaluations else []
+            # Deferred columns are only read when requested (reading them would load them one by one)
+            heavy = {
+                field: getattr(candidate, field)
+                for field in CANDIDATE_HEAVY_COLUMNS if params.wants(field)
+            }
+            resume_text = heavy.get("resume_text")
             
-            result.append({
+            result.append(params.project({
                 "id": candidate.id,
                 "name": candidate.name,
                 "email": candidate.email,
                 "experience_years": candidate.experience_years,
                 "skills": candidate.skills,
                 "education": candidate.education,
-                "motivational_letter": candidate.motivational_letter,  # Include motivation letter
-                "resume_text": candidate.resume_text[:200] + "..." if candidate.resume_text and len(candidate.resume_text) > 200 else candidate.resume_text,  # Preview
+                "motivational_letter": heavy.get("motivational_letter"),  # Include motivation letter
+                "resume_text": resume_text[:200] + "..." if resume_text and len(resume_text) > 200 else resume_text,  # Preview
                 "created_at": candidate.created_at.isoformat() if candidate.created_at else None,
                 "job": job_info,
                 "job_id": candidate.job_id,
                 "preferential_job_ids": candidate.preferential_job_ids,  # Include preferential job IDs
-                "company_note": candidate.company_note,  # Include company note from supplying company
+                "company_note": heavy.get("company_note"),  # Include company note from supplying company
                 "submitted_by_company_id": candidate.submitted_by_company_id,  # Include recruiter company ID
                 "submitted_by_company_name": submitted_by_company_name,  # Include recruiter company name
                 "evaluations": [
@@ -4986,8 +5786,8 @@ async def get_candidates(
                 "evaluation_count": len(evaluations),
                 "conversation_count": conversation_count,
                 # Extended fields
-                "motivation_reason": candidate.motivation_reason,
-                "test_results": candidate.test_results,
+                "motivation_reason": heavy.get("motivation_reason"),
+                "test_results": heavy.get("test_results"),
                 "age": candidate.age,
                 "years_experience": candidate.years_experience,
                 "skill_tags": skill_tags,
@@ -5002,24 +5802,24 @@ async def get_candidates(
                 "source": candidate.source,
                 "pipeline_stage": candidate.pipeline_stage,
                 "pipeline_status": candidate.pipeline_status,
-            })
-        
-        db.close()
+            }))
         
         return {
             "success": True,
-            "candidates": result
+            "candidates": result,
+            "next_cursor": next_cursor
         }
-        
+    
+    try:
+        return await database.run_sync(load)
     except Exception as e:
         print(f"Error getting candidates: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to get candidates: {str(e)}")
 
 @app.get("/candidate-conversations")
-async def get_candidate_conversations(candidate_id: str = Query(...), job_id: Optional[str] = Query(None)):
+async def get_candidate_conversations(candidate_id: str = Query(...), job_id: Optional[str] = Query(None), db: Session = Depends(get_db)):
     """Fetch stored candidate conversations"""
     try:
-        db = SessionLocal()
         query = db.query(CandidateConversationDB).filter(CandidateConversationDB.candidate_id == candidate_id)
         if job_id:
             query = query.filter(
@@ -5045,11 +5845,11 @@ async def create_scheduled_appointment(
     location: Optional[str] = Form(None),
     notes: Optional[str] = Form(None),
     conversation_id: Optional[str] = Form(None),
-    current_user: UserDB = Depends(get_current_user)
+    current_user: UserDB = Depends(get_current_user),
+    db: Session = Depends(get_db)
 ):
     """Create a scheduled appointment for a candidate"""
     try:
-        db = SessionLocal()
         
         # Verify candidate and job exist
         candidate = db.query(CandidateDB).filter(CandidateDB.id == candidate_id).first()
@@ -5137,11 +5937,11 @@ async def create_scheduled_appointment(
 async def get_scheduled_appointments(
     candidate_id: Optional[str] = None,
     job_id: Optional[str] = None,
-    current_user: UserDB = Depends(get_current_user)
+    current_user: UserDB = Depends(get_current_user),
+    db: Session = Depends(get_db)
 ):
     """Get scheduled appointments, optionally filtered by candidate or job"""
     try:
-        db = SessionLocal()
         
         query = db.query(ScheduledAppointmentDB)
         
@@ -5185,11 +5985,10 @@ async def get_scheduled_appointments(
         raise HTTPException(status_code=500, detail=f"Failed to get appointments: {str(e)}")
 
 @app.post("/candidate-conversations")
-async def create_candidate_conversation(request_data: CandidateConversationRequest):
+async def create_candidate_conversation(request_data: CandidateConversationRequest, db: Session = Depends(get_db)):
     """Store a new candidate conversation and optional persona guidance"""
     try:
         import json
-        db = SessionLocal()
         candidate = db.query(CandidateDB).filter(CandidateDB.id == request_data.candidate_id).first()
         if not candidate:
             db.close()
@@ -5262,11 +6061,11 @@ async def create_candidate_conversation(request_data: CandidateConversationReque
 async def update_candidate(
     candidate_id: str,
     request: Request,
-    current_user: UserDB = Depends(get_current_user)
+    current_user: UserDB = Depends(get_current_user),
+    db: Session = Depends(get_db)
 ):
     """Update candidate details (company note, etc.)"""
     try:
-        db = SessionLocal()
         candidate = db.query(CandidateDB).filter(CandidateDB.id == candidate_id).first()
         if not candidate:
             db.close()
@@ -5387,10 +6186,9 @@ async def update_candidate(
         raise HTTPException(status_code=500, detail=f"Failed to update candidate: {str(e)}")
 
 @app.get("/candidates/{candidate_id}")
-async def get_candidate_detail(candidate_id: str):
+async def get_candidate_detail(candidate_id: str, db: Session = Depends(get_db)):
     """Detailed candidate view including full resume and conversations"""
     try:
-        db = SessionLocal()
         candidate = db.query(CandidateDB).filter(CandidateDB.id == candidate_id).first()
         if not candidate:
             db.close()
@@ -5478,11 +6276,11 @@ async def get_candidate_detail(candidate_id: str):
 async def update_candidate_pipeline(
     candidate_id: str,
     request: Request,
-    current_user: UserDB = Depends(get_current_user)
+    current_user: UserDB = Depends(get_current_user),
+    db: Session = Depends(get_db)
 ):
     """Update candidate pipeline stage, status, and job assignments - supports both JSON and Form data"""
     try:
-        db = SessionLocal()
         candidate = db.query(CandidateDB).filter(CandidateDB.id == candidate_id).first()
         if not candidate:
             db.close()
@@ -5527,13 +6325,15 @@ async def update_candidate_pipeline(
         # Update preferential_job_ids if provided
         if "preferential_job_ids" in data and data["preferential_job_ids"] is not None:
             # Verify all jobs exist
-            pref_job_ids = [jid.strip() for jid in str(data["preferential_job_ids"]).split(",") if jid.strip()]
+            pref_job_ids = parse_job_ids(data["preferential_job_ids"])
+            found_job_ids = {
+                row[0] for row in db.query(JobPostingDB.id).filter(JobPostingDB.id.in_(pref_job_ids))
+            } if pref_job_ids else set()
             for job_id in pref_job_ids:
-                job = db.query(JobPostingDB).filter(JobPostingDB.id == job_id).first()
-                if not job:
+                if job_id not in found_job_ids:
                     db.close()
                     raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
-            candidate.preferential_job_ids = data["preferential_job_ids"]
+            set_preferential_job_ids(db, candidate, pref_job_ids, existing_job_ids=found_job_ids)
         
         # Validate and update pipeline_stage
         valid_stages = ['introduced', 'review', 'first_interview', 'second_interview', 'offer', 'complete']
@@ -5610,11 +6410,11 @@ async def update_candidate_pipeline(
 @app.post("/candidates/{candidate_id}/actions/advance")
 async def advance_candidate_for_interview(
     candidate_id: str,
-    job_id: Optional[str] = Form(None)
+    job_id: Optional[str] = Form(None),
+    db: Session = Depends(get_db)
 ):
     """Advance candidate to first_interview stage after AI analysis"""
     try:
-        db = SessionLocal()
         candidate = db.query(CandidateDB).filter(CandidateDB.id == candidate_id).first()
         if not candidate:
             db.close()
@@ -5661,11 +6461,11 @@ async def advance_candidate_for_interview(
 async def reject_candidate(
     candidate_id: str,
     request: Request,
-    reason: Optional[str] = None
+    reason: Optional[str] = None,
+    db: Session = Depends(get_db)
 ):
     """Reject candidate and remove from active pipeline"""
     try:
-        db = SessionLocal()
         
         # Get current user for notification
         current_user = None
@@ -5752,33 +6552,130 @@ async def debate_candidate(
     job_id: Optional[str] = Form(None),  # Allow job_id to be passed from frontend
     company_note: Optional[str] = Form(None),
     company_note_file: Optional[UploadFile] = File(None),
+    debate_session_id: Optional[str] = Form(None),  # Resume this debate session from its checkpoints
     request: Request = None
 ):
     """Multi-expert debate between selected personas"""
-    db = None
+    persona_prompts = await read_persona_prompts(request)
+    company_note_text = await read_company_note(company_note, company_note_file)
+    return await run_candidate_debate(candidate_id, persona_prompts, job_id=job_id, company_note=company_note_text,
+                                      debate_session_id=debate_session_id)
+
+@app.post("/debate-candidate/stream")
+async def debate_candidate_stream(
+    candidate_id: str = Form(...),
+    job_id: Optional[str] = Form(None),
+    company_note: Optional[str] = Form(None),
+    company_note_file: Optional[UploadFile] = File(None),
+    stream_tokens: Optional[bool] = Form(False),  # Also send 'token' events with content deltas
+    debate_session_id: Optional[str] = Form(None),  # Resume this debate session from its checkpoints
+    request: Request = None
+):
+    """Streaming /debate-candidate (server-sent events).
+
+    Events: 'session' with the debate_session_id, 'step_start', 'message' per moderator/persona
+    message as soon as it is produced (plus 'token'/'token_reset' with stream_tokens),
+    'step_complete', and finally 'result' with the same body as /debate-candidate including
+    result_id ('error' on failure).
+    """
+    persona_prompts = await read_persona_prompts(request)
+    company_note_text = await read_company_note(company_note, company_note_file)
+    # Validate before streaming so bad requests still get a proper status code
+    inputs = load_debate_inputs(candidate_id, persona_prompts, job_id, company_note_text)
+    try:
+        import langchain_debate  # noqa: F401
+    except ImportError:
+        # No streaming engine: run the single-prompt debate and send it as one result
+        async def single_result():
+            yield "result", await run_candidate_debate(candidate_id, persona_prompts, job_id=job_id, company_note=company_note_text)
+        return sse_response(single_result())
+    checkpoints = open_debate_checkpoints(inputs, persona_prompts, debate_session_id)
+    return sse_response(stream_candidate_debate(inputs, persona_prompts, stream_tokens=bool(stream_tokens),
+                                                checkpoints=checkpoints))
+
+@app.get("/workflow-progress/{session_id}")
+async def get_workflow_progress(session_id: str):
+    """Progress of a running debate (session_id = debate_session_id); works from any worker"""
+    progress = await asyncio.to_thread(get_progress, session_id)
+    if progress is None:
+        raise HTTPException(status_code=404, detail="No progress for this session (unknown or expired)")
+    return {"success": True, "progress": progress}
+
+@app.get("/workflow-progress/{session_id}/stream")
+async def stream_workflow_progress(session_id: str):
+    """Server-sent 'progress' events whenever the session's progress changes, until it completes or fails"""
+    if await asyncio.to_thread(get_progress, session_id) is None:
+        raise HTTPException(status_code=404, detail="No progress for this session (unknown or expired)")
+    
+    async def progress_events():
+        async for progress in subscribe_progress(session_id):
+            yield "progress", progress
+    return sse_response(progress_events())
+
+@app.get("/debate-sessions/{session_id}")
+async def get_debate_session(session_id: str, include_payload: bool = False):
+    """Status of a checkpointed debate and its completed/failed steps"""
+    session = debate_checkpoint_store.get_session(session_id, include_payload=include_payload)
+    if not session:
+        raise HTTPException(status_code=404, detail="Debate session not found")
+    session.pop("persona_prompts", None)
+    return {"success": True, "session": session}
+
+async def resume_debate_session(session: Dict[str, Any], allow_completed: bool = False) -> Dict[str, Any]:
+    return await run_candidate_debate(
+        session["candidate_id"],
+        session["persona_prompts"],
+        job_id=session["job_id"],
+        company_note=session["company_note"],
+        debate_session_id=session["id"],
+        allow_completed=allow_completed
+    )
+
+@app.post("/debate-sessions/{session_id}/resume")
+async def resume_debate(session_id: str):
+    """Continue a failed or interrupted debate from its last checkpoint (same body as /debate-candidate)"""
+    session = debate_checkpoint_store.get_session(session_id)
+    if not session:
+        raise HTTPException(status_code=404, detail="Debate session not found")
+    if session["status"] == "completed":
+        raise HTTPException(status_code=409, detail=f"Debate session already completed (result_id {session['result_id']})")
+    return await resume_debate_session(session)
+
+@app.post("/debate-sessions/{session_id}/steps/{step}/rerun")
+async def rerun_debate_step(session_id: str, step: str):
+    """Run one step again (e.g. 'personas_round3') and continue from there; later steps are redone too"""
+    session = debate_checkpoint_store.get_session(session_id)
+    if not session:
+        raise HTTPException(status_code=404, detail="Debate session not found")
+    if not debate_checkpoint_store.discard_from(session_id, step):
+        raise HTTPException(status_code=404, detail=f"No checkpoint for step '{step}' in this debate session")
+    return await resume_debate_session(session, allow_completed=True)
+
+async def read_company_note(company_note: Optional[str], company_note_file: Optional[UploadFile]) -> Optional[str]:
+    """Use the uploaded company note file if present, otherwise the text field"""
+    if company_note_file and company_note_file.filename:
+        try:
+            company_note_result = await extract_text_from_upload_async(company_note_file)
+            return company_note_result["text"]
+        except Exception as e:
+            print(f"Error processing company note file in debate: {str(e)}")
+    return company_note  # Fallback to text input
+
+def load_debate_inputs(
+    candidate_id: str,
+    persona_prompts: Dict[str, str],
+    job_id: Optional[str] = None,
+    company_note: Optional[str] = None
+) -> Dict[str, Any]:
+    """Validate a debate request and build the (token-budgeted) debate context; raises HTTPException"""
+    if not persona_prompts:
+        raise HTTPException(status_code=400, detail="No persona prompts provided")
+    
+    db = SessionLocal()
     try:
-        print(f"\n=== DEBATE REQUEST START ===")
-        print(f"candidate_id: {candidate_id}")
-        print(f"job_id: {job_id}")
-        print(f"company_note: {'present' if company_note else 'none'}")
-        # Get form data to extract dynamic persona prompts
-        form_data = await request.form()
-        
-        # Extract persona prompts dynamically
-        persona_prompts = {}
-        for key, value in form_data.items():
-            if key.endswith('_prompt'):
-                persona_name = key.replace('_prompt', '')
-                persona_prompts[persona_name] = value
-        
-        if not persona_prompts:
-            raise HTTPException(status_code=400, detail="No persona prompts provided")
-        
-        db = SessionLocal()
         candidate = db.query(CandidateDB).filter(CandidateDB.id == candidate_id).first()
         
         if not candidate:
-            db.close()
             raise HTTPException(status_code=404, detail="Candidate not found")
         
         # Determine which job_id to use: passed parameter, candidate.job_id, or first preferential job
@@ -5794,23 +6691,25 @@ async def debate_candidate(
                 debate_job_id = preferential_list[0]
         
         if not debate_job_id:
-            db.close()
             raise HTTPException(status_code=400, detail="Debate requires a job posting. Please select a job before running debate.")
         
-        # Get job information if available
-        job_info = ""
+        # Get job information if available (description/requirements are budgeted below)
+        job = None
         if debate_job_id:
             job = db.query(JobPostingDB).filter(JobPostingDB.id == debate_job_id).first()
-            if job:
-                job_info = f"""
+        
+        def format_job_info(job_desc: str, job_req: str) -> str:
+            if not job:
+                return ""
+            return f"""
 
 JOB POSTING DETAILS:
 Title: {job.title}
 Company: {job.company}
 Location: {job.location}
 Salary Range: {job.salary_range}
-Description: {job.description}
-Requirements: {job.requirements}"""
+Description: {job_desc}
+Requirements: {job_req}"""
         
         # Create dynamic debate prompt
         persona_descriptions = []
@@ -5828,14 +6727,6 @@ The personas and their roles are:
 
 Each persona should evaluate the candidate from their perspective and then engage in a professional debate about the hiring decision."""
         
-        # Include motivational letter if available
-        motivational_info = ""
-        if candidate.motivational_letter:
-            motivational_info = f"""
-
-MOTIVATIONAL LETTER:
-{candidate.motivational_letter}"""
-        
         # Build extended candidate information section for debate (candidate-5: ensure digital employees assess all new fields)
         # Re-use same logic as in evaluate-candidate
         debate_extended_info_sections = []
@@ -5912,30 +6803,43 @@ MOTIVATIONAL LETTER:
             debate_extended_info_sections.append(f"Bron / Hoe gevonden: {candidate.source}")
         
         # Combine extended info for debate
+        extended_info_text = "\n".join(debate_extended_info_sections)
+        
+        # Include company note if provided (guidance only, not ground truth)
+        company_note_text = company_note
+        
+        # Every debate turn repeats this context, so budget it once and leave room for the conversation
+        budgeted_sections = fit_prompt_sections({
+            "resume": candidate.resume_text,
+            "company_note": company_note_text,
+            "job_description": job.description if job else "",
+            "job_requirements": job.requirements if job else "",
+            "motivation": candidate.motivational_letter,
+            "candidate_details": extended_info_text
+        }, format_job_info("", ""), OPENAI_MODEL_DEBATE, OPENAI_MAX_TOKENS_DEBATE,
+            reserve_tokens=DEBATE_HISTORY_RESERVE_TOKENS)
+        job_info = format_job_info(budgeted_sections["job_description"], budgeted_sections["job_requirements"])
+        company_note_text = budgeted_sections["company_note"]
+        
+        # Include motivational letter if available
+        motivational_info = ""
+        if budgeted_sections["motivation"]:
+            motivational_info = f"""
+
+MOTIVATIONAL LETTER:
+{budgeted_sections['motivation']}"""
+        
         debate_extended_candidate_info = ""
-        if debate_extended_info_sections:
-            extended_info_text = "\n".join(debate_extended_info_sections)
+        if budgeted_sections["candidate_details"]:
             debate_extended_candidate_info = f"""
 
 BELANGRIJK - STRUCTUREDE KANDIDAATINFORMATIE:
 Deze gestructureerde informatie is expliciet opgeslagen voor deze kandidaat. Gebruik deze informatie actief in je discussie, vooral als deze relevanter of actueler is dan informatie uit het CV.
 
-{truncate_text_safely(extended_info_text, 2000)}"""
-        
-        # Include company note if provided (guidance only, not ground truth)
-        company_note_text = company_note
-        if company_note_file and company_note_file.filename:
-            try:
-                company_note_content = await company_note_file.read()
-                company_note_result = extract_text_from_file(company_note_content, company_note_file.filename)
-                company_note_text = company_note_result["text"]
-            except Exception as e:
-                print(f"Error processing company note file in debate: {str(e)}")
-                company_note_text = company_note  # Fallback to text input
+{budgeted_sections['candidate_details']}"""
         
         company_note_info = ""
         if company_note_text:
-            company_note_text = truncate_text_safely(company_note_text, MAX_COMPANY_NOTE_CHARS)
             company_note_info = f"""
 
 BEDRIJFSNOTITIE (Belangrijke informatie over de kandidaat van de makelaar):
@@ -5943,295 +6847,365 @@ Deze bedrijfsnotitie bevat belangrijke informatie over de kandidaat van de makel
 Neem deze informatie serieus mee in je discussie en evaluatie.
 {company_note_text}"""
         
-        # Initialize variables before try block
-        response = None
-        timing_data = {}
-        full_prompt_text = ""
+        # For debate, we still include all candidate info in the base candidate_info
+        # But personas will focus on what's relevant to them based on their prompts and instructions
+        # This allows them to reference other aspects if needed in discussion, but focus on their domain
+        candidate_info_base = f"{budgeted_sections['resume']}{motivational_info}"
         
-        # Use LangChain multi-agent system for realistic debate
-        try:
-            # Try to import langchain_debate - this will fail if langchain_openai is not installed
-            from langchain_debate import run_multi_agent_debate
-            LANGCHAIN_AVAILABLE = True
-            
-            # For debate, we still include all candidate info in the base candidate_info
-            # But personas will focus on what's relevant to them based on their prompts and instructions
-            # This allows them to reference other aspects if needed in discussion, but focus on their domain
-            candidate_info_base = f"{candidate.resume_text}{motivational_info}"
-            
-            # Optionally add a note about structured fields being available but to focus on relevant ones
-            if debate_extended_candidate_info:
-                # Add a note that structured info is available but personas should focus on their domain
-                candidate_info_base += f"""
+        # Optionally add a note about structured fields being available but to focus on relevant ones
+        if debate_extended_candidate_info:
+            # Add a note that structured info is available but personas should focus on their domain
+            candidate_info_base += f"""
 
 BELANGRIJK - STRUCTUREDE KANDIDAATINFORMATIE (beschikbaar voor alle experts):
 Deze gestructureerde informatie is expliciet opgeslagen voor deze kandidaat. Focus in je discussie alleen op aspecten die relevant zijn voor jouw expertise.
 {debate_extended_candidate_info.replace('BELANGRIJK - STRUCTUREDE KANDIDAATINFORMATIE:', 'STRUCTUREDE INFORMATIE (focus op wat relevant is voor jouw rol):')}
 """
-            
-            candidate_info = candidate_info_base
-            
-            print(f"Calling run_multi_agent_debate with {len(persona_prompts)} personas...")
-            try:
-                debate_result = await run_multi_agent_debate(
-                persona_prompts=persona_prompts,
-                candidate_info=candidate_info,
-                job_info=job_info,
-                    company_note=company_note_text if company_note_text else None,
-                    track_timing=True
-                )
-            except Exception as debate_error:
-                print(f"Error in run_multi_agent_debate: {debate_error}")
-                traceback.print_exc()
-                raise HTTPException(
-                    status_code=500, 
-                    detail=f"Debate execution failed: {str(debate_error)}"
-                )
-            
-            # Handle tuple return (response, timing_data)
-            try:
-                if isinstance(debate_result, tuple) and len(debate_result) == 2:
-                    response, timing_data = debate_result
-                    print(f"✓ Extracted tuple: response type={type(response)}, timing_data keys={list(timing_data.keys()) if timing_data else []}")
-                elif isinstance(debate_result, tuple):
-                    # Handle unexpected tuple length
-                    response = debate_result[0] if len(debate_result) > 0 else ""
-                    if len(debate_result) > 1:
-                        timing_data = debate_result[1] if isinstance(debate_result[1], dict) else {}
-                    print(f"⚠ Unexpected tuple length: {len(debate_result)}, using first element")
-                else:
-                    response = debate_result
-                    timing_data = {}
-                    print(f"⚠ Debate result is not a tuple, type: {type(debate_result)}")
-                
-                # Ensure response is not None
-                if response is None:
-                    raise ValueError("Debate response is None")
-                
-                print(f"Debate response type: {type(response)}, length: {len(str(response)) if response else 0}")
-                
-                # Validate response is JSON string
-                if isinstance(response, str):
-                    try:
-                        import json
-                        parsed = json.loads(response)
-                        if isinstance(parsed, list):
-                            print(f"✓ Valid JSON array with {len(parsed)} messages")
-                        else:
-                            print(f"⚠ Response is JSON but not an array: {type(parsed)}")
-                    except json.JSONDecodeError:
-                        print(f"⚠ Response is not valid JSON string, first 200 chars: {str(response)[:200]}")
-                    except Exception as unpack_error:
-                        print(f"Error unpacking debate result: {unpack_error}")
-                        traceback.print_exc()
-                        raise HTTPException(status_code=500, detail=f"Failed to process debate result: {str(unpack_error)}")
-                
-                # Build full prompt for display
-                full_prompt_text = f"LANGCHAIN MULTI-AGENT DEBATE SYSTEM\n\nModerator + {len(persona_prompts)} Persona Agents\n\nPersonas: {', '.join(persona_prompts.keys())}\n\nDebate structured with:\n1. Moderator introduction\n2. Initial thoughts from each persona\n3. Multiple rounds of discussion\n4. Final summary from moderator"
-            except Exception as e:
-                print(f"Error processing debate result: {e}")
-                traceback.print_exc()
-                raise
-            
-        except ImportError as e:
-            print(f"ImportError: {e}")
-            traceback.print_exc()
-            # Fallback to simple OpenAI if LangChain not available
-            print("LangChain not available, falling back to simple debate...")
-            user_prompt = f"""Please facilitate a debate between the {len(persona_prompts)} personas about this candidate:
+        
+        candidate_info = candidate_info_base
+        
+        # Single-prompt debate, used when LangChain is not installed
+        user_prompt = f"""Please facilitate a debate between the {len(persona_prompts)} personas about this candidate:
 
 CANDIDATE CV:
-{candidate.resume_text}{motivational_info}{job_info}{company_note_info}
+{budgeted_sections['resume']}{motivational_info}{job_info}{company_note_info}
 
 Each persona should provide their evaluation and then engage in a professional discussion about the hiring decision."""
-            
-            openai_result = call_openai_safe([
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt}
-            ], max_tokens=OPENAI_MAX_TOKENS_DEBATE, temperature=OPENAI_TEMPERATURE_DEBATE, model=OPENAI_MODEL_DEBATE)
-            
-            if not openai_result["success"]:
-                db.close()
-                raise HTTPException(status_code=500, detail=f"AI debate failed: {openai_result['error']}")
-            
-            # Ensure response and timing_data are initialized
-            response = openai_result["result"].choices[0].message.content
-            full_prompt_text = f"SYSTEM PROMPT:\n{system_prompt}\n\nUSER PROMPT:\n{user_prompt}"
-            timing_data = {}  # Create empty timing data for fallback
-        
-        # Response is already unpacked above (if from LangChain), now format it
-        # Ensure response is initialized
-        if response is None:
-            db.close()
-            raise HTTPException(status_code=500, detail="Debate returned no response")
-        
-        debate_response = response
-        debate_timing_data = timing_data if timing_data else {}
-        
-        print(f"Processing debate_response: type={type(debate_response)}, timing_data steps={len(debate_timing_data.get('steps', []))}")
         
-        # Ensure debate_response is a string
-        if isinstance(debate_response, (dict, list)):
-            debate_response = json.dumps(debate_response, ensure_ascii=False)
-        elif not isinstance(debate_response, str):
-            debate_response = str(debate_response) if debate_response else ""
-        
-        if not debate_response:
-            db.close()
-            raise HTTPException(status_code=500, detail="Debate returned empty response")
-        
-        result_data = {
-            "debate": debate_response,
-            "full_prompt": full_prompt_text,
-            "tokens_used": 0,  # LangChain doesn't return token count in same format
-            "timing_data": debate_timing_data
+        return {
+            "candidate": candidate,
+            "job": job,
+            "job_id": debate_job_id,
+            "candidate_info": candidate_info,
+            "job_info": job_info,
+            "company_note": company_note_text if company_note_text else None,
+            "raw_company_note": company_note,
+            "fallback_system_prompt": system_prompt,
+            "fallback_user_prompt": user_prompt
         }
-        # Remove transcript key if it exists to avoid duplicate display
-        if "transcript" in result_data:
-            del result_data["transcript"]
-        
-        # Initialize result_id variable
-        result_id = None
+    finally:
+        db.close()
+
+
+def describe_langchain_debate(persona_prompts: Dict[str, str]) -> str:
+    """'full_prompt' shown for LangChain debates (the prompts are built per turn)"""
+    return f"LANGCHAIN MULTI-AGENT DEBATE SYSTEM\n\nModerator + {len(persona_prompts)} Persona Agents\n\nPersonas: {', '.join(persona_prompts.keys())}\n\nDebate structured with:\n1. Moderator introduction\n2. Initial thoughts from each persona\n3. Multiple rounds of discussion\n4. Final summary from moderator"
+
+
+def save_debate_result(inputs: Dict[str, Any], persona_prompts: Dict[str, str], result_data: Dict[str, Any]) -> Optional[str]:
+    """Archive older debates for the same candidate, job and persona set, store this one and notify job watchers"""
+    candidate = inputs["candidate"]
+    job = inputs["job"]
+    debate_job_id = inputs["job_id"]
+    db = SessionLocal()
+    try:
+        import json
+        # Sort persona IDs for consistent comparison
+        persona_ids_json = json.dumps(sorted(list(persona_prompts.keys())))
+        
+        db.query(EvaluationResultDB).filter(
+            EvaluationResultDB.candidate_id == candidate.id,
+            EvaluationResultDB.job_id == debate_job_id,
+            EvaluationResultDB.result_type == 'debate',
+            EvaluationResultDB.selected_personas == persona_ids_json,
+            EvaluationResultDB.is_archived == False
+        ).update({"is_archived": True, "updated_at": func.now()}, synchronize_session=False)
+        
+        result_id = str(uuid4())
+        db.add(EvaluationResultDB(
+            id=result_id,
+            candidate_id=candidate.id,
+            job_id=debate_job_id,
+            result_type='debate',
+            result_data=json.dumps(result_data),
+            selected_personas=persona_ids_json,
+            company_note=inputs["raw_company_note"],
+            is_archived=False
+        ))
         
-        # Save debate result to database
+        # Create notifications for job watchers
         try:
-            import json
-            result_json = json.dumps(result_data)
-            # Sort persona IDs for consistent comparison
-            persona_ids_json = json.dumps(sorted(list(persona_prompts.keys())))
-            
-            # Archive old debate results for the same candidate, job, and persona set
-            old_results = db.query(EvaluationResultDB).filter(
-                EvaluationResultDB.candidate_id == candidate_id,
-                EvaluationResultDB.job_id == debate_job_id,
-                EvaluationResultDB.result_type == 'debate',
-                EvaluationResultDB.selected_personas == persona_ids_json,
-                EvaluationResultDB.is_archived == False
-            ).all()
-            
-            # Archive all old results
-            for old_result in old_results:
-                old_result.is_archived = True
-                old_result.updated_at = func.now()
-            
-            # Check if there's an existing non-archived result
-            existing_result = db.query(EvaluationResultDB).filter(
-                EvaluationResultDB.candidate_id == candidate_id,
-                EvaluationResultDB.job_id == debate_job_id,
-                EvaluationResultDB.result_type == 'debate',
-                EvaluationResultDB.selected_personas == persona_ids_json,
-                EvaluationResultDB.is_archived == False
-            ).first()
-            
-            if existing_result:
-                # Update existing result
-                existing_result.result_data = result_json
-                existing_result.company_note = company_note
-                existing_result.updated_at = func.now()
-                existing_result.is_archived = False  # Ensure it's not archived
-                result_id = existing_result.id
-            else:
-                # Create new result
-                debate_result = EvaluationResultDB(
-                    candidate_id=candidate_id,
-                    job_id=debate_job_id,
-                    result_type='debate',
-                    result_data=result_json,
-                    selected_personas=persona_ids_json,
-                    company_note=company_note,
-                    is_archived=False
-                )
-                db.add(debate_result)
-            
-            db.commit()
-            if not result_id:
-                db.refresh(debate_result)
-                result_id = debate_result.id
-                
-                # Create notifications for job watchers
-                try:
-                    watchers = db.query(JobWatcherDB).filter(JobWatcherDB.job_id == debate_job_id).all()
-                    for watcher in watchers:
-                        notification = NotificationDB(
-                            user_id=watcher.user_id,
-                            type="debate_complete",
-                            title=f"Expert debat voltooid voor {candidate.name}",
-                            message=f"Expert debat is voltooid voor {candidate.name} bij {job.title if job else 'vacature'}",
-                            related_candidate_id=candidate_id,
-                            related_job_id=debate_job_id,
-                            related_result_id=result_id
-                        )
-                        db.add(notification)
-                    db.commit()
-                except Exception as notif_error:
-                    print(f"Error creating notifications: {str(notif_error)}")
-                    # Don't fail the whole request if notifications fail
-        except Exception as e:
-            print(f"Error saving debate result: {str(e)}")
-            traceback.print_exc()
-            # Continue even if saving fails
+            watchers = db.query(JobWatcherDB).filter(JobWatcherDB.job_id == debate_job_id).all()
+            for watcher in watchers:
+                db.add(NotificationDB(
+                    user_id=watcher.user_id,
+                    type="debate_complete",
+                    title=f"Expert debat voltooid voor {candidate.name}",
+                    message=f"Expert debat is voltooid voor {candidate.name} bij {job.title if job else 'vacature'}",
+                    related_candidate_id=candidate.id,
+                    related_job_id=debate_job_id,
+                    related_result_id=result_id
+                ))
+        except Exception as notif_error:
+            print(f"Error creating notifications: {str(notif_error)}")
+            # Don't fail the whole request if notifications fail
         
+        db.commit()
+        return result_id
+    except Exception as e:
+        print(f"Error saving debate result: {str(e)}")
+        traceback.print_exc()
+        # Continue even if saving fails
+        return None
+    finally:
         db.close()
+
+
+def normalize_debate_timing_data(debate_timing_data: Dict[str, Any]) -> Dict[str, Any]:
+    """Make timing data JSON-safe for the response (timestamps and durations as floats)"""
+    try:
+        # Convert timing_data to ensure it's JSON-serializable
+        if debate_timing_data and isinstance(debate_timing_data, dict):
+            # Convert timestamps to numbers if needed
+            processed_timing = {
+                'start_time': float(debate_timing_data.get('start_time', 0)) if isinstance(debate_timing_data.get('start_time'), (int, float)) else 0,
+                'end_time': float(debate_timing_data.get('end_time', 0)) if isinstance(debate_timing_data.get('end_time'), (int, float)) else 0,
+                'total': float(debate_timing_data.get('total', 0)) if isinstance(debate_timing_data.get('total'), (int, float)) else 0,
+                'steps': []
+            }
+            # Process steps array
+            if 'steps' in debate_timing_data and isinstance(debate_timing_data['steps'], list):
+                for step in debate_timing_data['steps']:
+                    if isinstance(step, dict):
+                        processed_step = {}
+                        for key, value in step.items():
+                            # Convert timestamp to float if it's a number
+                            if key == 'timestamp':
+                                processed_step[key] = float(value) if isinstance(value, (int, float)) else value
+                            elif key == 'duration':
+                                processed_step[key] = float(value) if isinstance(value, (int, float)) else value
+                            # Keep other fields as-is (strings, lists, etc.)
+                            else:
+                                processed_step[key] = value
+                        processed_timing['steps'].append(processed_step)
+                    else:
+                        processed_timing['steps'].append(step)
+            # Debate planner outcome (which rounds ran and why it stopped) and context size
+            for key in ('rounds', 'planner', 'context', 'restored_steps'):
+                if key in debate_timing_data:
+                    processed_timing[key] = debate_timing_data[key]
+            debate_timing_data = processed_timing
+    except Exception as timing_error:
+        print(f"Error processing timing data: {timing_error}")
+        traceback.print_exc()
+        debate_timing_data = {}
+    return debate_timing_data
+
+
+def finish_debate_result(inputs: Dict[str, Any], persona_prompts: Dict[str, str], response: Any,
+                         timing_data: Optional[Dict[str, Any]], full_prompt_text: str) -> Dict[str, Any]:
+    """Persist a finished debate and build the /debate-candidate response body"""
+    # Ensure response is initialized
+    if response is None:
+        raise HTTPException(status_code=500, detail="Debate returned no response")
+    
+    debate_response = response
+    debate_timing_data = timing_data if timing_data else {}
+    
+    print(f"Processing debate_response: type={type(debate_response)}, timing_data steps={len(debate_timing_data.get('steps', []))}")
+    
+    # Ensure debate_response is a string
+    if isinstance(debate_response, (dict, list)):
+        debate_response = json.dumps(debate_response, ensure_ascii=False)
+    elif not isinstance(debate_response, str):
+        debate_response = str(debate_response) if debate_response else ""
+    
+    if not debate_response:
+        raise HTTPException(status_code=500, detail="Debate returned empty response")
+    
+    result_data = {
+        "debate": debate_response,
+        "full_prompt": full_prompt_text,
+        "tokens_used": 0,  # LangChain doesn't return token count in same format
+        "timing_data": debate_timing_data
+    }
+    result_id = save_debate_result(inputs, persona_prompts, result_data)
+    
+    debate_timing_data = normalize_debate_timing_data(debate_timing_data)
+    print(f"Final return: debate length={len(debate_response)}, timing_data steps={len(debate_timing_data.get('steps', []))}")
+    
+    return {
+        "success": True,
+        "debate": debate_response,
+        "tokens_used": 0,  # LangChain doesn't return token count in same format
+        "full_prompt": full_prompt_text,
+        "timing_data": debate_timing_data,  # Include timing data for workflow visualization
+        "result_id": result_id  # Include result_id so frontend can navigate directly
+    }
+
+
+def open_debate_checkpoints(inputs: Dict[str, Any], persona_prompts: Dict[str, str],
+                            debate_session_id: Optional[str] = None, allow_completed: bool = False):
+    """Open the debate session to checkpoint into (resuming debate_session_id if it exists); None if disabled
+
+    A resumed session must have the same inputs as the request, so its checkpoints are not mixed with
+    another debate; a completed session is only reopened to rerun a step (allow_completed).
+    """
+    if not DEBATE_CHECKPOINTS_ENABLED:
+        return None
+    if debate_session_id:
+        session = debate_checkpoint_store.get_session(debate_session_id)
+        if session:
+            if session["candidate_id"] != inputs["candidate"].id:
+                raise HTTPException(status_code=400, detail="Debate session belongs to another candidate")
+            if session["status"] == "completed" and not allow_completed:
+                raise HTTPException(status_code=409, detail=f"Debate session already completed (result_id {session['result_id']})")
+            if (session["job_id"] != inputs["job_id"]
+                    or session["persona_prompts"] != persona_prompts
+                    or (session["company_note"] or None) != (inputs["raw_company_note"] or None)):
+                raise HTTPException(
+                    status_code=409,
+                    detail="Debate session was started with other personas, job or company note; "
+                           f"resume it with POST /debate-sessions/{debate_session_id}/resume"
+                )
+            return debate_checkpoint_store.open(debate_session_id)
+    session_id = debate_checkpoint_store.create(
+        inputs["candidate"].id, inputs["job_id"], persona_prompts, inputs["raw_company_note"], session_id=debate_session_id
+    )
+    return debate_checkpoint_store.open(session_id)
+
+
+class DebateProgressReporter:
+    """Debate event callback that records finished steps in workflow_progress under session_id
+
+    The progress store is a blocking SQLite read-modify-write, so every write runs in a thread;
+    writes are chained so they land in event order and finish() waits for all of them.
+    """
+
+    def __init__(self, session_id: str):
+        self.session_id = session_id
+        self.step_agents: Dict[str, str] = {}
+        self._last_write: Optional[asyncio.Future] = None
+        self._write(create_progress_session, session_id)
+
+    def _write(self, func, *args):
+        previous = self._last_write
+
+        async def write():
+            if previous is not None:
+                await asyncio.gather(previous, return_exceptions=True)
+            try:
+                await asyncio.to_thread(func, *args)
+            except Exception as e:
+                print(f"Could not record debate progress for {self.session_id}: {e}")
+        self._last_write = asyncio.ensure_future(write())
+
+    def __call__(self, event: str, data: Dict[str, Any]):
+        if event == 'step_start':
+            self.step_agents[data['step']] = ', '.join(data.get('agents', []))
+        elif event == 'step_complete':
+            step = data['step']
+            agent = self.step_agents.get(step, 'Moderator')
+            restored = ' (checkpoint)' if data.get('restored') else ''
+            self._write(update_progress, self.session_id, step, agent, data.get('duration', 0),
+                        f"{agent}: {step} voltooid{restored}")
+
+    async def complete(self, total_duration: float):
+        self._write(complete_progress, self.session_id, total_duration)
+        await self._last_write
+
+    async def fail(self, error: str):
+        self._write(fail_progress, self.session_id, error)
+        await self._last_write
+
+
+def resume_hint(session_id: str) -> str:
+    return f"debate_session_id={session_id}; resume with POST /debate-sessions/{session_id}/resume"
+
+
+async def run_candidate_debate(
+    candidate_id: str,
+    persona_prompts: Dict[str, str],
+    job_id: Optional[str] = None,
+    company_note: Optional[str] = None,
+    debate_session_id: Optional[str] = None,
+    allow_completed: bool = False
+) -> Dict[str, Any]:
+    """Run the multi-agent debate and store the EvaluationResultDB row (used by the endpoint and task workers)
+
+    Completed steps are checkpointed under a debate session. Passing the debate_session_id of a
+    failed or interrupted debate resumes it from its last checkpoint; allow_completed also reopens
+    a completed one (step reruns).
+    """
+    try:
+        print(f"\n=== DEBATE REQUEST START ===")
+        print(f"candidate_id: {candidate_id}")
+        print(f"job_id: {job_id}")
+        print(f"company_note: {'present' if company_note else 'none'}")
         
-        # Ensure debate_response is properly formatted (already formatted above, but double-check)
-        final_debate_response = debate_response
-        if isinstance(final_debate_response, (dict, list)):
-            final_debate_response = json.dumps(final_debate_response, ensure_ascii=False)
-        elif not isinstance(final_debate_response, str):
-            final_debate_response = str(final_debate_response) if final_debate_response else ""
+        inputs = load_debate_inputs(candidate_id, persona_prompts, job_id, company_note)
+        checkpoints = None
+        progress_session_id = None
         
-        # Ensure timing_data is serializable
+        # Use LangChain multi-agent system for realistic debate
         try:
-            # Convert timing_data to ensure it's JSON-serializable
-            if debate_timing_data and isinstance(debate_timing_data, dict):
-                # Convert timestamps to numbers if needed
-                processed_timing = {
-                    'start_time': float(debate_timing_data.get('start_time', 0)) if isinstance(debate_timing_data.get('start_time'), (int, float)) else 0,
-                    'end_time': float(debate_timing_data.get('end_time', 0)) if isinstance(debate_timing_data.get('end_time'), (int, float)) else 0,
-                    'total': float(debate_timing_data.get('total', 0)) if isinstance(debate_timing_data.get('total'), (int, float)) else 0,
-                    'steps': []
-                }
-                # Process steps array
-                if 'steps' in debate_timing_data and isinstance(debate_timing_data['steps'], list):
-                    for step in debate_timing_data['steps']:
-                        if isinstance(step, dict):
-                            processed_step = {}
-                            for key, value in step.items():
-                                # Convert timestamp to float if it's a number
-                                if key == 'timestamp':
-                                    processed_step[key] = float(value) if isinstance(value, (int, float)) else value
-                                elif key == 'duration':
-                                    processed_step[key] = float(value) if isinstance(value, (int, float)) else value
-                                # Keep other fields as-is (strings, lists, etc.)
-                                else:
-                                    processed_step[key] = value
-                            processed_timing['steps'].append(processed_step)
-                        else:
-                            processed_timing['steps'].append(step)
-                debate_timing_data = processed_timing
-        except Exception as timing_error:
-            print(f"Error processing timing data: {timing_error}")
+            # Try to import langchain_debate - this will fail if langchain_openai is not installed
+            from langchain_debate import run_multi_agent_debate
+            
+            checkpoints = open_debate_checkpoints(inputs, persona_prompts, debate_session_id, allow_completed)
+            # Progress is visible to every worker under the debate session id. Without checkpoints a
+            # client-supplied debate_session_id is used as-is, so the client can poll it while the debate runs;
+            # otherwise a fresh id is returned in the result (or the error) as progress_session_id
+            progress_session_id = checkpoints.session_id if checkpoints else (debate_session_id or str(uuid4()))
+            progress_reporter = DebateProgressReporter(progress_session_id)
+            print(f"Calling run_multi_agent_debate with {len(persona_prompts)} personas...")
+            try:
+                response, timing_data = await run_multi_agent_debate(
+                    persona_prompts=persona_prompts,
+                    candidate_info=inputs["candidate_info"],
+                    job_info=inputs["job_info"],
+                    company_note=inputs["company_note"],
+                    track_timing=True,
+                    checkpoints=checkpoints,
+                    on_event=progress_reporter
+                )
+                await progress_reporter.complete(timing_data.get('total', 0))
+            except Exception as debate_error:
+                print(f"Error in run_multi_agent_debate: {debate_error}")
+                traceback.print_exc()
+                await progress_reporter.fail(str(debate_error))
+                detail = f"Debate execution failed: {str(debate_error)}"
+                if checkpoints:
+                    debate_checkpoint_store.mark_failed(checkpoints.session_id, str(debate_error))
+                    detail += f" ({resume_hint(checkpoints.session_id)})"
+                else:
+                    detail += f" (progress_session_id={progress_session_id})"
+                raise HTTPException(
+                    status_code=500, 
+                    detail=detail
+                )
+            full_prompt_text = describe_langchain_debate(persona_prompts)
+            
+        except ImportError as e:
+            print(f"ImportError: {e}")
             traceback.print_exc()
-            debate_timing_data = {}
-        
-        print(f"Final return: debate length={len(final_debate_response)}, timing_data steps={len(debate_timing_data.get('steps', []))}")
+            # Fallback to simple OpenAI if LangChain not available
+            print("LangChain not available, falling back to simple debate...")
+            system_prompt = inputs["fallback_system_prompt"]
+            user_prompt = inputs["fallback_user_prompt"]
+            
+            openai_result = await call_openai_safe_async([
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_prompt}
+            ], max_tokens=OPENAI_MAX_TOKENS_DEBATE, temperature=OPENAI_TEMPERATURE_DEBATE, model=OPENAI_MODEL_DEBATE, cache_endpoint="debate")
+            
+            if not openai_result["success"]:
+                raise HTTPException(status_code=500, detail=f"AI debate failed: {openai_result['error']}")
+            
+            response = openai_result["result"].choices[0].message.content
+            full_prompt_text = f"SYSTEM PROMPT:\n{system_prompt}\n\nUSER PROMPT:\n{user_prompt}"
+            timing_data = {}  # Create empty timing data for fallback
         
-        return {
-            "success": True,
-            "debate": final_debate_response,
-            "tokens_used": 0,  # LangChain doesn't return token count in same format
-            "full_prompt": full_prompt_text,
-            "timing_data": debate_timing_data,  # Include timing data for workflow visualization
-            "result_id": result_id  # Include result_id so frontend can navigate directly
-        }
+        result = finish_debate_result(inputs, persona_prompts, response, timing_data, full_prompt_text)
+        if checkpoints:
+            debate_checkpoint_store.complete(checkpoints.session_id, result.get("result_id"))
+            result["debate_session_id"] = checkpoints.session_id
+        if progress_session_id:
+            result["progress_session_id"] = progress_session_id
+        return result
         
     except HTTPException:
         # Re-raise HTTPExceptions (they already have proper status codes)
-        if db:
-            try:
-                db.close()
-            except:
-                pass
         raise
     except Exception as e:
         error_msg = f"Error in debate endpoint: {str(e)}"
@@ -6267,13 +7241,6 @@ Each persona should provide their evaluation and then engage in a professional d
         except Exception as log_error:
             print(f"Failed to write error log: {log_error}")
         
-        # Ensure database is closed
-        if db:
-            try:
-                db.close()
-            except:
-                pass
-        
         # Create detailed error message
         error_detail = f"Debate failed: {str(e)}"
         # Try to get more context about the error
@@ -6284,6 +7251,39 @@ Each persona should provide their evaluation and then engage in a professional d
         
         raise HTTPException(status_code=500, detail=error_detail)
 
+
+
+async def stream_candidate_debate(inputs: Dict[str, Any], persona_prompts: Dict[str, str], stream_tokens: bool = False,
+                                  checkpoints=None):
+    """Yield (event, data) from the streaming debate engine, then 'result' with the saved debate"""
+    from langchain_debate import stream_multi_agent_debate
+    if checkpoints:
+        yield 'session', {'debate_session_id': checkpoints.session_id, 'restored_steps': checkpoints.restored_steps}
+    try:
+        async for event, data in stream_multi_agent_debate(
+            persona_prompts=persona_prompts,
+            candidate_info=inputs["candidate_info"],
+            job_info=inputs["job_info"],
+            company_note=inputs["company_note"],
+            track_timing=True,
+            stream_tokens=stream_tokens,
+            checkpoints=checkpoints
+        ):
+            if event == 'complete':
+                result = finish_debate_result(
+                    inputs, persona_prompts, data['debate'], data['timing_data'], describe_langchain_debate(persona_prompts)
+                )
+                if checkpoints:
+                    debate_checkpoint_store.complete(checkpoints.session_id, result.get("result_id"))
+                    result["debate_session_id"] = checkpoints.session_id
+                yield 'result', result
+            else:
+                yield event, data
+    except Exception as e:
+        if checkpoints:
+            debate_checkpoint_store.mark_failed(checkpoints.session_id, str(e))
+            raise HTTPException(status_code=500, detail=f"Debate execution failed: {str(e)} ({resume_hint(checkpoints.session_id)})")
+        raise
 @app.post("/debate-chat")
 async def debate_chat(request: DebateChatRequest):
     """Allow users to chat with personas after a debate has concluded"""
@@ -6370,14 +7370,15 @@ async def debate_chat(request: DebateChatRequest):
                 "Geef een concreet en bruikbaar antwoord. Verwijs naar inzichten uit het debat indien relevant."
             )
 
-            ai_response = call_openai_safe(
+            ai_response = await call_openai_safe_async(
                 [
                     {"role": "system", "content": system_prompt},
                     {"role": "user", "content": user_prompt}
                 ],
                 max_tokens=700,
                 temperature=0.4,
-                model=OPENAI_MODEL_DEBATE
+                model=OPENAI_MODEL_DEBATE,
+                cache_endpoint="debate"
             )
 
             if not ai_response["success"]:
@@ -6401,8 +7402,10 @@ async def debate_chat(request: DebateChatRequest):
 # Job Analysis endpoint
 # -----------------------------
 @app.post("/analyze-job")
-async def analyze_job(job_id: str = Form(...)):
+async def analyze_job(job_id: str = Form(...), bypass_cache: Optional[bool] = Form(False)):
     """AI analysis of job posting: correctness, research quality, role extension"""
+    # Own session instead of get_db: the task queue also calls this directly
+    db = None
     try:
         print(f"Received job analysis request. job_id: {repr(job_id)}, type: {type(job_id)}, length: {len(job_id) if job_id else 0}")
         
@@ -6567,10 +7570,11 @@ Regels:
         
         # Call OpenAI with web search capability
         print(f"Calling OpenAI for job analysis. Model: {OPENAI_MODEL_JOB_ANALYSIS}, Max tokens: {OPENAI_MAX_TOKENS_JOB_ANALYSIS}")
-        openai_result = call_openai_safe([
+        openai_result = await call_openai_safe_async([
             {"role": "system", "content": system_prompt},
             {"role": "user", "content": user_prompt}
-        ], max_tokens=OPENAI_MAX_TOKENS_JOB_ANALYSIS, temperature=OPENAI_TEMPERATURE_JOB_ANALYSIS, model=OPENAI_MODEL_JOB_ANALYSIS)
+        ], max_tokens=OPENAI_MAX_TOKENS_JOB_ANALYSIS, temperature=OPENAI_TEMPERATURE_JOB_ANALYSIS, model=OPENAI_MODEL_JOB_ANALYSIS,
+           cache_endpoint="job_analysis", use_cache=False if bypass_cache else None)
         
         if not openai_result["success"]:
             db.close()
@@ -6817,13 +7821,15 @@ Regels:
                 status_code=500,
                 detail=f"An unexpected error occurred while analyzing the job posting: {error_msg}. Please try again."
             )
+    finally:
+        if db is not None:
+            db.close()
 
 # -----------------------------
 # Job posting endpoints
 # -----------------------------
 @app.post("/job-postings")
-def create_job_posting(job: JobPosting):
-    db = SessionLocal()
+def create_job_posting(job: JobPosting, db: Session = Depends(get_db)):
     try:
         # Check for duplicate vacancy before creating
         existing_job = check_duplicate_vacancy(db, job.title, job.company, None)
@@ -6854,8 +7860,7 @@ def create_job_posting(job: JobPosting):
         raise HTTPException(status_code=500, detail=f"Failed to create job posting: {str(e)}")
 
 @app.get("/job-postings")
-def list_job_postings():
-    db = SessionLocal()
+def list_job_postings(db: Session = Depends(get_db)):
     jobs = db.query(JobPostingDB).all()
     result = [
         {
@@ -6873,8 +7878,7 @@ def list_job_postings():
     return result
 
 @app.get("/job-postings/{job_id}/overview")
-def job_overview(job_id: str):
-    db = SessionLocal()
+def job_overview(job_id: str, db: Session = Depends(get_db)):
     candidates = db.query(CandidateDB).filter(CandidateDB.job_id == job_id).all()
     overview = []
     for c in candidates:
@@ -6891,8 +7895,7 @@ def job_overview(job_id: str):
 
 
 @app.get("/debug-candidate/{candidate_id}")
-def debug_candidate(candidate_id: str):
-    db = SessionLocal()
+def debug_candidate(candidate_id: str, db: Session = Depends(get_db)):
     candidate = db.query(CandidateDB).filter(CandidateDB.id == candidate_id).first()
     db.close()
     
@@ -6910,16 +7913,26 @@ def debug_candidate(candidate_id: str):
 # -----------------------------
 # Result Storage and Retrieval endpoints
 # -----------------------------
+# Sortable columns of evaluation result lists
+EVALUATION_RESULT_SORT_COLUMNS = {
+    "created_at": EvaluationResultDB.created_at,
+    "result_type": EvaluationResultDB.result_type
+}
+
 @app.get("/evaluation-results")
 async def get_evaluation_results(
     candidate_id: Optional[str] = None,
     job_id: Optional[str] = None,
     result_type: Optional[str] = None,
-    company_id: Optional[str] = None
+    company_id: Optional[str] = None,
+    params: ListParams = Depends(list_params(EVALUATION_RESULT_SORT_COLUMNS)),
+    database: RequestDatabase = Depends(get_async_db)
 ):
-    """Get saved evaluation or debate results, optionally filtered by company_id"""
-    try:
-        db = SessionLocal()
+    """Get saved evaluation or debate results, optionally filtered by company_id
+    
+    Supports limit/cursor pagination, sort and fields; leave result_data out of fields to skip loading it.
+    """
+    def load(db):
         query = db.query(EvaluationResultDB)
         
         # Filter by company_id if provided (multi-portal isolation)
@@ -6951,56 +7964,56 @@ async def get_evaluation_results(
         # Only show non-archived results by default
         query = query.filter(EvaluationResultDB.is_archived == False)
         
-        results = query.order_by(EvaluationResultDB.created_at.desc()).all()
-        candidate_cache = {}
-        job_cache = {}
+        # Candidate name and job title come from joins; result_data is only loaded when requested
+        query = query.outerjoin(
+            CandidateDB, CandidateDB.id == EvaluationResultDB.candidate_id
+        ).outerjoin(
+            JobPostingDB, JobPostingDB.id == EvaluationResultDB.job_id
+        ).add_columns(CandidateDB.name, JobPostingDB.title)
+        if not params.wants("result_data"):
+            query = query.options(defer(EvaluationResultDB.result_data))
+        results, next_cursor = paginate(query, params, EVALUATION_RESULT_SORT_COLUMNS, EvaluationResultDB.id)
         
         import json
         result_list = []
-        for result in results:
+        for result, candidate_name, job_title in results:
             try:
-                result_data = json.loads(result.result_data)
+                result_data = json.loads(result.result_data) if params.wants("result_data") else None
                 persona_ids = json.loads(result.selected_personas) if result.selected_personas else []
                 
-                if result.candidate_id not in candidate_cache:
-                    candidate_obj = db.query(CandidateDB).filter(CandidateDB.id == result.candidate_id).first()
-                    candidate_cache[result.candidate_id] = candidate_obj.name if candidate_obj else None
-                if result.job_id not in job_cache:
-                    job_obj = db.query(JobPostingDB).filter(JobPostingDB.id == result.job_id).first()
-                    job_cache[result.job_id] = job_obj.title if job_obj else None
-                
-                result_list.append({
+                result_list.append(params.project({
                     "id": result.id,
                     "candidate_id": result.candidate_id,
-                    "candidate_name": candidate_cache.get(result.candidate_id),
+                    "candidate_name": candidate_name,
                     "job_id": result.job_id,
-                    "job_title": job_cache.get(result.job_id),
+                    "job_title": job_title,
                     "result_type": result.result_type,
                     "selected_personas": persona_ids,
                     "company_note": result.company_note,
                     "created_at": result.created_at.isoformat() if result.created_at else None,
                     "updated_at": result.updated_at.isoformat() if result.updated_at else None,
                     "result_data": result_data
-                })
+                }))
             except Exception as e:
                 print(f"Error parsing result {result.id}: {str(e)}")
                 continue
         
-        db.close()
-        
         return {
             "success": True,
-            "results": result_list
+            "results": result_list,
+            "next_cursor": next_cursor
         }
+    
+    try:
+        return await database.run_sync(load)
     except Exception as e:
         print(f"Error getting evaluation results: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to get evaluation results: {str(e)}")
 
 @app.get("/evaluation-results/{result_id}")
-async def get_evaluation_result(result_id: str):
+async def get_evaluation_result(result_id: str, db: Session = Depends(get_db)):
     """Get a specific evaluation or debate result by ID"""
     try:
-        db = SessionLocal()
         result = db.query(EvaluationResultDB).filter(EvaluationResultDB.id == result_id).first()
         
         if not result:
@@ -7032,11 +8045,10 @@ async def get_evaluation_result(result_id: str):
         raise HTTPException(status_code=500, detail=f"Failed to get evaluation result: {str(e)}")
 
 @app.delete("/evaluation-results/{result_id}")
-async def delete_evaluation_result(result_id: str):
+async def delete_evaluation_result(result_id: str, db: Session = Depends(get_db)):
     """Delete an evaluation or debate result"""
     try:
         print(f"DELETE request received for evaluation result: {result_id}")
-        db = SessionLocal()
         result = db.query(EvaluationResultDB).filter(EvaluationResultDB.id == result_id).first()
         
         if not result:
@@ -7065,10 +8077,9 @@ async def delete_evaluation_result(result_id: str):
         raise HTTPException(status_code=500, detail=f"Failed to delete evaluation result: {str(e)}")
 
 @app.delete("/candidates/{candidate_id}")
-async def delete_candidate(candidate_id: str):
+async def delete_candidate(candidate_id: str, db: Session = Depends(get_db)):
     """Delete a candidate and all associated data"""
     try:
-        db = SessionLocal()
         candidate = db.query(CandidateDB).filter(CandidateDB.id == candidate_id).first()
         
         if not candidate:
@@ -7100,11 +8111,11 @@ async def delete_candidate(candidate_id: str):
 @app.put("/candidates/{candidate_id}/assign-jobs")
 async def assign_jobs_to_candidate(
     candidate_id: str,
-    job_ids: List[str] = Form(...)
+    job_ids: List[str] = Form(...),
+    db: Session = Depends(get_db)
 ):
     """Assign multiple jobs to a candidate"""
     try:
-        db = SessionLocal()
         candidate = db.query(CandidateDB).filter(CandidateDB.id == candidate_id).first()
         
         if not candidate:
@@ -7143,10 +8154,9 @@ async def assign_jobs_to_candidate(
 # -----------------------------
 
 @app.get("/users/me")
-async def get_current_user_info(current_user: UserDB = Depends(get_current_user)):
+async def get_current_user_info(current_user: UserDB = Depends(get_current_user), db: Session = Depends(get_db)):
     """Get current authenticated user information"""
     try:
-        db = SessionLocal()
         company = None
         if current_user.company_id:
             company = db.query(CompanyDB).filter(CompanyDB.id == current_user.company_id).first()
@@ -7161,10 +8171,9 @@ async def get_current_user_info(current_user: UserDB = Depends(get_current_user)
         raise HTTPException(status_code=500, detail=f"Failed to get current user: {str(e)}")
 
 @app.get("/users")
-async def get_users(user_id: Optional[str] = None, email: Optional[str] = None, company_id: Optional[str] = None):
+async def get_users(user_id: Optional[str] = None, email: Optional[str] = None, company_id: Optional[str] = None, db: Session = Depends(get_db)):
     """Get all users"""
     try:
-        db = SessionLocal()
         query = db.query(UserDB, CompanyDB).outerjoin(CompanyDB, UserDB.company_id == CompanyDB.id)
         query = query.filter(UserDB.is_active == True)
         if user_id:
@@ -7192,11 +8201,11 @@ async def create_user(
     name: str = Form(...),
     role: str = Form("user"),
     company_id: Optional[str] = Form(None),
-    company_name: Optional[str] = Form(None)
+    company_name: Optional[str] = Form(None),
+    db: Session = Depends(get_db)
 ):
     """Create a new user"""
     try:
-        db = SessionLocal()
         # Check if user already exists
         existing = db.query(UserDB).filter(UserDB.email == email).first()
         if existing:
@@ -7234,14 +8243,14 @@ async def create_user(
 @app.delete("/users/{user_id}")
 async def delete_user(
     user_id: str,
-    current_user: UserDB = Depends(require_role(["admin"]))
+    current_user: UserDB = Depends(require_role(["admin"])),
+    db: Session = Depends(get_db)
 ):
     """Delete a user - ADMIN ONLY
     
     Prevents deletion of the 4 required users (admin@admin.nl, user@company.nl, user@recruiter.nl, user@kandidaat.nl)
     """
     try:
-        db = SessionLocal()
         
         # Prevent deletion of required users
         required_emails = [
@@ -7308,10 +8317,9 @@ async def delete_user(
 # -----------------------------
 
 @app.get("/recruiter-agencies")
-async def get_recruiter_agencies():
+async def get_recruiter_agencies(db: Session = Depends(get_db)):
     """Get all recruiter companies/agencies that can be assigned to job postings"""
     try:
-        db = SessionLocal()
         
         # Get all companies that have at least one recruiter user
         recruiter_companies = db.query(CompanyDB).join(
@@ -7373,10 +8381,9 @@ async def get_recruiter_agencies():
         raise HTTPException(status_code=500, detail=f"Failed to get recruiter agencies: {str(e)}")
 
 @app.get("/companies")
-async def get_companies(company_id: Optional[str] = None, slug: Optional[str] = None, domain: Optional[str] = None):
+async def get_companies(company_id: Optional[str] = None, slug: Optional[str] = None, domain: Optional[str] = None, db: Session = Depends(get_db)):
     """Get company records"""
     try:
-        db = SessionLocal()
         query = db.query(CompanyDB)
         if company_id:
             query = query.filter(CompanyDB.id == company_id)
@@ -7400,11 +8407,11 @@ async def create_company(
     slug: Optional[str] = Form(None),
     primary_domain: Optional[str] = Form(None),
     plan: Optional[str] = Form("trial"),
-    status: Optional[str] = Form("active")
+    status: Optional[str] = Form("active"),
+    db: Session = Depends(get_db)
 ):
     """Create a company"""
     try:
-        db = SessionLocal()
         slug_base = slugify(slug or name)
         unique_slug = generate_unique_slug(db, slug_base)
         normalized_domain = primary_domain.lower() if primary_domain else None
@@ -7439,7 +8446,8 @@ async def create_company(
 @app.get("/recruiter/vacancies")
 async def get_recruiter_vacancies(
     include_new: bool = Query(True, description="Include new vacancies not yet assigned (default: True)"),
-    current_user: UserDB = Depends(require_role(["admin", "recruiter"]))
+    current_user: UserDB = Depends(require_role(["admin", "recruiter"])),
+    db: Session = Depends(get_db)
 ):
     """Get all vacancies visible to recruiters (assigned + new vacancies from company portals)
     
@@ -7449,7 +8457,6 @@ async def get_recruiter_vacancies(
     """
     try:
         import json
-        db = SessionLocal()
         
         # Get all vacancies from company portals (active and inactive)
         # Exclude vacancies from the recruiter's own company (if they have one)
@@ -7570,18 +8577,54 @@ async def get_recruiter_vacancies(
         raise HTTPException(status_code=500, detail=f"Failed to get recruiter vacancies: {str(e)}")
 
 @app.get("/recruiter/candidates")
-async def get_recruiter_candidates(job_id: Optional[str] = None, current_user: UserDB = Depends(require_role(["admin", "recruiter"]))):
-    """Get ALL candidates for recruiter (recruiter should see all candidates in the system)"""
-    try:
-        db = SessionLocal()
-        
+async def get_recruiter_candidates(
+    job_id: Optional[str] = None,
+    params: ListParams = Depends(list_params(CANDIDATE_SORT_COLUMNS)),
+    current_user: UserDB = Depends(require_role(["admin", "recruiter"])),
+    database: RequestDatabase = Depends(get_async_db)
+):
+    """Get ALL candidates for recruiter (recruiter should see all candidates in the system)
+    
+    Supports limit/cursor pagination, sort and fields, like GET /candidates
+    """
+    def load(db):
         # Get ALL candidates (recruiter should see all candidates, not just their own)
         query = db.query(CandidateDB)
         
         if job_id:
             query = query.filter(CandidateDB.job_id == job_id)
         
-        candidates = query.all()
+        # Only the listed columns are read; the CV and other long texts are never loaded
+        query = query.options(
+            load_only(
+                CandidateDB.id, CandidateDB.name, CandidateDB.email, CandidateDB.job_id, CandidateDB.created_at,
+                CandidateDB.pipeline_stage, CandidateDB.pipeline_status, CandidateDB.skill_tags,
+                CandidateDB.submitted_by_company_id
+            ),
+            joinedload(CandidateDB.job).load_only(JobPostingDB.id, JobPostingDB.title, JobPostingDB.company)
+        )
+        candidates, next_cursor = paginate(query, params, CANDIDATE_SORT_COLUMNS, CandidateDB.id)
+        
+        # Evaluation status of the whole page in one query (EvaluationResultDB, not EvaluationDB)
+        evaluation_stats = {}
+        if candidates and (params.wants("has_evaluation") or params.wants("evaluation_count") or params.wants("updated_at")):
+            # Use or_ to handle both SQLite (BOOLEAN) and PostgreSQL (INTEGER) compatibility
+            evaluation_stats = {
+                candidate_id: (count, latest)
+                for candidate_id, count, latest in db.query(
+                    EvaluationResultDB.candidate_id,
+                    func.count(EvaluationResultDB.id),
+                    func.max(EvaluationResultDB.created_at)
+                ).filter(
+                    EvaluationResultDB.candidate_id.in_([candidate.id for candidate in candidates]),
+                    EvaluationResultDB.result_type == 'evaluation',
+                    or_(
+                        EvaluationResultDB.is_archived == False,
+                        EvaluationResultDB.is_archived == None,
+                        EvaluationResultDB.is_archived == 0
+                    )  # Only count non-archived evaluations (works with both BOOLEAN and INTEGER)
+                ).group_by(EvaluationResultDB.candidate_id).all()
+            }
         
         result = []
         for candidate in candidates:
@@ -7594,39 +8637,22 @@ async def get_recruiter_candidates(job_id: Optional[str] = None, current_user: U
                 except:
                     skill_tags = candidate.skill_tags
             
-            # Get evaluation status for this candidate (check EvaluationResultDB, not EvaluationDB)
-            # Use or_ to handle both SQLite (BOOLEAN) and PostgreSQL (INTEGER) compatibility
-            evaluations = db.query(EvaluationResultDB).filter(
-                EvaluationResultDB.candidate_id == candidate.id,
-                EvaluationResultDB.result_type == 'evaluation',
-                or_(
-                    EvaluationResultDB.is_archived == False,
-                    EvaluationResultDB.is_archived == None,
-                    EvaluationResultDB.is_archived == 0
-                )  # Only count non-archived evaluations (works with both BOOLEAN and INTEGER)
-            ).all()
-            has_evaluation = len(evaluations) > 0
+            evaluation_count, latest_evaluation_at = evaluation_stats.get(candidate.id, (0, None))
             
             # Get job info if assigned
             job_info = None
-            if candidate.job_id:
-                job = db.query(JobPostingDB).filter(JobPostingDB.id == candidate.job_id).first()
-                if job:
-                    job_info = {
-                        "id": job.id,
-                        "title": job.title,
-                        "company": job.company
-                    }
+            job = candidate.job if candidate.job_id else None
+            if job:
+                job_info = {
+                    "id": job.id,
+                    "title": job.title,
+                    "company": job.company
+                }
             
-            # Get updated_at from the most recent evaluation if available, otherwise use candidate created_at
-            updated_at = candidate.created_at
-            if evaluations:
-                # Use the most recent evaluation's created_at as updated_at
-                most_recent_eval = max(evaluations, key=lambda e: e.created_at if e.created_at else datetime.min.replace(tzinfo=None))
-                if most_recent_eval.created_at:
-                    updated_at = most_recent_eval.created_at
+            # Use the most recent evaluation's created_at as updated_at, otherwise the candidate's created_at
+            updated_at = latest_evaluation_at or candidate.created_at
             
-            result.append({
+            result.append(params.project({
                 "id": candidate.id,
                 "name": candidate.name,
                 "email": candidate.email,
@@ -7637,17 +8663,19 @@ async def get_recruiter_candidates(job_id: Optional[str] = None, current_user: U
                 "pipeline_stage": candidate.pipeline_stage,
                 "pipeline_status": candidate.pipeline_status,
                 "skill_tags": skill_tags,
-                "has_evaluation": has_evaluation,
-                "evaluation_count": len(evaluations),
+                "has_evaluation": evaluation_count > 0,
+                "evaluation_count": evaluation_count,
                 "submitted_by_company_id": candidate.submitted_by_company_id
-            })
-        
-        db.close()
+            }))
         
         return {
             "success": True,
-            "candidates": result
+            "candidates": result,
+            "next_cursor": next_cursor
         }
+    
+    try:
+        return await database.run_sync(load)
     except Exception as e:
         print(f"Error getting recruiter candidates: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to get recruiter candidates: {str(e)}")
@@ -7656,11 +8684,11 @@ async def get_recruiter_candidates(job_id: Optional[str] = None, current_user: U
 async def assign_workspace(
     job_id: str = Form(...),
     recruiter_id: str = Form(...),
-    current_user: UserDB = Depends(require_role(["admin"]))
+    current_user: UserDB = Depends(require_role(["admin"])),
+    db: Session = Depends(get_db)
 ):
     """Assign a vacancy (workspace) to a recruiter (admin only)"""
     try:
-        db = SessionLocal()
         
         # Verify job exists
         job = db.query(JobPostingDB).filter(JobPostingDB.id == job_id).first()
@@ -7697,10 +8725,13 @@ async def assign_workspace(
 # -----------------------------
 
 @app.get("/notifications")
-async def get_notifications(user_id: Optional[str] = Query(None), unread_only: bool = Query(False)):
+async def get_notifications(
+    user_id: Optional[str] = Query(None),
+    unread_only: bool = Query(False),
+    database: RequestDatabase = Depends(get_async_db)
+):
     """Get notifications for a user"""
-    try:
-        db = SessionLocal()
+    def load(db):
         query = db.query(NotificationDB)
         
         if user_id:
@@ -7710,7 +8741,6 @@ async def get_notifications(user_id: Optional[str] = Query(None), unread_only: b
             query = query.filter(NotificationDB.is_read == False)
         
         notifications = query.order_by(NotificationDB.created_at.desc()).limit(50).all()
-        db.close()
         
         return {
             "success": True,
@@ -7729,6 +8759,9 @@ async def get_notifications(user_id: Optional[str] = Query(None), unread_only: b
                 for n in notifications
             ]
         }
+    
+    try:
+        return await database.run_sync(load)
     except Exception as e:
         print(f"Error getting notifications: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to get notifications: {str(e)}")
@@ -7741,11 +8774,11 @@ async def create_notification(
     message: Optional[str] = Form(None),
     related_candidate_id: Optional[str] = Form(None),
     related_job_id: Optional[str] = Form(None),
-    related_result_id: Optional[str] = Form(None)
+    related_result_id: Optional[str] = Form(None),
+    db: Session = Depends(get_db)
 ):
     """Create a notification"""
     try:
-        db = SessionLocal()
         notification = NotificationDB(
             user_id=user_id,
             type=type,
@@ -7774,10 +8807,9 @@ async def create_notification(
         raise HTTPException(status_code=500, detail=f"Failed to create notification: {str(e)}")
 
 @app.put("/notifications/{notification_id}/read")
-async def mark_notification_read(notification_id: str):
+async def mark_notification_read(notification_id: str, db: Session = Depends(get_db)):
     """Mark a notification as read"""
     try:
-        db = SessionLocal()
         notification = db.query(NotificationDB).filter(NotificationDB.id == notification_id).first()
         if not notification:
             db.close()
@@ -7795,10 +8827,9 @@ async def mark_notification_read(notification_id: str):
         raise HTTPException(status_code=500, detail=f"Failed to mark notification as read: {str(e)}")
 
 @app.put("/notifications/read-all")
-async def mark_all_notifications_read(user_id: str = Form(...)):
+async def mark_all_notifications_read(user_id: str = Form(...), db: Session = Depends(get_db)):
     """Mark all notifications as read for a user"""
     try:
-        db = SessionLocal()
         notifications = db.query(NotificationDB).filter(
             NotificationDB.user_id == user_id,
             NotificationDB.is_read == False
@@ -7819,15 +8850,26 @@ async def mark_all_notifications_read(user_id: str = Form(...)):
 # Comment Endpoints
 # -----------------------------
 
+# Sortable columns of comment and approval lists
+COMMENT_SORT_COLUMNS = {
+    "created_at": CommentDB.created_at
+}
+APPROVAL_SORT_COLUMNS = {
+    "created_at": ApprovalDB.created_at,
+    "status": ApprovalDB.status,
+    "approval_type": ApprovalDB.approval_type
+}
+
 @app.get("/comments")
 async def get_comments(
     candidate_id: Optional[str] = Query(None),
     job_id: Optional[str] = Query(None),
-    result_id: Optional[str] = Query(None)
+    result_id: Optional[str] = Query(None),
+    params: ListParams = Depends(list_params(COMMENT_SORT_COLUMNS)),
+    database: RequestDatabase = Depends(get_async_db)
 ):
-    """Get comments"""
-    try:
-        db = SessionLocal()
+    """Get comments (supports limit/cursor pagination, sort and fields)"""
+    def load(db):
         query = db.query(CommentDB)
         
         if candidate_id:
@@ -7837,32 +8879,33 @@ async def get_comments(
         if result_id:
             query = query.filter(CommentDB.result_id == result_id)
         
-        comments = query.order_by(CommentDB.created_at.desc()).all()
-        db.close()
+        # User names come from a join
+        query = query.outerjoin(UserDB, UserDB.id == CommentDB.user_id).add_columns(UserDB.name, UserDB.email)
+        comments, next_cursor = paginate(query, params, COMMENT_SORT_COLUMNS, CommentDB.id)
         
-        # Get user names for comments
-        db = SessionLocal()
         comments_with_users = []
-        for comment in comments:
-            user = db.query(UserDB).filter(UserDB.id == comment.user_id).first()
-            comments_with_users.append({
+        for comment, user_name, user_email in comments:
+            comments_with_users.append(params.project({
                 "id": comment.id,
                 "user_id": comment.user_id,
-                "user_name": user.name if user else "Unknown",
-                "user_email": user.email if user else "",
+                "user_name": user_name if user_name is not None else "Unknown",
+                "user_email": user_email if user_email is not None else "",
                 "candidate_id": comment.candidate_id,
                 "job_id": comment.job_id,
                 "result_id": comment.result_id,
                 "content": comment.content,
                 "created_at": comment.created_at.isoformat() if comment.created_at else None,
                 "updated_at": comment.updated_at.isoformat() if comment.updated_at else None
-            })
-        db.close()
+            }))
         
         return {
             "success": True,
-            "comments": comments_with_users
+            "comments": comments_with_users,
+            "next_cursor": next_cursor
         }
+    
+    try:
+        return await database.run_sync(load)
     except Exception as e:
         print(f"Error getting comments: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to get comments: {str(e)}")
@@ -7873,11 +8916,11 @@ async def create_comment(
     content: str = Form(...),
     candidate_id: Optional[str] = Form(None),
     job_id: Optional[str] = Form(None),
-    result_id: Optional[str] = Form(None)
+    result_id: Optional[str] = Form(None),
+    db: Session = Depends(get_db)
 ):
     """Create a comment"""
     try:
-        db = SessionLocal()
         comment = CommentDB(
             user_id=user_id,
             content=content,
@@ -7903,10 +8946,9 @@ async def create_comment(
         raise HTTPException(status_code=500, detail=f"Failed to create comment: {str(e)}")
 
 @app.put("/comments/{comment_id}")
-async def update_comment(comment_id: str, content: str = Form(...)):
+async def update_comment(comment_id: str, content: str = Form(...), db: Session = Depends(get_db)):
     """Update a comment"""
     try:
-        db = SessionLocal()
         comment = db.query(CommentDB).filter(CommentDB.id == comment_id).first()
         if not comment:
             db.close()
@@ -7925,10 +8967,9 @@ async def update_comment(comment_id: str, content: str = Form(...)):
         raise HTTPException(status_code=500, detail=f"Failed to update comment: {str(e)}")
 
 @app.delete("/comments/{comment_id}")
-async def delete_comment(comment_id: str):
+async def delete_comment(comment_id: str, db: Session = Depends(get_db)):
     """Delete a comment"""
     try:
-        db = SessionLocal()
         comment = db.query(CommentDB).filter(CommentDB.id == comment_id).first()
         if not comment:
             db.close()
@@ -7955,11 +8996,12 @@ async def get_approvals(
     job_id: Optional[str] = Query(None),
     result_id: Optional[str] = Query(None),
     approval_type: Optional[str] = Query(None),
-    user_id: Optional[str] = Query(None)
+    user_id: Optional[str] = Query(None),
+    params: ListParams = Depends(list_params(APPROVAL_SORT_COLUMNS)),
+    database: RequestDatabase = Depends(get_async_db)
 ):
-    """Get approvals"""
-    try:
-        db = SessionLocal()
+    """Get approvals (supports limit/cursor pagination, sort and fields)"""
+    def load(db):
         query = db.query(ApprovalDB)
         
         if candidate_id:
@@ -7973,17 +9015,17 @@ async def get_approvals(
         if user_id:
             query = query.filter(ApprovalDB.user_id == user_id)
         
-        approvals = query.order_by(ApprovalDB.created_at.desc()).all()
+        # User names come from a join
+        query = query.outerjoin(UserDB, UserDB.id == ApprovalDB.user_id).add_columns(UserDB.name, UserDB.email)
+        approvals, next_cursor = paginate(query, params, APPROVAL_SORT_COLUMNS, ApprovalDB.id)
         
-        # Get user names for approvals
         approvals_with_users = []
-        for approval in approvals:
-            user = db.query(UserDB).filter(UserDB.id == approval.user_id).first()
-            approvals_with_users.append({
+        for approval, user_name, user_email in approvals:
+            approvals_with_users.append(params.project({
                 "id": approval.id,
                 "user_id": approval.user_id,
-                "user_name": user.name if user else "Unknown",
-                "user_email": user.email if user else "",
+                "user_name": user_name if user_name is not None else "Unknown",
+                "user_email": user_email if user_email is not None else "",
                 "candidate_id": approval.candidate_id,
                 "job_id": approval.job_id,
                 "result_id": approval.result_id,
@@ -7992,13 +9034,16 @@ async def get_approvals(
                 "comment": approval.comment,
                 "created_at": approval.created_at.isoformat() if approval.created_at else None,
                 "updated_at": approval.updated_at.isoformat() if approval.updated_at else None
-            })
-        db.close()
+            }))
         
         return {
             "success": True,
-            "approvals": approvals_with_users
+            "approvals": approvals_with_users,
+            "next_cursor": next_cursor
         }
+    
+    try:
+        return await database.run_sync(load)
     except Exception as e:
         print(f"Error getting approvals: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to get approvals: {str(e)}")
@@ -8006,11 +9051,11 @@ async def get_approvals(
 @app.post("/approvals")
 async def create_approval(
     request: Request,
-    current_user: UserDB = Depends(get_current_user)
+    current_user: UserDB = Depends(get_current_user),
+    db: Session = Depends(get_db)
 ):
     """Create or update an approval"""
     try:
-        db = SessionLocal()
         
         # Handle both Form and JSON
         content_type = request.headers.get("content-type", "")
@@ -8128,11 +9173,11 @@ async def create_approval(
 async def update_approval(
     approval_id: str,
     status: Optional[str] = Form(None),
-    comment: Optional[str] = Form(None)
+    comment: Optional[str] = Form(None),
+    db: Session = Depends(get_db)
 ):
     """Update an approval"""
     try:
-        db = SessionLocal()
         approval = db.query(ApprovalDB).filter(ApprovalDB.id == approval_id).first()
         
         if not approval:
@@ -8168,10 +9213,9 @@ async def update_approval(
         raise HTTPException(status_code=500, detail=f"Failed to update approval: {str(e)}")
 
 @app.delete("/approvals/{approval_id}")
-async def delete_approval(approval_id: str):
+async def delete_approval(approval_id: str, db: Session = Depends(get_db)):
     """Delete an approval"""
     try:
-        db = SessionLocal()
         approval = db.query(ApprovalDB).filter(ApprovalDB.id == approval_id).first()
         
         if not approval:
@@ -8194,10 +9238,9 @@ async def delete_approval(approval_id: str):
 # -----------------------------
 
 @app.get("/job-watchers/{job_id}")
-async def get_job_watchers(job_id: str):
+async def get_job_watchers(job_id: str, db: Session = Depends(get_db)):
     """Get users watching a job"""
     try:
-        db = SessionLocal()
         watchers = db.query(JobWatcherDB).filter(JobWatcherDB.job_id == job_id).all()
         
         user_ids = [w.user_id for w in watchers]
@@ -8221,10 +9264,9 @@ async def get_job_watchers(job_id: str):
         raise HTTPException(status_code=500, detail=f"Failed to get job watchers: {str(e)}")
 
 @app.post("/job-watchers")
-async def add_job_watcher(job_id: str = Form(...), user_id: str = Form(...)):
+async def add_job_watcher(job_id: str = Form(...), user_id: str = Form(...), db: Session = Depends(get_db)):
     """Add a user as a watcher for a job"""
     try:
-        db = SessionLocal()
         # Check if already watching
         existing = db.query(JobWatcherDB).filter(
             JobWatcherDB.job_id == job_id,
@@ -8246,10 +9288,9 @@ async def add_job_watcher(job_id: str = Form(...), user_id: str = Form(...)):
         raise HTTPException(status_code=500, detail=f"Failed to add job watcher: {str(e)}")
 
 @app.delete("/job-watchers/{job_id}/{user_id}")
-async def remove_job_watcher(job_id: str, user_id: str):
+async def remove_job_watcher(job_id: str, user_id: str, db: Session = Depends(get_db)):
     """Remove a user as a watcher for a job"""
     try:
-        db = SessionLocal()
         watcher = db.query(JobWatcherDB).filter(
             JobWatcherDB.job_id == job_id,
             JobWatcherDB.user_id == user_id
@@ -8270,10 +9311,9 @@ async def remove_job_watcher(job_id: str, user_id: str):
 # -----------------------------
 
 @app.get("/candidate-watchers/{candidate_id}")
-async def get_candidate_watchers(candidate_id: str):
+async def get_candidate_watchers(candidate_id: str, db: Session = Depends(get_db)):
     """Get users watching a candidate"""
     try:
-        db = SessionLocal()
         watchers = db.query(CandidateWatcherDB).filter(CandidateWatcherDB.candidate_id == candidate_id).all()
         
         user_ids = [w.user_id for w in watchers]
@@ -8297,10 +9337,9 @@ async def get_candidate_watchers(candidate_id: str):
         raise HTTPException(status_code=500, detail=f"Failed to get candidate watchers: {str(e)}")
 
 @app.post("/candidate-watchers")
-async def add_candidate_watcher(candidate_id: str = Form(...), user_id: str = Form(...)):
+async def add_candidate_watcher(candidate_id: str = Form(...), user_id: str = Form(...), db: Session = Depends(get_db)):
     """Add a user as a watcher for a candidate"""
     try:
-        db = SessionLocal()
         # Check if already watching
         existing = db.query(CandidateWatcherDB).filter(
             CandidateWatcherDB.candidate_id == candidate_id,
@@ -8322,10 +9361,9 @@ async def add_candidate_watcher(candidate_id: str = Form(...), user_id: str = Fo
         raise HTTPException(status_code=500, detail=f"Failed to add candidate watcher: {str(e)}")
 
 @app.delete("/candidate-watchers/{candidate_id}/{user_id}")
-async def remove_candidate_watcher(candidate_id: str, user_id: str):
+async def remove_candidate_watcher(candidate_id: str, user_id: str, db: Session = Depends(get_db)):
     """Remove a user as a watcher for a candidate"""
     try:
-        db = SessionLocal()
         watcher = db.query(CandidateWatcherDB).filter(
             CandidateWatcherDB.candidate_id == candidate_id,
             CandidateWatcherDB.user_id == user_id
@@ -8346,10 +9384,9 @@ async def remove_candidate_watcher(candidate_id: str, user_id: str):
 # -----------------------------
 
 @app.get("/evaluation-templates")
-async def get_evaluation_templates():
+async def get_evaluation_templates(db: Session = Depends(get_db)):
     """Get all evaluation templates"""
     try:
-        db = SessionLocal()
         templates = db.query(EvaluationTemplateDB).order_by(EvaluationTemplateDB.created_at.desc()).all()
         db.close()
         
@@ -8385,11 +9422,11 @@ async def create_evaluation_template(
     selected_actions: str = Form(...),  # Comma-separated
     company_note: Optional[str] = Form(None),
     use_candidate_company_note: bool = Form(False),
-    created_by: Optional[str] = Form(None)
+    created_by: Optional[str] = Form(None),
+    db: Session = Depends(get_db)
 ):
     """Create a new evaluation template"""
     try:
-        db = SessionLocal()
         
         template = EvaluationTemplateDB(
             name=name,
@@ -8428,10 +9465,9 @@ async def create_evaluation_template(
         raise HTTPException(status_code=500, detail=f"Failed to create evaluation template: {str(e)}")
 
 @app.delete("/evaluation-templates/{template_id}")
-async def delete_evaluation_template(template_id: str):
+async def delete_evaluation_template(template_id: str, db: Session = Depends(get_db)):
     """Delete an evaluation template"""
     try:
-        db = SessionLocal()
         template = db.query(EvaluationTemplateDB).filter(EvaluationTemplateDB.id == template_id).first()
         
         if not template:
@@ -8487,10 +9523,10 @@ Schrijf in het Nederlands."""
 
 Maak een beknopte, professionele samenvatting van deze kandidaat op basis van alle evaluaties."""
 
-        openai_result = call_openai_safe([
+        openai_result = await call_openai_safe_async([
             {"role": "system", "content": system_prompt},
             {"role": "user", "content": user_prompt}
-        ], max_tokens=500, temperature=0.3, model=OPENAI_MODEL_EVALUATION)
+        ], max_tokens=500, temperature=0.3, model=OPENAI_MODEL_EVALUATION, cache_endpoint="candidate_summary")
 
         if not openai_result["success"]:
             raise HTTPException(status_code=500, detail=f"AI summary generation failed: {openai_result.get('error', 'Unknown error')}")
@@ -8512,10 +9548,9 @@ Maak een beknopte, professionele samenvatting van deze kandidaat op basis van al
 # -----------------------------
 
 @app.post("/match-candidates")
-async def match_candidates_to_job(job_id: str = Form(...), limit: Optional[int] = Form(10)):
+async def match_candidates_to_job(job_id: str = Form(...), limit: Optional[int] = Form(10), db: Session = Depends(get_db)):
     """AI-powered matching of candidates to a job posting"""
     try:
-        db = SessionLocal()
         
         # Get job posting
         job = db.query(JobPostingDB).filter(JobPostingDB.id == job_id).first()
@@ -8527,7 +9562,7 @@ async def match_candidates_to_job(job_id: str = Form(...), limit: Optional[int]
         candidates = db.query(CandidateDB).filter(
             or_(
                 CandidateDB.job_id == job_id,
-                CandidateDB.preferential_job_ids.like(f"%{job_id}%")
+                CandidateDB.id.in_(candidates_linked_to_jobs(job_id))
             )
         ).all()
         
@@ -8539,13 +9574,26 @@ async def match_candidates_to_job(job_id: str = Form(...), limit: Optional[int]
                 "message": "No candidates found for this job"
             }
         
-        # Prepare job information
-        job_info = (f"VACATURE: {job.title}\n"
-                   f"BEDRIJF: {job.company}\n"
-                   f"LOCATIE: {job.location}\n"
-                   f"SALARIS: {job.salary_range}\n\n"
-                   f"BESCHRIJVING:\n{truncate_text_safely(job.description, 1500)}\n\n"
-                   f"EISEN:\n{truncate_text_safely(job.requirements, 1500)}")
+        # Prepare job information (description/requirements are budgeted per candidate prompt)
+        def format_job_info(job_desc: str, job_req: str) -> str:
+            return (f"VACATURE: {job.title}\n"
+                    f"BEDRIJF: {job.company}\n"
+                    f"LOCATIE: {job.location}\n"
+                    f"SALARIS: {job.salary_range}\n\n"
+                    f"BESCHRIJVING:\n{job_desc}\n\n"
+                    f"EISEN:\n{job_req}")
+        
+        # Create matching prompt
+        system_prompt = ("Je bent een expert HR-matcher. Je taak is om te beoordelen hoe goed een kandidaat matcht met een vacature.\n\n"
+                        "Geef een match score van 1-10, waarbij:\n"
+                        "- 1-3: Zeer slechte match (kandidaat voldoet niet aan basisvereisten)\n"
+                        "- 4-5: Zwakke match (kandidaat voldoet aan enkele vereisten maar mist belangrijke aspecten)\n"
+                        "- 6-7: Goede match (kandidaat voldoet aan de meeste vereisten)\n"
+                        "- 8-9: Uitstekende match (kandidaat voldoet aan vrijwel alle vereisten en heeft extra kwaliteiten)\n"
+                        "- 10: Perfecte match (kandidaat is ideaal voor deze functie)\n\n"
+                        "Geef ook een korte motivatie (2-3 zinnen) waarom deze score is gegeven.\n\n"
+                        "Antwoord in JSON formaat met match_score (1-10), reasoning, strengths en concerns.")
+        match_max_tokens = 800
         
         # Match each candidate using AI
         matches = []
@@ -8553,16 +9601,29 @@ async def match_candidates_to_job(job_id: str = Form(...), limit: Optional[int]
         
         for candidate in candidates:
             # Prepare candidate information
-            candidate_info = (f"KANDIDAAT: {candidate.name}\n"
-                            f"EMAIL: {candidate.email or 'Niet opgegeven'}\n"
-                            f"ERVARING: {candidate.experience_years or 'Niet opgegeven'} jaar\n"
-                            f"VAARDIGHEDEN: {candidate.skills or 'Niet opgegeven'}\n"
-                            f"OPLEIDING: {candidate.education or 'Niet opgegeven'}\n\n"
-                            f"CV:\n{truncate_text_safely(candidate.resume_text or '', 1500)}\n\n"
-                            f"MOTIVATIEBRIEF:\n{truncate_text_safely(candidate.motivational_letter or '', 1000)}")
+            def format_candidate_info(resume: str, motivation: str, note: str) -> str:
+                info = (f"KANDIDAAT: {candidate.name}\n"
+                        f"EMAIL: {candidate.email or 'Niet opgegeven'}\n"
+                        f"ERVARING: {candidate.experience_years or 'Niet opgegeven'} jaar\n"
+                        f"VAARDIGHEDEN: {candidate.skills or 'Niet opgegeven'}\n"
+                        f"OPLEIDING: {candidate.education or 'Niet opgegeven'}\n\n"
+                        f"CV:\n{resume}\n\n"
+                        f"MOTIVATIEBRIEF:\n{motivation}")
+                if note:
+                    info += f"\nBEDRIJFSNOTITIE (van leverancier):\n{note}\n"
+                return info
             
-            if candidate.company_note:
-                candidate_info += f"\nBEDRIJFSNOTITIE (van leverancier):\n{truncate_text_safely(candidate.company_note, 500)}\n"
+            budgeted_sections = fit_prompt_sections({
+                "resume": candidate.resume_text,
+                "company_note": candidate.company_note,
+                "job_description": job.description,
+                "job_requirements": job.requirements,
+                "motivation": candidate.motivational_letter
+            }, [system_prompt, format_job_info("", ""), format_candidate_info("", "", "")],
+                OPENAI_MODEL_EVALUATION, match_max_tokens)
+            job_info = format_job_info(budgeted_sections["job_description"], budgeted_sections["job_requirements"])
+            candidate_info = format_candidate_info(budgeted_sections["resume"], budgeted_sections["motivation"],
+                                                   budgeted_sections["company_note"])
             
             # Get evaluation scores if available
             evaluations = db.query(EvaluationResultDB).filter(
@@ -8589,17 +9650,6 @@ async def match_candidates_to_job(job_id: str = Form(...), limit: Optional[int]
                             pass
             
             avg_score = sum(evaluation_scores) / len(evaluation_scores) if evaluation_scores else None
-            
-            # Create matching prompt
-            system_prompt = ("Je bent een expert HR-matcher. Je taak is om te beoordelen hoe goed een kandidaat matcht met een vacature.\n\n"
-                            "Geef een match score van 1-10, waarbij:\n"
-                            "- 1-3: Zeer slechte match (kandidaat voldoet niet aan basisvereisten)\n"
-                            "- 4-5: Zwakke match (kandidaat voldoet aan enkele vereisten maar mist belangrijke aspecten)\n"
-                            "- 6-7: Goede match (kandidaat voldoet aan de meeste vereisten)\n"
-                            "- 8-9: Uitstekende match (kandidaat voldoet aan vrijwel alle vereisten en heeft extra kwaliteiten)\n"
-                            "- 10: Perfecte match (kandidaat is ideaal voor deze functie)\n\n"
-                            "Geef ook een korte motivatie (2-3 zinnen) waarom deze score is gegeven.\n\n"
-                            "Antwoord in JSON formaat met match_score (1-10), reasoning, strengths en concerns.")
 
             eval_info = f"\nBESTAANDE EVALUATIES: Gemiddelde score: {avg_score:.1f}/10" if avg_score else ""
             user_prompt = "VACATURE:\n" + str(job_info) + "\n\nKANDIDAAT:\n" + str(candidate_info) + "\n" + eval_info + "\n\nBeoordeel hoe goed deze kandidaat matcht met deze vacature. Geef een match score en motivatie."
@@ -8613,16 +9663,15 @@ async def match_candidates_to_job(job_id: str = Form(...), limit: Optional[int]
                 "avg_score": avg_score
             })
         
-        # Process matches in parallel (but limit concurrent requests)
-        from config import OPENAI_MODEL_EVALUATION, OPENAI_MAX_TOKENS_EVALUATION, OPENAI_TEMPERATURE_EVALUATION
-        
+        # Process matches in parallel (concurrency is bounded by the LLM governor)
         async def process_match(task):
             try:
                 result = await call_openai_safe_async(
                     task["prompt"],
-                    max_tokens=800,
+                    max_tokens=match_max_tokens,
                     temperature=0.2,
-                    model=OPENAI_MODEL_EVALUATION
+                    model=OPENAI_MODEL_EVALUATION,
+                    cache_endpoint="candidate_matching"
                 )
                 
                 if result["success"]:
@@ -8669,13 +9718,8 @@ async def match_candidates_to_job(job_id: str = Form(...), limit: Optional[int]
                     "evaluation_score": task["avg_score"]
                 }
         
-        # Process matches with limited concurrency (5 at a time)
-        semaphore = asyncio.Semaphore(5)
-        async def process_with_semaphore(task):
-            async with semaphore:
-                return await process_match(task)
-        
-        match_results = await asyncio.gather(*[process_with_semaphore(task) for task in matching_tasks])
+        # Process matches in parallel - concurrency and rate limits are enforced by the global LLM governor
+        match_results = await asyncio.gather(*[process_match(task) for task in matching_tasks])
         
         # Sort by match score (descending)
         match_results.sort(key=lambda x: x["match_score"], reverse=True)
@@ -8789,6 +9833,9 @@ async def reset_database(
         print("Deleting evaluations...")
         db.query(EvaluationDB).delete()
         
+        print("Deleting candidate-job links...")
+        db.query(CandidateJobLinkDB).delete()
+        
         print("Deleting candidates...")
         db.query(CandidateDB).delete()
         
@@ -8856,12 +9903,12 @@ async def reset_database(
 @app.post("/llm-judge/evaluate")
 async def evaluate_llm_performance(
     result_id: str = Form(...),
-    request: Request = None
+    request: Request = None,
+    db: Session = Depends(get_db)
 ):
     try:
         from llm_judge import get_judge
         
-        db = SessionLocal()
         result = db.query(EvaluationResultDB).filter(EvaluationResultDB.id == result_id).first()
         
         if not result:
@@ -9040,6 +10087,302 @@ async def get_llm_settings():
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to get settings: {str(e)}")
 
+# -----------------------------
+# Background tasks (durable queue for evaluations, debates and job analyses)
+# -----------------------------
+async def _evaluation_task(payload: Dict[str, Any], context) -> Dict[str, Any]:
+    return await run_candidate_evaluation(**payload)
+
+async def _debate_task(payload: Dict[str, Any], context) -> Dict[str, Any]:
+    return await run_candidate_debate(**payload)
+
+async def _job_analysis_task(payload: Dict[str, Any], context) -> Dict[str, Any]:
+    return await analyze_job(job_id=payload["job_id"], bypass_cache=payload.get("bypass_cache", False))
+
+async def _batch_evaluation_task(payload: Dict[str, Any], context) -> Dict[str, Any]:
+    return await run_batch_evaluation(**payload, context=context)
+
+task_queue.register_handler("evaluation", _evaluation_task)
+task_queue.register_handler("debate", _debate_task)
+task_queue.register_handler("job_analysis", _job_analysis_task)
+task_queue.register_handler("batch_evaluation", _batch_evaluation_task)
+
+@app.on_event("startup")
+async def start_task_queue():
+    """Start background task workers (also requeues tasks left running by a previous process)"""
+    await task_queue.start()
+
+@app.on_event("shutdown")
+async def stop_task_queue():
+    """Stop workers; interrupted tasks go back to the queue"""
+    await task_queue.stop()
+
+def _require_candidate(candidate_id: str):
+    db = SessionLocal()
+    try:
+        if not db.query(CandidateDB.id).filter(CandidateDB.id == candidate_id).first():
+            raise HTTPException(status_code=404, detail="Candidate not found")
+    finally:
+        db.close()
+
+def _request_user_id(request: Optional[Request]) -> Optional[str]:
+    """Id of the active user behind the request's bearer token, or None (task endpoints allow anonymous callers)"""
+    auth_header = request.headers.get("authorization") if request is not None else None
+    if not auth_header or not auth_header.startswith("Bearer "):
+        return None
+    try:
+        payload = jwt.decode(auth_header.replace("Bearer ", ""), SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        return None
+    user_id = payload.get("sub")
+    if not user_id:
+        return None
+    db = SessionLocal()
+    try:
+        user = db.query(UserDB.id).filter(UserDB.id == user_id, UserDB.is_active == True).first()
+        return user.id if user else None
+    finally:
+        db.close()
+
+def _submit_task(request: Optional[Request], task_type: str, payload: Dict[str, Any], priority: int) -> str:
+    """Persist a task for the calling user (blocking; run it with asyncio.to_thread)"""
+    return task_queue.submit(task_type, payload, priority=priority, created_by=_request_user_id(request))
+
+def _queued_response(task_id: str) -> Dict[str, Any]:
+    return {
+        "success": True,
+        "task_id": task_id,
+        "status": "queued",
+        "status_url": f"/tasks/{task_id}"
+    }
+
+@app.post("/tasks/evaluate-candidate")
+async def submit_evaluation_task(
+    candidate_id: str = Form(...),
+    job_id: Optional[str] = Form(None),
+    strictness: Optional[str] = Form("medium"),
+    company_note: Optional[str] = Form(None),
+    bypass_cache: Optional[bool] = Form(False),
+    priority: int = Form(0),  # Higher runs first
+    request: Request = None
+):
+    """Queue a candidate evaluation; poll /tasks/{task_id} for the result_id"""
+    persona_prompts = await read_persona_prompts(request)
+    if not persona_prompts:
+        raise HTTPException(status_code=400, detail="At least one persona must be selected for evaluation")
+    await asyncio.to_thread(_require_candidate, candidate_id)
+    task_id = await asyncio.to_thread(_submit_task, request, "evaluation", {
+        "candidate_id": candidate_id,
+        "persona_prompts": persona_prompts,
+        "job_id": job_id,
+        "strictness": strictness,
+        "company_note": company_note,
+        "bypass_cache": bool(bypass_cache)
+    }, priority)
+    return _queued_response(task_id)
+
+@app.post("/tasks/debate-candidate")
+async def submit_debate_task(
+    candidate_id: str = Form(...),
+    job_id: Optional[str] = Form(None),
+    company_note: Optional[str] = Form(None),
+    company_note_file: Optional[UploadFile] = File(None),
+    priority: int = Form(0),  # Higher runs first
+    request: Request = None
+):
+    """Queue a multi-expert debate; poll /tasks/{task_id} for the result_id"""
+    persona_prompts = await read_persona_prompts(request)
+    if not persona_prompts:
+        raise HTTPException(status_code=400, detail="No persona prompts provided")
+    await asyncio.to_thread(_require_candidate, candidate_id)
+    company_note_text = await read_company_note(company_note, company_note_file)
+    # Fixed up front so a retried or requeued task resumes the same debate from its checkpoints
+    debate_session_id = str(uuid4())
+    task_id = await asyncio.to_thread(_submit_task, request, "debate", {
+        "candidate_id": candidate_id,
+        "persona_prompts": persona_prompts,
+        "job_id": job_id,
+        "company_note": company_note_text,
+        "debate_session_id": debate_session_id
+    }, priority)
+    return {**_queued_response(task_id), "debate_session_id": debate_session_id}
+
+@app.post("/tasks/analyze-job")
+async def submit_job_analysis_task(
+    job_id: str = Form(...),
+    bypass_cache: Optional[bool] = Form(False),
+    priority: int = Form(0),  # Higher runs first
+    request: Request = None
+):
+    """Queue a job posting analysis; poll /tasks/{task_id} for the result"""
+    task_id = await asyncio.to_thread(_submit_task, request, "job_analysis", {
+        "job_id": job_id,
+        "bypass_cache": bool(bypass_cache)
+    }, priority)
+    return _queued_response(task_id)
+
+@app.post("/tasks/batch-evaluate")
+async def submit_batch_evaluation_task(
+    job_id: Optional[str] = Form(None),
+    template_id: Optional[str] = Form(None),  # EvaluationTemplateDB with the persona set (and optional job/company note)
+    candidate_ids: Optional[str] = Form(None),  # Comma-separated; default: all candidates linked to the job
+    company_note: Optional[str] = Form(None),
+    use_candidate_company_note: Optional[bool] = Form(None),
+    bypass_cache: Optional[bool] = Form(False),
+    priority: int = Form(0),  # Higher runs first
+    request: Request = None
+):
+    """Queue an evaluation of all candidates of a job with one persona set.
+
+    Personas come from '<persona_name>_prompt' form fields or from an evaluation template.
+    Poll /tasks/{task_id} for progress (total/completed/failed) and /tasks/{task_id}/result for the per-candidate result_ids.
+    """
+    persona_prompts = await read_persona_prompts(request)
+    if template_id:
+        db = SessionLocal()
+        try:
+            template = db.query(EvaluationTemplateDB).filter(EvaluationTemplateDB.id == template_id).first()
+            if not template:
+                raise HTTPException(status_code=404, detail="Template not found")
+            persona_ids = [pid.strip() for pid in (template.selected_persona_ids or "").split(",") if pid.strip()]
+            if not persona_prompts:
+                personas = db.query(PersonaDB).filter(PersonaDB.id.in_(persona_ids)).all()
+                persona_prompts = {persona.name: persona.system_prompt for persona in personas}
+            job_id = job_id or template.job_id
+            if company_note is None:
+                company_note = template.company_note
+            if use_candidate_company_note is None:
+                use_candidate_company_note = template.use_candidate_company_note
+        finally:
+            db.close()
+    if not job_id:
+        raise HTTPException(status_code=400, detail="Evaluation requires a job posting. Please select a job before evaluating.")
+    if not persona_prompts:
+        raise HTTPException(status_code=400, detail="At least one persona must be selected for evaluation")
+    db = SessionLocal()
+    try:
+        if not db.query(JobPostingDB.id).filter(JobPostingDB.id == job_id).first():
+            raise HTTPException(status_code=404, detail="Associated job posting not found")
+    finally:
+        db.close()
+    task_id = await asyncio.to_thread(_submit_task, request, "batch_evaluation", {
+        "job_id": job_id,
+        "persona_prompts": persona_prompts,
+        "candidate_ids": [cid.strip() for cid in candidate_ids.split(",") if cid.strip()] if candidate_ids else None,
+        "company_note": company_note,
+        "use_candidate_company_note": bool(use_candidate_company_note),
+        "bypass_cache": bool(bypass_cache)
+    }, priority)
+    return _queued_response(task_id)
+
+@app.get("/tasks")
+async def list_tasks(
+    status: Optional[str] = Query(None),
+    task_type: Optional[str] = Query(None),
+    limit: int = Query(50, ge=1, le=200)
+):
+    """List recent background tasks"""
+    tasks = await asyncio.to_thread(task_queue.list, status=status, task_type=task_type, limit=limit)
+    return {
+        "success": True,
+        "tasks": tasks,
+        "queue_depth": await asyncio.to_thread(task_queue.queue_depth)
+    }
+
+@app.get("/tasks/{task_id}")
+async def get_task_status(task_id: str):
+    """Get status, progress and result_id of a background task"""
+    task = await asyncio.to_thread(task_queue.get, task_id)
+    if not task:
+        raise HTTPException(status_code=404, detail="Taak niet gevonden")
+    return {"success": True, "task": task}
+
+@app.get("/tasks/{task_id}/result")
+async def get_task_result(task_id: str):
+    """Get the full result of a finished task (same body as the synchronous endpoint)"""
+    task = await asyncio.to_thread(task_queue.get, task_id, include_result=True)
+    if not task:
+        raise HTTPException(status_code=404, detail="Taak niet gevonden")
+    if task["status"] == "failed":
+        raise HTTPException(status_code=500, detail=task["error"] or "Taak mislukt")
+    if task["status"] != "completed":
+        raise HTTPException(status_code=409, detail=f"Taak is nog niet voltooid (status: {task['status']})")
+    return task["result"]
+
+@app.post("/tasks/{task_id}/cancel")
+async def cancel_task(task_id: str):
+    """Cancel a queued or running background task"""
+    task = await asyncio.to_thread(task_queue.cancel, task_id)
+    if not task:
+        raise HTTPException(status_code=404, detail="Taak niet gevonden")
+    return {"success": True, "task": task}
+
+@app.get("/llm-governor/status")
+async def get_llm_governor_status():
+    """Get OpenAI queue depth, in-flight calls and remaining rate budgets"""
+    return {
+        "success": True,
+        "governor": get_governor().get_status()
+    }
+
+
+@app.get("/llm-resilience/status")
+async def get_llm_resilience_status():
+    """Get retry/hedge counters, circuit breaker states and latency percentiles"""
+    return {
+        "success": True,
+        "resilience": get_resilience().get_status()
+    }
+
+
+@app.get("/llm-cache/stats")
+async def get_llm_cache_stats():
+    """Get LLM response cache hit/miss counters"""
+    return {
+        "success": True,
+        "cache": get_llm_cache().get_stats()
+    }
+
+
+@app.post("/llm-cache/clear")
+async def clear_llm_cache(current_user: UserDB = Depends(require_role(["admin"]))):
+    """Drop all cached LLM responses (admin only)"""
+    await asyncio.to_thread(get_llm_cache().clear)
+    return {
+        "success": True,
+        "message": "LLM cache geleegd"
+    }
+
+
+@app.get("/extraction-cache/stats")
+async def get_extraction_cache_stats():
+    """Get document extraction cache hit/miss counters"""
+    return {
+        "success": True,
+        "cache": extraction_cache.get_stats()
+    }
+
+
+@app.post("/extraction-cache/clear")
+async def clear_extraction_cache(current_user: UserDB = Depends(require_role(["admin"]))):
+    """Drop all cached document extractions (admin only)"""
+    removed = extraction_cache.clear()
+    return {
+        "success": True,
+        "removed": removed,
+        "message": "Extractiecache geleegd"
+    }
+
+
+@app.get("/extraction-stats")
+async def get_extraction_stats():
+    """Per-extractor latency, success rate and output quality, to tune PDF_EXTRACTION_PRIORITY"""
+    return {
+        "success": True,
+        "strategy": get_extraction_strategy().get_stats(),
+        "pool": get_extraction_pool().stats
+    }
+
 if __name__ == "__main__":
     import uvicorn
     # Note: reload=True requires running as: uvicorn main:app --reload
@@ -0,0 +1,153 @@
+"""
+Pagination - Keyset (cursor) pagination, sorting and field projection for list endpoints
+Pages are ordered by a sort column plus id and continue after the last row of the previous page
+(not OFFSET), so with an index ending in (sort column, id) every page reads just its own rows,
+however large the tenant is. Sort columns must be NOT NULL. fields= lets clients skip
+heavy columns such as resume_text or result_data; those are deferred in SQL, not just dropped from JSON.
+"""
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+import base64
+import json
+
+from fastapi import HTTPException, Query
+from sqlalchemy import String, literal, tuple_, type_coerce
+from sqlalchemy.orm import defer
+
+# Import config
+try:
+    from config import LIST_DEFAULT_PAGE_SIZE, LIST_MAX_PAGE_SIZE
+except ImportError:
+    LIST_DEFAULT_PAGE_SIZE = None
+    LIST_MAX_PAGE_SIZE = 500
+
+
+def encode_cursor(sort: str, value: Any, row_id: str) -> str:
+    """Opaque cursor pointing just after a row"""
+    if isinstance(value, datetime):
+        value = {"datetime": value.isoformat()}
+    payload = json.dumps({"sort": sort, "value": value, "id": row_id}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Dict[str, Any]:
+    """Inverse of encode_cursor; raises ValueError for a cursor that was not made by it"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        if not isinstance(data, dict) or not isinstance(data.get("id"), str) or not isinstance(data.get("sort"), str):
+            raise ValueError("missing fields")
+        if isinstance(data.get("value"), dict):
+            data["value"] = datetime.fromisoformat(data["value"]["datetime"])
+        return data
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {str(e)}")
+
+
+class ListParams:
+    """Parsed limit / cursor / sort / fields of a list request"""
+
+    def __init__(self, limit: Optional[int] = None, cursor: Optional[Dict[str, Any]] = None,
+                 sort: str = "-created_at", fields: Optional[Iterable[str]] = None):
+        self.cursor = cursor
+        self.sort = sort
+        self.sort_field = sort.lstrip("-")
+        self.descending = sort.startswith("-")
+        self.fields = set(fields) | {"id"} if fields else None
+        if limit is None and (cursor or LIST_DEFAULT_PAGE_SIZE):
+            limit = LIST_DEFAULT_PAGE_SIZE or LIST_MAX_PAGE_SIZE
+        self.limit = limit
+
+    @property
+    def paginated(self) -> bool:
+        return self.limit is not None
+
+    def wants(self, field: str) -> bool:
+        """Whether the response should contain this field"""
+        return self.fields is None or field in self.fields
+
+    def project(self, item: Dict[str, Any]) -> Dict[str, Any]:
+        """Drop the fields the client did not ask for"""
+        if self.fields is None:
+            return item
+        return {key: value for key, value in item.items() if key in self.fields}
+
+    def defer_unwanted(self, heavy_columns: Dict[str, Any]) -> List[Any]:
+        """defer() options for heavy columns whose field was not requested: {field: column}"""
+        return [defer(column) for field, column in heavy_columns.items() if not self.wants(field)]
+
+
+def list_params(sort_fields: Iterable[str], default_sort: str = "-created_at"):
+    """FastAPI dependency parsing ?limit=&cursor=&sort=&fields= for an endpoint
+
+    sort_fields are the names clients may sort on; prefix a name with '-' for descending order.
+    """
+    sort_fields = list(sort_fields)
+
+    def dependency(
+        limit: Optional[int] = Query(None, ge=1, le=LIST_MAX_PAGE_SIZE),
+        cursor: Optional[str] = Query(None),
+        sort: Optional[str] = Query(None),
+        fields: Optional[str] = Query(None)
+    ) -> ListParams:
+        sort = sort or default_sort
+        if sort.lstrip("-") not in sort_fields:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Ongeldige sortering '{sort}'. Mogelijk: {', '.join(sort_fields)} (met '-' voor aflopend)"
+            )
+        decoded = None
+        if cursor:
+            try:
+                decoded = decode_cursor(cursor)
+            except ValueError:
+                raise HTTPException(status_code=400, detail="Ongeldige cursor")
+            if decoded["sort"] != sort:
+                raise HTTPException(status_code=400, detail="Cursor hoort bij een andere sortering")
+        field_names = [name.strip() for name in fields.split(",") if name.strip()] if fields else None
+        return ListParams(limit=limit, cursor=decoded, sort=sort, fields=field_names)
+
+    return dependency
+
+
+def _after_cursor(column, id_column, cursor: Dict[str, Any], descending: bool):
+    """Rows after the cursor row in (column, id) order, as one row-value comparison the index can seek"""
+    # The cursor holds the value as the database stores it (see _stored_value); text is compared as is
+    value = cursor["value"]
+    anchor = tuple_(literal(value, type_=String if isinstance(value, str) else column.type), literal(cursor["id"], type_=String))
+    row = tuple_(column, id_column)
+    return row < anchor if descending else row > anchor
+
+
+def _stored_value(query, column, id_column, row_id: str) -> Any:
+    """Sort value of a row exactly as stored; SQLite keeps timestamps as text in more than one format,
+    so a value converted to datetime and back would not compare equal to its own row"""
+    return query.session.query(type_coerce(column, String)).filter(id_column == row_id).scalar()
+
+
+def paginate(query, params: ListParams, sort_columns: Dict[str, Any], id_column) -> Tuple[List[Any], Optional[str]]:
+    """Sort a query and fetch one page of it: (rows, next_cursor or None)
+
+    Rows may be entities or tuples whose first element is the entity (queries with add_columns).
+    Without a limit every row is returned, sorted.
+    """
+    column = sort_columns[params.sort_field]
+    if params.descending:
+        order = [column.desc(), id_column.desc()]
+    else:
+        order = [column.asc(), id_column.asc()]
+    if params.cursor:
+        query = query.filter(_after_cursor(column, id_column, params.cursor, params.descending))
+    query = query.order_by(*order)
+    if not params.paginated:
+        return query.all(), None
+
+    rows = query.limit(params.limit + 1).all()
+    if len(rows) <= params.limit:
+        return rows, None
+    rows = rows[:params.limit]
+    last = rows[-1]
+    entity = last if isinstance(last, column.class_) else last[0]
+    row_id = getattr(entity, id_column.key)
+    next_cursor = encode_cursor(params.sort, _stored_value(query, column, id_column, row_id), row_id)
+    return rows, next_cursor
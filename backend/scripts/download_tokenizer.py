@@ -0,0 +1,27 @@
+"""
+Tokenizer Download Script
+Fetches the BPE file of TOKENIZER_DEFAULT_ENCODING into TOKENIZER_CACHE_DIR at build time,
+so token counting (token_budget.py) needs no network access at runtime.
+"""
+import os
+import sys
+from pathlib import Path
+
+
+def main():
+    project_root = Path(__file__).resolve().parents[1]
+    sys.path.append(str(project_root))
+
+    # Import inside function so TIKTOKEN_CACHE_DIR is set from config first
+    from token_budget import TOKENIZER_CACHE_DIR, TOKENIZER_DEFAULT_ENCODING, get_encoding
+
+    os.makedirs(TOKENIZER_CACHE_DIR, exist_ok=True)
+    if get_encoding() is None:
+        # Don't fail the build - token counts fall back to length-based estimates
+        print(f"⚠ Could not download tokenizer '{TOKENIZER_DEFAULT_ENCODING}'.")
+        return
+    print(f"✅ Tokenizer '{TOKENIZER_DEFAULT_ENCODING}' cached in {TOKENIZER_CACHE_DIR}")
+
+
+if __name__ == "__main__":
+    main()
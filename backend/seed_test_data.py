@@ -12,7 +12,7 @@ sys.path.insert(0, os.path.dirname(__file__))
 
 from main import (
     SessionLocal, CompanyDB, UserDB, CandidateDB, JobPostingDB,
-    get_password_hash, generate_unique_slug, CandidateDB
+    get_password_hash, generate_unique_slug, CandidateDB, set_preferential_job_ids
 )
 from sqlalchemy import func
 import json
@@ -287,7 +287,7 @@ def seed_test_data():
             print(f"  ✓ Assigned {created_candidates[1].name} to {created_vacancies[0].title}")
             
             # Pieter to first vacancy (via recruiter)
-            created_candidates[2].preferential_job_ids = created_vacancies[0].id
+            set_preferential_job_ids(db, created_candidates[2], [created_vacancies[0].id])
             print(f"  ✓ Assigned {created_candidates[2].name} to {created_vacancies[0].title} (preferential)")
             
             # Jan to second vacancy
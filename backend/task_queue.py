@@ -0,0 +1,371 @@
+"""
+Task Queue - Durable background queue for long-running LLM work (evaluations, debates, job analyses)
+Tasks are rows in the application database. Worker coroutines claim them by priority, hold a
+lease while running and requeue tasks whose worker stopped (restart recovery).
+"""
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, Dict, List, Optional, Any
+from uuid import uuid4
+import asyncio
+import json
+import os
+import socket
+
+# Import config
+try:
+    from config import (
+        TASK_QUEUE_WORKERS, TASK_QUEUE_POLL_INTERVAL_SECONDS, TASK_QUEUE_LEASE_SECONDS, TASK_QUEUE_MAX_ATTEMPTS
+    )
+except ImportError:
+    TASK_QUEUE_WORKERS = 4
+    TASK_QUEUE_POLL_INTERVAL_SECONDS = 2.0
+    TASK_QUEUE_LEASE_SECONDS = 60
+    TASK_QUEUE_MAX_ATTEMPTS = 3
+
+TASK_STATUS_QUEUED = 'queued'
+TASK_STATUS_RUNNING = 'running'
+TASK_STATUS_COMPLETED = 'completed'
+TASK_STATUS_FAILED = 'failed'
+TASK_STATUS_CANCELLED = 'cancelled'
+FINISHED_STATUSES = (TASK_STATUS_COMPLETED, TASK_STATUS_FAILED, TASK_STATUS_CANCELLED)
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _loads(value: Optional[str]):
+    if not value:
+        return None
+    try:
+        return json.loads(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class TaskContext:
+    """Passed to handlers so they can report progress on their task row"""
+
+    def __init__(self, queue: "TaskQueue", task_id: str):
+        self.queue = queue
+        self.task_id = task_id
+        self._progress_lock = asyncio.Lock()
+
+    async def set_progress(self, progress: Dict[str, Any]):
+        """Store a progress snapshot; writes run in a thread, in call order"""
+        snapshot = json.dumps(progress, ensure_ascii=False)
+        async with self._progress_lock:
+            await asyncio.to_thread(self.queue._update, self.task_id, progress=snapshot)
+
+
+TaskHandler = Callable[[Dict[str, Any], TaskContext], Awaitable[Dict[str, Any]]]
+
+
+class TaskQueue:
+    """DB-backed priority queue with in-process worker coroutines.
+
+    Several processes may run workers against the same database: a task is claimed with a
+    conditional UPDATE (status still 'queued'), so exactly one worker gets it.
+    """
+
+    def __init__(self, session_factory, task_model, worker_count: int = TASK_QUEUE_WORKERS):
+        self.session_factory = session_factory
+        self.task_model = task_model
+        self.worker_count = worker_count
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid4().hex[:6]}"
+        self._handlers: Dict[str, TaskHandler] = {}
+        self._workers: List[asyncio.Task] = []
+        self._running: Dict[str, asyncio.Task] = {}  # task_id -> handler task in this process
+        self._wakeup: Optional[asyncio.Event] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None  # Loop the workers run on
+        self._stopping = False
+
+    def register_handler(self, task_type: str, handler: TaskHandler):
+        self._handlers[task_type] = handler
+
+    # ----- Submitting / inspecting -----
+    # Blocking database calls: async callers run them in a thread (asyncio.to_thread)
+
+    def _notify_loop(self, callback):
+        # Worker state belongs to the workers' event loop; this may be called from another thread
+        if self._loop is not None and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(callback)
+
+    def submit(self, task_type: str, payload: Dict[str, Any], priority: int = 0,
+               created_by: Optional[str] = None) -> str:
+        """Persist a new task and wake a worker; returns the task id"""
+        if task_type not in self._handlers:
+            raise ValueError(f"Unknown task type: {task_type}")
+        db = self.session_factory()
+        try:
+            task = self.task_model(
+                task_type=task_type,
+                status=TASK_STATUS_QUEUED,
+                priority=priority,
+                payload=json.dumps(payload, ensure_ascii=False),
+                created_by=created_by,
+                created_at=_utcnow()
+            )
+            db.add(task)
+            db.commit()
+            task_id = task.id
+        finally:
+            db.close()
+        if self._wakeup is not None:
+            self._notify_loop(self._wakeup.set)
+        return task_id
+
+    def serialize(self, task, include_result: bool = False) -> Dict[str, Any]:
+        data = {
+            "id": task.id,
+            "task_type": task.task_type,
+            "status": task.status,
+            "priority": task.priority,
+            "progress": _loads(task.progress),
+            "result_id": task.result_id,
+            "error": task.error,
+            "attempts": task.attempts,
+            "cancel_requested": bool(task.cancel_requested),
+            "created_by": task.created_by,
+            "created_at": task.created_at.isoformat() if task.created_at else None,
+            "started_at": task.started_at.isoformat() if task.started_at else None,
+            "finished_at": task.finished_at.isoformat() if task.finished_at else None
+        }
+        if include_result:
+            data["result"] = _loads(task.result)
+        return data
+
+    def get(self, task_id: str, include_result: bool = False) -> Optional[Dict[str, Any]]:
+        db = self.session_factory()
+        try:
+            task = db.query(self.task_model).filter(self.task_model.id == task_id).first()
+            return self.serialize(task, include_result) if task else None
+        finally:
+            db.close()
+
+    def list(self, status: Optional[str] = None, task_type: Optional[str] = None,
+             limit: int = 50) -> List[Dict[str, Any]]:
+        db = self.session_factory()
+        try:
+            query = db.query(self.task_model)
+            if status:
+                query = query.filter(self.task_model.status == status)
+            if task_type:
+                query = query.filter(self.task_model.task_type == task_type)
+            tasks = query.order_by(self.task_model.created_at.desc()).limit(limit).all()
+            return [self.serialize(task) for task in tasks]
+        finally:
+            db.close()
+
+    def queue_depth(self) -> int:
+        db = self.session_factory()
+        try:
+            return db.query(self.task_model).filter(self.task_model.status == TASK_STATUS_QUEUED).count()
+        finally:
+            db.close()
+
+    def cancel(self, task_id: str) -> Optional[Dict[str, Any]]:
+        """Cancel a queued task immediately; a running task is stopped by the worker that owns it"""
+        db = self.session_factory()
+        try:
+            task = db.query(self.task_model).filter(self.task_model.id == task_id).first()
+            if not task:
+                return None
+            if task.status == TASK_STATUS_QUEUED:
+                task.status = TASK_STATUS_CANCELLED
+                task.finished_at = _utcnow()
+            elif task.status == TASK_STATUS_RUNNING:
+                task.cancel_requested = True
+            db.commit()
+            db.refresh(task)
+            result = self.serialize(task)
+        finally:
+            db.close()
+        # Running in this process: stop it now instead of at the next heartbeat
+        running = self._running.get(task_id)
+        if running is not None:
+            self._notify_loop(running.cancel)
+        return result
+
+    # ----- Workers -----
+
+    async def start(self):
+        """Start worker coroutines on the current event loop"""
+        if self._workers:
+            return
+        self._wakeup = asyncio.Event()
+        self._loop = asyncio.get_running_loop()
+        self._stopping = False
+        await asyncio.to_thread(self._recover_expired_leases)
+        for index in range(self.worker_count):
+            self._workers.append(asyncio.create_task(self._worker_loop(index)))
+        print(f"✓ Task queue started with {self.worker_count} workers ({self.worker_id})")
+
+    async def stop(self):
+        """Stop workers; tasks interrupted by shutdown go back to the queue"""
+        self._stopping = True
+        for worker in self._workers:
+            worker.cancel()
+        for task_id, running in list(self._running.items()):
+            running.cancel()
+            await asyncio.to_thread(
+                self._update, task_id, status=TASK_STATUS_QUEUED, worker_id=None, lease_expires_at=None, started_at=None
+            )
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        self._running = {}
+
+    async def _worker_loop(self, index: int):
+        # Database work runs in threads so polling and bookkeeping never block the event loop
+        while True:
+            try:
+                self._wakeup.clear()
+                while True:
+                    claimed = await asyncio.to_thread(self._claim_next)
+                    if not claimed:
+                        break
+                    await self._execute(*claimed)
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=TASK_QUEUE_POLL_INTERVAL_SECONDS)
+                except asyncio.TimeoutError:
+                    # Periodic poll picks up tasks submitted by other processes and expired leases
+                    await asyncio.to_thread(self._recover_expired_leases)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Task worker {index} error: {e}")
+                await asyncio.sleep(TASK_QUEUE_POLL_INTERVAL_SECONDS)
+
+    def _claim_next(self):
+        """Atomically move the highest-priority queued task to 'running' for this worker"""
+        db = self.session_factory()
+        try:
+            candidates = db.query(self.task_model.id).filter(
+                self.task_model.status == TASK_STATUS_QUEUED
+            ).order_by(
+                self.task_model.priority.desc(), self.task_model.created_at.asc()
+            ).limit(5).all()
+            for (task_id,) in candidates:
+                now = _utcnow()
+                claimed = db.query(self.task_model).filter(
+                    self.task_model.id == task_id,
+                    self.task_model.status == TASK_STATUS_QUEUED
+                ).update({
+                    self.task_model.status: TASK_STATUS_RUNNING,
+                    self.task_model.worker_id: self.worker_id,
+                    self.task_model.started_at: now,
+                    self.task_model.lease_expires_at: now + timedelta(seconds=TASK_QUEUE_LEASE_SECONDS),
+                    self.task_model.attempts: self.task_model.attempts + 1
+                }, synchronize_session=False)
+                db.commit()
+                if claimed:
+                    task = db.query(self.task_model).filter(self.task_model.id == task_id).first()
+                    return task.id, task.task_type, _loads(task.payload) or {}
+            return None
+        finally:
+            db.close()
+
+    def _recover_expired_leases(self):
+        """Requeue running tasks whose worker stopped heartbeating (crash/restart)"""
+        db = self.session_factory()
+        try:
+            expired = db.query(self.task_model).filter(
+                self.task_model.status == TASK_STATUS_RUNNING,
+                self.task_model.lease_expires_at < _utcnow()
+            ).all()
+            for task in expired:
+                if task.cancel_requested:
+                    task.status = TASK_STATUS_CANCELLED
+                    task.finished_at = _utcnow()
+                elif (task.attempts or 0) >= TASK_QUEUE_MAX_ATTEMPTS:
+                    task.status = TASK_STATUS_FAILED
+                    task.error = f"Task abandoned after {task.attempts} attempts (worker stopped)"
+                    task.finished_at = _utcnow()
+                else:
+                    task.status = TASK_STATUS_QUEUED
+                    task.worker_id = None
+                    task.lease_expires_at = None
+                print(f"Recovered task {task.id} from expired lease -> {task.status}")
+            if expired:
+                db.commit()
+        except Exception as e:
+            print(f"Task lease recovery failed: {e}")
+        finally:
+            db.close()
+
+    async def _execute(self, task_id: str, task_type: str, payload: Dict[str, Any]):
+        handler = self._handlers.get(task_type)
+        if handler is None:
+            await asyncio.to_thread(
+                self._finish, task_id, TASK_STATUS_FAILED, error=f"No handler registered for task type '{task_type}'"
+            )
+            return
+
+        run = asyncio.create_task(handler(payload, TaskContext(self, task_id)))
+        self._running[task_id] = run
+        heartbeat = asyncio.create_task(self._heartbeat(task_id, run))
+        try:
+            result = await run
+        except asyncio.CancelledError:
+            if self._stopping:
+                raise  # Shutting down: stop() requeues the task
+            await asyncio.to_thread(self._finish, task_id, TASK_STATUS_CANCELLED)
+        except Exception as e:
+            error = getattr(e, 'detail', None) or str(e) or type(e).__name__
+            print(f"Task {task_id} ({task_type}) failed: {error}")
+            await asyncio.to_thread(self._finish, task_id, TASK_STATUS_FAILED, error=str(error))
+        else:
+            result_id = result.get("result_id") if isinstance(result, dict) else None
+            await asyncio.to_thread(self._finish, task_id, TASK_STATUS_COMPLETED, result=result, result_id=result_id)
+        finally:
+            heartbeat.cancel()
+            self._running.pop(task_id, None)
+
+    async def _heartbeat(self, task_id: str, run: asyncio.Task):
+        """Extend the lease while the handler runs and honour cancel requests from any process"""
+        interval = max(1.0, TASK_QUEUE_LEASE_SECONDS / 3)
+        while not run.done():
+            await asyncio.sleep(interval)
+            if not await asyncio.to_thread(self._extend_lease, task_id):
+                run.cancel()
+                return
+
+    def _extend_lease(self, task_id: str) -> bool:
+        """Extend a running task's lease; False if the task is gone or a cancel was requested"""
+        db = self.session_factory()
+        try:
+            task = db.query(self.task_model).filter(self.task_model.id == task_id).first()
+            if task is None or task.cancel_requested:
+                return False
+            task.lease_expires_at = _utcnow() + timedelta(seconds=TASK_QUEUE_LEASE_SECONDS)
+            db.commit()
+        except Exception as e:
+            print(f"Task heartbeat failed for {task_id}: {e}")
+        finally:
+            db.close()
+        return True
+
+    def _update(self, task_id: str, **fields):
+        db = self.session_factory()
+        try:
+            db.query(self.task_model).filter(self.task_model.id == task_id).update(
+                {getattr(self.task_model, name): value for name, value in fields.items()},
+                synchronize_session=False
+            )
+            db.commit()
+        except Exception as e:
+            print(f"Could not update task {task_id}: {e}")
+        finally:
+            db.close()
+
+    def _finish(self, task_id: str, status: str, result: Any = None, result_id: Optional[str] = None,
+                error: Optional[str] = None):
+        self._update(
+            task_id,
+            status=status,
+            result=json.dumps(result, ensure_ascii=False, default=str) if result is not None else None,
+            result_id=result_id,
+            error=error,
+            lease_expires_at=None,
+            finished_at=_utcnow()
+        )
@@ -0,0 +1,167 @@
+"""
+Test script for GET /candidates queries and pagination
+Seeds a throwaway SQLite database and checks that listing candidates runs the same
+number of SQL statements for 5 and for 50 candidates (no per-candidate queries),
+and that cursor pages and fields= return every candidate once with only the asked fields
+"""
+import asyncio
+import os
+import tempfile
+
+# Use a throwaway database; must be set before main is imported
+_db_dir = tempfile.mkdtemp(prefix="candidates-queries-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_db_dir, 'test.db')}"
+
+from sqlalchemy import event
+
+import main
+from pagination import ListParams, decode_cursor
+
+MAX_QUERIES = 5
+
+
+def seed_candidates(count):
+    """Create a company, a job and count candidates with evaluations and conversations"""
+    db = main.SessionLocal()
+    try:
+        company = main.CompanyDB(name="Test Bureau", slug=f"test-bureau-{main.uuid4()}")
+        db.add(company)
+        db.flush()
+        job = main.JobPostingDB(title="Developer", company="Test BV", description="Python developer")
+        db.add(job)
+        db.flush()
+        for index in range(count):
+            candidate = main.CandidateDB(
+                name=f"Kandidaat {index}",
+                email=f"kandidaat{index}-{main.uuid4()}@example.com",
+                resume_text="Python, SQL",
+                job_id=job.id,
+                submitted_by_company_id=company.id
+            )
+            db.add(candidate)
+            db.flush()
+            for persona in list(main.PersonaEnum)[:2]:
+                db.add(main.EvaluationDB(candidate_id=candidate.id, job_id=job.id, persona=persona, result_summary="Goed"))
+            for conversation in range(index % 3):
+                db.add(main.CandidateConversationDB(
+                    candidate_id=candidate.id, job_id=job.id, title=f"Gesprek {conversation}", summary="Samenvatting"
+                ))
+        db.commit()
+    finally:
+        db.close()
+
+
+def reset_database():
+    main.Base.metadata.drop_all(bind=main.engine)
+    main.Base.metadata.create_all(bind=main.engine)
+
+
+def database_engines():
+    """The sync engine, and the async engine handlers use when its driver is installed"""
+    engines = [main.engine]
+    if main.AsyncSessionLocal is not None:
+        engines.append(main.AsyncSessionLocal.kw["bind"].sync_engine)
+    return engines
+
+
+def call_get_candidates(current_user, params):
+    async def call():
+        database = main.RequestDatabase(main.SessionLocal, main.AsyncSessionLocal)
+        try:
+            return await main.get_candidates(params=params, current_user=current_user, database=database)
+        finally:
+            await database.close()
+    return asyncio.run(call())
+
+
+def record_statements(function, *args):
+    """SQL statements executed while running function(*args), and its result"""
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    for engine in database_engines():
+        event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        result = function(*args)
+    finally:
+        for engine in database_engines():
+            event.remove(engine, "before_cursor_execute", before_cursor_execute)
+    return statements, result
+
+
+def count_queries(current_user, params=None):
+    """Number of SQL statements executed by GET /candidates, and its response"""
+    statements, response = record_statements(call_get_candidates, current_user, params or ListParams())
+    return len(statements), response
+
+
+def test_candidates_query_count_is_constant():
+    """GET /candidates must not issue queries per candidate"""
+    admin = main.UserDB(email="admin@example.com", name="Admin", role="admin")
+    counts = {}
+    for count in (5, 50):
+        reset_database()
+        seed_candidates(count)
+        queries, response = count_queries(admin)
+        assert len(response["candidates"]) == count
+        counts[count] = queries
+        print(f"{count} candidates: {queries} queries")
+
+    assert counts[5] > 0, "No statements recorded"
+    assert counts[5] == counts[50], f"Query count grows with candidates: {counts}"
+    assert counts[50] <= MAX_QUERIES, f"Too many queries: {counts[50]}"
+
+
+def test_candidates_response_contents():
+    """Job, evaluations, conversation count and company name are still returned"""
+    reset_database()
+    seed_candidates(3)
+    admin = main.UserDB(email="admin@example.com", name="Admin", role="admin")
+    _, response = count_queries(admin)
+    by_name = {candidate["name"]: candidate for candidate in response["candidates"]}
+    for index in range(3):
+        candidate = by_name[f"Kandidaat {index}"]
+        assert candidate["job"]["title"] == "Developer"
+        assert len(candidate["evaluations"]) == 2
+        assert candidate["conversation_count"] == index % 3
+        assert candidate["submitted_by_company_name"] == "Test Bureau"
+
+
+def test_candidates_cursor_pages():
+    """Following next_cursor returns every candidate exactly once, also with equal created_at"""
+    reset_database()
+    seed_candidates(23)
+    admin = main.UserDB(email="admin@example.com", name="Admin", role="admin")
+    for sort in ("-created_at", "name"):
+        seen = []
+        cursor = None
+        while True:
+            queries, response = count_queries(admin, ListParams(limit=5, cursor=cursor, sort=sort))
+            assert len(response["candidates"]) <= 5
+            assert queries <= MAX_QUERIES
+            seen.extend(candidate["id"] for candidate in response["candidates"])
+            if not response["next_cursor"]:
+                break
+            cursor = decode_cursor(response["next_cursor"])
+        assert len(seen) == 23 and len(set(seen)) == 23, f"{sort}: {len(seen)} rows, {len(set(seen))} unique"
+
+
+def test_candidates_fields():
+    """fields= limits the response and leaves resume_text unloaded"""
+    reset_database()
+    seed_candidates(3)
+    admin = main.UserDB(email="admin@example.com", name="Admin", role="admin")
+    statements, response = record_statements(call_get_candidates, admin, ListParams(fields=["name", "email"]))
+    for candidate in response["candidates"]:
+        assert set(candidate) == {"id", "name", "email"}
+    assert not any("resume_text" in statement for statement in statements)
+
+
+if __name__ == "__main__":
+    test_candidates_query_count_is_constant()
+    test_candidates_response_contents()
+    test_candidates_cursor_pages()
+    test_candidates_fields()
+    print("All tests passed")
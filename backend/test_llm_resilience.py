@@ -0,0 +1,83 @@
+"""
+Test script for the OpenAI retry/hedge/circuit layer
+Runs call_async against fake calls (no API key or network needed) and checks that the
+circuit breaker recovers when its half-open trial call is cancelled, and that
+time queued for governor admission neither triggers a hedge nor counts as latency
+"""
+import asyncio
+from contextlib import asynccontextmanager
+
+import llm_resilience
+from llm_resilience import CircuitOpenError, LLMResilience
+
+
+def test_cancelled_trial_releases_circuit():
+    """Cancelling the half-open trial call lets the next call through instead of failing fast forever"""
+    resilience = LLMResilience()
+    breaker = resilience.breaker("test-model")
+    breaker.reset_seconds = 0.05
+    for _ in range(breaker.failure_threshold):
+        breaker.record_failure()
+    assert breaker.state == 'open'
+
+    async def scenario():
+        async def rejected():
+            return "should not run"
+        try:
+            await resilience.call_async("test-model", rejected, hedge=False)
+            raise AssertionError("Call went through an open circuit")
+        except CircuitOpenError:
+            pass
+
+        await asyncio.sleep(breaker.reset_seconds)
+        started = asyncio.Event()
+
+        async def hanging():
+            started.set()
+            await asyncio.sleep(60)
+        trial = asyncio.ensure_future(resilience.call_async("test-model", hanging, hedge=False))
+        await started.wait()
+        assert breaker.state == 'half_open' and breaker.trial_in_progress
+        trial.cancel()
+        try:
+            await trial
+        except asyncio.CancelledError:
+            pass
+
+        async def succeeding():
+            return "ok"
+        return await resilience.call_async("test-model", succeeding, hedge=False)
+
+    assert asyncio.run(scenario()) == "ok"
+    assert breaker.state == 'closed'
+
+
+def test_queued_call_is_not_hedged(monkeypatch):
+    """A call waiting in the admission queue past the hedge delay fires no duplicate"""
+    monkeypatch.setattr(llm_resilience, "OPENAI_HEDGE_MIN_DELAY_SECONDS", 0.1)
+    resilience = LLMResilience()
+    tracker = resilience.latency("test-model")
+    for _ in range(llm_resilience.OPENAI_HEDGE_MIN_SAMPLES):
+        tracker.record(0.01)
+    hedge_after = resilience.hedge_delay("test-model")
+    assert hedge_after is not None
+    calls = []
+
+    @asynccontextmanager
+    async def slow_admission():
+        await asyncio.sleep(hedge_after * 1.5)
+        yield "ticket"
+
+    async def fast_call(ticket):
+        calls.append(ticket)
+        return "ok"
+
+    assert asyncio.run(resilience.call_async("test-model", fast_call, admit=slow_admission)) == "ok"
+    assert calls == ["ticket"]
+    assert resilience.stats['hedges'] == 0
+    assert tracker.percentile(100) < hedge_after, "Queue time was recorded as latency"
+
+
+if __name__ == "__main__":
+    import pytest
+    raise SystemExit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,190 @@
+"""
+Test script for the secondary indexes of the models
+Creates a throwaway SQLite database and checks with EXPLAIN QUERY PLAN that the hot
+lookup queries use their index, that the list endpoints' own paginated queries read their
+index in order (no temp B-tree sort) on the first and later pages, and that missing indexes
+are created idempotently
+"""
+import asyncio
+import os
+import tempfile
+
+# Use a throwaway database; must be set before main is imported
+_db_dir = tempfile.mkdtemp(prefix="query-plans-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_db_dir, 'test.db')}"
+
+from sqlalchemy import event, inspect, text
+
+import main
+from pagination import ListParams, decode_cursor
+
+
+def query_plan(query):
+    """SQLite query plan of an ORM query, as one string"""
+    sql = str(query.statement.compile(dialect=main.engine.dialect, compile_kwargs={"literal_binds": True}))
+    with main.engine.connect() as connection:
+        return "\n".join(row[-1] for row in connection.execute(text(f"EXPLAIN QUERY PLAN {sql}")))
+
+
+def assert_uses_index(query, index_name):
+    plan = query_plan(query)
+    assert f"INDEX {index_name}" in plan, f"Expected {index_name} in plan:\n{plan}"
+
+
+def database_engines():
+    """The sync engine, and the async engine handlers use when its driver is installed"""
+    engines = [main.engine]
+    if main.AsyncSessionLocal is not None:
+        engines.append(main.AsyncSessionLocal.kw["bind"].sync_engine)
+    return engines
+
+
+def call_endpoint(endpoint, **kwargs):
+    """Run a list endpoint; returns its response and the plans of its paginated (LIMIT) statements"""
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if "ORDER BY" in statement and "LIMIT" in statement:
+            statements.append((statement, parameters))
+
+    async def call():
+        database = main.RequestDatabase(main.SessionLocal, main.AsyncSessionLocal)
+        try:
+            return await endpoint(database=database, **kwargs)
+        finally:
+            await database.close()
+
+    for engine in database_engines():
+        event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        response = asyncio.run(call())
+    finally:
+        for engine in database_engines():
+            event.remove(engine, "before_cursor_execute", before_cursor_execute)
+    plans = []
+    with main.engine.connect() as connection:
+        for statement, parameters in statements:
+            rows = connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters)
+            plans.append("\n".join(row[-1] for row in rows))
+    return response, plans
+
+
+def assert_pages_read_index(endpoint, items_key, index_name, **kwargs):
+    """First and second page of a list endpoint use index_name and never sort in a temp B-tree"""
+    cursor = None
+    for page in range(2):
+        response, plans = call_endpoint(endpoint, params=ListParams(limit=3, cursor=cursor), **kwargs)
+        assert len(plans) == 1, f"Expected one paginated statement, got {len(plans)}"
+        assert f"INDEX {index_name}" in plans[0], f"Page {page + 1}: expected {index_name} in plan:\n{plans[0]}"
+        assert "TEMP B-TREE" not in plans[0], f"Page {page + 1} sorts all rows:\n{plans[0]}"
+        assert len(response[items_key]) == 3
+        cursor = decode_cursor(response["next_cursor"])
+
+
+def seed_list_rows(count=8):
+    """A company with count candidates, each with an evaluation result, and count comments on the first;
+    returns (company id, first candidate id)"""
+    db = main.SessionLocal()
+    try:
+        company = main.CompanyDB(name="Test Bureau", slug=f"test-bureau-{main.uuid4()}")
+        db.add(company)
+        db.flush()
+        job = main.JobPostingDB(title="Developer", company="Test BV", description="Python developer", company_id=company.id)
+        db.add(job)
+        db.flush()
+        candidate_ids = []
+        for index in range(count):
+            candidate = main.CandidateDB(
+                name=f"Kandidaat {index}", email=f"kandidaat{index}-{main.uuid4()}@example.com", resume_text="Python",
+                job_id=job.id, submitted_by_company_id=company.id
+            )
+            db.add(candidate)
+            db.flush()
+            db.add(main.EvaluationResultDB(
+                candidate_id=candidate.id, job_id=job.id, result_type="evaluation", result_data="{}"
+            ))
+            candidate_ids.append(candidate.id)
+        for index in range(count):
+            db.add(main.CommentDB(candidate_id=candidate_ids[0], user_id="u", content=f"Opmerking {index}"))
+        db.commit()
+        return company.id, candidate_ids[0]
+    finally:
+        db.close()
+
+
+def test_hot_queries_use_indexes():
+    """Each hot lookup query is an index search, not a table scan"""
+    db = main.SessionLocal()
+    try:
+        evaluation_results = db.query(main.EvaluationResultDB)
+        # Latest non-archived evaluation of a candidate for a job
+        assert_uses_index(evaluation_results.filter(
+            main.EvaluationResultDB.candidate_id == "c",
+            main.EvaluationResultDB.job_id == "j",
+            main.EvaluationResultDB.result_type == "evaluation",
+            main.EvaluationResultDB.is_archived == False
+        ), "ix_evaluation_results_candidate_job")
+        # Archiving the previous results of a job on re-evaluation
+        assert_uses_index(evaluation_results.filter(
+            main.EvaluationResultDB.job_id == "j",
+            main.EvaluationResultDB.result_type == "evaluation",
+            main.EvaluationResultDB.is_archived == False
+        ), "ix_evaluation_results_job_type")
+
+        # Unread notifications of a user, newest first
+        assert_uses_index(db.query(main.NotificationDB).filter(
+            main.NotificationDB.user_id == "u",
+            main.NotificationDB.is_read == False
+        ).order_by(main.NotificationDB.created_at.desc()), "ix_notifications_user_read_created")
+
+        # Watchers of a job use the unique constraint's index; jobs watched by a user their own
+        assert_uses_index(db.query(main.JobWatcherDB).filter(main.JobWatcherDB.job_id == "j"), "sqlite_autoindex_job_watchers")
+        assert_uses_index(db.query(main.JobWatcherDB).filter(main.JobWatcherDB.user_id == "u"), "ix_job_watchers_user_id")
+
+        assert_uses_index(db.query(main.JobPostingDB.id).filter(main.JobPostingDB.company_id == "co"), "ix_job_postings_company_id")
+
+        assert_uses_index(db.query(main.ScheduledAppointmentDB).filter(
+            main.ScheduledAppointmentDB.job_id == "j"
+        ).order_by(main.ScheduledAppointmentDB.scheduled_at.asc()), "ix_scheduled_appointments_job_scheduled")
+        assert_uses_index(db.query(main.ScheduledAppointmentDB).filter(
+            main.ScheduledAppointmentDB.scheduled_at >= "2026-01-01"
+        ), "ix_scheduled_appointments_scheduled_at")
+
+        # Company users' candidate view: preferential jobs through candidate_job_links
+        assert_uses_index(db.query(main.CandidateDB.id).filter(
+            main.CandidateDB.id.in_(main.candidates_linked_to_jobs(["j1", "j2"]))
+        ), "ix_candidate_job_links_job_candidate")
+    finally:
+        db.close()
+
+
+def test_list_pages_read_index_in_order():
+    """The list endpoints' paginated queries walk their (..., created_at, id) index, also after a cursor"""
+    company_id, candidate_id = seed_list_rows()
+    admin = main.UserDB(email="admin@example.com", name="Admin", role="admin")
+    recruiter = main.UserDB(email="recruiter@example.com", name="Recruiter", role="recruiter", company_id=company_id)
+
+    assert_pages_read_index(main.get_candidates, "candidates", "ix_candidates_created_id", current_user=admin)
+    assert_pages_read_index(main.get_candidates, "candidates", "ix_candidates_submitted_by_company_created_id",
+                            current_user=recruiter)
+    assert_pages_read_index(main.get_recruiter_candidates, "candidates", "ix_candidates_created_id", current_user=admin)
+    assert_pages_read_index(main.get_evaluation_results, "results", "ix_evaluation_results_archived_created_id")
+    assert_pages_read_index(main.get_comments, "comments", "ix_comments_candidate_created_id",
+                            candidate_id=candidate_id, job_id=None, result_id=None)
+
+
+def test_missing_indexes_are_created():
+    """ensure_indexes_exist adds indexes an existing database lacks and can run repeatedly"""
+    with main.engine.begin() as connection:
+        connection.execute(text("DROP INDEX ix_notifications_user_read_created"))
+    main.ensure_indexes_exist()
+    main.ensure_indexes_exist()
+    indexes = [index["name"] for index in inspect(main.engine).get_indexes("notifications")]
+    assert "ix_notifications_user_read_created" in indexes
+
+
+if __name__ == "__main__":
+    test_hot_queries_use_indexes()
+    test_list_pages_read_index_in_order()
+    test_missing_indexes_are_created()
+    print("All tests passed")
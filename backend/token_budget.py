@@ -0,0 +1,189 @@
+"""
+Token Budget - Tokenizer-based prompt budgeting for OpenAI calls
+Counts tokens with the model's BPE encoding (tiktoken) and divides a per-call input budget
+across prompt sections (CV, motivation, job description, company note) by priority.
+
+The BPE files are read from TOKENIZER_CACHE_DIR so no network access is needed at runtime;
+run scripts/download_tokenizer.py once at build time to fill it. If the encoding cannot be
+loaded, counts fall back to a conservative character-based estimate.
+"""
+from functools import lru_cache
+from typing import Dict, List, Optional, Union
+import os
+
+# Import config
+try:
+    from config import (
+        OPENAI_MAX_INPUT_TOKENS, OPENAI_MODEL_CONTEXT_WINDOWS, PROMPT_SECTION_LIMITS,
+        TOKENIZER_CACHE_DIR, TOKENIZER_DEFAULT_ENCODING, TOKEN_COUNT_CACHE_SIZE
+    )
+except ImportError:
+    OPENAI_MAX_INPUT_TOKENS = 4000
+    OPENAI_MODEL_CONTEXT_WINDOWS = {"gpt-4o-mini": 128000, "gpt-4": 8192}
+    PROMPT_SECTION_LIMITS = {}
+    TOKENIZER_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "tokenizer_cache")
+    TOKENIZER_DEFAULT_ENCODING = "o200k_base"
+    TOKEN_COUNT_CACHE_SIZE = 4096
+
+# tiktoken reads its BPE files from this directory before trying to download them
+if TOKENIZER_CACHE_DIR and not os.environ.get("TIKTOKEN_CACHE_DIR"):
+    os.environ["TIKTOKEN_CACHE_DIR"] = TOKENIZER_CACHE_DIR
+
+try:
+    import tiktoken
+    TIKTOKEN_AVAILABLE = True
+except ImportError:
+    TIKTOKEN_AVAILABLE = False
+    print("Warning: 'tiktoken' not available. Token counts will be estimated from text length.")
+
+TRUNCATION_MARKER = "\n\n[Content truncated for processing...]"
+TOKENS_PER_MESSAGE = 3  # Chat format overhead per message (role + separators)
+TOKENS_PER_REPLY = 3  # Every reply is primed with <|start|>assistant<|message|>
+FALLBACK_CHARS_PER_TOKEN = 3  # Conservative for Dutch text; overestimates rather than overruns
+
+DEFAULT_SECTION_LIMIT = {"priority": 99, "min_tokens": 0, "max_tokens": None}
+
+
+def _encoding_name_for_model(model: Optional[str]) -> str:
+    if model and TIKTOKEN_AVAILABLE:
+        try:
+            return tiktoken.encoding_name_for_model(model)
+        except KeyError:
+            pass
+    return TOKENIZER_DEFAULT_ENCODING
+
+
+@lru_cache(maxsize=None)
+def _get_encoding(encoding_name: str):
+    """Load a BPE encoding once per process, or None if it is unavailable offline"""
+    if not TIKTOKEN_AVAILABLE:
+        return None
+    try:
+        return tiktoken.get_encoding(encoding_name)
+    except Exception as e:
+        print(f"Warning: Could not load tokenizer '{encoding_name}' ({type(e).__name__}). "
+              f"Run scripts/download_tokenizer.py to install it. Using length-based estimates.")
+        return None
+
+
+def get_encoding(model: Optional[str] = None):
+    """Get the BPE encoding for a model (None when falling back to estimates)"""
+    return _get_encoding(_encoding_name_for_model(model))
+
+
+@lru_cache(maxsize=TOKEN_COUNT_CACHE_SIZE)
+def _count_tokens_cached(text: str, encoding_name: str) -> int:
+    encoding = _get_encoding(encoding_name)
+    if encoding is None:
+        return -(-len(text) // FALLBACK_CHARS_PER_TOKEN)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def count_tokens(text: Optional[str], model: Optional[str] = None) -> int:
+    """Count tokens in a string (memoized per string and encoding)"""
+    if not text:
+        return 0
+    return _count_tokens_cached(text, _encoding_name_for_model(model))
+
+
+def count_message_tokens(messages: List[Dict], model: Optional[str] = None) -> int:
+    """Count the prompt tokens of a chat request including per-message overhead"""
+    total = TOKENS_PER_REPLY
+    for message in messages:
+        total += TOKENS_PER_MESSAGE + count_tokens(message.get('content') or '', model)
+    return total
+
+
+def get_input_token_limit(model: Optional[str], max_tokens: int = 0) -> int:
+    """Maximum prompt tokens for a call: the configured cap, bounded by what the context window leaves"""
+    context_window = OPENAI_MODEL_CONTEXT_WINDOWS.get(model or '', None)
+    if context_window is None:
+        return OPENAI_MAX_INPUT_TOKENS
+    return max(0, min(OPENAI_MAX_INPUT_TOKENS, context_window - (max_tokens or 0)))
+
+
+def truncate_to_tokens(text: Optional[str], max_tokens: int, model: Optional[str] = None,
+                       marker: str = TRUNCATION_MARKER) -> str:
+    """Cut text to at most max_tokens tokens (marker included), preferring a line or word boundary"""
+    if not text:
+        return text or ""
+    if count_tokens(text, model) <= max_tokens:
+        return text
+    keep_tokens = max_tokens - count_tokens(marker, model)
+    if keep_tokens <= 0:
+        return ""
+
+    encoding = get_encoding(model)
+    if encoding is None:
+        head = text[:keep_tokens * FALLBACK_CHARS_PER_TOKEN]
+    else:
+        head = encoding.decode(encoding.encode(text, disallowed_special=())[:keep_tokens])
+
+    # Don't end mid-word/mid-line if a boundary is reasonably close
+    boundary = max(head.rfind('\n'), head.rfind(' '))
+    if boundary > len(head) * 0.8:
+        head = head[:boundary]
+    return head.rstrip() + marker
+
+
+def allocate_token_budget(sections: Dict[str, Optional[str]], budget_tokens: int,
+                          model: Optional[str] = None) -> Dict[str, str]:
+    """Divide budget_tokens across named prompt sections and truncate each to its share.
+
+    Limits per section come from PROMPT_SECTION_LIMITS (priority, min_tokens, max_tokens).
+    Every section first gets its minimum (in priority order), then the remaining budget is
+    handed out in priority order up to each section's cap. Budget a short section doesn't
+    need flows to the next one instead of being wasted.
+    """
+    names = [name for name, text in sections.items() if text]
+    ordered = sorted(names, key=lambda name: PROMPT_SECTION_LIMITS.get(name, DEFAULT_SECTION_LIMIT).get('priority', 99))
+
+    needs = {}
+    for name in ordered:
+        limits = PROMPT_SECTION_LIMITS.get(name, DEFAULT_SECTION_LIMIT)
+        need = count_tokens(sections[name], model)
+        if limits.get('max_tokens') is not None:
+            need = min(need, limits['max_tokens'])
+        needs[name] = need
+
+    remaining = max(0, budget_tokens)
+    grants = {name: 0 for name in ordered}
+    for name in ordered:
+        floor = min(needs[name], PROMPT_SECTION_LIMITS.get(name, DEFAULT_SECTION_LIMIT).get('min_tokens', 0))
+        grants[name] = min(floor, remaining)
+        remaining -= grants[name]
+    for name in ordered:
+        extra = min(needs[name] - grants[name], remaining)
+        grants[name] += extra
+        remaining -= extra
+
+    return {
+        name: truncate_to_tokens(text, grants[name], model) if name in grants else (text or "")
+        for name, text in sections.items()
+    }
+
+
+def fit_prompt_sections(sections: Dict[str, Optional[str]], fixed_text: Union[str, List[str]],
+                        model: Optional[str], max_tokens: int, reserve_tokens: int = 0) -> Dict[str, str]:
+    """Allocate whatever the call's input limit leaves after the fixed prompt parts to the sections"""
+    fixed_parts = [fixed_text] if isinstance(fixed_text, str) else fixed_text
+    fixed_tokens = sum(count_tokens(part, model) for part in fixed_parts)
+    overhead = TOKENS_PER_REPLY + 2 * TOKENS_PER_MESSAGE  # System + user message
+    budget = get_input_token_limit(model, max_tokens) - fixed_tokens - overhead - reserve_tokens
+    return allocate_token_budget(sections, budget, model)
+
+
+def fit_messages(messages: List[Dict], model: Optional[str], max_tokens: int) -> List[Dict]:
+    """Last-resort guard: truncate the final message so the request never exceeds the input limit"""
+    limit = get_input_token_limit(model, max_tokens)
+    total = count_message_tokens(messages, model)
+    if total <= limit or not messages:
+        return messages
+    last_message = messages[-1]
+    last_tokens = count_tokens(last_message.get('content') or '', model)
+    allowed = max(0, last_tokens - (total - limit))
+    print(f"Prompt is {total} tokens (limit {limit}); truncating last message to {allowed} tokens")
+    return messages[:-1] + [{
+        **last_message,
+        'content': truncate_to_tokens(last_message.get('content') or '', allowed, model)
+    }]
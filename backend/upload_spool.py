@@ -0,0 +1,126 @@
+"""
+Upload Spool - Streams uploaded documents to a temporary file instead of reading them into memory
+The upload is copied in UPLOAD_CHUNK_BYTES chunks, hashed on the way (extraction cache key) and
+rejected once it exceeds UPLOAD_MAX_BYTES. Its type is sniffed from the magic bytes, and extractors
+read the spooled file by path, so memory per upload stays flat whatever the file size.
+Zip archives (bulk CV submissions) are unpacked member by member the same way.
+"""
+from typing import List, Optional, Tuple
+import asyncio
+import hashlib
+import os
+import tempfile
+import zipfile
+
+from document_extraction import SNIFF_BYTES, sniff_document_type
+
+# Import config
+try:
+    from config import UPLOAD_MAX_BYTES, UPLOAD_CHUNK_BYTES, UPLOAD_SPOOL_DIR
+except ImportError:
+    UPLOAD_MAX_BYTES = 20 * 1024 * 1024
+    UPLOAD_CHUNK_BYTES = 1024 * 1024
+    UPLOAD_SPOOL_DIR = None
+
+
+class UploadTooLargeError(ValueError):
+    """The upload is larger than UPLOAD_MAX_BYTES"""
+
+    def __init__(self, filename: str, max_bytes: int):
+        super().__init__(f"{filename} is larger than {max_bytes} bytes")
+        self.filename = filename
+        self.max_bytes = max_bytes
+
+
+class SpooledUpload:
+    """An uploaded file on disk; delete it with close() (or use it as a context manager)"""
+
+    def __init__(self, path: str, filename: str, size: int, sha256: str, document_type: str):
+        self.path = path
+        self.filename = filename
+        self.size = size
+        self.sha256 = sha256
+        self.document_type = document_type
+
+    def close(self):
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+    def __enter__(self) -> "SpooledUpload":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _spool_stream(stream, filename: str, max_bytes: Optional[int], chunk_size: int) -> SpooledUpload:
+    """Copy a binary stream to a temporary file (blocking; run in a thread)"""
+    handle = tempfile.NamedTemporaryFile(prefix="upload-", dir=UPLOAD_SPOOL_DIR, delete=False)
+    digest = hashlib.sha256()
+    size = 0
+    head = b""
+    try:
+        while True:
+            chunk = stream.read(chunk_size)
+            if not chunk:
+                break
+            size += len(chunk)
+            if max_bytes and size > max_bytes:
+                raise UploadTooLargeError(filename, max_bytes)
+            if len(head) < SNIFF_BYTES:
+                head += chunk[:SNIFF_BYTES - len(head)]
+            digest.update(chunk)
+            handle.write(chunk)
+        handle.close()
+        document_type = sniff_document_type(handle.name, head)
+    except BaseException:
+        handle.close()
+        os.unlink(handle.name)
+        raise
+    return SpooledUpload(handle.name, filename, size, digest.hexdigest(), document_type)
+
+
+def spool_zip_members(archive: SpooledUpload, max_files: int, max_bytes: Optional[int] = UPLOAD_MAX_BYTES,
+                      chunk_size: int = UPLOAD_CHUNK_BYTES) -> List[Tuple[str, Optional[SpooledUpload], Optional[str]]]:
+    """Spool every file in a zip archive: [(member name, spooled file or None, error or None)].
+
+    Directories and macOS metadata are skipped. Sizes are counted while unpacking (not taken from the
+    archive's headers), so a zip bomb stops at max_bytes per member. Raises ValueError for an invalid
+    archive or more than max_files members.
+    """
+    try:
+        zip_file = zipfile.ZipFile(archive.path)
+    except zipfile.BadZipFile:
+        raise ValueError(f"{archive.filename} is not a valid zip archive")
+    with zip_file:
+        members = [
+            member for member in zip_file.infolist()
+            if not member.is_dir() and not member.filename.startswith('__MACOSX/')
+            and not os.path.basename(member.filename).startswith('.')
+        ]
+        if len(members) > max_files:
+            raise ValueError(f"{archive.filename} contains {len(members)} files (maximum {max_files})")
+        spooled = []
+        for member in members:
+            filename = os.path.basename(member.filename)
+            try:
+                with zip_file.open(member) as stream:
+                    spooled.append((filename, _spool_stream(stream, filename, max_bytes, chunk_size), None))
+            except UploadTooLargeError as e:
+                spooled.append((filename, None, str(e)))
+            except Exception as e:
+                spooled.append((filename, None, f"Could not unpack {filename}: {str(e)}"))
+        return spooled
+
+
+async def spool_upload(upload, max_bytes: Optional[int] = UPLOAD_MAX_BYTES,
+                       chunk_size: int = UPLOAD_CHUNK_BYTES) -> SpooledUpload:
+    """Copy a FastAPI UploadFile to a temporary file; raises UploadTooLargeError past max_bytes"""
+    filename = upload.filename or "upload"
+    if max_bytes and getattr(upload, 'size', None) and upload.size > max_bytes:
+        raise UploadTooLargeError(filename, max_bytes)
+    await upload.seek(0)
+    # upload.file is Starlette's own (memory or disk) spool; copying it blocks, so run it in a thread
+    return await asyncio.to_thread(_spool_stream, upload.file, filename, max_bytes, chunk_size)
@@ -1,28 +1,192 @@
 """
 Workflow Progress Tracker - Stores real-time progress during debate execution
+Progress lives in a pluggable backend: in-memory (single process) or a SQLite file that all
+uvicorn workers on the host share. Sessions expire after WORKFLOW_PROGRESS_TTL_SECONDS without
+updates and the store keeps at most WORKFLOW_PROGRESS_MAX_SESSIONS (least recently updated go
+first). subscribe() pushes every change to a client instead of having it poll.
 """
-from typing import Dict, List, Optional
+from collections import OrderedDict
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+import asyncio
+import json
+import os
+import sqlite3
+import threading
 import time
 from datetime import datetime
 
-# In-memory store for progress (in production, use Redis or similar)
-_progress_store: Dict[str, Dict] = {}
+# Import config
+try:
+    from config import (
+        WORKFLOW_PROGRESS_BACKEND, WORKFLOW_PROGRESS_SQLITE_PATH, WORKFLOW_PROGRESS_TTL_SECONDS,
+        WORKFLOW_PROGRESS_MAX_SESSIONS, WORKFLOW_PROGRESS_POLL_INTERVAL_SECONDS
+    )
+except ImportError:
+    WORKFLOW_PROGRESS_BACKEND = "sqlite"
+    WORKFLOW_PROGRESS_SQLITE_PATH = "workflow_progress.db"
+    WORKFLOW_PROGRESS_TTL_SECONDS = 3600
+    WORKFLOW_PROGRESS_MAX_SESSIONS = 1000
+    WORKFLOW_PROGRESS_POLL_INTERVAL_SECONDS = 0.5
+
+FINISHED_STATUSES = ('completed', 'failed')
+
+
+class MemoryProgressBackend:
+    """Progress in this process only (single worker, tests)"""
+
+    def __init__(self, ttl_seconds: float = WORKFLOW_PROGRESS_TTL_SECONDS,
+                 max_sessions: int = WORKFLOW_PROGRESS_MAX_SESSIONS):
+        self.ttl_seconds = ttl_seconds
+        self.max_sessions = max_sessions
+        self._entries: "OrderedDict[str, Tuple[Dict, int, float]]" = OrderedDict()  # id -> (progress, version, updated_at)
+        self._lock = threading.Lock()
+
+    def _evict(self, now: float):
+        while self._entries:
+            session_id, (_, _, updated_at) = next(iter(self._entries.items()))
+            if len(self._entries) > self.max_sessions or now - updated_at > self.ttl_seconds:
+                del self._entries[session_id]
+            else:
+                break
+
+    def put(self, session_id: str, progress: Dict) -> int:
+        now = time.time()
+        with self._lock:
+            version = self._entries[session_id][1] + 1 if session_id in self._entries else 1
+            self._entries[session_id] = (progress, version, now)
+            self._entries.move_to_end(session_id)
+            self._evict(now)
+            return version
+
+    def get(self, session_id: str) -> Optional[Tuple[Dict, int]]:
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is None:
+                return None
+            if time.time() - entry[2] > self.ttl_seconds:
+                del self._entries[session_id]
+                return None
+            return entry[0], entry[1]
+
+    def delete(self, session_id: str):
+        with self._lock:
+            self._entries.pop(session_id, None)
+
+    def count(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+
+class SQLiteProgressBackend:
+    """Progress in a SQLite file, shared by every worker process on the host"""
+
+    def __init__(self, path: str = WORKFLOW_PROGRESS_SQLITE_PATH, ttl_seconds: float = WORKFLOW_PROGRESS_TTL_SECONDS,
+                 max_sessions: int = WORKFLOW_PROGRESS_MAX_SESSIONS):
+        if not os.path.isabs(path):
+            path = os.path.join(os.path.dirname(os.path.abspath(__file__)), path)
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_sessions = max_sessions
+        self._local = threading.local()
+        with self._connect() as connection:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS workflow_progress ("
+                "session_id TEXT PRIMARY KEY, data TEXT NOT NULL, version INTEGER NOT NULL, updated_at REAL NOT NULL)"
+            )
+            connection.execute("CREATE INDEX IF NOT EXISTS ix_workflow_progress_updated_at ON workflow_progress (updated_at)")
+
+    def _connect(self) -> sqlite3.Connection:
+        # One connection per thread; sqlite3 connections are not shareable between threads
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5.0)
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def put(self, session_id: str, progress: Dict) -> int:
+        now = time.time()
+        connection = self._connect()
+        with connection:
+            row = connection.execute(
+                "INSERT INTO workflow_progress (session_id, data, version, updated_at) VALUES (?, ?, 1, ?) "
+                "ON CONFLICT(session_id) DO UPDATE SET data = excluded.data, version = version + 1, "
+                "updated_at = excluded.updated_at RETURNING version",
+                (session_id, json.dumps(progress, ensure_ascii=False), now)
+            ).fetchone()
+            if row[0] == 1:
+                # New session: drop expired sessions and keep the store bounded
+                connection.execute("DELETE FROM workflow_progress WHERE updated_at < ?", (now - self.ttl_seconds,))
+                connection.execute(
+                    "DELETE FROM workflow_progress WHERE session_id IN (SELECT session_id FROM workflow_progress "
+                    "ORDER BY updated_at DESC LIMIT -1 OFFSET ?)", (self.max_sessions,)
+                )
+        return row[0]
+
+    def get(self, session_id: str) -> Optional[Tuple[Dict, int]]:
+        row = self._connect().execute(
+            "SELECT data, version FROM workflow_progress WHERE session_id = ? AND updated_at >= ?",
+            (session_id, time.time() - self.ttl_seconds)
+        ).fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0]), row[1]
+
+    def delete(self, session_id: str):
+        connection = self._connect()
+        with connection:
+            connection.execute("DELETE FROM workflow_progress WHERE session_id = ?", (session_id,))
+
+    def count(self) -> int:
+        return self._connect().execute("SELECT COUNT(*) FROM workflow_progress").fetchone()[0]
+
+
+# Global backend instance (singleton pattern)
+_backend = None
+_backend_lock = threading.Lock()
+# Subscribers in this process, woken right away when this process writes their session
+_subscribers: Dict[str, List[Tuple[asyncio.AbstractEventLoop, asyncio.Event]]] = {}
+
+def get_progress_backend():
+    """Get or create the configured progress backend"""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                if WORKFLOW_PROGRESS_BACKEND == "sqlite":
+                    _backend = SQLiteProgressBackend()
+                else:
+                    _backend = MemoryProgressBackend()
+    return _backend
+
+def set_progress_backend(backend) -> None:
+    """Replace the progress backend (e.g. MemoryProgressBackend in tests)"""
+    global _backend
+    _backend = backend
+
+def _save(session_id: str, progress: Dict) -> None:
+    get_progress_backend().put(session_id, progress)
+    for loop, event in list(_subscribers.get(session_id, [])):
+        loop.call_soon_threadsafe(event.set)
 
 def create_progress_session(session_id: str) -> None:
     """Create a new progress session"""
-    _progress_store[session_id] = {
+    _save(session_id, {
         'start_time': time.time(),
         'steps': [],
         'current_step': None,
         'status': 'running',
         'message': 'Initializing...'
-    }
+    })
 
 def update_progress(session_id: str, step: str, agent: str, duration: float, message: str = None):
     """Update progress for a specific step"""
-    if session_id not in _progress_store:
+    progress = get_progress(session_id)
+    if progress is None:
         create_progress_session(session_id)
-    
+        progress = get_progress(session_id)
+
     step_data = {
         'step': step,
         'agent': agent,
@@ -30,24 +194,72 @@ def update_progress(session_id: str, step: str, agent: str, duration: float, mes
         'timestamp': time.time(),
         'message': message or f"{agent} executing {step}"
     }
-    
-    _progress_store[session_id]['steps'].append(step_data)
-    _progress_store[session_id]['current_step'] = step
-    _progress_store[session_id]['message'] = message or f"{agent} executing {step}"
+
+    progress['steps'].append(step_data)
+    progress['current_step'] = step
+    progress['message'] = message or f"{agent} executing {step}"
+    _save(session_id, progress)
 
 def get_progress(session_id: str) -> Optional[Dict]:
     """Get current progress for a session"""
-    return _progress_store.get(session_id)
+    entry = get_progress_backend().get(session_id)
+    return entry[0] if entry else None
 
 def complete_progress(session_id: str, total_duration: float):
     """Mark progress as complete"""
-    if session_id in _progress_store:
-        _progress_store[session_id]['status'] = 'completed'
-        _progress_store[session_id]['total'] = total_duration
-        _progress_store[session_id]['end_time'] = time.time()
+    progress = get_progress(session_id)
+    if progress is not None:
+        progress['status'] = 'completed'
+        progress['total'] = total_duration
+        progress['end_time'] = time.time()
+        _save(session_id, progress)
+
+def fail_progress(session_id: str, error: str):
+    """Mark progress as failed"""
+    progress = get_progress(session_id)
+    if progress is not None:
+        progress['status'] = 'failed'
+        progress['message'] = error
+        progress['end_time'] = time.time()
+        _save(session_id, progress)
 
 def clear_progress(session_id: str):
     """Clear progress for a session (cleanup)"""
-    if session_id in _progress_store:
-        del _progress_store[session_id]
+    get_progress_backend().delete(session_id)
+
+async def subscribe(session_id: str, poll_interval: float = WORKFLOW_PROGRESS_POLL_INTERVAL_SECONDS,
+                    timeout: Optional[float] = None) -> AsyncIterator[Dict]:
+    """Yield the session's progress every time it changes, until it completes, fails or expires.
 
+    Writes from this process wake the subscriber immediately; writes from other workers are
+    picked up within poll_interval (a primary-key lookup on the shared store).
+    """
+    event = asyncio.Event()
+    registration = (asyncio.get_running_loop(), event)
+    _subscribers.setdefault(session_id, []).append(registration)
+    started = time.monotonic()
+    last_version = 0
+    try:
+        while True:
+            event.clear()
+            entry = await asyncio.to_thread(get_progress_backend().get, session_id)
+            if entry is None:
+                if last_version:
+                    return  # Cleared or expired
+            elif entry[1] != last_version:
+                last_version = entry[1]
+                yield entry[0]
+                if entry[0].get('status') in FINISHED_STATUSES:
+                    return
+            if timeout is not None and time.monotonic() - started > timeout:
+                return
+            try:
+                await asyncio.wait_for(event.wait(), poll_interval)
+            except asyncio.TimeoutError:
+                pass
+    finally:
+        registrations = _subscribers.get(session_id, [])
+        if registration in registrations:
+            registrations.remove(registration)
+        if not registrations:
+            _subscribers.pop(session_id, None)